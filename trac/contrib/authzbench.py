@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2023 Edgewall Software
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution. The terms
+# are also available at https://trac.edgewall.org/wiki/TracLicense.
+#
+# This software consists of voluntary contributions made by many
+# individuals. For the exact contribution history, see the revision
+# history and logs, available at https://trac.edgewall.org/.
+
+"""Benchmark of the permission checks of the `AuthzPolicy`.
+
+An authz file with the given number of sections is generated, then
+permissions are checked on wiki pages, tickets and attachments for
+several users. The checks are first done on resources which haven't
+been checked before, then repeated on the same resources. The best
+time out of several runs is reported, in checks per second.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from trac.resource import Resource
+from trac.test import EnvironmentStub
+from trac.util.text import printout
+from tracopt.perm.authz_policy import AuthzPolicy
+
+USERS = ['anonymous', 'user0', 'user1', 'user7', 'admin']
+
+
+def write_authz_file(path, num_sections):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("[groups]\n")
+        f.write("admins = admin\n")
+        f.write("devs = %s\n" % ', '.join('user%d' % i for i in range(10)))
+        for idx in range(num_sections):
+            kind = idx % 4
+            if kind == 0:
+                f.write("\n[wiki:Project%d/*]\n" % idx)
+                f.write("@devs = WIKI_VIEW, WIKI_MODIFY\n")
+                f.write("* =\n")
+            elif kind == 1:
+                f.write("\n[ticket:%d*]\n" % idx)
+                f.write("user%d = TICKET_VIEW, TICKET_MODIFY\n" % (idx % 10))
+            elif kind == 2:
+                f.write("\n[wiki:Project%d/*/attachment:*]\n" % idx)
+                f.write("@admins = ATTACHMENT_VIEW\n")
+            else:
+                f.write("\n[milestone:m%d]\n" % idx)
+                f.write("anonymous = MILESTONE_VIEW\n")
+        f.write("\n[*]\n")
+        f.write("@admins = TRAC_ADMIN\n")
+        f.write("* = WIKI_VIEW, TICKET_VIEW\n")
+
+
+def get_resources(num, offset):
+    for idx in range(offset, offset + num):
+        kind = idx % 3
+        if kind == 0:
+            yield 'WIKI_VIEW', Resource('wiki', 'Project%d/Page%d'
+                                                % (idx % 400, idx))
+        elif kind == 1:
+            yield 'TICKET_VIEW', Resource('ticket', idx)
+        else:
+            page = Resource('wiki', 'Project%d/Page%d' % (idx % 400, idx))
+            yield 'ATTACHMENT_VIEW', page.child('attachment', 'file.txt')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--sections', type=int, default=500,
+                        help="number of sections of the authz file "
+                             "(default: %(default)s)")
+    parser.add_argument('-n', '--checks', type=int, default=2000,
+                        help="number of resources checked for each user "
+                             "(default: %(default)s)")
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help="number of runs of each benchmark, the best "
+                             "time is reported (default: %(default)s)")
+    args = parser.parse_args()
+    if args.sections < 0 or args.checks < 1 or args.repeat < 1:
+        parser.error("SECTIONS, CHECKS and REPEAT must be positive numbers.")
+    return args
+
+
+def main():
+    args = parse_args()
+    dir = tempfile.mkdtemp(prefix='trac-authzbench-')
+    try:
+        authz_file = os.path.join(dir, 'authz.conf')
+        write_authz_file(authz_file, args.sections)
+        with open(authz_file, encoding='utf-8') as f:
+            num_lines = len(f.readlines())
+        env = EnvironmentStub(enable=['trac.*', AuthzPolicy], path=dir,
+                              config=[('logging', 'log_level', 'WARNING')])
+        env.config.set('authz_policy', 'authz_file', authz_file)
+        policy = AuthzPolicy(env)
+        printout("%d sections, %d lines, %d users, %d checks per run"
+                 % (args.sections, num_lines, len(USERS),
+                    args.checks * len(USERS)))
+
+        def run(offset):
+            checks = list(get_resources(args.checks, offset))
+            start = time.perf_counter()
+            for user in USERS:
+                for action, resource in checks:
+                    policy.check_permission(action, user, resource, None)
+            return time.perf_counter() - start
+
+        new = repeated = None
+        for idx in range(args.repeat):
+            offset = (idx + 1) * args.checks
+            elapsed = run(offset)
+            new = elapsed if new is None else min(new, elapsed)
+            elapsed = run(offset)
+            repeated = elapsed if repeated is None else min(repeated,
+                                                            elapsed)
+        num_checks = args.checks * len(USERS)
+        for title, elapsed in (('new resources', new),
+                               ('repeated checks', repeated)):
+            printout("%-20s %8.3f s %10.0f checks/s"
+                     % (title, elapsed, num_checks / elapsed))
+        env.reset_db()
+    finally:
+        shutil.rmtree(dir)
+
+
+if __name__ == '__main__':
+    main()
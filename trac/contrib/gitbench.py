@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2023 Edgewall Software
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution. The terms
+# are also available at https://trac.edgewall.org/wiki/TracLicense.
+#
+# This software consists of voluntary contributions made by many
+# individuals. For the exact contribution history, see the revision
+# history and logs, available at https://trac.edgewall.org/.
+
+"""Benchmark of the revision cache of the git repositories.
+
+A bare repository is generated with a linear history on `master` and
+the given number of branches, each forking from a random commit of
+`master` and half of them merged back. The time to build the revision
+cache, to load it from a snapshot and to update it after a push is
+reported, then the number of "branches containing" queries and of
+ancestor checks per second, on random commits.
+"""
+
+import argparse
+import logging
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+
+from trac.util.text import printout
+from tracopt.versioncontrol.git.PyGIT import Storage
+
+
+def fast_import(path, commands):
+    proc = subprocess.Popen(['git', '--git-dir=' + path, 'fast-import',
+                             '--quiet'], stdin=subprocess.PIPE)
+    proc.communicate('\n'.join(commands).encode('utf-8') + b'\n')
+    if proc.returncode != 0:
+        raise SystemExit("git fast-import exits with %d" % proc.returncode)
+
+
+def commit(commands, ref, mark, parents=()):
+    ts = 1000000000 + mark
+    commands.extend([
+        'commit ' + ref,
+        'mark :%d' % mark,
+        'author Joe <joe@example.com> %d +0000' % ts,
+        'committer Joe <joe@example.com> %d +0000' % ts,
+        'data 2', '.'])
+    for idx, parent in enumerate(parents):
+        commands.append('%s %s' % ('merge' if idx else 'from', parent))
+    commands.extend(['M 100644 :1 file', ''])
+
+
+def create_repos(path, args):
+    subprocess.check_call(['git', 'init', '--quiet', '--bare', path])
+    commands = ['blob', 'mark :1', 'data 0', '']
+    mark = 1
+    for idx in range(args.commits):
+        mark += 1
+        commit(commands, 'refs/heads/master', mark,
+               [':%d' % (mark - 1)] if idx else [])
+    tip = mark
+    for idx in range(args.branches):
+        ref = 'refs/heads/branch%d' % idx
+        parent = ':%d' % random.randint(2, tip)
+        for _ in range(random.randint(1, 20)):
+            mark += 1
+            commit(commands, ref, mark, [parent])
+            parent = ':%d' % mark
+        if idx % 2:
+            mark += 1
+            commit(commands, 'refs/heads/master', mark,
+                   [':%d' % tip, parent])
+            tip = mark
+    fast_import(path, commands)
+
+
+def push(path, num):
+    commands = ['blob', 'mark :1', 'data 0', '']
+    for idx in range(num):
+        commit(commands, 'refs/heads/master', 2000000000 + idx,
+               ['refs/heads/master^0'] if idx == 0 else [])
+    fast_import(path, commands)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--commits', type=int, default=50000,
+                        help="number of commits on master "
+                             "(default: %(default)s)")
+    parser.add_argument('-b', '--branches', type=int, default=200,
+                        help="number of branches (default: %(default)s)")
+    parser.add_argument('-n', '--checks', type=int, default=1000,
+                        help="number of queries of each kind "
+                             "(default: %(default)s)")
+    args = parser.parse_args()
+    if args.commits < 1 or args.branches < 0 or args.checks < 1:
+        parser.error("COMMITS, BRANCHES and CHECKS must be positive "
+                     "numbers.")
+    return args
+
+
+def main():
+    args = parse_args()
+    log = logging.getLogger('gitbench')
+    dir = tempfile.mkdtemp(prefix='trac-gitbench-')
+    try:
+        path = os.path.join(dir, 'repos.git')
+        rev_cache_dir = os.path.join(dir, 'cache')
+        create_repos(path, args)
+
+        def storage():
+            return Storage(path, log, rev_cache_dir=rev_cache_dir)
+
+        def timed(title, fn):
+            start = time.perf_counter()
+            rv = fn()
+            printout("%-24s %10.1f ms" % (title,
+                                          (time.perf_counter() - start)
+                                          * 1000))
+            return rv
+
+        git = storage()
+        timed("build", git.sync)
+        revs = list(git.all_revs())
+        printout("%d commits, %d branches" % (len(revs),
+                                              len(git.get_branches())))
+        timed("load snapshot", lambda: storage().rev_cache)
+        push(path, 10)
+        timed("update after push", git.sync)
+
+        def run(title, queries, fn):
+            start = time.perf_counter()
+            for query in queries:
+                fn(*query)
+            elapsed = time.perf_counter() - start
+            printout("%-24s %10.0f queries/s" % (title,
+                                                 len(queries) / elapsed))
+
+        run("branches containing", [(random.choice(revs), True)
+                                     for _ in range(args.checks)],
+            git.get_branch_contains)
+        run("ancestor checks", [(random.choice(revs), random.choice(revs))
+                                for _ in range(args.checks)],
+            git.rev_is_anchestor_of)
+    finally:
+        shutil.rmtree(dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2023 Edgewall Software
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution. The terms
+# are also available at https://trac.edgewall.org/wiki/TracLicense.
+#
+# This software consists of voluntary contributions made by many
+# individuals. For the exact contribution history, see the revision
+# history and logs, available at https://trac.edgewall.org/.
+
+"""Benchmark of concurrent requests on a SQLite database.
+
+An environment with the given number of tickets is created, then
+several threads run "requests" for the given duration, like the
+threads of tracd. Each request reads a page of tickets and, for the
+given ratio of requests, modifies a ticket and adds a ticket change.
+The number of requests per second, the latencies and the number of
+requests which failed because the database was locked are reported.
+"""
+
+import argparse
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from trac.db.api import DatabaseManager
+from trac.env import Environment
+from trac.util.concurrency import get_thread_id
+from trac.util.text import printout
+
+
+def create_env(path, args):
+    db = 'sqlite:db/trac.db?journal_mode=%s' % args.journal_mode
+    env = Environment(path, create=True, options=[
+        ('trac', 'database', db),
+        ('logging', 'log_level', 'WARNING'),
+        ('sqlite', 'mmap_size', str(args.mmap_size)),
+        ('sqlite', 'cache_size', str(args.cache_size)),
+    ])
+    now = int(time.time() * 1000000)
+    with env.db_transaction as db:
+        db.executemany("""
+            INSERT INTO ticket (id, type, time, changetime, component,
+                                priority, owner, reporter, status,
+                                summary, description)
+            VALUES (%s, 'defect', %s, %s, 'component1', 'major',
+                    'somebody', 'anonymous', 'new', %s, %s)
+            """, [(id_, now, now, 'Ticket %d' % id_,
+                   'Description of ticket %d' % id_)
+                  for id_ in range(1, args.tickets + 1)])
+    return env
+
+
+def read_request(env, num_tickets):
+    offset = random.randrange(max(num_tickets - 100, 1))
+    env.db_query("""
+        SELECT id, summary, status, owner, changetime FROM ticket
+        ORDER BY changetime DESC, id LIMIT 100 OFFSET %s
+        """, (offset,))
+
+
+def write_request(env, num_tickets):
+    id_ = random.randint(1, num_tickets)
+    now = int(time.time() * 1000000)
+    with env.db_transaction as db:
+        db("UPDATE ticket SET changetime=%s WHERE id=%s", (now, id_))
+        db("""
+            INSERT INTO ticket_change (ticket, time, author, field,
+                                       oldvalue, newvalue)
+            VALUES (%s, %s, 'somebody', 'comment', '', 'Comment')
+            """, (id_, now + random.randrange(1000000)))
+
+
+def run_requests(env, args, deadline, results):
+    dbm = DatabaseManager(env)
+    latencies = []
+    errors = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            read_request(env, args.tickets)
+            if random.random() < args.writes:
+                write_request(env, args.tickets)
+        except env.db_exc.OperationalError:
+            errors += 1
+        else:
+            latencies.append(time.perf_counter() - start)
+        finally:
+            dbm.shutdown(get_thread_id())  # end of the request
+    results.append((latencies, errors))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-t', '--threads', type=int, default=8,
+                        help="number of concurrent threads "
+                             "(default: %(default)s)")
+    parser.add_argument('-d', '--duration', type=float, default=5,
+                        help="duration of the benchmark in seconds "
+                             "(default: %(default)s)")
+    parser.add_argument('-w', '--writes', type=float, default=0.2,
+                        help="ratio of requests modifying the database "
+                             "(default: %(default)s)")
+    parser.add_argument('-n', '--tickets', type=int, default=5000,
+                        help="number of tickets (default: %(default)s)")
+    parser.add_argument('-j', '--journal-mode', default='wal',
+                        help="journal mode of the database "
+                             "(default: %(default)s)")
+    parser.add_argument('--mmap-size', type=int, default=0,
+                        help="[sqlite] mmap_size (default: %(default)s)")
+    parser.add_argument('--cache-size', type=int, default=0,
+                        help="[sqlite] cache_size (default: %(default)s)")
+    args = parser.parse_args()
+    if args.threads < 1 or args.duration <= 0 or args.tickets < 1 or \
+            not 0 <= args.writes <= 1:
+        parser.error("THREADS, DURATION and TICKETS must be positive "
+                     "numbers and WRITES must be between 0 and 1.")
+    return args
+
+
+def main():
+    args = parse_args()
+    dir = tempfile.mkdtemp(prefix='trac-sqlitebench-')
+    try:
+        env = create_env(dir, args)
+        printout("%d threads, %d tickets, %d%% of writes, journal mode %s"
+                 % (args.threads, args.tickets, args.writes * 100,
+                    args.journal_mode))
+        results = []
+        deadline = time.perf_counter() + args.duration
+        threads = [threading.Thread(target=run_requests,
+                                    args=(env, args, deadline, results))
+                   for idx in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        latencies = sorted(latency for result in results
+                           for latency in result[0])
+        errors = sum(result[1] for result in results)
+        num = len(latencies)
+        printout("%d requests, %.0f requests/s, %d errors"
+                 % (num, num / args.duration, errors))
+        if num:
+            printout("latency: median %.1f ms, 95th percentile %.1f ms, "
+                     "max %.1f ms" % (latencies[num // 2] * 1000,
+                                      latencies[num * 95 // 100] * 1000,
+                                      latencies[-1] * 1000))
+        env.shutdown()
+    finally:
+        shutil.rmtree(dir)
+
+
+if __name__ == '__main__':
+    main()
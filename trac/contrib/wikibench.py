@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2023 Edgewall Software
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution. The terms
+# are also available at https://trac.edgewall.org/wiki/TracLicense.
+#
+# This software consists of voluntary contributions made by many
+# individuals. For the exact contribution history, see the revision
+# history and logs, available at https://trac.edgewall.org/.
+
+"""Benchmark of the wiki formatters over the default wiki pages.
+
+For each formatter, the best time out of several runs over all the pages
+is reported, in lines per second.
+"""
+
+import argparse
+import io
+import time
+from pkg_resources import resource_listdir, resource_string
+
+from trac.loader import load_components
+from trac.test import EnvironmentStub, Mock, MockPerm
+from trac.util.text import printout
+from trac.web.chrome import web_context
+from trac.web.href import Href
+from trac.wiki.formatter import (
+    OutlineFormatter, format_to_html, format_to_oneliner
+)
+from trac.wiki.model import WikiPage
+from trac.wiki.parser import WikiParser
+
+
+def bench_html(env, context, text):
+    format_to_html(env, context, text)
+
+
+def bench_oneliner(env, context, text):
+    format_to_oneliner(env, context, text)
+
+
+def bench_outline(env, context, text):
+    OutlineFormatter(env, context).format(text, io.StringIO())
+
+
+BENCHMARKS = [
+    ('format_to_html', bench_html),
+    ('format_to_oneliner', bench_oneliner),
+    ('OutlineFormatter', bench_outline),
+]
+
+
+def parse_args(all_pages):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help="number of runs of each benchmark, the best "
+                             "time is reported (default: %(default)s)")
+    parser.add_argument('-w', '--whole-rules', action='store_true',
+                        help="search the wiki rules as a single regular "
+                             "expression, for comparison")
+    parser.add_argument('pages', metavar='page', nargs='*',
+                        help="the wiki page(s) to format")
+
+    args = parser.parse_args()
+    for page in args.pages:
+        if page not in all_pages:
+            parser.error("%s is not one of the default pages." % page)
+    if args.repeat < 1:
+        parser.error("REPEAT must be a positive number.")
+
+    return args
+
+
+def main():
+    all_pages = sorted(name for name
+                            in resource_listdir('trac.wiki', 'default-pages')
+                            if not name.startswith('.'))
+    args = parse_args(all_pages)
+    pages = sorted(args.pages) if args.pages else all_pages
+
+    env = EnvironmentStub(disable=['trac.mimeview.pygments.*'])
+    load_components(env)
+    with env.db_transaction:
+        for name in all_pages:
+            wiki = WikiPage(env, name)
+            wiki.text = resource_string('trac.wiki', 'default-pages/' +
+                                        name).decode('utf-8')
+            if wiki.text:
+                wiki.save('trac', '')
+
+    parser = WikiParser(env)
+    if args.whole_rules:
+        parser.rules  # compiles the rules and the tokenizer
+        parser._tokenizer = None
+
+    req = Mock(href=Href('/'), abs_href=Href('http://localhost/'),
+               perm=MockPerm(), authname='anonymous', tz=None, locale=None,
+               chrome={})
+    documents = []
+    for name in pages:
+        wiki = WikiPage(env, name)
+        if wiki.exists:
+            documents.append((web_context(req, wiki.resource), wiki.text))
+    num_lines = sum(len(text.splitlines()) for context, text in documents)
+
+    printout("%d pages, %d lines" % (len(documents), num_lines))
+    for title, func in BENCHMARKS:
+        best = None
+        for idx in range(args.repeat):
+            start = time.perf_counter()
+            for context, text in documents:
+                func(env, context, text)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        printout("%-20s %8.3f s %10.0f lines/s" %
+                 (title, best, num_lines / best))
+
+
+if __name__ == '__main__':
+    main()
@@ -17,6 +17,7 @@
 #         Christopher Lenz <cmlenz@gmx.de>
 
 from datetime import datetime
+from functools import partial
 from tempfile import TemporaryFile
 from zipfile import ZipFile, ZIP_DEFLATED
 import errno
@@ -32,7 +33,9 @@ from trac.core import *
 from trac.mimeview import *
 from trac.perm import IPermissionPolicy
 from trac.resource import *
-from trac.search import search_to_sql, shorten_result
+from trac.search import ISearchIndexer, SearchIndex, expand_search_result, \
+                         iter_search_rows, search_to_sql, shorten_result
+from trac.timeline.api import TimelineEventCache
 from trac.util import content_disposition, create_zipinfo, file_or_std, \
                       get_reporter_id, normalize_filename
 from trac.util.datefmt import datetime_now, format_datetime, \
@@ -116,7 +119,7 @@ class ILegacyAttachmentPolicyDelegate(Interface):
 class AttachmentModule(Component):
 
     implements(IRequestHandler, INavigationContributor, IWikiSyntaxProvider,
-               IResourceManager)
+               IResourceManager, IAttachmentChangeListener, ISearchIndexer)
 
     realm = 'attachment'
     is_valid_default_handler = False
@@ -277,6 +280,7 @@ class AttachmentModule(Component):
 
         The tuples are in the form (change, realm, id, filename, time,
         description, author). `change` can currently only be `created`.
+        The changes are ordered by decreasing time.
 
         FIXME: no iterator
         """
@@ -284,6 +288,7 @@ class AttachmentModule(Component):
                 self.env.db_query("""
                 SELECT type, id, filename, time, description, author
                 FROM attachment WHERE time > %s AND time < %s AND type = %s
+                ORDER BY time DESC, id, filename
                 """, (to_utimestamp(start), to_utimestamp(stop), realm)):
             time = from_utimestamp(ts or 0)
             yield 'created', realm, id_, filename, time, description, author
@@ -292,7 +297,7 @@ class AttachmentModule(Component):
         """Return an event generator suitable for ITimelineEventProvider.
 
         Events are changes to attachments on resources of the given
-        `resource_realm.realm`.
+        `resource_realm.realm`, ordered by decreasing date.
         """
         for change, realm, id_, filename, time, descr, author in \
                 self.get_history(start, stop, resource_realm.realm):
@@ -322,19 +327,77 @@ class AttachmentModule(Component):
         `resource_realm.realm` whose filename, description or author match
         the given terms.
         """
+        for result in self.get_ranked_search_results(req, resource_realm,
+                                                     terms, None):
+            yield expand_search_result(result)
+
+    def get_ranked_search_results(self, req, resource_realm, terms, limit):
+        """Return a search result generator suitable for
+        `ISearchSource.get_ranked_search_results`.
+
+        :since: 1.7.1
+        """
         with self.env.db_query as db:
-            sql_query, args = search_to_sql(
-                    db, ['filename', 'description', 'author'], terms)
-            for id, time, filename, desc, author in db("""
+            index_query = SearchIndex(self.env).get_documents_query(
+                db, self.realm, terms)
+            if index_query is None:
+                sql_query, args = search_to_sql(
+                        db, ['filename', 'description', 'author'], terms)
+            else:
+                # the documents are identified by "<realm>:<id>/<filename>"
+                sql_query = '%s IN (%s)' % (db.concat('type', "':'", 'id',
+                                                      "'/'", 'filename'),
+                                            index_query[0])
+                args = tuple(index_query[1])
+            for id, time, filename, desc, author in iter_search_rows(db, """
                     SELECT id, time, filename, description, author
-                    FROM attachment WHERE type = %s AND """ + sql_query,
-                    (resource_realm.realm,) + args):
+                    FROM attachment WHERE type = %s AND (""" + sql_query +
+                    """) ORDER BY time DESC, id, filename""",
+                    (resource_realm.realm,) + args, limit):
                 attachment = resource_realm(id=id).child(self.realm, filename)
                 if 'ATTACHMENT_VIEW' in req.perm(attachment):
                     yield (get_resource_url(self.env, attachment, req.href),
                            get_resource_shortname(self.env, attachment),
                            from_utimestamp(time), author,
-                           shorten_result(desc, terms))
+                           partial(shorten_result, desc, terms))
+
+    # IAttachmentChangeListener methods
+
+    def attachment_added(self, attachment):
+        SearchIndex(self.env).index_document(
+            self.realm, self._get_search_index_id(attachment.parent_realm,
+                                                  attachment.parent_id,
+                                                  attachment.filename),
+            '\n'.join((attachment.filename, attachment.description or '',
+                       attachment.author or '')))
+        TimelineEventCache(self.env).invalidate()
+
+    def attachment_deleted(self, attachment):
+        SearchIndex(self.env).remove_document(
+            self.realm, self._get_search_index_id(attachment.parent_realm,
+                                                  attachment.parent_id,
+                                                  attachment.filename))
+        TimelineEventCache(self.env).invalidate()
+
+    def attachment_moved(self, attachment, old_parent_realm, old_parent_id,
+                         old_filename):
+        SearchIndex(self.env).remove_document(
+            self.realm, self._get_search_index_id(old_parent_realm,
+                                                  old_parent_id,
+                                                  old_filename))
+        self.attachment_added(attachment)
+
+    # ISearchIndexer methods
+
+    def get_search_index_realms(self):
+        yield self.realm
+
+    def get_search_index_documents(self, realm):
+        for type, id, filename, desc, author in self.env.db_query("""
+                SELECT type, id, filename, description, author
+                FROM attachment"""):
+            yield (self._get_search_index_id(type, id, filename),
+                   '\n'.join((filename, desc or '', author or '')))
 
     # IResourceManager methods
 
@@ -387,6 +450,10 @@ class AttachmentModule(Component):
 
     # Internal methods
 
+    def _get_search_index_id(self, parent_realm, parent_id, filename):
+        # The filename is a basename, see `normalize_filename`
+        return '%s:%s/%s' % (parent_realm, parent_id, filename)
+
     def _do_save(self, req, attachment):
         req.perm(attachment.resource).require('ATTACHMENT_CREATE')
         parent_resource = attachment.resource.parent
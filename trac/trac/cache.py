@@ -12,11 +12,17 @@
 # history and logs, available at https://trac.edgewall.org/.
 
 import functools
+import os
+import pickle
 
-from trac.core import Component
+from trac.config import ExtensionOption, PathOption
+from trac.core import Component, Interface, implements
+from trac.db.api import DatabaseManager
+from trac.util import AtomicFile
 from trac.util.concurrency import ThreadLocal, threading
+from trac.util.text import exception_to_unicode
 
-__all__ = ['CacheManager', 'cached']
+__all__ = ['CacheManager', 'ICacheBackend', 'cached']
 
 _id_to_key = {}
 
@@ -79,6 +85,18 @@ class CachedSingletonProperty(CachedPropertyBase):
             id = self.id = key_to_id(self.make_key(instance.__class__))
         CacheManager(instance.env).invalidate(id)
 
+    def update(self, instance, updater):
+        """Update the cached data with `updater` instead of invalidating
+        it. See `CacheManager.update`.
+
+        :since: 1.7.1
+        """
+        try:
+            id = self.id
+        except AttributeError:
+            id = self.id = key_to_id(self.make_key(instance.__class__))
+        CacheManager(instance.env).update(id, updater)
+
 
 class CachedProperty(CachedPropertyBase):
     """Cached property descriptor for classes having potentially
@@ -113,6 +131,18 @@ class CachedProperty(CachedPropertyBase):
             setattr(instance, self.key_attr, id)
         CacheManager(instance.env).invalidate(id)
 
+    def update(self, instance, updater):
+        """Update the cached data with `updater` instead of invalidating
+        it. See `CacheManager.update`.
+
+        :since: 1.7.1
+        """
+        id = getattr(instance, self.key_attr)
+        if isinstance(id, str):
+            id = key_to_id(self.make_key(instance.__class__) + ':' + id)
+            setattr(instance, self.key_attr, id)
+        CacheManager(instance.env).update(id, updater)
+
 
 def cached(fn_or_attr=None):
     r"""Method decorator creating a cached attribute from a data
@@ -180,20 +210,184 @@ def cached(fn_or_attr=None):
     return decorator
 
 
+class ICacheBackend(Interface):
+    """Storage of the data retrieved for the `cached` attributes.
+
+    The validity of the data is still checked by the `CacheManager`,
+    each value being stored along with the generation of the cache at
+    the time it was retrieved.
+
+    :since: 1.7.1
+    """
+
+    def get(id, generation):
+        """Return the data stored for `id` at `generation`.
+
+        Raise a `KeyError` if there's no such data.
+        """
+
+    def set(id, data, generation):
+        """Store the `data` retrieved for `id` at `generation`."""
+
+    def invalidate(id):
+        """Discard the data stored for `id`."""
+
+
+class MemoryCacheBackend(Component):
+    """Store the cached data in the memory of each process.
+
+    :since: 1.7.1
+    """
+
+    implements(ICacheBackend)
+
+    def __init__(self):
+        self._cache = {}
+
+    # ICacheBackend methods
+
+    def get(self, id, generation):
+        data, data_generation = self._cache[id]
+        if data_generation != generation:
+            raise KeyError(id)
+        return data
+
+    def set(self, id, data, generation):
+        self._cache[id] = data, generation
+
+    def invalidate(self, id):
+        self._cache.pop(id, None)
+
+
+class FileCacheBackend(Component):
+    """Share the cached data between the processes serving an
+    environment, by storing it as files in a directory.
+
+    Each process still keeps the data in memory, so the files are only
+    read after the data has been retrieved by another process. Data
+    which can't be pickled is only kept in memory.
+
+    :since: 1.7.1
+    """
+
+    implements(ICacheBackend)
+
+    directory = PathOption('cache', 'directory', '',
+        """Directory in which the `FileCacheBackend` stores the cached
+        data. Relative paths are resolved relative to the `conf`
+        directory of the environment. Defaults to the `files/cache`
+        directory of the environment. A directory on a memory-backed
+        file system (e.g. `/dev/shm/...`) can be used for sharing
+        the data in memory.
+        (''since 1.7.1'')""")
+
+    def __init__(self):
+        self._memory = MemoryCacheBackend(self.env)
+
+    @property
+    def _dir(self):
+        return self.directory or os.path.join(self.env.files_dir, 'cache')
+
+    def _path(self, id, generation):
+        return os.path.join(self._dir, '%d.%d' % (id, generation))
+
+    def _remove(self, id, keep=None):
+        prefix = '%d.' % id
+        try:
+            names = os.listdir(self._dir)
+        except OSError:
+            return
+        for name in names:
+            if name.startswith(prefix) and name != keep:
+                try:
+                    os.unlink(os.path.join(self._dir, name))
+                except OSError:
+                    pass
+
+    # ICacheBackend methods
+
+    def get(self, id, generation):
+        try:
+            return self._memory.get(id, generation)
+        except KeyError:
+            pass
+        try:
+            with open(self._path(id, generation), 'rb') as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            raise KeyError(id)
+        except Exception as e:
+            self.log.warning("Failed to read cached data for %s: %s",
+                             _id_to_key.get(id, id), exception_to_unicode(e))
+            raise KeyError(id)
+        self._memory.set(id, data, generation)
+        return data
+
+    def set(self, id, data, generation):
+        self._memory.set(id, data, generation)
+        try:
+            content = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            self.log.debug("Cached data for %s is not shared: %s",
+                           _id_to_key.get(id, id), exception_to_unicode(e))
+            return
+        path = self._path(id, generation)
+        try:
+            os.makedirs(self._dir, exist_ok=True)
+            with AtomicFile(path, 'wb') as f:
+                f.write(content)
+        except OSError as e:
+            self.log.warning("Failed to write cached data for %s: %s",
+                             _id_to_key.get(id, id), exception_to_unicode(e))
+            return
+        self._remove(id, keep=os.path.basename(path))
+
+    def invalidate(self, id):
+        self._memory.invalidate(id)
+        self._remove(id)
+
+
 class CacheManager(Component):
     """Cache manager."""
 
     required = True
 
+    backend = ExtensionOption('cache', 'backend', ICacheBackend,
+                              'MemoryCacheBackend',
+        """Name of the component storing the cached data. The
+        `FileCacheBackend` shares the data between the processes
+        serving the environment, which otherwise each retrieve the data
+        after it has been invalidated.
+        (''since 1.7.1'')""")
+
+    change_feed = PathOption('cache', 'change_feed', '',
+        """File rewritten after each invalidation of the cached data.
+        When set, the generations of the cached data are only read
+        again from the database at the start of a request if the file
+        has changed since they were last read, instead of on every
+        request. All the processes serving the environment must be
+        able to write the file, and the data must only be invalidated
+        through Trac. Relative paths are resolved relative to the `conf`
+        directory of the environment. A file on a memory-backed file
+        system (e.g. `/dev/shm/...`) avoids any disk access.
+        (''since 1.7.1'')""")
+
     def __init__(self):
-        self._cache = {}
-        self._local = ThreadLocal(meta=None, cache=None)
+        self._local = ThreadLocal(meta=None, cache=None, stamp=None)
         self._lock = threading.RLock()
 
     # Public interface
 
     def reset_metadata(self):
-        """Reset per-request cache metadata."""
+        """Reset per-request cache metadata.
+
+        The metadata is kept when the `[cache] change_feed` file shows
+        that no data has been invalidated since it was retrieved.
+        """
+        if self._local.meta is not None and self.change_feed:
+            stamp = self._read_stamp()
+            if stamp is not None and stamp == self._local.stamp:
+                return
         self._local.meta = self._local.cache = None
 
     def get(self, id, retriever, instance):
@@ -203,10 +397,15 @@ class CacheManager(Component):
         local_cache = self._local.cache
         if local_meta is None:
             # First cache usage in this request, retrieve cache metadata
-            # from the database and make a thread-local copy of the cache
+            # from the database, the data is then copied from the backend
+            # to the thread-local cache on first access
+            if self.change_feed:
+                # Read before the metadata, so that an invalidation
+                # committed meanwhile is seen at the next reset
+                self._local.stamp = self._read_stamp()
             meta = self.env.db_query("SELECT id, generation FROM cache")
             self._local.meta = local_meta = dict(meta)
-            self._local.cache = local_cache = self._cache.copy()
+            self._local.cache = local_cache = {}
 
         db_generation = local_meta.get(id, -1)
 
@@ -218,29 +417,32 @@ class CacheManager(Component):
         except KeyError:
             pass
 
+        backend = self.backend
         with self.env.db_query as db:
             with self._lock:
-                # Get data from the process cache
+                # Get data from the backend
                 try:
-                    data, generation = local_cache[id] = self._cache[id]
-                    if generation == db_generation:
-                        return data
+                    data = backend.get(id, db_generation)
                 except KeyError:
-                    generation = None   # Force retrieval from the database
+                    pass
+                else:
+                    local_cache[id] = data, db_generation
+                    return data
 
-                # Check if the process cache has the newest version, as it may
+                # Check if the backend has the newest version, as it may
                 # have been updated after the metadata retrieval
                 for db_generation, in db(
                         "SELECT generation FROM cache WHERE id=%s", (id,)):
                     break
                 else:
                     db_generation = -1
-                if db_generation == generation:
-                    return data
-
-                # Retrieve data from the database
-                data = retriever(instance)
-                local_cache[id] = self._cache[id] = data, db_generation
+                try:
+                    data = backend.get(id, db_generation)
+                except KeyError:
+                    # Retrieve data from the database
+                    data = retriever(instance)
+                    backend.set(id, data, db_generation)
+                local_cache[id] = data, db_generation
                 local_meta[id] = db_generation
                 return data
 
@@ -264,10 +466,98 @@ class CacheManager(Component):
                        (id, 0, _id_to_key.get(id, '<unknown>')))
 
                 # Invalidate in this process
-                self._cache.pop(id, None)
+                self.backend.invalidate(id)
+
+                # Notify the other processes, once the new generation
+                # can be read by them
+                if self.change_feed:
+                    DatabaseManager(self.env).call_after_commit(
+                        self._write_stamp)
 
                 # Invalidate in this thread
                 try:
                     del self._local.cache[id]
                 except (KeyError, TypeError):
                     pass
+
+    def update(self, id, updater):
+        """Update the cached data for the given id by applying `updater`
+        to the current data, instead of retrieving the data again after
+        an invalidation.
+
+        `updater` is called with the current data and must return the
+        new data, without modifying the current data which may be in
+        use in other threads. When the current data isn't available in
+        this process, the data is simply invalidated. The new data
+        becomes visible once the transaction in progress is committed.
+
+        The generation of the data is incremented as for an
+        invalidation. The other processes only get the updated data
+        when the cache backend is shared by the processes, like the
+        `FileCacheBackend`; with the default `MemoryCacheBackend`, they
+        retrieve the data again as after an invalidation.
+
+        :since: 1.7.1
+        """
+        with self.env.db_transaction as db:
+            with self._lock:
+                db("UPDATE cache SET generation=generation+1 WHERE id=%s",
+                   (id,))
+                for generation, in db("""
+                        SELECT generation FROM cache WHERE id=%s
+                        """, (id,)):
+                    break
+                else:
+                    generation = 0
+                    db("INSERT INTO cache VALUES (%s, %s, %s)",
+                       (id, 0, _id_to_key.get(id, '<unknown>')))
+                backend = self.backend
+                try:
+                    data = backend.get(id, generation - 1)
+                except KeyError:
+                    updated = False
+                else:
+                    data = updater(data)
+                    updated = True
+                backend.invalidate(id)
+                try:
+                    del self._local.cache[id]
+                except (KeyError, TypeError):
+                    pass
+
+                def store():
+                    # Only store the data if the new generation hasn't
+                    # been rolled back nor superseded meanwhile
+                    for current, in self.env.db_query("""
+                            SELECT generation FROM cache WHERE id=%s
+                            """, (id,)):
+                        if current == generation:
+                            with self._lock:
+                                backend.set(id, data, generation)
+
+                dbm = DatabaseManager(self.env)
+                if updated:
+                    dbm.call_after_commit(store)
+                if self.change_feed:
+                    dbm.call_after_commit(self._write_stamp)
+
+    # Internal methods
+
+    def _read_stamp(self):
+        try:
+            with open(self.change_feed, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            self._write_stamp()
+        except OSError as e:
+            self.log.warning("Failed to read the cache change feed: %s",
+                             exception_to_unicode(e))
+
+    def _write_stamp(self):
+        try:
+            os.makedirs(os.path.dirname(self.change_feed), exist_ok=True)
+            with AtomicFile(self.change_feed, 'wb') as f:
+                f.write(os.urandom(16))
+        except OSError as e:
+            self.log.warning("Failed to write the cache change feed: %s",
+                             exception_to_unicode(e))
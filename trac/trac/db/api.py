@@ -22,14 +22,16 @@ from abc import ABCMeta, abstractmethod
 
 from trac import db_default
 from trac.api import IEnvironmentSetupParticipant, ISystemInfoProvider
-from trac.config import BoolOption, ConfigurationError, IntOption, Option
+from trac.config import BoolOption, ConfigurationError, IntOption, \
+                         ListOption, Option
 from trac.core import *
 from trac.db.pool import ConnectionPool
 from trac.db.schema import Table
 from trac.db.util import ConnectionWrapper
-from trac.util.concurrency import ThreadLocal
+from trac.util.concurrency import ThreadLocal, get_thread_id
+from trac.util.datefmt import time_now
 from trac.util.html import tag
-from trac.util.text import unicode_passwd
+from trac.util.text import exception_to_unicode, unicode_passwd
 from trac.util.translation import _, tag_
 
 
@@ -69,7 +71,7 @@ class TransactionContextManager(DbContextManager):
         db = self.dbmgr._transaction_local.wdb  # outermost writable db
         if not db:
             db = self.dbmgr._transaction_local.rdb  # reuse wrapped connection
-            if db:
+            if db and not self.dbmgr._is_replica(db):
                 db = ConnectionWrapper(db.cnx, db.log)
             else:
                 db = self.dbmgr.get_connection()
@@ -78,13 +80,20 @@ class TransactionContextManager(DbContextManager):
 
     def __exit__(self, et, ev, tb):
         if self.db:
-            self.dbmgr._transaction_local.wdb = None
+            local = self.dbmgr._transaction_local
+            local.wdb = None
+            callbacks, local.callbacks = local.callbacks, None
             if et is None:
                 self.db.commit()
+                # read our own writes until the end of the request
+                local.sticky = True
             else:
                 self.db.rollback()
-            if not self.dbmgr._transaction_local.rdb:
+            if not local.rdb or local.rdb.cnx is not self.db.cnx:
                 self.db.close()
+            if et is None and callbacks:
+                for callback in callbacks:
+                    callback()
 
 
 class QueryContextManager(DbContextManager):
@@ -94,6 +103,10 @@ class QueryContextManager(DbContextManager):
 
     def __enter__(self):
         db = self.dbmgr._transaction_local.rdb  # outermost readonly db
+        wdb = self.dbmgr._transaction_local.wdb
+        if db and wdb and self.dbmgr._is_replica(db):
+            # read the uncommitted changes from within a transaction
+            return ConnectionWrapper(wdb.cnx, wdb.log, readonly=True)
         if not db:
             db = self.dbmgr._transaction_local.wdb  # reuse wrapped connection
             if db:
@@ -160,6 +173,15 @@ class ConnectionBase(object, metaclass=ABCMeta):
         """Returns whether the table exists."""
         pass
 
+    @abstractmethod
+    def has_window_functions(self):
+        """Returns whether window functions such as `COUNT(*) OVER ()`
+        are supported.
+
+        :since: 1.7.1
+        """
+        pass
+
     @abstractmethod
     def like(self):
         """Returns a case-insensitive `LIKE` clause."""
@@ -269,13 +291,43 @@ class DatabaseManager(Component):
         """Timeout value for database connection, in seconds.
         Use '0' to specify ''no timeout''.""")
 
+    replicas = ListOption('trac', 'database_replicas', '',
+        doc="""List of database connection strings of read-only
+        replicas of the `database`. When set, the read-only queries
+        are spread over the replicas, except in a request which has
+        already modified the database, so that it reads its own
+        changes. The `database` is used when a replica can't be
+        reached. (''since 1.7.1'')""")
+
+    pool_size = IntOption('trac', 'database_pool_size', 0,
+        """Maximum number of database connections opened by the
+        process. The pool is shared by all the environments loaded in
+        the process and its size is the largest of their values. Use
+        '0' to take the size from the `TRAC_DB_POOL_SIZE` environment
+        variable, or 10 when it is not set. (''since 1.7.1'')""")
+
+    pool_idle_timeout = IntOption('trac', 'database_pool_idle_timeout', 120,
+        """Number of seconds after which an unused pooled database
+        connection is closed. (''since 1.7.1'')""")
+
+    pool_ping_interval = IntOption('trac', 'database_pool_ping_interval', 0,
+        """Interval in seconds at which a background thread checks that
+        the unused pooled database connections are still working. The
+        connections are then not checked each time they are taken from
+        the pool. Use '0' to check the connections only when they are
+        taken from the pool. (''since 1.7.1'')""")
+
     debug_sql = BoolOption('trac', 'debug_sql', False,
         """Show the SQL queries in the Trac log, at DEBUG level.
         """)
 
     def __init__(self):
         self._cnx_pool = None
-        self._transaction_local = ThreadLocal(wdb=None, rdb=None)
+        self._replica_pools = None
+        self._replica_index = 0
+        self._replica_failures = {}
+        self._transaction_local = ThreadLocal(wdb=None, rdb=None,
+                                              callbacks=None, sticky=False)
 
     def init_db(self):
         connector, args = self.get_connector()
@@ -414,14 +466,84 @@ class DatabaseManager(Component):
         If `readonly` is `True`, the returned connection will purposely
         lack the `rollback` and `commit` methods.
         """
+        if readonly and self.replicas and \
+                not self._transaction_local.sticky:
+            db = self._get_replica_connection()
+            if db:
+                return ConnectionWrapper(db, readonly=True)
         if not self._cnx_pool:
-            connector, args = self.get_connector()
-            self._cnx_pool = ConnectionPool(5, connector, **args)
+            self._cnx_pool = self._create_pool(*self.get_connector())
         db = self._cnx_pool.get_cnx(self.timeout or None)
         if readonly:
             db = ConnectionWrapper(db, readonly=True)
         return db
 
+    replica_retry_delay = 30
+
+    def _get_replica_connection(self):
+        """Get a connection from one of the replicas, in turn. Replicas
+        which fail to provide a connection are skipped for
+        `replica_retry_delay` seconds.
+        """
+        if self._replica_pools is None:
+            self._replica_pools = [
+                self._create_pool(*self.get_connector(uri))
+                for uri in self.replicas]
+        num = len(self._replica_pools)
+        now = time_now()
+        for idx in range(num):
+            idx = (self._replica_index + idx) % num
+            if self._replica_failures.get(idx, 0) > now:
+                continue
+            self._replica_index = idx + 1
+            try:
+                return self._replica_pools[idx].get_cnx(self.timeout or None)
+            except Exception as e:
+                self.log.warning("Database replica %s unavailable, using "
+                                 "the primary database: %s",
+                                 self.replicas[idx],
+                                 exception_to_unicode(e))
+                self._replica_failures[idx] = now + self.replica_retry_delay
+
+    def _is_replica(self, db):
+        """Return whether the connection `db` comes from a replica."""
+        return bool(self._replica_pools) and \
+               any(pool.owns(db.cnx) for pool in self._replica_pools)
+
+    def _create_pool(self, connector, args):
+        return ConnectionPool(self.pool_size, connector,
+                              idle_timeout=self.pool_idle_timeout,
+                              ping_interval=self.pool_ping_interval, **args)
+
+    def get_pool_stats(self):
+        """Return the counters of the process-wide connection pool.
+
+        See `ConnectionPoolBackend.get_stats` for the available keys.
+
+        :since: 1.7.1
+        """
+        if not self._cnx_pool:
+            return {}
+        return self._cnx_pool.get_stats()
+
+    def call_after_commit(self, callback):
+        """Call `callback` once the transaction in progress in the
+        current thread has been committed.
+
+        The callback is called without arguments, right away if there's
+        no transaction in progress. It is dropped if the transaction is
+        rolled back.
+
+        :since: 1.7.1
+        """
+        local = self._transaction_local
+        if not local.wdb:
+            callback()
+        elif local.callbacks is None:
+            local.callbacks = [callback]
+        else:
+            local.callbacks.append(callback)
+
     def get_database_version(self, name='database_version'):
         """Returns the database version from the SYSTEM table as an int,
         or `False` if the entry is not found.
@@ -547,10 +669,17 @@ class DatabaseManager(Component):
                 self.set_database_version(i, name)
 
     def shutdown(self, tid=None):
+        if tid == get_thread_id():
+            self._transaction_local.sticky = False
         if self._cnx_pool:
             self._cnx_pool.shutdown(tid)
             if not tid:
                 self._cnx_pool = None
+        if self._replica_pools:
+            for pool in self._replica_pools:
+                pool.shutdown(tid)
+            if not tid:
+                self._replica_pools = None
 
     def backup(self, dest=None):
         """Save a backup of the database.
@@ -575,8 +704,14 @@ class DatabaseManager(Component):
             os.makedirs(backup_dir)
         return connector.backup(dest)
 
-    def get_connector(self):
-        scheme, args = parse_connection_uri(self.connection_uri)
+    def get_connector(self, connection_uri=None):
+        """Return the connector and its connection arguments for the
+        `connection_uri`, or for the `database` by default.
+
+        :since 1.7.1: added the `connection_uri` argument.
+        """
+        scheme, args = parse_connection_uri(connection_uri or
+                                            self.connection_uri)
         candidates = [
             (priority, connector)
             for connector in self.connectors
@@ -500,6 +500,18 @@ class MySQLConnection(ConnectionBase, ConnectionWrapper):
             """, (self.schema, table))
         return bool(rows[0][0])
 
+    def has_window_functions(self):
+        # Window functions are available since MySQL 8.0 and MariaDB 10.2,
+        # e.g. "8.0.36" or "5.5.5-10.6.16-MariaDB"
+        info = self.cnx.get_server_info()
+        versions = [tuple(map(int, v))
+                    for v in re.findall(r'(\d+)\.(\d+)\.\d+', info)]
+        if not versions:
+            return False
+        if 'mariadb' in info.lower():
+            return versions[-1] >= (10, 2)
+        return versions[0] >= (8, 0)
+
     def like(self):
         return "LIKE %%s COLLATE %s_general_ci ESCAPE '/'" % self.charset
 
@@ -16,6 +16,7 @@
 
 import os
 import sys
+from collections import deque
 
 from trac.core import TracError
 from trac.db.util import ConnectionWrapper
@@ -55,15 +56,81 @@ class PooledConnection(ConnectionWrapper):
 
 class ConnectionPoolBackend(object):
     """A process-wide LRU-based connection pool.
+
+    The idle connections are kept in a free list per connection key,
+    so that a connection can be taken from or returned to the pool in
+    constant time.
     """
+
+    default_idle_timeout = 120
+
     def __init__(self, maxsize):
         self._available = threading.Condition(threading.RLock())
+        self._default_maxsize = maxsize
         self._maxsize = maxsize
+        self._maxsizes = {}
+        self._idle_timeouts = {}
+        self._ping_intervals = {}
+        self._logs = {}
         self._active = {}
-        self._pool = []
-        self._pool_key = []
-        self._pool_time = []
+        self._pool = {}  # key -> deque of (cnx, returned time, checked time)
+        self._pool_size = 0
         self._waiters = 0
+        self._maintainer = None
+        self._stopped = threading.Event()
+        self._stats = dict.fromkeys(('checkouts', 'waits', 'wait_time',
+                                     'creations', 'failures', 'timeouts',
+                                     'pings'), 0)
+
+    def configure(self, key, maxsize=None, idle_timeout=None,
+                  ping_interval=None, log=None):
+        """Set the pool parameters used for the connections identified
+        by `key`.
+
+        The pool is shared by all the keys, its size is the largest of
+        the configured `maxsize`. Pooled connections unused for more
+        than `idle_timeout` seconds are closed, and the idle connections
+        are checked every `ping_interval` seconds by a background
+        thread instead of being checked at each checkout. The failures
+        of that thread are reported to `log`.
+
+        :since: 1.7.1
+        """
+        with self._available:
+            if maxsize:
+                self._maxsizes[key] = maxsize
+            else:
+                self._maxsizes.pop(key, None)
+            self._maxsize = max(self._maxsizes.values(),
+                                default=self._default_maxsize)
+            if idle_timeout is not None:
+                self._idle_timeouts[key] = idle_timeout
+            if log:
+                self._logs[key] = log
+            if ping_interval:
+                self._ping_intervals[key] = ping_interval
+            else:
+                self._ping_intervals.pop(key, None)
+            self._available.notify_all()
+
+    def get_stats(self):
+        """Return a `dict` with the counters of the pool.
+
+        The counters are the number of `checkouts` of a connection, of
+        `waits` for an available connection and the total `wait_time`,
+        the number of `creations` of a new connection, of `failures`
+        to get a working connection, of `timeouts` and of `pings` of a
+        pooled connection. The current number of `active` and `idle`
+        connections and the `maxsize` of the pool are also given.
+
+        :since: 1.7.1
+        """
+        with self._available:
+            stats = dict(self._stats)
+            stats['active'] = len(self._active)
+            stats['idle'] = self._pool_size
+            stats['maxsize'] = self._maxsize
+        return stats
 
     def get_cnx(self, connector, kwargs, timeout=None):
         cnx = None
@@ -81,13 +148,16 @@ class ConnectionPoolBackend(object):
                 if self._waiters == 0:
                     cnx = self._take_cnx(connector, kwargs, key, tid)
                 if not cnx:
-                    self._waiters += 1
-                    self._available.wait()
-                    self._waiters -= 1
-                    cnx = self._take_cnx(connector, kwargs, key, tid)
+                    cnx = self._wait_cnx(connector, kwargs, key, tid, start,
+                                         timeout)
                 num = 1
             if cnx:
                 self._active[(tid, key)] = (cnx, num)
+                self._stats['checkouts'] += 1
+            else:
+                self._stats['timeouts'] += 1
+            if self._ping_intervals:
+                self._start_maintainer()
 
         deferred = num == 1 and isinstance(cnx, tuple)
         exception = None
@@ -115,14 +185,18 @@ class ConnectionPoolBackend(object):
                 # replace placeholder with real Connection
                 with self._available:
                     self._active[(tid, key)] = (cnx, num)
+                    if op in ('close', 'create'):
+                        self._stats['creations'] += 1
             return PooledConnection(self, cnx, key, tid, log)
 
         if deferred:
             # cnx couldn't be reused, clear placeholder
             with self._available:
                 del self._active[(tid, key)]
+                self._stats['failures'] += 1
+                self._available.notify()
             if op == 'ping': # retry
-                return self.get_cnx(connector, kwargs)
+                return self.get_cnx(connector, kwargs, timeout)
 
         # if we didn't get a cnx after wait(), something's fishy...
         if isinstance(exception, TracError):
@@ -132,28 +206,56 @@ class ConnectionPoolBackend(object):
                    time=timeout)
         raise TimeoutError(errmsg) from exception
 
+    def _wait_cnx(self, connector, kwargs, key, tid, start, timeout):
+        """Wait until a connection can be taken or `timeout` seconds
+        have elapsed since `start`.
+
+        Note: _available lock must be held when calling this method.
+        """
+        cnx = None
+        self._waiters += 1
+        self._stats['waits'] += 1
+        try:
+            while not cnx:
+                if timeout:
+                    remaining = start + timeout - time_now()
+                    if remaining <= 0:
+                        break
+                    self._available.wait(remaining)
+                else:
+                    self._available.wait()
+                cnx = self._take_cnx(connector, kwargs, key, tid)
+        finally:
+            self._waiters -= 1
+            self._stats['wait_time'] += time_now() - start
+        return cnx
+
     def _take_cnx(self, connector, kwargs, key, tid):
         """Note: _available lock must be held when calling this method."""
         # Second best option: Reuse a live pooled connection
-        if key in self._pool_key:
-            idx = self._pool_key.index(key)
-            self._pool_key.pop(idx)
-            self._pool_time.pop(idx)
-            cnx = self._pool.pop(idx)
+        free = self._pool.get(key)
+        if free:
+            cnx, returned, checked = free.pop()
+            self._pool_size -= 1
             # If possible, verify that the pooled connection is
-            # still available and working.
+            # still available and working, unless this has been done
+            # recently by the maintainer thread.
             if hasattr(cnx, 'ping'):
-                return 'ping', cnx
+                interval = self._ping_intervals.get(key)
+                if not interval or time_now() - checked >= interval:
+                    self._stats['pings'] += 1
+                    return 'ping', cnx
             return cnx
         # Third best option: Create a new connection
-        elif len(self._active) + len(self._pool) < self._maxsize:
+        elif len(self._active) + self._pool_size < self._maxsize:
             return 'create', None
         # Forth best option: Replace a pooled connection with a new one
-        elif len(self._active) < self._maxsize:
+        elif len(self._active) < self._maxsize and self._pool_size:
             # Remove the LRU connection in the pool
-            cnx = self._pool.pop(0)
-            self._pool_key.pop(0)
-            self._pool_time.pop(0)
+            lru = min((free for free in self._pool.values() if free),
+                      key=lambda free: free[0][1])
+            cnx = lru.popleft()[0]
+            self._pool_size -= 1
             return 'close', cnx
 
     def _return_cnx(self, cnx, key, tid):
@@ -175,29 +277,124 @@ class ConnectionPoolBackend(object):
             # Connection available, from reuse or from creation of a new one
             with self._available:
                 if cnx and cnx.poolable:
-                    self._pool.append(cnx)
-                    self._pool_key.append(key)
-                    self._pool_time.append(time_now())
+                    now = time_now()
+                    self._pool.setdefault(key, deque()) \
+                              .append((cnx, now, now))
+                    self._pool_size += 1
+                self._available.notify()
+
+    def _start_maintainer(self):
+        """Start the thread checking the idle connections, if needed.
+
+        Note: _available lock must be held when calling this method.
+        """
+        if self._maintainer is None or not self._maintainer.is_alive():
+            self._stopped.clear()
+            self._maintainer = threading.Thread(target=self._maintain_loop,
+                                                name='Database pool')
+            self._maintainer.daemon = True
+            self._maintainer.start()
+
+    def _maintain_loop(self):
+        while True:
+            with self._available:
+                if not self._ping_intervals:
+                    self._maintainer = None
+                    return
+                interval = min(self._ping_intervals.values())
+            if self._stopped.wait(interval):
+                return
+            try:
+                self.maintain()
+            except Exception as e:
+                with self._available:
+                    logs = {id(log): log for key, log in self._logs.items()
+                            if key in self._ping_intervals}
+                for log in logs.values():
+                    log.error("Failed to maintain the connection pool: %s",
+                              exception_to_unicode(e, traceback=True))
+
+    def maintain(self):
+        """Close the connections idle for too long and check the other
+        idle connections which haven't been checked recently.
+
+        :since: 1.7.1
+        """
+        now = time_now()
+        expired = []
+        to_check = []
+        with self._available:
+            for key, free in self._pool.items():
+                timeout = self._idle_timeouts.get(key,
+                                                  self.default_idle_timeout)
+                interval = self._ping_intervals.get(key)
+                kept = deque()
+                for item in free:
+                    cnx, returned, checked = item
+                    if now - returned >= timeout:
+                        expired.append(cnx)
+                    elif interval and hasattr(cnx, 'ping') and \
+                            now - checked >= interval:
+                        to_check.append((key, item))
+                    else:
+                        kept.append(item)
+                self._pool[key] = kept
+            self._pool_size -= len(expired) + len(to_check)
+            if expired or to_check:
+                self._available.notify_all()
+
+        for cnx in expired:
+            try:
+                cnx.close()
+            except Exception:
+                pass
+        checked = []
+        for key, (cnx, returned, last) in to_check:
+            try:
+                cnx.ping()
+            except Exception:
+                try:
+                    cnx.close()
+                except Exception:
+                    pass
+            else:
+                checked.append((key, (cnx, returned, time_now())))
+        with self._available:
+            self._stats['pings'] += len(to_check)
+            self._stats['failures'] += len(to_check) - len(checked)
+            for key, item in checked:
+                free = self._pool.setdefault(key, deque())
+                # keep the free list ordered by returned time
+                idx = len(free)
+                while idx > 0 and free[idx - 1][1] > item[1]:
+                    idx -= 1
+                free.insert(idx, item)
+                self._pool_size += 1
                 self._available.notify()
 
     def shutdown(self, tid=None):
         """Close pooled connections not used in a while"""
-        delay = 120
-        if tid is None:
-            delay = 0
-        when = time_now() - delay
+        now = time_now()
+        closing = []
         with self._available:
             if tid is None: # global shutdown, also close active connections
                 for db, num in self._active.values():
                     # close only real connections
                     if not isinstance(db, tuple):
-                        db.close()
+                        closing.append(db)
                 self._active = {}
-            while self._pool_time and self._pool_time[0] <= when:
-                db = self._pool.pop(0)
-                db.close()
-                self._pool_key.pop(0)
-                self._pool_time.pop(0)
+                self._stopped.set()
+            for key, free in self._pool.items():
+                if tid is None:
+                    delay = 0
+                else:
+                    delay = self._idle_timeouts.get(key,
+                                                    self.default_idle_timeout)
+                while free and free[0][1] <= now - delay:
+                    closing.append(free.popleft()[0])
+                    self._pool_size -= 1
+        for db in closing:
+            db.close()
 
 
 _pool_size = int(os.environ.get('TRAC_DB_POOL_SIZE', 10))
@@ -205,13 +402,26 @@ _backend = ConnectionPoolBackend(_pool_size)
 
 
 class ConnectionPool(object):
-    def __init__(self, maxsize, connector, **kwargs):
-        # maxsize not used right now but kept for api compatibility
+    def __init__(self, maxsize, connector, idle_timeout=None,
+                 ping_interval=None, **kwargs):
         self._connector = connector
         self._kwargs = kwargs
+        _backend.configure(str(kwargs), maxsize, idle_timeout, ping_interval,
+                           kwargs.get('log'))
 
     def get_cnx(self, timeout=None):
         return _backend.get_cnx(self._connector, self._kwargs, timeout)
 
+    def get_stats(self):
+        return _backend.get_stats()
+
+    def owns(self, cnx):
+        """Return whether `cnx` is a connection taken from this pool.
+
+        :since: 1.7.1
+        """
+        return isinstance(cnx, PooledConnection) and \
+               cnx._key == str(self._kwargs)
+
     def shutdown(self, tid=None):
         _backend.shutdown(tid)
@@ -397,6 +397,9 @@ class PostgreSQLConnection(ConnectionBase, ConnectionWrapper):
             """, (table,))
         return rows[0][0]
 
+    def has_window_functions(self):
+        return True
+
     def like(self):
         return "ILIKE %s ESCAPE '/'"
 
@@ -16,16 +16,20 @@
 
 import errno
 import os
+import random
 import re
+import time
 import weakref
 from contextlib import closing
 
-from trac.config import ConfigurationError, ListOption
+from trac.config import ChoiceOption, ConfigurationError, IntOption, \
+                         ListOption
 from trac.core import Component, TracError, implements
 from trac.db.api import ConnectionBase, IDatabaseConnector
 from trac.db.schema import Table, Column, Index
 from trac.db.util import ConnectionWrapper, IterableCursor
 from trac.util import get_pkginfo, getuser, lazy
+from trac.util.datefmt import time_now
 from trac.util.html import tag
 from trac.util.translation import _, tag_
 
@@ -52,11 +56,21 @@ class PyFormatCursor(sqlite.Cursor):
     __slots__ = ['cnx']
 
     def _rollback_on_error(self, function, *args, **kwargs):
-        try:
-            return function(self, *args, **kwargs)
-        except sqlite.DatabaseError:
-            self.cnx.rollback()
-            raise
+        retries = 0
+        while True:
+            # the first statement of a transaction can be retried when
+            # the database is busy, as nothing has been done yet
+            retriable = not self.connection.in_transaction
+            try:
+                return function(self, *args, **kwargs)
+            except sqlite.DatabaseError as e:
+                if not retriable or retries >= self.cnx._busy_retries or \
+                        not _is_busy(e):
+                    self.cnx.rollback()
+                    raise
+                self.connection.rollback()
+            _wait_busy(retries)
+            retries += 1
 
     def execute(self, sql, args=None):
         if args:
@@ -159,6 +173,42 @@ class SQLiteConnector(Component):
         The paths may be absolute or relative to the Trac environment.
         """)
 
+    mmap_size = IntOption('sqlite', 'mmap_size', 0,
+        """Maximum number of bytes of the database file accessed using
+        memory-mapped I/O. Use '0' to disable memory-mapped I/O. The
+        `mmap_size` parameter of the database connection string takes
+        precedence. (''since 1.7.1'')""")
+
+    cache_size = IntOption('sqlite', 'cache_size', 0,
+        """Size of the page cache of each connection, in pages when
+        positive or in KiB when negative. Use '0' for the SQLite
+        default. The `cache_size` parameter of the database connection
+        string takes precedence. (''since 1.7.1'')""")
+
+    temp_store = ChoiceOption('sqlite', 'temp_store',
+                              ['default', 'file', 'memory'],
+        """Storage of the temporary tables and indices: `default`,
+        `file` or `memory`. The `temp_store` parameter of the database
+        connection string takes precedence. (''since 1.7.1'')""")
+
+    busy_timeout = IntOption('sqlite', 'busy_timeout', 0,
+        """Time in milliseconds to wait for a lock on the database.
+        Use '0' to use the `timeout` parameter of the database
+        connection string, 10 seconds by default. The `busy_timeout`
+        parameter of the database connection string takes precedence.
+        (''since 1.7.1'')""")
+
+    busy_retries = IntOption('sqlite', 'busy_retries', 3,
+        """Number of times the first statement of a transaction or the
+        commit of a transaction is retried, after an increasing delay,
+        when the database is still locked after the `busy_timeout`.
+        (''since 1.7.1'')""")
+
+    optimize_interval = IntOption('sqlite', 'optimize_interval', 3600,
+        """Interval in seconds at which `PRAGMA optimize` is run on the
+        connections, which is also run when a connection is closed.
+        Use '0' to disable. (''since 1.7.1'')""")
+
     memory_cnx = None
 
     def __init__(self):
@@ -176,7 +226,16 @@ class SQLiteConnector(Component):
 
     def get_connection(self, path, log=None, params={}):
         self.required = True
+        params = dict(params)
         params['extensions'] = self._extensions
+        params['busy_retries'] = self.busy_retries
+        params['optimize_interval'] = self.optimize_interval
+        for name in ('mmap_size', 'cache_size', 'busy_timeout'):
+            value = getattr(self, name)
+            if value:
+                params.setdefault(name, value)
+        if self.temp_store != 'default':
+            params.setdefault('temp_store', self.temp_store)
         if path == ':memory:':
             try:
                 self.memory_cnx.cursor()
@@ -210,9 +269,13 @@ class SQLiteConnector(Component):
             # this direct connect will create the database if needed
             cnx = sqlite.connect(path, isolation_level=None,
                                  timeout=int(params.get('timeout', 10000)))
+            journal_mode = params.get('journal_mode')
+            if not journal_mode and sqlite_version >= (3, 7, 0):
+                # readers don't block the writer in WAL mode
+                journal_mode = 'WAL'
             try:
                 with closing(cnx.cursor()) as cursor:
-                    _set_journal_mode(cursor, params.get('journal_mode'))
+                    _set_journal_mode(cursor, journal_mode)
                     set_synchronous(cursor, params.get('synchronous'))
                     insert_schema(cursor, schema)
                 cnx.isolation_level = 'DEFERRED'
@@ -229,11 +292,12 @@ class SQLiteConnector(Component):
         if path != ':memory:':
             if not os.path.isabs(path):
                 path = os.path.join(self.env.path, path)
-            try:
-                os.remove(path)
-            except OSError as e:
-                if e.errno != errno.ENOENT:
-                    raise
+            for suffix in ('', '-wal', '-shm'):
+                try:
+                    os.remove(path + suffix)
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
 
     def db_exists(self, path, log=None, params={}):
         return os.path.exists(path)
@@ -266,7 +330,14 @@ class SQLiteConnector(Component):
         except ValueError:
             pass
         db_name = os.path.join(self.env.path, db_str[7:])
-        shutil.copy(db_name, dest_file)
+        with closing(sqlite.connect(db_name)) as cnx:
+            if hasattr(cnx, 'backup'):
+                # the backup API also copies the content of the WAL file
+                with closing(sqlite.connect(dest_file)) as dest:
+                    cnx.backup(dest)
+            else:
+                cnx.execute('PRAGMA wal_checkpoint(FULL)')
+                shutil.copy(db_name, dest_file)
         if not os.path.exists(dest_file):
             raise TracError(_("No destination file created"))
         return dest_file
@@ -288,7 +359,8 @@ class SQLiteConnector(Component):
 class SQLiteConnection(ConnectionBase, ConnectionWrapper):
     """Connection wrapper for SQLite."""
 
-    __slots__ = ['_active_cursors', '_eager']
+    __slots__ = ['_active_cursors', '_eager', '_busy_retries',
+                 '_optimize_interval', '_optimized']
 
     poolable = sqlite_version >= (3, 3, 8)
 
@@ -327,7 +399,11 @@ class SQLiteConnection(ConnectionBase, ConnectionWrapper):
         with closing(cnx.cursor()) as cursor:
             _set_journal_mode(cursor, params.get('journal_mode'))
             set_synchronous(cursor, params.get('synchronous'))
+            _set_pragmas(cursor, params)
         cnx.isolation_level = 'DEFERRED'
+        self._busy_retries = int(params.get('busy_retries', 0))
+        self._optimize_interval = int(params.get('optimize_interval', 0))
+        self._optimized = time_now()
         ConnectionWrapper.__init__(self, cnx, log)
 
     def cursor(self):
@@ -336,10 +412,38 @@ class SQLiteConnection(ConnectionBase, ConnectionWrapper):
         cursor.cnx = self
         return IterableCursor(cursor, self.log)
 
+    def commit(self):
+        retries = 0
+        while True:
+            try:
+                return self.cnx.commit()
+            except sqlite.OperationalError as e:
+                # the transaction is still active and can be committed
+                # once the readers are done
+                if retries >= self._busy_retries or not _is_busy(e):
+                    raise
+            _wait_busy(retries)
+            retries += 1
+
     def rollback(self):
         for cursor in self._active_cursors:
             cursor.close()
         self.cnx.rollback()
+        if self._optimize_interval and \
+                time_now() - self._optimized >= self._optimize_interval:
+            self._optimize()
+
+    def close(self):
+        if self._optimize_interval:
+            self._optimize()
+        self.cnx.close()
+
+    def _optimize(self):
+        self._optimized = time_now()
+        try:
+            self.cnx.execute('PRAGMA optimize')
+        except sqlite.Error:
+            pass
 
     def cast(self, column, type):
         if sqlite_version >= (3, 2, 3):
@@ -406,6 +510,9 @@ class SQLiteConnection(ConnectionBase, ConnectionWrapper):
     def has_table(self, table):
         return bool(self._get_table_info(table))
 
+    def has_window_functions(self):
+        return sqlite_version >= (3, 25, 0)
+
     def like(self):
         if sqlite_version >= (3, 1, 0):
             return "LIKE %s ESCAPE '/'"
@@ -496,6 +603,37 @@ def _set_journal_mode(cursor, value):
                           value=value, version=sqlite_version_string))
 
 
+def _set_pragmas(cursor, params):
+    for name in ('mmap_size', 'cache_size', 'busy_timeout'):
+        value = params.get(name)
+        if value not in (None, ''):
+            try:
+                value = int(value)
+            except ValueError:
+                raise TracError(_("PRAGMA %(name)s `%(value)s` must be an "
+                                  "integer", name=name, value=value))
+            cursor.execute('PRAGMA %s = %d' % (name, value))
+    value = params.get('temp_store')
+    if value:
+        if value.upper() not in ('DEFAULT', 'FILE', 'MEMORY', '0', '1',
+                                 '2'):
+            raise TracError(_("PRAGMA temp_store `%(value)s` isn't "
+                              "supported", value=value))
+        cursor.execute('PRAGMA temp_store = %s' % value.upper())
+
+
+def _is_busy(e):
+    return isinstance(e, sqlite.OperationalError) and \
+           str(e).startswith('database is locked')
+
+
+def _wait_busy(retries):
+    """Wait before retrying an operation which failed because the
+    database is locked, for an increasing delay with a random jitter.
+    """
+    time.sleep(0.1 * 2 ** retries * random.uniform(0.5, 1.5))
+
+
 def set_synchronous(cursor, value):
     if not value:
         return
@@ -13,6 +13,7 @@
 
 import copy
 import os
+import sqlite3
 import unittest
 
 from trac.config import ConfigurationError
@@ -21,7 +22,8 @@ from trac.db.api import DatabaseManager, get_column_names, \
 from trac.db_default import (schema as default_schema,
                              db_version as default_db_version)
 from trac.db.schema import Column, Table
-from trac.test import EnvironmentStub, get_dburi, makeSuite
+from trac.test import EnvironmentStub, get_dburi, makeSuite, mkdtemp, rmtree
+from trac.util.concurrency import get_thread_id
 
 
 class ParseConnectionStringTestCase(unittest.TestCase):
@@ -314,6 +316,28 @@ class ConnectionTestCase(unittest.TestCase):
                 """):
             self.fail("Transaction was not rolled back")
 
+    def test_call_after_commit(self):
+        """Callbacks are called after the outermost transaction is
+        committed, and dropped when it's rolled back.
+        """
+        calls = []
+        self.dbm.call_after_commit(lambda: calls.append(0))
+        self.assertEqual([0], calls)
+        with self.env.db_transaction:
+            with self.env.db_transaction:
+                self.dbm.call_after_commit(lambda: calls.append(1))
+            self.assertEqual([0], calls)
+        self.assertEqual([0, 1], calls)
+        try:
+            with self.env.db_transaction:
+                self.dbm.call_after_commit(lambda: calls.append(2))
+                raise ValueError
+        except ValueError:
+            pass
+        with self.env.db_transaction:
+            pass
+        self.assertEqual([0, 1], calls)
+
     def test_get_last_id(self):
         q = "INSERT INTO report (author) VALUES ('anonymous')"
         with self.env.db_transaction as db:
@@ -388,6 +412,20 @@ class ConnectionTestCase(unittest.TestCase):
                 self.assertEqual(column_names,
                                  db.get_column_names(table.name))
 
+    def test_has_window_functions(self):
+        self.dbm.insert_into_tables([
+            ('blog', ('author', 'comment'),
+             (('author1', 'comment one'),
+              ('author2', 'comment two'),
+              ('author3', 'comment three'))),
+        ])
+        with self.env.db_query as db:
+            if not db.has_window_functions():
+                self.skipTest("Window functions are not supported")
+            rows = db("""SELECT COUNT(*) OVER (), author FROM blog
+                         ORDER BY author LIMIT 2""")
+        self.assertEqual([(3, 'author1'), (3, 'author2')], rows)
+
     def test_get_column_names_non_existent_table(self):
         with self.assertRaises(self.env.db_exc.OperationalError) as cm:
             self.dbm.get_column_names('blah')
@@ -452,7 +490,7 @@ class DatabaseManagerTestCase(unittest.TestCase):
         new_db_version = default_db_version + 1
         self.dbm.set_database_version(new_db_version)
         self.assertEqual(new_db_version, self.dbm.get_database_version())
-        self.assertEqual([('INFO', 'Upgraded database_version from 45 to 46')],
+        self.assertEqual([('INFO', 'Upgraded database_version from 46 to 47')],
                          self.env.log_messages)
 
         # Restore the previous version to avoid destroying the database
@@ -486,6 +524,70 @@ class DatabaseManagerTestCase(unittest.TestCase):
         self.assertEqual(sequence_names, self.dbm.get_sequence_names())
 
 
+class ReplicaTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentStub()
+        self.dbm = DatabaseManager(self.env)
+        self.tmpdir = mkdtemp()
+        self.replica_path = os.path.join(self.tmpdir, 'replica.db')
+        with sqlite3.connect(self.replica_path) as cnx:
+            cnx.execute("CREATE TABLE system (name text PRIMARY KEY, "
+                        "value text)")
+            cnx.execute("INSERT INTO system VALUES ('marker', 'replica')")
+        cnx.close()
+        self.env.db_transaction("""
+            INSERT INTO system (name, value) VALUES ('marker', 'primary')
+            """)
+        self.env.config.set('trac', 'database_replicas',
+                            'sqlite:' + self.replica_path)
+        self.dbm.shutdown(get_thread_id())  # end of the "request"
+
+    def tearDown(self):
+        for pool in self.dbm._replica_pools or ():
+            pool.shutdown()
+        self.dbm._replica_pools = None
+        self.env.reset_db()
+        rmtree(self.tmpdir)
+
+    def _get_marker(self):
+        return self.env.db_query("""
+            SELECT value FROM system WHERE name='marker'
+            """)[0][0]
+
+    def test_query_from_replica(self):
+        self.assertEqual('replica', self._get_marker())
+        with self.env.db_transaction as db:
+            self.assertEqual('primary', db("""
+                SELECT value FROM system WHERE name='marker'
+                """)[0][0])
+
+    def test_read_own_writes(self):
+        self.env.db_transaction("""
+            UPDATE system SET value='updated' WHERE name='marker'
+            """)
+        self.assertEqual('updated', self._get_marker())
+        self.dbm.shutdown(get_thread_id())
+        self.assertEqual('replica', self._get_marker())
+
+    def test_transaction_within_query(self):
+        with self.env.db_query as rdb:
+            self.assertEqual('replica', rdb("""
+                SELECT value FROM system WHERE name='marker'
+                """)[0][0])
+            with self.env.db_transaction as db:
+                db("UPDATE system SET value='updated' WHERE name='marker'")
+                self.assertEqual('updated', self._get_marker())
+        self.assertEqual('updated', self._get_marker())
+
+    def test_fallback_to_primary(self):
+        self.env.config.set('trac', 'database_replicas',
+                            'sqlite:' + os.path.join(self.tmpdir, 'missing',
+                                                     'replica.db'))
+        self.assertEqual('primary', self._get_marker())
+        self.assertEqual('primary', self._get_marker())
+
+
 class ModifyTableTestCase(unittest.TestCase):
 
     def setUp(self):
@@ -612,6 +714,7 @@ def test_suite():
     suite.addTest(makeSuite(StringsTestCase))
     suite.addTest(makeSuite(ConnectionTestCase))
     suite.addTest(makeSuite(DatabaseManagerTestCase))
+    suite.addTest(makeSuite(ReplicaTestCase))
     suite.addTest(makeSuite(ModifyTableTestCase))
     return suite
 
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2023 Edgewall Software
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution. The terms
+# are also available at https://trac.edgewall.org/wiki/TracLicense.
+#
+# This software consists of voluntary contributions made by many
+# individuals. For the exact contribution history, see the revision
+# history and logs, available at https://trac.edgewall.org/log/.
+
+import unittest
+
+from trac.db.pool import ConnectionPoolBackend, TimeoutError
+from trac.test import Mock, makeSuite
+from trac.util.concurrency import threading
+
+
+class Connection(object):
+
+    poolable = True
+
+    def __init__(self, path):
+        self.path = path
+        self.closed = False
+        self.pings = 0
+        self.broken = False
+
+    def close(self):
+        self.closed = True
+
+    def rollback(self):
+        pass
+
+    def ping(self):
+        self.pings += 1
+        if self.broken:
+            raise Exception("Connection lost")
+
+
+class Connector(object):
+
+    def __init__(self):
+        self.connections = []
+
+    def get_connection(self, path, log=None):
+        cnx = Connection(path)
+        self.connections.append(cnx)
+        return cnx
+
+
+class ConnectionPoolBackendTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = ConnectionPoolBackend(2)
+        self.connector = Connector()
+
+    def tearDown(self):
+        self.backend.shutdown()
+
+    def _get_cnx(self, path='db1', timeout=None):
+        return self.backend.get_cnx(self.connector, {'path': path}, timeout)
+
+    def _run_in_thread(self, func):
+        result = []
+        thread = threading.Thread(target=lambda: result.append(func()))
+        thread.start()
+        thread.join()
+        return result[0]
+
+    def test_reuse_pooled_connection(self):
+        db = self._get_cnx()
+        cnx = db.cnx
+        db.close()
+        db = self._get_cnx()
+        self.assertIs(cnx, db.cnx)
+        self.assertEqual(1, cnx.pings)
+        db.close()
+        stats = self.backend.get_stats()
+        self.assertEqual(2, stats['checkouts'])
+        self.assertEqual(1, stats['creations'])
+        self.assertEqual(1, stats['pings'])
+        self.assertEqual(0, stats['active'])
+        self.assertEqual(1, stats['idle'])
+
+    def test_free_lists_per_key(self):
+        db1 = self._get_cnx('db1')
+        db2 = self._run_in_thread(lambda: self._get_cnx('db2'))
+        cnx1, cnx2 = db1.cnx, db2.cnx
+        db2.close()
+        db1.close()
+        db = self._get_cnx('db2')
+        self.assertIs(cnx2, db.cnx)
+        db.close()
+        db = self._get_cnx('db1')
+        self.assertIs(cnx1, db.cnx)
+        db.close()
+
+    def test_replace_lru_connection(self):
+        db1 = self._get_cnx('db1')
+        db2 = self._run_in_thread(lambda: self._get_cnx('db2'))
+        cnx1 = db1.cnx
+        db1.close()
+        db2.close()
+        db = self._get_cnx('db3')
+        self.assertTrue(cnx1.closed)
+        self.assertEqual('db3', db.cnx.path)
+        db.close()
+        self.assertEqual(2, self.backend.get_stats()['idle'])
+
+    def test_broken_connection_replaced(self):
+        db = self._get_cnx()
+        cnx = db.cnx
+        db.close()
+        cnx.broken = True
+        db = self._get_cnx()
+        self.assertIsNot(cnx, db.cnx)
+        db.close()
+        stats = self.backend.get_stats()
+        self.assertEqual(1, stats['failures'])
+        self.assertEqual(2, stats['creations'])
+
+    def test_waiter_times_out(self):
+        self.backend.configure("{'path': 'db1'}", maxsize=1)
+        db = self._get_cnx()
+        errors = []
+
+        def get_cnx():
+            try:
+                self._get_cnx(timeout=0.1)
+            except TimeoutError as e:
+                errors.append(e)
+        thread = threading.Thread(target=get_cnx)
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(1, len(errors))
+        db.close()
+        stats = self.backend.get_stats()
+        self.assertEqual(1, stats['waits'])
+        self.assertEqual(1, stats['timeouts'])
+        self.assertGreater(stats['wait_time'], 0)
+
+    def test_configure_maxsize(self):
+        self.backend.configure('key1', maxsize=5)
+        self.backend.configure('key2', maxsize=3)
+        self.assertEqual(5, self.backend.get_stats()['maxsize'])
+        self.backend.configure('key1', maxsize=0)
+        self.assertEqual(3, self.backend.get_stats()['maxsize'])
+        self.backend.configure('key2', maxsize=0)
+        self.assertEqual(2, self.backend.get_stats()['maxsize'])
+
+    def test_shutdown_closes_idle_connections(self):
+        key = "{'path': 'db1'}"
+        self.backend.configure(key, idle_timeout=0)
+        db = self._get_cnx()
+        cnx = db.cnx
+        db.close()
+        self.backend.shutdown(threading.get_ident())
+        self.assertTrue(cnx.closed)
+        self.assertEqual(0, self.backend.get_stats()['idle'])
+
+    def test_maintain(self):
+        key = "{'path': 'db1'}"
+        db1 = self._get_cnx()
+        db2 = self._run_in_thread(lambda: self._get_cnx())
+        cnx1, cnx2 = db1.cnx, db2.cnx
+        db1.close()
+        db2.close()
+        cnx2.broken = True
+        # check all the idle connections
+        self.backend.configure(key, idle_timeout=3600, ping_interval=-1)
+        self.backend.maintain()
+        self.assertEqual(1, cnx1.pings)
+        self.assertFalse(cnx1.closed)
+        self.assertTrue(cnx2.closed)
+        stats = self.backend.get_stats()
+        self.assertEqual(1, stats['idle'])
+        self.assertEqual(1, stats['failures'])
+
+        self.backend.configure(key, idle_timeout=3600, ping_interval=3600)
+        db = self._get_cnx()
+        self.assertIs(cnx1, db.cnx)
+        self.assertEqual(1, cnx1.pings)  # not pinged again on checkout
+        db.close()
+
+        self.backend.configure(key, idle_timeout=0, ping_interval=3600)
+        self.backend.maintain()
+        self.assertTrue(cnx1.closed)
+        self.assertEqual(0, self.backend.get_stats()['idle'])
+
+    def test_maintain_failure_logged(self):
+        key = "{'path': 'db1'}"
+        logged = threading.Event()
+        messages = []
+        def error(msg, *args):
+            messages.append(msg % args)
+            logged.set()
+        def maintain():
+            raise Exception("Maintenance failed")
+        self.backend.maintain = maintain
+        self.backend.configure(key, ping_interval=0.01,
+                               log=Mock(error=error))
+        self._get_cnx().close()
+        self.assertTrue(logged.wait(5))
+        self.assertIn('Maintenance failed', messages[0])
+
+
+def test_suite():
+    return makeSuite(ConnectionPoolBackendTestCase)
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')
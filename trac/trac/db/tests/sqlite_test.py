@@ -19,11 +19,12 @@ import unittest
 from trac.config import ConfigurationError
 from trac.db.api import DatabaseManager
 from trac.db.schema import Column, Index, Table
-from trac.db.sqlite_backend import sqlite_version
+from trac.db.sqlite_backend import sqlite, sqlite_version
 from trac.env import Environment
 from trac.test import EnvironmentStub, MockRequest, get_dburi, makeSuite, \
                       mkdtemp, rmtree
 from trac.util import translation
+from trac.util.concurrency import threading
 
 
 class DatabaseFileTestCase(unittest.TestCase):
@@ -103,6 +104,83 @@ class DatabaseFileTestCase(unittest.TestCase):
             translation.deactivate()
 
 
+    @unittest.skipIf(sqlite_version < (3, 7, 0), "WAL isn't supported")
+    def test_wal_for_new_environment(self):
+        self._create_env()
+        self.env = Environment(self.env_path)
+        self.assertEqual([('wal',)], self._pragma('journal_mode'))
+
+    def test_pragmas(self):
+        self._create_env()
+        self.env = Environment(self.env_path)
+        self.env.config.set('sqlite', 'cache_size', '-4000')
+        self.env.config.set('sqlite', 'temp_store', 'memory')
+        self.env.config.set('sqlite', 'busy_timeout', '1234')
+        self.assertEqual([(-4000,)], self._pragma('cache_size'))
+        self.assertEqual([(2,)], self._pragma('temp_store'))
+        self.assertEqual([(1234,)], self._pragma('busy_timeout'))
+
+    def _pragma(self, name):
+        with self.env.db_query as db:
+            cursor = db.cursor()
+            cursor.execute("PRAGMA %s" % name)
+            return cursor.fetchall()
+
+    def _lock_database(self, delay):
+        cnx = sqlite.connect(self.db_path, isolation_level=None,
+                             check_same_thread=False)
+        cnx.execute("BEGIN IMMEDIATE")
+
+        def release():
+            cnx.rollback()
+            cnx.close()
+        timer = threading.Timer(delay, release)
+        timer.start()
+        return timer
+
+    def _insert(self):
+        self.env.db_transaction("""
+            INSERT INTO system (name, value) VALUES ('test', '1')
+            """)
+
+    def test_retry_when_busy(self):
+        self._create_env()
+        self.env = Environment(self.env_path)
+        self.env.config.set('sqlite', 'busy_timeout', '10')
+        self.env.config.set('sqlite', 'busy_retries', '5')
+        timer = self._lock_database(0.3)
+        try:
+            self._insert()
+        finally:
+            timer.join()
+        self.assertEqual([('1',)], self.env.db_query("""
+            SELECT value FROM system WHERE name='test'
+            """))
+
+    def test_no_retry_when_busy(self):
+        self._create_env()
+        self.env = Environment(self.env_path)
+        self.env.config.set('sqlite', 'busy_timeout', '10')
+        self.env.config.set('sqlite', 'busy_retries', '0')
+        timer = self._lock_database(0.3)
+        try:
+            self.assertRaises(sqlite.OperationalError, self._insert)
+        finally:
+            timer.join()
+
+    def test_backup_with_wal(self):
+        self._create_env()
+        self.env = Environment(self.env_path)
+        self._insert()
+        dest = os.path.join(self.env_path, 'backup.db')
+        self.env.backup(dest)
+        with sqlite.connect(dest) as cnx:
+            self.assertEqual([('1',)], cnx.execute("""
+                SELECT value FROM system WHERE name='test'
+                """).fetchall())
+        cnx.close()
+
+
 class SQLiteConnectionTestCase(unittest.TestCase):
 
     if sqlite_version < (3, 37, 0):
@@ -17,7 +17,7 @@
 from trac.db.schema import Table, Column, Index
 
 # Database version identifier. Used for automatic upgrades.
-db_version = 45
+db_version = 46
 
 def __mkreports(reports):
     """Utility function used to create report data in same syntax as the
@@ -191,6 +191,13 @@ schema = [
         Column('target'),
         Index(['sid', 'authenticated', 'class']),
         Index(['class', 'realm', 'target'])],
+
+    # Search index
+    Table('search_index', key=('realm', 'id', 'term'))[
+        Column('realm'),
+        Column('id'),
+        Column('term'),
+        Index(['realm', 'term'])],
 ]
 
 
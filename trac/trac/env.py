@@ -16,6 +16,7 @@
 
 """Trac Environment model and related APIs."""
 
+import bisect
 from contextlib import contextmanager
 import hashlib
 import os.path
@@ -502,7 +503,9 @@ class Environment(Component, ComponentManager):
     def shutdown(self, tid=None):
         """Close the environment."""
         from trac.versioncontrol.api import RepositoryManager
+        from trac.web.session import SessionStore
         RepositoryManager(self).shutdown(tid)
+        SessionStore(self).shutdown(tid)
         DatabaseManager(self).shutdown(tid)
         if tid is None:
             log.shutdown(self.log)
@@ -737,6 +740,43 @@ class Environment(Component, ComponentManager):
         del self._known_users
         del self._known_users_dict
 
+    def get_known_user_info(self, username):
+        """Returns the (name, email) tuple of the given known user, or
+        `None` if the user isn't known.
+
+        :since: 1.7.1
+        """
+        return self._known_users_dict.get(username)
+
+    def update_known_user(self, username, name, email):
+        """Add or update a single entry of the known_users cache, when
+        the name or email of an authenticated session is saved.
+
+        Unlike `invalidate_known_users_cache`, the cached data is not
+        retrieved again from the whole session table by this process.
+        The other processes only avoid retrieving it again when the
+        cache backend is shared, see `CacheManager.update`.
+
+        :since: 1.7.1
+        """
+        def update_list(users):
+            users = list(users)
+            idx = bisect.bisect_left([u[0] for u in users], username)
+            if idx < len(users) and users[idx][0] == username:
+                users[idx] = (username, name, email)
+            else:
+                users.insert(idx, (username, name, email))
+            return users
+
+        def update_dict(users):
+            users = dict(users)
+            users[username] = (name, email)
+            return users
+
+        with self.db_transaction:
+            type(self)._known_users.update(self, update_list)
+            type(self)._known_users_dict.update(self, update_dict)
+
     def backup(self, dest=None):
         """Create a backup of the database.
 
@@ -1025,9 +1065,10 @@ class EnvironmentAdmin(Component):
 
         if prefix == 'sqlite':
             db_path = os.path.join(self.env.path, os.path.normpath(db_path))
-            # don't copy the journal (also, this would fail on Windows)
+            # don't copy the journal (also, this would fail on Windows),
+            # but copy the WAL file which contains the last changes
             skip = [db_path + '-journal', db_path + '-stmtjrnl',
-                    db_path + '-shm', db_path + '-wal']
+                    db_path + '-shm']
             if no_db:
                 skip.append(db_path)
 
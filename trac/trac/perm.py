@@ -161,6 +161,27 @@ class IPermissionPolicy(Interface):
         this will probably change in the future (e.g. `'VIEW' in ...`).
         """
 
+    def check_permissions(action, username, resources, perm):
+        """Check that the action can be performed by username on each
+        of the resources.
+
+        :param resources: the list of resources on which the check
+                          applies, which may contain `None` for a global
+                          check.
+        :param perm: the permission cache for that username, which is
+                     not specific to any of the resources.
+
+        :return: a sequence of decisions, one for each resource, with
+                 the same meaning as the return value of
+                 `check_permission`.
+
+        This method is optional. It lets the policy decide on the
+        results of a query, the events of the timeline, etc., at once,
+        instead of checking each resource in turn.
+
+        :since: 1.7.1
+        """
+
 
 class DefaultPermissionStore(Component):
     """Default implementation of permission storage and group management.
@@ -172,6 +193,9 @@ class DefaultPermissionStore(Component):
 
     group_providers = ExtensionPoint(IPermissionGroupProvider)
 
+    def __init__(self):
+        self._permission_index = None
+
     # IPermissionGroupProvider methods
 
     def get_permission_groups(self, username):
@@ -203,16 +227,24 @@ class DefaultPermissionStore(Component):
 
         Users are returned as a list of usernames.
         """
-        # get_user_permissions() takes care of the magic 'authenticated'
-        # group. The optimized loop we had before didn't. This is very
-        # inefficient, but it works.
+        index = self._index
+        holders = set()
+        for permission in permissions:
+            holders.update(index.holders.get(permission, ()))
+        if not holders:
+            return []
+        # The groups of the other providers, such as the magic
+        # 'authenticated' group, are only known per user
+        providers = [provider for provider in self.group_providers
+                              if provider is not self]
         result = set()
-        users = {u[0] for u in self.env.get_known_users()}
-        for user in users:
-            user_perms = self.get_user_permissions(user)
-            for group in permissions:
-                if group in user_perms:
-                    result.add(user)
+        for user in {u[0] for u in self.env.get_known_users()}:
+            if user in holders or \
+                    any(group in holders
+                        for provider in providers
+                        for group in provider.get_permission_groups(user)
+                                     or []):
+                result.add(user)
         return sorted(result)
 
     def get_all_permissions(self):
@@ -248,26 +280,61 @@ class DefaultPermissionStore(Component):
                           SELECT username, action FROM permission
                           """))
 
+    @property
+    def _index(self):
+        """The `_PermissionIndex` of the permissions, built again after
+        each change of the `permission` table."""
+        permissions = self._all_permissions
+        index = self._permission_index
+        if index is None or index.permissions is not permissions:
+            index = self._permission_index = _PermissionIndex(permissions)
+        return index
+
     def _get_actions_and_groups(self, subjects):
         """Get actions and groups for `subjects`, an iterable of username
         and groups that username is a member of.
         """
         actions = set()
         groups = set()
-        perms = self._all_permissions
-        while True:
-            num_users = len(subjects)
-            num_actions = len(actions)
-            for user, action in perms:
-                if user in subjects:
+        index = self._index
+        for subject in subjects:
+            actions.update(index.actions.get(subject, ()))
+            groups.update(index.groups.get(subject, ()))
+        return actions, groups
+
+
+class _PermissionIndex(object):
+    """Actions and groups of each subject of the `permission` table,
+    with the groups expanded recursively, and subjects possessing each
+    action.
+    """
+
+    def __init__(self, permissions):
+        self.permissions = permissions
+        members = {}
+        for subject, action in permissions:
+            members.setdefault(subject, []).append(action)
+        self.actions = {}
+        self.groups = {}
+        self.holders = {}
+        for subject in members:
+            actions = set()
+            groups = set()
+            seen = {subject}
+            stack = [subject]
+            while stack:
+                for action in members.get(stack.pop(), ()):
                     if action.isupper():
                         actions.add(action)
-                    if not action.isupper():  # permission group
-                        subjects.add(action)
+                    else:  # permission group
                         groups.add(action)
-            if num_users == len(subjects) and num_actions == len(actions):
-                break
-        return actions, groups
+                        if action not in seen:
+                            seen.add(action)
+                            stack.append(action)
+            self.actions[subject] = frozenset(actions)
+            self.groups[subject] = frozenset(groups)
+            for action in actions:
+                self.holders.setdefault(action, set()).add(subject)
 
 
 class DefaultPermissionGroupProvider(Component):
@@ -321,6 +388,11 @@ class DefaultPermissionPolicy(Component):
 
         return action in permissions or None
 
+    def check_permissions(self, action, username, resources, perm):
+        # The decision doesn't depend on the resource
+        decision = self.check_permission(action, username, None, perm)
+        return [decision] * len(resources)
+
 
 class PermissionSystem(Component):
     """Permission management sub-system."""
@@ -571,6 +643,58 @@ class PermissionSystem(Component):
                        username, action, resource)
         return False
 
+    def check_permissions(self, action, username, resources, perm=None):
+        """Return a list of booleans telling whether permission to
+        perform action is allowed for each of the given resources.
+
+        The policies implementing `IPermissionPolicy.check_permissions`
+        decide on all the resources left undecided at once, the others
+        on each resource in turn.
+
+        :param perm: the `PermissionCache` for that username.
+
+        :since: 1.7.1
+        """
+        if username is None:
+            username = 'anonymous'
+        resources = [None if resource and resource.realm is None
+                     else resource for resource in resources]
+        decisions = [False] * len(resources)
+        pending = list(range(len(resources)))
+        for policy in self.policies:
+            if not pending:
+                break
+            if hasattr(policy, 'check_permissions'):
+                results = policy.check_permissions(
+                    action, username, [resources[idx] for idx in pending],
+                    perm)
+            else:
+                results = []
+                for idx in pending:
+                    resource = resources[idx]
+                    if perm is not None:
+                        resource_perm = PermissionCache(self.env, username,
+                                                        resource, perm._cache)
+                    else:
+                        resource_perm = None
+                    results.append(policy.check_permission(
+                        action, username, resource, resource_perm))
+            undecided = []
+            for idx, decision in zip(pending, results):
+                if decision is None:
+                    undecided.append(idx)
+                    continue
+                self.log.debug("%s %s %s performing %s on %r",
+                               policy.__class__.__name__,
+                               'allows' if decision else 'denies',
+                               username, action, resources[idx])
+                decisions[idx] = decision
+            pending = undecided
+        for idx in pending:
+            self.log.debug("No policy allowed %s performing %s on %r",
+                           username, action, resources[idx])
+        return decisions
+
     # IPermissionRequestor methods
 
     def get_permission_actions(self):
@@ -672,6 +796,35 @@ class PermissionCache(object):
 
     __contains__ = has_permission
 
+    def filter_allowed(self, action, resources):
+        """Return the list of the `resources` on which `action` is
+        allowed.
+
+        This is equivalent to checking `action in perm(resource)` for
+        each resource, but the permission policies supporting it decide
+        on all the resources at once. The decisions are cached as for
+        the individual checks.
+
+        :since: 1.7.1
+        """
+        resources = list(resources)
+        pending = {}
+        for resource in resources:
+            key = (self.username, hash(resource), action)
+            cached = self._cache.get(key)
+            if not (cached and resource == cached[1]) and key not in pending:
+                pending[key] = resource
+        if pending:
+            # Avoid recursion in policies that call has_permission.
+            for key, resource in pending.items():
+                self._cache[key] = (False, resource)
+            decisions = PermissionSystem(self.env).check_permissions(
+                action, self.username, list(pending.values()), self)
+            for (key, resource), decision in zip(pending.items(), decisions):
+                self._cache[key] = (decision, resource)
+        return [resource for resource in resources
+                         if self._has_permission(action, resource)]
+
     def require(self, action, realm_or_resource=None, id=False, version=False,
                 message=None):
         resource = self._normalize_resource(realm_or_resource, id, version)
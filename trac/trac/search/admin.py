@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2023 Edgewall Software
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution. The terms
+# are also available at https://trac.edgewall.org/wiki/TracLicense.
+#
+# This software consists of voluntary contributions made by many
+# individuals. For the exact contribution history, see the revision
+# history and logs, available at https://trac.edgewall.org/log/.
+
+import sys
+
+from trac.admin import AdminCommandError, IAdminCommandProvider
+from trac.core import *
+from trac.search.api import SearchIndex
+from trac.util.text import printout
+from trac.util.translation import _, ngettext
+
+
+class SearchAdmin(Component):
+    """trac-admin command provider for search index administration."""
+
+    implements(IAdminCommandProvider)
+
+    # IAdminCommandProvider methods
+
+    def get_admin_commands(self):
+        yield ('search reindex', '[realm] [...]',
+               """Rebuild the full-text search index
+
+               When one or more realms are specified, only the documents of
+               these realms are reindexed. Otherwise, the documents of all
+               the realms are reindexed. Note that this operation can take
+               a long time to complete.
+
+               The index is only used when the [search] use_index option
+               is enabled.
+               """,
+               self._complete_reindex, self._do_reindex)
+
+    def _complete_reindex(self, args):
+        return SearchIndex(self.env).get_realms()
+
+    def _do_reindex(self, *realms):
+        search_index = SearchIndex(self.env)
+        if realms:
+            available = search_index.get_realms()
+            for realm in realms:
+                if realm not in available:
+                    raise AdminCommandError(
+                        _("Unknown search index realm: %(realm)s",
+                          realm=realm))
+        count = search_index.reindex(realms or None, self._reindex_feedback)
+        # Erase to end of line.
+        sys.stdout.write('\033[K')
+        printout(ngettext('%(num)s document indexed.',
+                          '%(num)s documents indexed.', num=count))
+
+    def _reindex_feedback(self, realm, count):
+        sys.stdout.write(' [%s: %d]\r' % (realm, count))
+        sys.stdout.flush()
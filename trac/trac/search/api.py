@@ -11,9 +11,13 @@
 # individuals. For the exact contribution history, see the revision
 # history and logs, available at https://trac.edgewall.org/log/.
 
+from operator import itemgetter
+import heapq
 import re
 
+from trac.config import BoolOption, ExtensionOption
 from trac.core import *
+from trac.util.html import Fragment
 
 
 class ISearchSource(Interface):
@@ -40,6 +44,340 @@ class ISearchSource(Interface):
         `(href, title, date, author, excerpt).`
         """
 
+    def get_ranked_search_results(req, terms, filters, limit):
+        """Return an iterable of the search results matching each search
+        term in `terms`, ordered by decreasing date.
+
+        The results are tuples like those returned by
+        `get_search_results`, except that the `title` and `excerpt` can
+        also be callables taking no arguments. These are only called for
+        the results actually displayed (see `expand_search_result`).
+
+        The iterable is consumed lazily and only the first results are
+        used, so the results should be produced on demand. `limit` is
+        the number of results the caller will consume at most, or `None`
+        if all the results are needed. It can be used for fetching the
+        database rows in chunks (see `iter_search_rows`).
+
+        This method is optional. When it isn't implemented, the results
+        of `get_search_results` are sorted. (''since 1.7.1'')
+        """
+
+
+class ISearchIndexer(Interface):
+    """Extension point interface for components providing the documents
+    stored in the full-text search index.
+
+    The implementations are also responsible for keeping their documents
+    up to date, usually by calling `SearchIndex.index_document` and
+    `SearchIndex.remove_document` from their change listeners.
+
+    :since: 1.7.1
+    """
+
+    def get_search_index_realms():
+        """Return an iterable of the realms for which documents are
+        provided.
+        """
+
+    def get_search_index_documents(realm):
+        """Return an iterable of `(id, text)` tuples for all the
+        documents of the given `realm`.
+
+        The `id` is a string identifying the document in the realm and
+        `text` is the searchable text of the document.
+        """
+
+
+class ISearchIndexBackend(Interface):
+    """Extension point interface for components storing the full-text
+    search index.
+
+    :since: 1.7.1
+    """
+
+    def index_document(realm, id, tokens):
+        """Store the document `id` of `realm`, replacing any previously
+        indexed version of it.
+
+        `tokens` is a set of normalized words (see `tokenize_search_text`).
+        """
+
+    def remove_document(realm, id):
+        """Remove the document `id` of `realm` from the index."""
+
+    def remove_documents(realm):
+        """Remove all the documents of `realm` from the index."""
+
+    def find_documents(realm, tokens):
+        """Return the set of ids of the documents of `realm` containing
+        a word starting with each of the given `tokens`.
+        """
+
+    def get_documents_query(db, realm, tokens):
+        """Return `(sql, args)` of a query selecting the `id` column of
+        the documents of `realm` containing a word starting with each of
+        the given `tokens`.
+
+        The query is used as a sub-query by the search sources, so that
+        the number of matching documents doesn't affect the size of
+        their queries.
+        """
+
+
+class DatabaseSearchIndexBackend(Component):
+    """Store the full-text search index in the `search_index` table of
+    the Trac database.
+
+    The table holds one row per distinct word and document, so that
+    looking up a word is an indexed prefix match rather than a scan of
+    the indexed tables.
+    """
+
+    implements(ISearchIndexBackend)
+
+    # ISearchIndexBackend methods
+
+    def index_document(self, realm, id, tokens):
+        with self.env.db_transaction as db:
+            db("DELETE FROM search_index WHERE realm=%s AND id=%s",
+               (realm, id))
+            db.executemany("""
+                INSERT INTO search_index (realm, id, term) VALUES (%s,%s,%s)
+                """, [(realm, id, token) for token in sorted(tokens)])
+
+    def remove_document(self, realm, id):
+        self.env.db_transaction(
+            "DELETE FROM search_index WHERE realm=%s AND id=%s", (realm, id))
+
+    def remove_documents(self, realm):
+        self.env.db_transaction("DELETE FROM search_index WHERE realm=%s",
+                                (realm,))
+
+    def find_documents(self, realm, tokens):
+        ids = None
+        with self.env.db_query as db:
+            # Longer words are usually more selective, look them up first
+            for token in sorted(set(tokens), key=len, reverse=True):
+                found = {id_ for id_, in db("""
+                    SELECT DISTINCT id FROM search_index
+                    WHERE realm=%s AND term """ + db.prefix_match(),
+                    (realm, db.prefix_match_value(token)))}
+                ids = found if ids is None else ids & found
+                if not ids:
+                    break
+        return ids or set()
+
+    def get_documents_query(self, db, realm, tokens):
+        # Longer words are usually more selective, the outermost query
+        # looks up the longest one
+        sql = args = None
+        for token in sorted(set(tokens), key=len):
+            query = """SELECT id FROM search_index
+                       WHERE realm=%s AND term """ + db.prefix_match()
+            query_args = [realm, db.prefix_match_value(token)]
+            if sql:
+                query += " AND id IN (%s)" % sql
+                query_args.extend(args)
+            sql, args = query, query_args
+        return sql, args
+
+
+class SearchIndex(Component):
+    """Full-text search index used by the search sources in place of
+    `LIKE` scans of the indexed tables.
+
+    The index is only maintained and used when `[search] use_index` is
+    enabled. It must be populated with `trac-admin $ENV search reindex`
+    after enabling it.
+
+    :since: 1.7.1
+    """
+
+    indexers = ExtensionPoint(ISearchIndexer)
+
+    use_index = BoolOption('search', 'use_index', 'false',
+        """Maintain a full-text search index and use it for searching
+        tickets, wiki pages, changesets and attachments, instead of
+        scanning the database tables.
+
+        The index matches whole words and word prefixes, rather than
+        arbitrary substrings. Run `trac-admin $ENV search reindex`
+        after enabling this option, and after a repository `resync`.
+        (''since 1.7.1'')
+        """)
+
+    backend = ExtensionOption('search', 'index_backend',
+                              ISearchIndexBackend,
+                              'DatabaseSearchIndexBackend',
+        """Name of the component implementing `ISearchIndexBackend`,
+        which is used for storing the full-text search index.
+        (''since 1.7.1'')
+        """)
+
+    def get_realms(self):
+        """Return the sorted list of the realms provided by the
+        `ISearchIndexer`s, whether or not documents of these realms
+        have been indexed yet.
+        """
+        return sorted(realm for indexer in self.indexers
+                            for realm in indexer.get_search_index_realms())
+
+    def index_document(self, realm, id, text):
+        """Add or update the document `id` of `realm` in the index.
+
+        Does nothing if the index is not enabled.
+        """
+        if self.use_index:
+            self.backend.index_document(realm, str(id),
+                                        set(tokenize_search_text(text)))
+
+    def remove_document(self, realm, id):
+        """Remove the document `id` of `realm` from the index.
+
+        Does nothing if the index is not enabled.
+        """
+        if self.use_index:
+            self.backend.remove_document(realm, str(id))
+
+    def find_documents(self, realm, terms):
+        """Return the set of ids of the documents of `realm` matching
+        all the search `terms`.
+
+        `None` is returned when the index is not enabled or when it
+        can't be used for the given terms, in which case the caller
+        should fall back to `search_to_sql`.
+        """
+        tokens = self._get_tokens(terms)
+        if tokens is None:
+            return None
+        return self.backend.find_documents(realm, tokens)
+
+    def get_documents_query(self, db, realm, terms):
+        """Return `(sql, args)` of a query selecting the `id` column of
+        the documents of `realm` matching all the search `terms`, to be
+        used as a sub-query.
+
+        `None` is returned when the index is not enabled or when it
+        can't be used for the given terms, like `find_documents`.
+        """
+        tokens = self._get_tokens(terms)
+        if tokens is None:
+            return None
+        return self.backend.get_documents_query(db, realm, tokens)
+
+    def reindex(self, realms=None, feedback=None):
+        """Rebuild the index for the given `realms`, or for all the
+        indexed realms if `None`.
+
+        `feedback` is called with the realm and the number of
+        documents indexed so far, every 100 documents and at the end
+        of each realm.
+
+        :return: the number of indexed documents.
+        """
+        total = 0
+        for indexer in self.indexers:
+            for realm in indexer.get_search_index_realms():
+                if realms is not None and realm not in realms:
+                    continue
+                with self.env.db_transaction:
+                    self.backend.remove_documents(realm)
+                    count = 0
+                    for id, text in indexer.get_search_index_documents(realm):
+                        self.backend.index_document(
+                            realm, str(id), set(tokenize_search_text(text)))
+                        count += 1
+                        if feedback and count % 100 == 0:
+                            feedback(realm, count)
+                if feedback:
+                    feedback(realm, count)
+                total += count
+        return total
+
+    def _get_tokens(self, terms):
+        if not self.use_index:
+            return None
+        tokens = []
+        for term in terms:
+            term_tokens = tokenize_search_text(term)
+            if not term_tokens:
+                return None
+            tokens.extend(term_tokens)
+        return tokens
+
+
+_search_token_re = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize_search_text(text):
+    """Split `text` into the lower-cased words stored in the full-text
+    search index.
+
+    Numbers are also returned without their leading zeros.
+
+    >>> tokenize_search_text('Fix #0042: crash in Foo.bar()')
+    ['fix', '0042', '42', 'crash', 'in', 'foo', 'bar']
+    """
+    tokens = []
+    for token in _search_token_re.findall(text.lower() if text else ''):
+        tokens.append(token)
+        if token.isdigit() and token[0] == '0' and token.strip('0'):
+            tokens.append(token.lstrip('0'))
+    return tokens
+
+
+def iter_search_rows(db, sql, args, chunk_size):
+    """Iterate over the rows returned by the `sql` query, fetching at
+    most `chunk_size` rows at a time.
+
+    The query must be ordered on unique keys so that successive chunks
+    are consistent. If `chunk_size` is `None`, all the rows are fetched
+    at once.
+
+    :since: 1.7.1
+    """
+    if not chunk_size:
+        for row in db(sql, args):
+            yield row
+        return
+    offset = 0
+    while True:
+        rows = db(sql + " LIMIT %s OFFSET %s",
+                  tuple(args) + (chunk_size, offset))
+        for row in rows:
+            yield row
+        if len(rows) < chunk_size:
+            break
+        offset += chunk_size
+
+
+def merge_search_results(*iterables):
+    """Merge iterables of search results which are ordered by decreasing
+    date into a single iterable, ordered the same way.
+
+    The iterables are consumed lazily.
+
+    :since: 1.7.1
+    """
+    return heapq.merge(*iterables, key=itemgetter(2), reverse=True)
+
+
+def expand_search_result(result):
+    """Return the search `result` tuple with its `title` and `excerpt`
+    computed, if they were given as callables.
+
+    :since: 1.7.1
+    """
+    def expand(value):
+        # `Fragment`s are callable, but are already computed
+        if callable(value) and not isinstance(value, Fragment):
+            return value()
+        return value
+
+    href, title, date, author, excerpt = result
+    return href, expand(title), date, author, expand(excerpt)
+
 
 def search_to_sql(db, columns, terms):
     """Convert a search query into an SQL WHERE clause and corresponding
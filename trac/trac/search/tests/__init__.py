@@ -13,12 +13,13 @@
 
 import unittest
 
-from trac.search.tests import web_ui
+from trac.search.tests import api, web_ui
 from trac.search.tests.functional import functionalSuite
 
 
 def test_suite():
     suite = unittest.TestSuite()
+    suite.addTest(api.test_suite())
     suite.addTest(web_ui.test_suite())
     return suite
 
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2023 Edgewall Software
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution. The terms
+# are also available at https://trac.edgewall.org/wiki/TracLicense.
+#
+# This software consists of voluntary contributions made by many
+# individuals. For the exact contribution history, see the revision
+# history and logs, available at https://trac.edgewall.org/log/.
+
+import itertools
+import unittest
+
+from trac.search.api import (
+    SearchIndex, expand_search_result, iter_search_rows,
+    merge_search_results, tokenize_search_text
+)
+from trac.test import EnvironmentStub, MockRequest, makeSuite
+from trac.ticket.test import insert_ticket
+from trac.ticket.web_ui import TicketModule
+from trac.util.html import tag
+from trac.wiki.model import WikiPage
+from trac.wiki.web_ui import WikiModule
+
+
+class TokenizeSearchTextTestCase(unittest.TestCase):
+
+    def test_words(self):
+        self.assertEqual(['fix', 'crash', 'in', 'foo', 'bar'],
+                         tokenize_search_text('Fix crash in Foo.bar()'))
+
+    def test_numbers(self):
+        self.assertEqual(['0042', '42', '0', '10'],
+                         tokenize_search_text('0042 0 10'))
+
+    def test_empty(self):
+        self.assertEqual([], tokenize_search_text(None))
+        self.assertEqual([], tokenize_search_text('#!/'))
+
+
+class SearchResultsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentStub()
+
+    def tearDown(self):
+        self.env.reset_db()
+
+    def test_iter_search_rows(self):
+        with self.env.db_transaction as db:
+            db.executemany("INSERT INTO system (name, value) VALUES (%s,%s)",
+                           [('search%02d' % i, str(i)) for i in range(25)])
+        expected = [(str(i),) for i in range(25)]
+
+        with self.env.db_query as db:
+            sql = "SELECT value FROM system WHERE name %s ORDER BY name" \
+                  % db.prefix_match()
+            args = (db.prefix_match_value('search'),)
+            self.assertEqual(expected,
+                             list(iter_search_rows(db, sql, args, None)))
+            self.assertEqual(expected,
+                             list(iter_search_rows(db, sql, args, 10)))
+            self.assertEqual(expected,
+                             list(iter_search_rows(db, sql, args, 25)))
+            self.assertEqual(expected[:3],
+                             list(itertools.islice(
+                                 iter_search_rows(db, sql, args, 2), 3)))
+
+    def test_merge_search_results(self):
+        def results(*dates):
+            for date in dates:
+                yield ('/%d' % date, 'title', date, 'author', 'excerpt')
+
+        merged = merge_search_results(results(9, 5, 1), results(),
+                                      results(8, 7, 2))
+        self.assertEqual([9, 8, 7, 5, 2, 1], [r[2] for r in merged])
+
+    def test_expand_search_result(self):
+        title = tag.span('title')
+        result = ('/1', title, 1, 'author', lambda: 'excerpt')
+        self.assertEqual(('/1', title, 1, 'author', 'excerpt'),
+                         expand_search_result(result))
+
+
+class SearchIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentStub(default_data=True)
+        self.env.config.set('search', 'use_index', 'enabled')
+        self.search_index = SearchIndex(self.env)
+
+    def tearDown(self):
+        self.env.reset_db()
+
+    def _search_tickets(self, *terms):
+        req = MockRequest(self.env)
+        return sorted(int(r[0].rsplit('/', 1)[1]) for r in
+                      TicketModule(self.env).get_search_results(
+                          req, terms, ['ticket']))
+
+    def _search_wiki(self, *terms):
+        req = MockRequest(self.env)
+        return sorted(r[0].rsplit('/', 1)[1] for r in
+                      WikiModule(self.env).get_search_results(
+                          req, terms, ['wiki']))
+
+    def test_find_documents_disabled(self):
+        self.env.config.set('search', 'use_index', 'disabled')
+        self.assertIsNone(self.search_index.find_documents('ticket', ['x']))
+
+    def test_find_documents_without_words(self):
+        self.assertIsNone(self.search_index.find_documents('ticket', ['#']))
+
+    def test_get_documents_query(self):
+        insert_ticket(self.env, summary='Crash on startup')
+        insert_ticket(self.env, summary='Slow startup')
+        insert_ticket(self.env, summary='Crash on exit')
+
+        with self.env.db_query as db:
+            self.assertIsNone(self.search_index.get_documents_query(
+                db, 'ticket', ['#']))
+            sql, args = self.search_index.get_documents_query(
+                db, 'ticket', ['crash', 'START'])
+            self.assertEqual([('1',)], db(sql, args))
+
+    def test_ticket_search_with_many_hits(self):
+        with self.env.db_transaction as db:
+            db.executemany("""
+                INSERT INTO search_index (realm, id, term) VALUES (%s,%s,%s)
+                """, [('ticket', str(i), 'crash') for i in range(1, 1201)])
+        insert_ticket(self.env, summary='Crash on startup')
+        insert_ticket(self.env, summary='Crash on exit')
+
+        self.assertEqual([1, 2], self._search_tickets('crash'))
+        self.assertEqual([2], self._search_tickets('crash', 'exit'))
+
+    def test_ticket_created(self):
+        insert_ticket(self.env, summary='Crash on startup',
+                      keywords='segfault')
+        insert_ticket(self.env, summary='Slow startup')
+
+        self.assertEqual({'1', '2'},
+                         self.search_index.find_documents('ticket',
+                                                          ['startup']))
+        self.assertEqual([1], self._search_tickets('Crash', 'start'))
+        self.assertEqual([1], self._search_tickets('segf'))
+        self.assertEqual([], self._search_tickets('crash', 'slow'))
+
+    def test_ticket_changed_and_deleted(self):
+        ticket = insert_ticket(self.env, summary='Crash on startup')
+        ticket.save_changes('joe', 'Happens with the frobnicator too')
+        self.assertEqual([1], self._search_tickets('frobnicator'))
+
+        ticket['summary'] = 'Hang on startup'
+        ticket.save_changes('joe')
+        self.assertEqual([], self._search_tickets('crash'))
+        self.assertEqual([1], self._search_tickets('hang'))
+
+        ticket.delete()
+        self.assertEqual([], self._search_tickets('hang'))
+        self.assertEqual(set(), self.search_index.find_documents('ticket',
+                                                                 ['hang']))
+
+    def test_ticket_custom_field(self):
+        self.env.config.set('ticket-custom', 'customer', 'text')
+        insert_ticket(self.env, customer='Megacorp')
+        self.assertEqual([1], self._search_tickets('megacorp'))
+
+    def test_wiki_page(self):
+        page = WikiPage(self.env, 'SandBox')
+        page.text = 'Playground for the wiki syntax'
+        page.save('joe', 'Initial')
+        self.assertEqual(['SandBox'], self._search_wiki('play'))
+
+        page.rename('PlayGround')
+        self.assertEqual(['PlayGround'], self._search_wiki('play'))
+
+        page.delete()
+        self.assertEqual([], self._search_wiki('play'))
+
+    def test_reindex(self):
+        self.env.config.set('search', 'use_index', 'disabled')
+        insert_ticket(self.env, summary='Crash on startup')
+        page = WikiPage(self.env, 'SandBox')
+        page.text = 'Playground for the wiki syntax'
+        page.save('joe', 'Initial')
+        self.env.config.set('search', 'use_index', 'enabled')
+        self.assertEqual([], self._search_tickets('crash'))
+
+        count = self.search_index.reindex(['ticket'])
+
+        self.assertEqual(1, count)
+        self.assertEqual([1], self._search_tickets('crash'))
+        self.assertEqual([], self._search_wiki('playground'))
+
+        feedback = []
+        self.search_index.reindex(feedback=lambda *args:
+                                  feedback.append(args))
+
+        self.assertIn(('ticket', 1), feedback)
+        self.assertIn(('wiki', 1), feedback)
+        self.assertEqual(['SandBox'], self._search_wiki('playground'))
+
+    def test_get_realms(self):
+        self.assertEqual(['attachment', 'changeset', 'ticket', 'wiki'],
+                         self.search_index.get_realms())
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(makeSuite(TokenizeSearchTextTestCase))
+    suite.addTest(makeSuite(SearchResultsTestCase))
+    suite.addTest(makeSuite(SearchIndexTestCase))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')
@@ -11,6 +11,7 @@
 # individuals. For the exact contribution history, see the revision
 # history and logs, available at https://trac.edgewall.org/log/.
 
+from datetime import datetime, timedelta
 import os
 import pkg_resources
 import unittest
@@ -20,6 +21,7 @@ from trac.test import EnvironmentStub, MockRequest, makeSuite
 from trac.ticket.model import Ticket
 from trac.ticket.test import insert_ticket
 from trac.ticket.web_ui import TicketModule
+from trac.util.datefmt import utc
 from trac.wiki.admin import WikiAdmin
 from trac.wiki.web_ui import WikiModule
 from trac.web.api import RequestDone
@@ -104,6 +106,38 @@ class SearchModuleTestCase(unittest.TestCase):
                        'title': 'Previous Page', 'type': None, 'class': None},
                       req.chrome['links']['prev'])
 
+    def test_results_limited_to_shown_pages(self):
+        """Only the results needed for the page index are fetched."""
+        for id_ in range(1, 126):
+            self._insert_ticket(summary="Trac", description="Ticket %d" % id_,
+                                when=datetime(2023, 1, 1, tzinfo=utc) +
+                                     timedelta(days=id_))
+        req = MockRequest(self.env, path_info='/search',
+                          args={'q': 'Trac', 'ticket': 'on'})
+
+        data = self._process_request(req)[1]
+        results = data['results']
+
+        self.assertEqual(111, results.num_items)
+        self.assertTrue(results.has_more_items)
+        self.assertEqual('1 - 10 of more than 110', results.displayed_items())
+        self.assertEqual(list(range(1, 12)),
+                         [int(p['string']) for p in results.shown_pages])
+        self.assertEqual(['/trac.cgi/ticket/%d' % id_
+                          for id_ in range(125, 115, -1)],
+                         [result['href'] for result in results])
+        self.assertEqual('Ticket 125', list(results)[0]['excerpt'])
+
+        req = MockRequest(self.env, path_info='/search',
+                          args={'q': 'Trac', 'ticket': 'on', 'page': '3'})
+
+        data = self._process_request(req)[1]
+        results = data['results']
+
+        self.assertEqual(125, results.num_items)
+        self.assertFalse(results.has_more_items)
+        self.assertEqual('21 - 30 of 125', results.displayed_items())
+
     def test_camelcase_quickjump(self):
         """CamelCase word does quick-jump."""
         req = MockRequest(self.env, path_info='/search',
@@ -14,13 +14,17 @@
 #
 # Author: Jonas Borgström <jonas@edgewall.com>
 
+from itertools import islice
+from operator import itemgetter
 import pkg_resources
 import re
 
 from trac.config import IntOption, ListOption
 from trac.core import *
 from trac.perm import IPermissionRequestor
-from trac.search.api import ISearchSource
+from trac.search.api import (
+    ISearchSource, expand_search_result, merge_search_results
+)
 from trac.util.datefmt import format_datetime, user_time
 from trac.util.html import Markup, escape, find_element, tag
 from trac.util.presentation import Paginator
@@ -44,6 +48,8 @@ class SearchModule(Component):
 
     RESULTS_PER_PAGE = 10
 
+    SHOWN_PAGES = 21
+
     min_query_length = IntOption('search', 'min_query_length', 3,
         """Minimum length of query string allowed when performing a search.
         """)
@@ -106,9 +112,15 @@ class SearchModule(Component):
 
             terms = self._parse_query(req, query)
             if terms:
-                results = self._do_search(req, terms, filters)
+                # Only fetch the results needed for the requested page and
+                # for the page index shown after it
+                page = req.args.getint('page', 1, min=1)
+                limit = (page + self.SHOWN_PAGES // 2) * \
+                        self.RESULTS_PER_PAGE + 1
+                results = self._do_search(req, terms, filters, limit)
                 if results:
-                    data.update(self._prepare_results(req, filters, results))
+                    data.update(self._prepare_results(req, filters, results,
+                                                      len(results) == limit))
             if noquickjump and filters:
                 req.session['search.filters'] = ','.join(filters)
 
@@ -229,14 +241,22 @@ class SearchModule(Component):
                            'Query must be at least %(num)s characters long.',
                            num=self.min_query_length))
 
-    def _do_search(self, req, terms, filters):
+    def _do_search(self, req, terms, filters, limit=None):
+        """Return the `limit` most recent results from all the sources,
+        or all the results if `limit` is `None`.
+        """
         results = []
         for source in self.search_sources:
-            results.extend(source.get_search_results(req, terms, filters)
-                           or [])
-        return sorted(results, key=lambda x: x[2], reverse=True)
+            if hasattr(source, 'get_ranked_search_results'):
+                results.append(source.get_ranked_search_results(
+                    req, terms, filters, limit) or [])
+            else:
+                results.append(sorted(
+                    source.get_search_results(req, terms, filters) or [],
+                    key=itemgetter(2), reverse=True))
+        return list(islice(merge_search_results(*results), limit))
 
-    def _prepare_results(self, req, filters, results):
+    def _prepare_results(self, req, filters, results, has_more=False):
         page = req.args.getint('page', 1, min=1)
         try:
             results = Paginator(results, page - 1, self.RESULTS_PER_PAGE)
@@ -244,17 +264,19 @@ class SearchModule(Component):
             add_warning(req, _("Page %(page)s is out of range.", page=page))
             page = 1
             results = Paginator(results, page - 1, self.RESULTS_PER_PAGE)
+        results.has_more_items = has_more
 
         for idx, result in enumerate(results):
-            results[idx] = {'href': result[0], 'title': result[1],
-                            'date': user_time(req, format_datetime, result[2]),
-                            'author': result[3], 'excerpt': result[4]}
+            href, title, date, author, excerpt = expand_search_result(result)
+            results[idx] = {'href': href, 'title': title,
+                            'date': user_time(req, format_datetime, date),
+                            'author': author, 'excerpt': excerpt}
 
         search_args = [('q', req.args.get('q')), ('noquickjump', '1')]
         search_args.extend((filter_, 'on') for filter_ in filters)
 
         pagedata = []
-        shown_pages = results.get_shown_pages(21)
+        shown_pages = results.get_shown_pages(self.SHOWN_PAGES)
         for shown_page in shown_pages:
             page_href = req.href.search(search_args, page=shown_page)
             pagedata.append([page_href, None, str(shown_page),
@@ -140,6 +140,9 @@ class MockPerm(object):
     def __call__(self, realm_or_resource, id=False, version=False):
         return self
 
+    def filter_allowed(self, action, resources):
+        return list(resources)
+
     def require(self, action, realm_or_resource=None, id=False, version=False,
                 message=None):
         pass
@@ -383,9 +386,10 @@ class EnvironmentStub(Environment):
         # -- logging
         self.setup_log()
 
-        # -- database
+        # -- database and cache
         self.dburi = get_dburi()
         self.config.set('components', 'trac.db.*', 'enabled')
+        self.config.set('components', 'trac.cache.*', 'enabled')
         self.config.set('trac', 'database', self.dburi)
 
         if not destroying:
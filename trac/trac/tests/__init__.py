@@ -13,7 +13,7 @@
 
 import unittest
 
-from . import attachment, config, core, env, loader, notification, \
+from . import attachment, cache, config, core, env, loader, notification, \
                        perm, resource, wikisyntax, functional
 
 
@@ -27,6 +27,7 @@ def test_suite():
 def basicSuite():
     suite = unittest.TestSuite()
     suite.addTest(attachment.test_suite())
+    suite.addTest(cache.test_suite())
     suite.addTest(config.test_suite())
     suite.addTest(core.test_suite())
     suite.addTest(env.test_suite())
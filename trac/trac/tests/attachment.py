@@ -27,6 +27,7 @@ from trac.attachment import Attachment, AttachmentModule, \
 from trac.core import Component, ComponentMeta, implements, TracError
 from trac.perm import IPermissionPolicy, PermissionCache
 from trac.resource import IResourceManager, Resource, resource_exists
+from trac.search.api import SearchIndex
 from trac.test import EnvironmentStub, Mock, MockRequest, makeSuite, mkdtemp
 from trac.util.datefmt import format_datetime, to_utimestamp, utc
 from trac.web.api import HTTPBadRequest, RequestDone
@@ -619,6 +620,33 @@ class AttachmentModuleTestCase(unittest.TestCase):
         self.assertIn(b'<strong>HTML preview not available</strong>', result)
         xml = minidom.parseString(result)
 
+    def test_search_index_with_many_hits(self):
+        """The number of documents found in the search index doesn't
+        affect the size of the search query."""
+        self.env.config.set('search', 'use_index', 'enabled')
+        self.env.db_transaction.executemany("""
+            INSERT INTO attachment (type, id, filename, size, time,
+                                    description, author)
+            VALUES (%s,%s,%s,%s,%s,%s,%s)
+            """, [('parent_realm', str(i), 'file%d.txt' % i, 0, i,
+                   'Fix stuff', 'joe') for i in range(1200)])
+        self.env.db_transaction("""
+            INSERT INTO attachment (type, id, filename, size, time,
+                                    description, author)
+            VALUES ('parent_realm', '1', 'other.txt', 0, 1, 'Other', 'joe')
+            """)
+        SearchIndex(self.env).reindex(['attachment'])
+        req = MockRequest(self.env)
+        module = AttachmentModule(self.env)
+
+        results = list(module.get_search_results(
+            req, Resource('parent_realm'), ['fix']))
+
+        self.assertEqual(1200, len(results))
+        self.assertEqual(['/trac.cgi/attachment/parent_realm/1/other.txt'],
+                         [r[0] for r in module.get_search_results(
+                             req, Resource('parent_realm'), ['other'])])
+
 
 class LegacyAttachmentPolicyTestCase(unittest.TestCase):
 
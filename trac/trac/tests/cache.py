@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2023 Edgewall Software
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution. The terms
+# are also available at https://trac.edgewall.org/wiki/TracLicense.
+#
+# This software consists of voluntary contributions made by many
+# individuals. For the exact contribution history, see the revision
+# history and logs, available at https://trac.edgewall.org/log/.
+
+import os
+import shutil
+import unittest
+
+from trac.cache import (
+    CacheManager, FileCacheBackend, MemoryCacheBackend, cached)
+from trac.core import Component
+from trac.test import EnvironmentStub, makeSuite, mkdtemp
+
+
+class Retriever(Component):
+
+    def __init__(self):
+        self.calls = 0
+        self.value = None
+
+    @cached
+    def data(self):
+        self.calls += 1
+        return self.value if self.value is not None else {'calls': self.calls}
+
+
+class CacheManagerTestCase(unittest.TestCase):
+
+    backend = 'MemoryCacheBackend'
+
+    def setUp(self):
+        self.env = EnvironmentStub()
+        self.env.config.set('cache', 'backend', self.backend)
+        self.cache_manager = CacheManager(self.env)
+        self.retriever = Retriever(self.env)
+
+    def tearDown(self):
+        self.env.reset_db()
+
+    def test_get(self):
+        self.assertEqual({'calls': 1}, self.retriever.data)
+        self.assertEqual({'calls': 1}, self.retriever.data)
+        self.cache_manager.reset_metadata()
+        self.assertEqual({'calls': 1}, self.retriever.data)
+        self.assertEqual(1, self.retriever.calls)
+
+    def test_invalidate(self):
+        self.assertEqual({'calls': 1}, self.retriever.data)
+        del self.retriever.data
+        self.assertEqual({'calls': 2}, self.retriever.data)
+        self.cache_manager.reset_metadata()
+        self.assertEqual({'calls': 2}, self.retriever.data)
+
+    def test_update(self):
+        self.assertEqual({'calls': 1}, self.retriever.data)
+        Retriever.data.update(self.retriever, lambda d: dict(d, x=1))
+        self.cache_manager.reset_metadata()
+        self.assertEqual({'calls': 1, 'x': 1}, self.retriever.data)
+        self.assertEqual(1, self.retriever.calls)
+
+    def test_update_without_data_invalidates(self):
+        Retriever.data.update(self.retriever, lambda d: dict(d, x=1))
+        self.assertEqual({'calls': 1}, self.retriever.data)
+
+    def test_update_rolled_back(self):
+        self.assertEqual({'calls': 1}, self.retriever.data)
+        try:
+            with self.env.db_transaction:
+                Retriever.data.update(self.retriever, lambda d: dict(d, x=1))
+                raise ValueError
+        except ValueError:
+            pass
+        self.cache_manager.reset_metadata()
+        self.assertEqual({'calls': 2}, self.retriever.data)
+
+    def test_backend(self):
+        self.assertIsInstance(self.cache_manager.backend, MemoryCacheBackend)
+
+
+class FileCacheBackendTestCase(CacheManagerTestCase):
+
+    backend = 'FileCacheBackend'
+
+    def setUp(self):
+        super().setUp()
+        self.dir = mkdtemp()
+        self.env.config.set('cache', 'directory', self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        super().tearDown()
+
+    def _other_process(self):
+        """Forget the data kept in memory, as another process would."""
+        FileCacheBackend(self.env)._memory._cache.clear()
+        self.cache_manager.reset_metadata()
+
+    def test_backend(self):
+        self.assertIsInstance(self.cache_manager.backend, FileCacheBackend)
+
+    def test_data_shared(self):
+        self.assertEqual({'calls': 1}, self.retriever.data)
+        self.assertEqual(1, len(os.listdir(self.dir)))
+        self._other_process()
+        self.assertEqual({'calls': 1}, self.retriever.data)
+        self.assertEqual(1, self.retriever.calls)
+
+    def test_invalidate_removes_files(self):
+        self.assertEqual({'calls': 1}, self.retriever.data)
+        del self.retriever.data
+        self.assertEqual([], os.listdir(self.dir))
+        self._other_process()
+        self.assertEqual({'calls': 2}, self.retriever.data)
+        self.assertEqual(1, len(os.listdir(self.dir)))
+
+    def test_unpicklable_data(self):
+        self.retriever.value = lambda: None
+        value = self.retriever.data
+        self.assertIs(self.retriever.value, value)
+        self.assertEqual([], os.listdir(self.dir))
+        self.cache_manager.reset_metadata()
+        self.assertIs(value, self.retriever.data)
+        self._other_process()
+        self.assertIs(value, self.retriever.data)
+        self.assertEqual(2, self.retriever.calls)
+
+    def test_corrupted_file(self):
+        self.assertEqual({'calls': 1}, self.retriever.data)
+        name = os.listdir(self.dir)[0]
+        with open(os.path.join(self.dir, name), 'wb') as f:
+            f.write(b'corrupted')
+        self._other_process()
+        self.assertEqual({'calls': 2}, self.retriever.data)
+
+
+class ChangeFeedTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentStub()
+        self.dir = mkdtemp()
+        self.feed = os.path.join(self.dir, 'feed')
+        self.env.config.set('cache', 'change_feed', self.feed)
+        self.cache_manager = CacheManager(self.env)
+        self.retriever = Retriever(self.env)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        self.env.reset_db()
+
+    def _read_feed(self):
+        with open(self.feed, 'rb') as f:
+            return f.read()
+
+    def _invalidate_elsewhere(self):
+        """Invalidate the data without touching the change feed, as if
+        it was invalidated outside of Trac."""
+        self.env.db_transaction("""
+            UPDATE cache SET generation=generation+1 WHERE id=%s
+            """, (Retriever.data.id,))
+        MemoryCacheBackend(self.env)._cache.clear()
+
+    def test_metadata_kept_when_feed_unchanged(self):
+        self.assertEqual({'calls': 1}, self.retriever.data)
+        self.assertTrue(os.path.exists(self.feed))
+        del self.retriever.data
+        self.assertEqual({'calls': 2}, self.retriever.data)
+        self.cache_manager.reset_metadata()
+        self.assertEqual({'calls': 2}, self.retriever.data)
+
+        self._invalidate_elsewhere()
+        self.cache_manager.reset_metadata()
+        self.assertEqual({'calls': 2}, self.retriever.data)
+
+    def test_metadata_reset_when_feed_changed(self):
+        self.assertEqual({'calls': 1}, self.retriever.data)
+        self._invalidate_elsewhere()
+        CacheManager(self.env)._write_stamp()
+        self.cache_manager.reset_metadata()
+        self.assertEqual({'calls': 2}, self.retriever.data)
+
+    def test_feed_written_after_commit(self):
+        self.assertEqual({'calls': 1}, self.retriever.data)
+        stamp = self._read_feed()
+        with self.env.db_transaction:
+            del self.retriever.data
+            self.assertEqual(stamp, self._read_feed())
+        self.assertNotEqual(stamp, self._read_feed())
+
+    def test_feed_unchanged_after_rollback(self):
+        self.assertEqual({'calls': 1}, self.retriever.data)
+        stamp = self._read_feed()
+        try:
+            with self.env.db_transaction:
+                del self.retriever.data
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(stamp, self._read_feed())
+
+    def test_no_feed(self):
+        self.env.config.set('cache', 'change_feed', '')
+        self.assertEqual({'calls': 1}, self.retriever.data)
+        self._invalidate_elsewhere()
+        self.cache_manager.reset_metadata()
+        self.assertEqual({'calls': 2}, self.retriever.data)
+        self.assertFalse(os.path.exists(self.feed))
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(makeSuite(CacheManagerTestCase))
+    suite.addTest(makeSuite(FileCacheBackendTestCase))
+    suite.addTest(makeSuite(ChangeFeedTestCase))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')
@@ -468,6 +468,29 @@ class KnownUsersTestCase(unittest.TestCase):
             self.assertEqual(3, i)
             self.assertEqual(4, len(users_dict))
 
+    def test_get_known_user_info(self):
+        self.assertEqual(('Jane', None), self.env.get_known_user_info('jane'))
+        self.assertIsNone(self.env.get_known_user_info('123'))
+        self.assertIsNone(self.env.get_known_user_info('user4'))
+
+    def test_update_known_user(self):
+        self.env.get_known_users()
+        self.env.insert_users([('user4', None, None)])
+        self.env.update_known_user('jim', 'Jim', 'jim@example.com')
+        self.env.update_known_user('tom', 'Thomas', None)
+
+        self.assertEqual([('jane', 'Jane', None),
+                          ('jim', 'Jim', 'jim@example.com'),
+                          ('joe', None, 'joe@example.com'),
+                          ('tom', 'Thomas', None)],
+                         list(self.env.get_known_users()))
+        self.assertEqual(('Jim', 'jim@example.com'),
+                         self.env.get_known_user_info('jim'))
+        self.assertEqual(('Thomas', None),
+                         self.env.get_known_user_info('tom'))
+        # The whole session table hasn't been read again
+        self.assertIsNone(self.env.get_known_user_info('user4'))
+
 
 class SystemInfoTestCase(unittest.TestCase):
 
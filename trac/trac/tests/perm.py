@@ -135,6 +135,53 @@ class DefaultPermissionStoreTestCase(unittest.TestCase):
         self.assertEqual(['group10', 'group11', 'group8', 'group9'],
                          self.store.get_permission_groups('user3'))
 
+    def test_get_users_with_permissions(self):
+        self.env.insert_users([('john', '', ''), ('kate', '', ''),
+                               ('jane', '', ''), ('bill', '', '')])
+        self.env.db_transaction.executemany(
+            "INSERT INTO permission VALUES (%s,%s)",
+            [('dev', 'WIKI_MODIFY'),
+             ('admin', 'dev'),
+             ('admin', 'TRAC_ADMIN'),
+             ('john', 'admin'),
+             ('kate', 'dev'),
+             ('jane', 'TICKET_CREATE'),
+             ('group1', 'group2'),
+             ('group2', 'group1'),
+             ('bill', 'group1'),
+             ('authenticated', 'REPORT_VIEW'),
+             ('anonymous', 'TICKET_VIEW')])
+        self.assertEqual(['john', 'kate'],
+                         self.store.get_users_with_permissions(
+                             ['WIKI_MODIFY']))
+        self.assertEqual(['jane', 'john'],
+                         self.store.get_users_with_permissions(
+                             ['TRAC_ADMIN', 'TICKET_CREATE']))
+        self.assertEqual(['bill', 'jane', 'john', 'kate'],
+                         self.store.get_users_with_permissions(
+                             ['REPORT_VIEW']))
+        self.assertEqual(['bill', 'jane', 'john', 'kate'],
+                         self.store.get_users_with_permissions(
+                             ['TICKET_VIEW']))
+        self.assertEqual([], self.store.get_users_with_permissions(
+                                 ['WIKI_DELETE']))
+
+    def test_index_updated_on_change(self):
+        self.env.insert_users([('john', '', ''), ('kate', '', '')])
+        self.store.grant_permission('dev', 'WIKI_MODIFY')
+        self.store.grant_permission('john', 'dev')
+        self.assertEqual(['WIKI_MODIFY'],
+                         self.store.get_user_permissions('john'))
+        self.assertEqual(['john'], self.store.get_users_with_permissions(
+                                       ['WIKI_MODIFY']))
+
+        self.store.grant_permission('kate', 'dev')
+        self.store.revoke_permission('john', 'dev')
+        self.assertEqual([], self.store.get_user_permissions('john'))
+        self.assertEqual(['dev'], self.store.get_permission_groups('kate'))
+        self.assertEqual(['kate'], self.store.get_users_with_permissions(
+                                       ['WIKI_MODIFY']))
+
 
 class BaseTestCase(unittest.TestCase):
 
@@ -523,6 +570,88 @@ class PermissionPolicyTestCase(BaseTestCase):
                           ('testuser', 'TEST_ADMIN'): None})
 
 
+class FilterAllowedTestCase(BaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        class BatchPermissionPolicy(Component):
+            """Allows `TEST_MODIFY` on the wiki pages with an even id,
+            denies it on the other pages, doesn't decide on the other
+            resources.
+            """
+            implements(perm.IPermissionPolicy)
+
+            def __init__(self):
+                self.calls = []
+
+            def check_permission(self, action, username, resource, perm):
+                return self.check_permissions(action, username, [resource],
+                                              perm)[0]
+
+            def check_permissions(self, action, username, resources, perm):
+                self.calls.append(resources)
+                return [None if action != 'TEST_MODIFY' or
+                                not resource or resource.realm != 'wiki'
+                        else resource.id % 2 == 0
+                        for resource in resources]
+
+        cls.batch_policy = BatchPermissionPolicy
+
+    @classmethod
+    def tearDownClass(cls):
+        ComponentMeta.deregister(cls.batch_policy)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.env = EnvironmentStub(enable=[perm.DefaultPermissionStore,
+                                           perm.DefaultPermissionPolicy,
+                                           self.batch_policy] +
+                                          self.permission_requestors)
+        self.env.config.set('trac', 'permission_policies',
+                            'BatchPermissionPolicy, DefaultPermissionPolicy')
+        perm.PermissionSystem(self.env).grant_permission('testuser',
+                                                         'TEST_MODIFY')
+        self.policy = self.batch_policy(self.env)
+        self.perm = perm.PermissionCache(self.env, 'testuser')
+
+    def tearDown(self):
+        self.env.reset_db()
+
+    def test_filter_allowed(self):
+        resources = [Resource('wiki', id) for id in range(5)] + \
+                    [Resource('ticket', 1), Resource('wiki', 2)]
+
+        allowed = self.perm.filter_allowed('TEST_MODIFY', resources)
+
+        self.assertEqual([0, 2, 4, 1, 2],
+                         [resource.id for resource in allowed])
+        self.assertEqual(1, len(self.policy.calls))
+        self.assertEqual(6, len(self.policy.calls[0]))
+        self.assertEqual(
+            [resource for resource in resources
+                      if 'TEST_MODIFY' in perm.PermissionCache(
+                          self.env, 'testuser')(resource)],
+            allowed)
+
+    def test_decisions_cached(self):
+        resources = [Resource('wiki', id) for id in range(3)]
+        self.perm.filter_allowed('TEST_MODIFY', resources[:2])
+        self.assertIn('TEST_MODIFY', self.perm(resources[0]))
+        self.assertNotIn('TEST_MODIFY', self.perm('wiki', 1))
+        self.assertEqual(1, len(self.policy.calls))
+
+        allowed = self.perm.filter_allowed('TEST_MODIFY', resources)
+
+        self.assertEqual([resources[0], resources[2]], allowed)
+        self.assertEqual([[resources[2]]], self.policy.calls[1:])
+
+    def test_no_policy_decides(self):
+        self.assertEqual([], self.perm.filter_allowed(
+                                 'TEST_ADMIN', [Resource('wiki', 0), None]))
+
+
 class RecursivePolicyTestCase(unittest.TestCase):
     """Test case for policies that perform recursive permission checks."""
 
@@ -870,6 +999,7 @@ def test_suite():
     suite.addTest(makeSuite(PermissionSystemTestCase))
     suite.addTest(makeSuite(PermissionCacheTestCase))
     suite.addTest(makeSuite(PermissionPolicyTestCase))
+    suite.addTest(makeSuite(FilterAllowedTestCase))
     suite.addTest(makeSuite(RecursivePolicyTestCase))
     suite.addTest(makeSuite(TracAdminTestCase))
     return suite
@@ -24,7 +24,7 @@ from trac.util import as_int, getuser
 from trac.util.datefmt import format_date, format_datetime, \
                               get_datetime_format_hint, parse_date, user_time
 from trac.util.text import exception_to_unicode, print_table, printout
-from trac.util.translation import _, N_, gettext
+from trac.util.translation import _, N_, gettext, ngettext
 from trac.web.chrome import Chrome, add_ctxtnav, add_notice, add_script, \
                             add_warning
 
@@ -842,6 +842,19 @@ class TicketAdmin(Component):
                'Remove ticket', None, self._do_remove)
         yield ('ticket remove_comment', '<ticket#> <comment#>',
                'Remove ticket comment', None, self._do_remove_comment)
+        yield ('ticket custom rebuild', '',
+               """Rebuild the custom field table
+
+               The table has a column for each custom field and speeds up
+               the ticket queries on custom fields. It must be rebuilt when
+               custom fields are added to the [ticket-custom] section;
+               queries on custom fields not present in the table use the
+               slower `ticket_custom` table.
+               """,
+               None, self._do_rebuild_custom_table)
+        yield ('ticket custom drop', '',
+               'Drop the custom field table',
+               None, self._do_drop_custom_table)
 
     def _do_remove(self, number):
         number = as_int(number, None)
@@ -868,3 +881,13 @@ class TicketAdmin(Component):
             ticket.delete_change(comment_number)
         printout(_("The ticket comment %(num)s on ticket #%(id)s has been "
                    "deleted.", num=comment_number, id=ticket_number))
+
+    def _do_rebuild_custom_table(self):
+        count = model.CustomFieldTable(self.env).rebuild()
+        printout(ngettext("%(num)s ticket copied to the custom field table.",
+                          "%(num)s tickets copied to the custom field table.",
+                          count))
+
+    def _do_drop_custom_table(self):
+        model.CustomFieldTable(self.env).drop()
+        printout(_("Custom field table dropped."))
@@ -595,6 +595,8 @@ class TicketSystem(Component):
 
     # IWikiSyntaxProvider methods
 
+    _prefetch_chunk_size = 500
+
     def get_link_resolvers(self):
         return [('bug', self._format_link),
                 ('issue', self._format_link),
@@ -626,11 +628,13 @@ class TicketSystem(Component):
                         'TICKET_VIEW' in formatter.perm(ticket):
                     # TODO: attempt to retrieve ticket view directly,
                     #       something like: t = Ticket.view(num)
-                    for type, summary, status, resolution in \
-                            self.env.db_query("""
+                    rows = formatter.link_cache.get((self.realm, num))
+                    if rows is None:
+                        rows = self.env.db_query("""
                             SELECT type, summary, status, resolution
                             FROM ticket WHERE id=%s
-                            """, (str(num),)):
+                            """, (str(num),))
+                    for type, summary, status, resolution in rows:
                         description = self.format_summary(summary, status,
                                                           resolution, type)
                         title = '#%s: %s' % (num, description)
@@ -650,6 +654,32 @@ class TicketSystem(Component):
             pass
         return tag.a(label, class_='missing ticket')
 
+    def prefetch_links(self, formatter, links):
+        from trac.ticket.model import Ticket
+        cache = formatter.link_cache
+        ids = set()
+        for ns, target in links:
+            if ns is None:
+                target = target[1:]  # "#123" shorthand syntax
+            elif ns == 'comment':
+                continue
+            link = formatter.split_link(target)[0]
+            if link.isdigit() and Ticket.id_is_valid(link) and \
+                    (self.realm, int(link)) not in cache:
+                ids.add(int(link))
+        ids = sorted(ids)
+        with self.env.db_query as db:
+            for idx in range(0, len(ids), self._prefetch_chunk_size):
+                chunk = ids[idx:idx + self._prefetch_chunk_size]
+                for id_ in chunk:
+                    cache[(self.realm, id_)] = []
+                for id_, type, summary, status, resolution in db("""
+                        SELECT id, type, summary, status, resolution
+                        FROM ticket WHERE id IN (%s)
+                        """ % ','.join(['%s'] * len(chunk)), chunk):
+                    cache[(self.realm, id_)] = \
+                        [(type, summary, status, resolution)]
+
     def _format_comment_link(self, formatter, ns, target, label):
         resource = None
         if ':' in target:
@@ -22,6 +22,7 @@ import re
 from trac import core
 from trac.attachment import Attachment
 from trac.cache import cached
+from trac.config import IntOption
 from trac.core import TracError
 from trac.resource import Resource, ResourceExistsError, ResourceNotFound
 from trac.ticket.api import TicketSystem
@@ -315,6 +316,8 @@ class Ticket(object):
                        VALUES (%s, %s, %s)
                     """, [(tkt_id, c, db_values.get(c))
                           for c in custom_fields])
+            CustomFieldTable(self.env).insert_ticket(db, tkt_id, db_values)
+            QueryCountCache(self.env).invalidate()
 
         self.id = int(tkt_id)
         self._old = {}
@@ -415,6 +418,11 @@ class Ticket(object):
                       """, (self.id, db_values['changetime'], author, name,
                             old_db_val, db_val))
 
+            CustomFieldTable(self.env).update_ticket(
+                db, self.id, {name: db_values.get(name) for name in self._old
+                              if name in self.custom_fields})
+            QueryCountCache(self.env).invalidate()
+
             # always save comment, even if empty
             # (numbering support for timeline)
             db("""INSERT INTO ticket_change
@@ -498,6 +506,8 @@ class Ticket(object):
             db("DELETE FROM ticket WHERE id=%s", (self.id,))
             db("DELETE FROM ticket_change WHERE ticket=%s", (self.id,))
             db("DELETE FROM ticket_custom WHERE ticket=%s", (self.id,))
+            CustomFieldTable(self.env).delete_ticket(db, self.id)
+            QueryCountCache(self.env).invalidate()
 
         for listener in TicketSystem(self.env).change_listeners:
             listener.ticket_deleted(self)
@@ -567,10 +577,13 @@ class Ticket(object):
                         db("""UPDATE ticket_custom SET value=%s
                               WHERE ticket=%s AND name=%s
                               """, (oldvalue, self.id, field))
+                        CustomFieldTable(self.env).update_ticket(
+                            db, self.id, {field: oldvalue})
 
             # Delete the change
             db("DELETE FROM ticket_change WHERE ticket=%s AND time=%s",
                (self.id, ts))
+            QueryCountCache(self.env).invalidate()
 
             # Update last changed time
             db("UPDATE ticket SET changetime=%s WHERE id=%s",
@@ -637,6 +650,7 @@ class Ticket(object):
             # Update last changed time
             db("UPDATE ticket SET changetime=%s WHERE id=%s",
                (when_ts, self.id))
+            QueryCountCache(self.env).invalidate()
 
         self.values['changetime'] = when
 
@@ -865,6 +879,7 @@ class AbstractEnum(object):
                 db("UPDATE ticket SET %s=%%s WHERE %s=%%s"
                    % (self.ticket_col, self.ticket_col),
                    (self.name, self._old_name))
+                QueryCountCache(self.env).invalidate()
                 self._old_name = self.name
                 TicketSystem(self.env).reset_ticket_fields()
 
@@ -1024,6 +1039,7 @@ class Component(object):
                 # Update tickets
                 db("UPDATE ticket SET component=%s WHERE component=%s",
                    (self.name, self._old_name))
+                QueryCountCache(self.env).invalidate()
                 self._old_name = self.name
                 TicketSystem(self.env).reset_ticket_fields()
 
@@ -1045,6 +1061,148 @@ class Component(object):
             raise TracError(_("Invalid component name."))
 
 
+class CustomFieldTable(core.Component):
+    """Wide table projecting the values of the custom ticket fields.
+
+    The optional `ticket_custom_table` table has one row per ticket and
+    one column per custom field, as configured in the `[ticket-custom]`
+    section when the table was last rebuilt. It is kept in sync with
+    `ticket_custom` by the `Ticket` model and lets the ticket queries
+    select and filter custom fields without joining `ticket_custom` once
+    per field.
+    """
+
+    table_name = 'ticket_custom_table'
+
+    @cached
+    def fields(self):
+        """List of the custom field names projected in the table, or an
+        empty list when the table doesn't exist.
+        """
+        with self.env.db_query as db:
+            if db.has_table(self.table_name):
+                for value, in db("SELECT value FROM system WHERE name=%s",
+                                 (self.table_name,)):
+                    return to_list(value)
+        return []
+
+    def rebuild(self):
+        """Create or rebuild the table for the custom fields currently
+        configured, and populate it from `ticket_custom`.
+
+        :return: the number of tickets in the table.
+        """
+        from trac.db.api import DatabaseManager
+        from trac.db.schema import Column, Index, Table
+
+        names = [f['name'] for f in TicketSystem(self.env).custom_fields]
+        table = Table(self.table_name, key='id')[
+            [Column('id', type='int')] +
+            [Column(name) for name in names] +
+            [Index([name]) for name in names]]
+        with self.env.db_transaction as db:
+            db.drop_table(self.table_name)
+            DatabaseManager(self.env).create_tables([table])
+            db("""INSERT INTO %s (id%s)
+                  SELECT t.id%s FROM ticket AS t
+                  LEFT OUTER JOIN ticket_custom AS c ON c.ticket=t.id
+                  GROUP BY t.id
+                  """ % (db.quote(self.table_name),
+                         ''.join(',' + db.quote(name) for name in names),
+                         ",MAX(CASE WHEN c.name=%s THEN c.value END)"
+                         * len(names)), names)
+            db("DELETE FROM system WHERE name=%s", (self.table_name,))
+            db("INSERT INTO system (name, value) VALUES (%s, %s)",
+               (self.table_name, ','.join(names)))
+            del self.fields
+            count, = db("SELECT COUNT(*) FROM %s"
+                        % db.quote(self.table_name))[0]
+        return count
+
+    def drop(self):
+        """Drop the table. The ticket queries then use `ticket_custom`."""
+        with self.env.db_transaction as db:
+            db.drop_table(self.table_name)
+            db("DELETE FROM system WHERE name=%s", (self.table_name,))
+            del self.fields
+
+    def insert_ticket(self, db, tkt_id, values):
+        """Add the row of a new ticket, `values` being the database
+        values of its fields.
+        """
+        fields = self.fields
+        if fields:
+            db("INSERT INTO %s (id%s) VALUES (%%s%s)"
+               % (db.quote(self.table_name),
+                  ''.join(',' + db.quote(name) for name in fields),
+                  ',%s' * len(fields)),
+               [tkt_id] + [values.get(name) for name in fields])
+
+    def update_ticket(self, db, tkt_id, values):
+        """Update the row of a ticket with the changed database values
+        of its custom fields.
+        """
+        names = [name for name in values if name in self.fields]
+        if names:
+            db("UPDATE %s SET %s WHERE id=%%s"
+               % (db.quote(self.table_name),
+                  ','.join(db.quote(name) + '=%s' for name in names)),
+               [values[name] for name in names] + [tkt_id])
+
+    def delete_ticket(self, db, tkt_id):
+        """Remove the row of a deleted ticket."""
+        if self.fields:
+            db("DELETE FROM %s WHERE id=%%s" % db.quote(self.table_name),
+               (tkt_id,))
+
+
+class QueryCountCache(core.Component):
+    """Cache of the number of tickets matched by the ticket queries.
+
+    The counts are keyed by the SQL and the arguments of the queries,
+    and are shared by the processes of an environment through the cache
+    generations: the ticket models call `invalidate()` when they change
+    the `ticket` and `ticket_custom` tables.
+    """
+
+    cache_size = IntOption('query', 'count_cache_size', 0,
+        """Maximum number of ticket query counts kept in the cache of
+        each process. A paginated query whose count is cached only
+        fetches the rows of the displayed page, until a ticket is
+        created, changed or deleted. The default is 0, which disables
+        the cache. Note that plugins which modify the `ticket` table
+        directly may lead to outdated counts when it is enabled.
+        (''since 1.7.1'')
+        """)
+
+    @cached
+    def _counts(self):
+        return {}
+
+    def get(self, sql, args):
+        """Return the number of tickets cached for the query, or `None`.
+        """
+        if self.cache_size > 0:
+            return self._counts.get((sql, tuple(args)))
+
+    def set(self, sql, args, count):
+        """Store the number of tickets matched by the query."""
+        if self.cache_size <= 0:
+            return
+        counts = self._counts
+        while len(counts) >= self.cache_size:
+            try:
+                del counts[next(iter(counts))]
+            except (KeyError, RuntimeError, StopIteration):
+                break
+        counts[(sql, tuple(args))] = count
+
+    def invalidate(self):
+        """Discard the cached counts in all the processes."""
+        if self.cache_size > 0:
+            del self._counts
+
+
 class MilestoneCache(core.Component):
     """Cache for milestone data and factory for 'milestone' resources."""
 
@@ -1445,6 +1603,7 @@ class Version(object):
                 # Update tickets
                 db("UPDATE ticket SET version=%s WHERE version=%s",
                    (self.name, self._old_name))
+                QueryCountCache(self.env).invalidate()
                 self._old_name = self.name
             # Fields need reset if renamed or if time is changed
             TicketSystem(self.env).reset_ticket_fields()
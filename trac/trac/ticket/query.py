@@ -29,7 +29,8 @@ from trac.db import get_column_names
 from trac.mimeview.api import IContentConverter, Mimeview
 from trac.resource import Resource
 from trac.ticket.api import TicketSystem, translation_deactivated
-from trac.ticket.model import Milestone, _datetime_to_db_str
+from trac.ticket.model import (CustomFieldTable, Milestone, QueryCountCache,
+                               _datetime_to_db_str)
 from trac.ticket.roadmap import group_milestones
 from trac.util import Ranges, as_bool, as_int
 from trac.util.datefmt import (datetime_now, from_utimestamp,
@@ -267,7 +268,12 @@ class Query(object):
         """Get the number of matching tickets for the present query.
         """
         sql, args = self.get_sql(req, cached_ids, authname)
-        return self._count(sql, args)
+        count_cache = QueryCountCache(self.env)
+        cnt = count_cache.get(sql, args)
+        if cnt is None:
+            cnt = self._count(sql, args)
+            count_cache.set(sql, args, cnt)
+        return cnt
 
     def _count(self, sql, args):
         cnt = self.env.db_query("SELECT COUNT(*) FROM (%s) AS x"
@@ -276,54 +282,96 @@ class Query(object):
         self.env.log.debug("Count results in Query: %d", cnt)
         return cnt
 
+    def _fetch(self, sql, args, windowed=False):
+        """Return the column names and the rows of the query. When
+        `windowed` is set, the total number of rows of the unpaginated
+        query is prepended to each row by a window function.
+        """
+        if windowed:
+            sql = "SELECT COUNT(*) OVER () AS __count__," + \
+                  sql[len("SELECT "):]
+        with self.env.db_query as db:
+            cursor = db.cursor()
+            cursor.execute(sql, args)
+            return get_column_names(cursor), cursor.fetchall()
+
     def execute(self, req=None, cached_ids=None, authname=None, href=None):
         """Retrieve the list of matching tickets.
+
+        The number of matching tickets is stored in `num_items`. For a
+        paginated query, it is retrieved along with the rows of the page
+        in a single query when the database supports window functions,
+        unless it is already in the `QueryCountCache`.
         """
         if req is not None:
             href = req.href
 
         self.num_items = 0
         sql, args = self.get_sql(req, cached_ids, authname)
-        self.num_items = self._count(sql, args)
-
-        if self.num_items <= self.max:
-            self.has_more_pages = False
+        columns = rows = None
 
         if self.has_more_pages:
-            max = self.max
-            if self.group:
-                max += 1
-            sql += " LIMIT %d OFFSET %d" % (max, self.offset)
-            if (self.page > int(ceil(float(self.num_items) / self.max)) and
-                self.num_items != 0):
+            count_cache = QueryCountCache(self.env)
+            num_items = count_cache.get(sql, args)
+            limit = " LIMIT %d OFFSET %d" \
+                    % (self.max + 1 if self.group else self.max,
+                       self.offset)
+            if num_items is None:
+                with self.env.db_query as db:
+                    windowed = db.has_window_functions()
+                if windowed:
+                    columns, rows = self._fetch(sql + limit, args, True)
+                    if rows:
+                        num_items = rows[0][0]
+                        columns = columns[1:]
+                        rows = [row[1:] for row in rows]
+                    elif self.offset == 0:
+                        num_items = 0
+                    else:
+                        # Beyond the last page, or the first page is
+                        # shown in place of the only page.
+                        columns = rows = None
+                if num_items is None:
+                    num_items = self._count(sql, args)
+                count_cache.set(sql, args, num_items)
+            self.num_items = num_items
+
+            if self.num_items <= self.max:
+                self.has_more_pages = False
+                if self.offset != 0:
+                    columns = rows = None
+            elif (self.page > int(ceil(float(self.num_items) / self.max))
+                    and self.num_items != 0):
                 raise TracError(_("Page %(page)s is beyond the number of "
                                   "pages in the query", page=self.page))
+            elif rows is None:
+                columns, rows = self._fetch(sql + limit, args)
+
+        if rows is None:
+            columns, rows = self._fetch(sql, args)
+            if self.max == 0:
+                self.num_items = len(rows)
 
+        fields = [self.fields.by_name(column, None) for column in columns]
         results = []
-        with self.env.db_query as db:
-            cursor = db.cursor()
-            cursor.execute(sql, args)
-            columns = get_column_names(cursor)
-            fields = [self.fields.by_name(column, None) for column in columns]
-
-            for row in cursor:
-                result = {}
-                for name, field, val in zip(columns, fields, row):
-                    if name == 'reporter':
-                        val = val or 'anonymous'
-                    elif name == 'id':
-                        val = int(val)
-                        if href is not None:
-                            result['href'] = href.ticket(val)
-                    elif name in self.time_fields:
-                        val = from_utimestamp(int(val)) if val else None
-                    elif field and field['type'] == 'checkbox':
-                        val = as_bool(val)
-                    elif val is None:
-                        val = ''
-                    result[name] = val
-                results.append(result)
-            return results
+        for row in rows:
+            result = {}
+            for name, field, val in zip(columns, fields, row):
+                if name == 'reporter':
+                    val = val or 'anonymous'
+                elif name == 'id':
+                    val = int(val)
+                    if href is not None:
+                        result['href'] = href.ticket(val)
+                elif name in self.time_fields:
+                    val = from_utimestamp(int(val)) if val else None
+                elif field and field['type'] == 'checkbox':
+                    val = as_bool(val)
+                elif val is None:
+                    val = ''
+                result[name] = val
+            results.append(result)
+        return results
 
     def get_href(self, href, id=None, order=None, desc=None, format=None,
                  max=None, page=None):
@@ -424,7 +472,9 @@ class Query(object):
                                  if f['type'] == 'text' and
                                     f.get('format') == 'list'}
         cols_custom = [k for k in cols if k in custom_fields]
-        use_joins = len(cols_custom) <= 1
+        use_table = bool(cols_custom) and set(cols_custom).issubset(
+                        CustomFieldTable(self.env).fields)
+        use_joins = not use_table and len(cols_custom) <= 1
         enum_columns = [col for col in ('resolution', 'priority', 'severity',
                                         'type')
                             if col not in custom_fields and
@@ -440,7 +490,21 @@ class Query(object):
             sql.append(",priority.value AS _priority_value")
 
         with self.env.db_query as db:
-            if use_joins:
+            def custom_col(name):
+                if use_joins:
+                    return db.quote(name) + '.value'
+                else:
+                    return 'c.' + db.quote(name)
+
+            if use_table:
+                # Use the ticket_custom_table table, which has a column for
+                # each custom field
+                sql.extend(",c.%(qk)s AS %(qk)s" % {'qk': db.quote(k)}
+                           for k in cols_custom)
+                sql.append("\nFROM ticket AS t"
+                           "\n  LEFT OUTER JOIN %s AS c ON c.id=t.id"
+                           % db.quote(CustomFieldTable.table_name))
+            elif use_joins:
                 # Use LEFT OUTER JOIN for ticket_custom table
                 sql.extend(",%(qk)s.value AS %(qk)s" % {'qk': db.quote(k)}
                            for k in cols_custom)
@@ -485,10 +549,8 @@ class Query(object):
                 is_custom_field = name in custom_fields
                 if not is_custom_field:
                     col = 't.' + name
-                elif use_joins:
-                    col = db.quote(name) + '.value'
                 else:
-                    col = 'c.' + db.quote(name)
+                    col = custom_col(name)
                 value = value[len(mode) + neg:]
 
                 if name in self.time_fields:
@@ -608,10 +670,8 @@ class Query(object):
                     elif not mode and len(v) > 1 and k not in self.time_fields:
                         if k not in custom_fields:
                             col = 't.' + k
-                        elif use_joins:
-                            col = db.quote(k) + '.value'
                         else:
-                            col = 'c.' + db.quote(k)
+                            col = custom_col(k)
                         clauses.append("COALESCE(%s,'') %sIN (%s)"
                                        % (col, 'NOT ' if neg else '',
                                           ','.join('%s' for val in v)))
@@ -653,10 +713,8 @@ class Query(object):
                     col = name + '.value'
                 elif name not in custom_fields:
                     col = 't.' + name
-                elif use_joins:
-                    col = db.quote(name) + '.value'
                 else:
-                    col = 'c.' + db.quote(name)
+                    col = custom_col(name)
                 desc = ' DESC' if desc else ''
                 # FIXME: This is a somewhat ugly hack.  Can we also have the
                 #        column type for this?  If it's an integer, we do
@@ -1119,6 +1177,10 @@ class QueryModule(Component):
         if owner_field:
             TicketSystem(self.env).eventually_restrict_owner(owner_field)
         data = query.template_data(context, tickets, orig_list, orig_time, req)
+        # Check the permissions on all the results at once, the template
+        # then uses the cached decisions
+        req.perm.filter_allowed('TICKET_VIEW', [Resource(self.realm, t['id'])
+                                                for t in data['tickets']])
 
         req.session['query_href'] = query.get_href(context.href)
         req.session['query_time'] = to_timestamp(orig_time)
@@ -1192,9 +1254,12 @@ class QueryModule(Component):
             context = web_context(req)
             results = query.execute(req)
             fields = dict((f['name'], f) for f in query.fields)
+            allowed = {resource.id for resource in req.perm.filter_allowed(
+                           'TICKET_VIEW', [Resource(self.realm, result['id'])
+                                           for result in results])}
             for result in results:
                 ticket = Resource(self.realm, result['id'])
-                if 'TICKET_VIEW' in req.perm(ticket):
+                if result['id'] in allowed:
                     values = []
                     for col in cols:
                         value = result[col]
@@ -1472,8 +1537,10 @@ class TicketQueryMacro(WikiMacroBase):
         # Formats above had their own permission checks, here we need to
         # do it explicitly:
 
-        tickets = [t for t in tickets
-                   if 'TICKET_VIEW' in req.perm(self.realm, t['id'])]
+        allowed = {resource.id for resource in req.perm.filter_allowed(
+                       'TICKET_VIEW', [Resource(self.realm, t['id'])
+                                       for t in tickets])}
+        tickets = [t for t in tickets if t['id'] in allowed]
 
         if not tickets:
             return tag.span(_("No results"), class_='query_no_results')
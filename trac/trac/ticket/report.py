@@ -545,13 +545,24 @@ class ReportModule(Component):
         row_groups = []
         authorized_results = []
         prev_group_value = None
+
+        # Check the permissions on the resources of all the rows at once,
+        # the checks done for each row then use the cached decisions
+        cols = [header['col'] for header_group in header_groups
+                              for header in header_group]
+        resources = [self._get_row_resource(cols, result)
+                     for result in results]
+        for realm in {resource.realm for resource in resources}:
+            # FIXME: for now, we still need to hardcode the realm in the
+            # action
+            req.perm.filter_allowed(realm.upper() + '_VIEW',
+                                    [resource for resource in resources
+                                              if resource.realm == realm])
+
         for row_idx, result in enumerate(results):
             col_idx = 0
             cell_groups = []
             row = {'cell_groups': cell_groups}
-            realm = TicketSystem.realm
-            parent_realm = ''
-            parent_id = ''
             email_cells = []
             for header_group in header_groups:
                 cell_group = []
@@ -577,19 +588,9 @@ class ReportModule(Component):
                     col = col.strip('_')
                     if col in ('reporter', 'cc', 'owner'):
                         email_cells.append(cell)
-                    elif col == 'realm':
-                        realm = value
-                    elif col == 'parent_realm':
-                        parent_realm = value
-                    elif col == 'parent_id':
-                        parent_id = value
                     cell_group.append(cell)
                 cell_groups.append(cell_group)
-            if parent_realm:
-                resource = Resource(realm, row.get('id'),
-                                    parent=Resource(parent_realm, parent_id))
-            else:
-                resource = Resource(realm, row.get('id'))
+            resource = resources[row_idx]
             # FIXME: for now, we still need to hardcode the realm in the action
             if resource.realm.upper() + '_VIEW' not in req.perm(resource):
                 continue
@@ -672,6 +673,31 @@ class ReportModule(Component):
                     args=", ".join(missing_args)))
             return 'report_view.html', data, None
 
+    def _get_row_resource(self, cols, result):
+        """Return the resource described by the `realm`, `id`,
+        `parent_realm` and `parent_id` columns of a report row.
+        """
+        realm = TicketSystem.realm
+        id = None
+        parent_realm = ''
+        parent_id = ''
+        for col, value in zip(cols, result):
+            value = cell_value(value)
+            if col in ('report', 'ticket', 'id', '_id'):
+                id = value
+            col = col.strip('_')
+            if col == 'realm':
+                realm = value
+            elif col == 'parent_realm':
+                parent_realm = value
+            elif col == 'parent_id':
+                parent_id = value
+        if parent_realm:
+            return Resource(realm, id, parent=Resource(parent_realm,
+                                                       parent_id))
+        else:
+            return Resource(realm, id)
+
     def execute_paginated_report(self, req, id, sql, args, limit=0, offset=0):
         """
         :param req: `Request` object.
@@ -698,8 +724,15 @@ class ReportModule(Component):
             if id == self.REPORT_LIST_ID or limit == 0:
                 sql = base_sql
             else:
-                # The number of tickets is obtained
-                count_sql = 'SELECT COUNT(*) FROM (\n%s\n) AS tab' % base_sql
+                # The number of tickets and the column names are obtained,
+                # in a single query if the database has window functions
+                windowed = db.has_window_functions()
+                if windowed:
+                    count_sql = 'SELECT tab.*, COUNT(*) OVER () ' \
+                                'FROM (\n%s\n) AS tab LIMIT 1' % base_sql
+                else:
+                    count_sql = 'SELECT COUNT(*) FROM (\n%s\n) AS tab' \
+                                % base_sql
                 self.log.debug("Report {%d} SQL (count): %s", id, count_sql)
                 try:
                     cursor.execute(count_sql, args)
@@ -709,22 +742,27 @@ class ReportModule(Component):
                                      id, count_sql, args,
                                      exception_to_unicode(e, traceback=True))
                     return e, count_sql
-                num_items = cursor.fetchone()[0]
-
-                # The column names are obtained
-                colnames_sql = 'SELECT * FROM (\n%s\n) AS tab LIMIT 1' \
-                               % base_sql
-                self.log.debug("Report {%d} SQL (col names): %s",
-                               id, colnames_sql)
-                try:
-                    cursor.execute(colnames_sql, args)
-                except Exception as e:
-                    self.log.warning('Exception caught while executing '
-                                     'Report {%d}: args %r%s',
-                                     id, colnames_sql, args,
-                                     exception_to_unicode(e, traceback=True))
-                    return e, colnames_sql
-                cols = get_column_names(cursor)
+                if windowed:
+                    row = cursor.fetchone()
+                    num_items = row[-1] if row else 0
+                    cols = get_column_names(cursor)[:-1]
+                else:
+                    num_items = cursor.fetchone()[0]
+
+                    colnames_sql = 'SELECT * FROM (\n%s\n) AS tab LIMIT 1' \
+                                   % base_sql
+                    self.log.debug("Report {%d} SQL (col names): %s",
+                                   id, colnames_sql)
+                    try:
+                        cursor.execute(colnames_sql, args)
+                    except Exception as e:
+                        self.log.warning('Exception caught while executing '
+                                         'Report {%d}: %r, args %r%s',
+                                         id, colnames_sql, args,
+                                         exception_to_unicode(
+                                             e, traceback=True))
+                        return e, colnames_sql
+                    cols = get_column_names(cursor)
 
                 # The ORDER BY columns are inserted
                 sort_col = req.args.get('sort', '')
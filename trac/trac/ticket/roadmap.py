@@ -16,8 +16,11 @@
 # Author: Christopher Lenz <cmlenz@gmx.de>
 
 from datetime import datetime, timedelta
+import functools
+import heapq
 import io
 import itertools
+from operator import itemgetter
 import re
 
 from trac.attachment import Attachment, AttachmentModule
@@ -26,7 +29,10 @@ from trac.core import *
 from trac.notification.api import NotificationSystem
 from trac.perm import IPermissionRequestor
 from trac.resource import *
-from trac.search import ISearchSource, search_to_regexps, shorten_result
+from trac.search import (
+    ISearchSource, expand_search_result, merge_search_results,
+    search_to_regexps, shorten_result
+)
 from trac.util import as_bool, partition
 from trac.util.datefmt import (datetime_now, format_date, format_datetime,
                                from_utimestamp, get_datetime_format_hint,
@@ -36,16 +42,16 @@ from trac.util.html import tag
 from trac.util.presentation import classes
 from trac.util.text import CRLF, exception_to_unicode, to_unicode
 from trac.util.translation import _, tag_
-from trac.ticket.api import TicketSystem
+from trac.ticket.api import IMilestoneChangeListener, TicketSystem
 from trac.ticket.notification import BatchTicketChangeEvent
 from trac.ticket.model import Milestone, MilestoneCache, Ticket
-from trac.timeline.api import ITimelineEventProvider
+from trac.timeline.api import ITimelineEventProvider, TimelineEventCache
 from trac.web.api import HTTPBadRequest, IRequestHandler, RequestDone
 from trac.web.chrome import (Chrome, INavigationContributor, accesskey,
                              add_link, add_notice, add_stylesheet, add_warning,
                              auth_link, prevnext_nav, web_context)
 from trac.wiki.api import IWikiSyntaxProvider
-from trac.wiki.formatter import format_to
+from trac.wiki.formatter import WikiRenderCache, format_to
 
 
 class ITicketGroupStatsProvider(Interface):
@@ -359,8 +365,10 @@ def get_num_tickets_for_milestone(env, milestone, exclude_closed=False):
 def apply_ticket_permissions(env, req, tickets):
     """Apply permissions to a set of milestone tickets as returned by
     `get_tickets_for_milestone()`."""
-    return [t for t in tickets
-            if 'TICKET_VIEW' in req.perm('ticket', t['id'])]
+    allowed = {resource.id for resource in req.perm.filter_allowed(
+                   'TICKET_VIEW', [Resource('ticket', t['id'])
+                                   for t in tickets])}
+    return [t for t in tickets if t['id'] in allowed]
 
 
 def milestone_stats_data(env, req, stat, name, grouped_by='component',
@@ -493,8 +501,9 @@ class RoadmapModule(Component):
         if 'noduedate' in show:
             milestones = [m for m in milestones
                           if m.due is not None or m.completed]
-        milestones = [m for m in milestones
-                      if 'MILESTONE_VIEW' in req.perm(m.resource)]
+        allowed = {resource.id for resource in req.perm.filter_allowed(
+                       'MILESTONE_VIEW', [m.resource for m in milestones])}
+        milestones = [m for m in milestones if m.name in allowed]
 
         stats = []
         queries = []
@@ -656,9 +665,9 @@ class RoadmapModule(Component):
 class MilestoneModule(Component):
     """View and edit individual milestones."""
 
-    implements(INavigationContributor, IPermissionRequestor, IRequestHandler,
-               IResourceManager, ISearchSource, ITimelineEventProvider,
-               IWikiSyntaxProvider)
+    implements(IMilestoneChangeListener, INavigationContributor,
+               IPermissionRequestor, IRequestHandler, IResourceManager,
+               ISearchSource, ITimelineEventProvider, IWikiSyntaxProvider)
 
     realm = 'milestone'
 
@@ -692,6 +701,20 @@ class MilestoneModule(Component):
                    'MILESTONE_VIEW']
         return actions + [('MILESTONE_ADMIN', actions)]
 
+    # IMilestoneChangeListener methods
+
+    def milestone_created(self, milestone):
+        TimelineEventCache(self.env).invalidate()
+        WikiRenderCache(self.env).invalidate()
+
+    def milestone_changed(self, milestone, old_values):
+        TimelineEventCache(self.env).invalidate()
+        WikiRenderCache(self.env).invalidate()
+
+    def milestone_deleted(self, milestone):
+        TimelineEventCache(self.env).invalidate()
+        WikiRenderCache(self.env).invalidate()
+
     # ITimelineEventProvider methods
 
     def get_timeline_filters(self, req):
@@ -699,21 +722,33 @@ class MilestoneModule(Component):
             yield ('milestone', _("Milestones completed"))
 
     def get_timeline_events(self, req, start, stop, filters):
+        return self.get_ordered_timeline_events(req, start, stop, filters)
+
+    def get_ordered_timeline_events(self, req, start, stop, filters):
         if 'milestone' in filters:
             milestone_realm = Resource(self.realm)
-            for name, due, completed, description \
-                    in MilestoneCache(self.env).milestones.values():
-                if completed and start <= completed <= stop:
-                    # TODO: creation and (later) modifications should also be
-                    #       reported
+
+            def produce_milestone_events():
+                milestones = [m for m in
+                              MilestoneCache(self.env).milestones.values()
+                              if m[2] and start <= m[2] <= stop]
+                for name, due, completed, description \
+                        in sorted(milestones, key=itemgetter(2),
+                                  reverse=True):
+                    # TODO: creation and (later) modifications should also
+                    #       be reported
                     milestone = milestone_realm(id=name)
                     if 'MILESTONE_VIEW' in req.perm(milestone):
                         yield ('milestone', completed, '',  # FIXME: author?
                                (milestone, description))
 
             # Attachments
-            for event in AttachmentModule(self.env).get_timeline_events(
-                    req, milestone_realm, start, stop):
+            attachment_events = AttachmentModule(self.env) \
+                                .get_timeline_events(req, milestone_realm,
+                                                     start, stop)
+            for event in heapq.merge(produce_milestone_events(),
+                                     attachment_events, key=itemgetter(1),
+                                     reverse=True):
                 yield event
 
     def render_timeline_event(self, context, field, event):
@@ -1053,8 +1088,10 @@ class MilestoneModule(Component):
             add_link(req, rel, href, _('Milestone "%(name)s"',
                                        name=milestone.name))
 
-        milestones = [m for m in Milestone.select(self.env)
-                      if 'MILESTONE_VIEW' in req.perm(m.resource)]
+        milestones = Milestone.select(self.env)
+        allowed = {resource.id for resource in req.perm.filter_allowed(
+                       'MILESTONE_VIEW', [m.resource for m in milestones])}
+        milestones = [m for m in milestones if m.name in allowed]
         idx = [i for i, m in enumerate(milestones) if m.name == milestone.name]
         if idx:
             idx = idx[0]
@@ -1162,10 +1199,16 @@ class MilestoneModule(Component):
             yield ('milestone', _("Milestones"))
 
     def get_search_results(self, req, terms, filters):
+        for result in self.get_ranked_search_results(req, terms, filters,
+                                                     None):
+            yield expand_search_result(result)
+
+    def get_ranked_search_results(self, req, terms, filters, limit):
         if 'milestone' not in filters:
-            return
+            return ()
         term_regexps = search_to_regexps(terms)
         milestone_realm = Resource(self.realm)
+        results = []
         for name, due, completed, description \
                 in MilestoneCache(self.env).milestones.values():
             if all(r.search(description) or r.search(name)
@@ -1174,11 +1217,13 @@ class MilestoneModule(Component):
                 if 'MILESTONE_VIEW' in req.perm(milestone):
                     dt = (completed if completed else
                           due if due else datetime_now(utc))
-                    yield (get_resource_url(self.env, milestone, req.href),
-                           get_resource_name(self.env, milestone), dt,
-                           '', shorten_result(description, terms))
-
-        # Attachments
-        for result in AttachmentModule(self.env).get_search_results(
-                req, milestone_realm, terms):
-            yield result
+                    results.append((
+                        get_resource_url(self.env, milestone, req.href),
+                        get_resource_name(self.env, milestone), dt, '',
+                        functools.partial(shorten_result, description,
+                                          terms)))
+        results.sort(key=lambda result: result[2], reverse=True)
+
+        return merge_search_results(
+            results, AttachmentModule(self.env).get_ranked_search_results(
+                         req, milestone_realm, terms, limit))
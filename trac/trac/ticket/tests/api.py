@@ -11,6 +11,7 @@
 # individuals. For the exact contribution history, see the revision
 # history and logs, available at https://trac.edgewall.org/log/.
 
+import io
 from datetime import timedelta
 
 from trac.perm import PermissionCache, PermissionSystem
@@ -21,6 +22,8 @@ from trac.ticket.api import TicketSystem
 from trac.ticket.model import Milestone, Ticket, Version
 from trac.ticket.test import insert_ticket
 from trac.util.datefmt import datetime_now, utc
+from trac.web.chrome import web_context
+from trac.wiki.formatter import Formatter
 
 import unittest
 
@@ -502,6 +505,29 @@ class TicketSystemTestCase(unittest.TestCase):
         self.assertFalse(self.ticket_system.resource_exists(r3))
         self.assertFalse(self.ticket_system.resource_exists(r4))
 
+    def test_prefetch_links(self):
+        insert_ticket(self.env, summary='First', status='new')
+        insert_ticket(self.env, summary='Second', status='closed',
+                      resolution='fixed')
+        context = web_context(MockRequest(self.env))
+        formatter = Formatter(self.env, context)
+
+        out = io.StringIO()
+        formatter.format("#1 ticket:2 #99 [ticket:1 one]", out)
+        html = out.getvalue()
+
+        self.assertEqual([('defect', 'First', 'new', None)],
+                         formatter.link_cache[('ticket', 1)])
+        self.assertEqual([('defect', 'Second', 'closed', 'fixed')],
+                         formatter.link_cache[('ticket', 2)])
+        self.assertEqual([], formatter.link_cache[('ticket', 99)])
+        self.assertIn('<a class="new ticket" href="/trac.cgi/ticket/1" '
+                      'title="#1: defect: First (new)">#1</a>', html)
+        self.assertIn('title="#2: defect: Second (closed: fixed)">ticket:2</a>',
+                      html)
+        self.assertIn('<a class="missing ticket">#99</a>', html)
+        self.assertIn('>one</a>', html)
+
 
 def test_suite():
     return makeSuite(TicketSystemTestCase)
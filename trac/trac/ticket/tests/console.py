@@ -18,6 +18,7 @@ from trac.admin.api import get_console_locale
 from trac.admin.console import TracAdmin
 from trac.admin.test import TracAdminTestCaseBase
 from trac.test import EnvironmentStub, makeSuite
+from trac.ticket.model import CustomFieldTable
 from trac.ticket.test import insert_ticket
 from trac.util.datefmt import get_datetime_format_hint
 
@@ -296,6 +297,24 @@ class TracAdminTestCase(TracAdminTestCaseBase):
         self.assertEqual(2, rv, output)
         self.assertExpectedResult(output)
 
+    def test_ticket_custom_rebuild(self):
+        """Custom field table is rebuilt."""
+        self.env.config.set('ticket-custom', 'foo', 'text')
+        insert_ticket(self.env, foo='bar')
+        insert_ticket(self.env)
+        rv, output = self.execute('ticket custom rebuild')
+        self.assertEqual(0, rv, output)
+        self.assertExpectedResult(output)
+        self.assertEqual(['foo'], CustomFieldTable(self.env).fields)
+
+    def test_ticket_custom_drop(self):
+        """Custom field table is dropped."""
+        CustomFieldTable(self.env).rebuild()
+        rv, output = self.execute('ticket custom drop')
+        self.assertEqual(0, rv, output)
+        self.assertExpectedResult(output)
+        self.assertEqual([], CustomFieldTable(self.env).fields)
+
     def test_ticket_type_list_ok(self):
         """
         Tests the 'ticket_type list' command in trac-admin.  Since this command
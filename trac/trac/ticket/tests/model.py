@@ -24,10 +24,11 @@ from trac.ticket.api import (
     IMilestoneChangeListener, ITicketChangeListener, TicketSystem
 )
 from trac.ticket.model import (
-    Component, Milestone, Priority, Report, Ticket, Version
+    Component, CustomFieldTable, Milestone, Priority, Report, Ticket, Version
 )
 from trac.ticket.roadmap import MilestoneModule
 from trac.ticket.test import insert_ticket
+from trac.ticket.web_ui import TicketModule
 from trac.util.datefmt import datetime_now, from_utimestamp, to_utimestamp, utc
 
 
@@ -69,7 +70,8 @@ class TicketTestCase(unittest.TestCase):
     def setUp(self):
         self.env = EnvironmentStub(default_data=True,
                                    enable=['trac.ticket.*'] +
-                                           self.ticket_change_listeners)
+                                           self.ticket_change_listeners,
+                                   disable=[TicketModule])
         self.env.config.set('ticket-custom', 'foo', 'text')
         self.env.config.set('ticket-custom', 'cbon', 'checkbox')
         self.env.config.set('ticket-custom', 'cboff', 'checkbox')
@@ -608,7 +610,8 @@ class TicketCommentEditTestCase(TicketCommentTestCase):
     def setUp(self):
         self.env = EnvironmentStub(default_data=True,
                                    enable=['trac.ticket.*'] +
-                                          self.ticket_change_listeners)
+                                          self.ticket_change_listeners,
+                                   disable=[TicketModule])
         self.created = datetime(2001, 1, 1, 1, 0, 0, 0, utc)
         self._insert_ticket('Test ticket', self.created,
                             owner='john', keywords='a, b, c')
@@ -798,7 +801,8 @@ class TicketCommentDeleteTestCase(TicketCommentTestCase):
     def setUp(self):
         self.env = EnvironmentStub(default_data=True,
                                    enable=['trac.ticket.*'] +
-                                          self.ticket_change_listeners)
+                                          self.ticket_change_listeners,
+                                   disable=[TicketModule])
         self.env.config.set('ticket-custom', 'foo', 'text')
         self.created = datetime(2001, 1, 1, 1, 0, 0, 0, utc)
         self._insert_ticket('Test ticket', self.created,
@@ -1361,17 +1365,17 @@ class MilestoneTestCase(unittest.TestCase):
 
     def test_change_listener_created(self):
         ts = TicketSystem(self.env)
-        listener = ts.milestone_change_listeners[0]
+        listener = self.milestone_change_listeners[0](self.env)
         milestone = self._create_milestone(name='Milestone 1')
         milestone.insert()
 
-        self.assertEqual(1, len(ts.milestone_change_listeners))
+        self.assertIn(listener, ts.milestone_change_listeners)
         self.assertEqual('created', listener.action)
         self.assertEqual(milestone, listener.milestone)
 
     def test_change_listener_changed(self):
         ts = TicketSystem(self.env)
-        listener = ts.milestone_change_listeners[0]
+        listener = self.milestone_change_listeners[0](self.env)
         milestone = self._create_milestone(
             name='Milestone 1',
             due=datetime(2001, 1, 1, tzinfo=utc),
@@ -1383,7 +1387,7 @@ class MilestoneTestCase(unittest.TestCase):
         milestone.description = 'The changed description'
         milestone.update()
 
-        self.assertEqual(1, len(ts.milestone_change_listeners))
+        self.assertIn(listener, ts.milestone_change_listeners)
         self.assertEqual('changed', listener.action)
         self.assertEqual(milestone, listener.milestone)
         self.assertEqual({'name': 'Milestone 1', 'completed': None,
@@ -1392,9 +1396,9 @@ class MilestoneTestCase(unittest.TestCase):
 
     def test_change_listener_deleted(self):
         ts = TicketSystem(self.env)
-        listener = ts.milestone_change_listeners[0]
+        listener = self.milestone_change_listeners[0](self.env)
         milestone = self._create_milestone(name='Milestone 1')
-        self.assertEqual(1, len(ts.milestone_change_listeners))
+        self.assertIn(listener, ts.milestone_change_listeners)
         milestone.insert()
         self.assertTrue(milestone.exists)
         milestone.delete()
@@ -1839,6 +1843,63 @@ class VersionTestCase(unittest.TestCase):
             "SELECT name, time, description FROM version WHERE name='Test'"))
 
 
+class CustomFieldTableTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentStub(default_data=True)
+        self.env.config.set('ticket-custom', 'foo', 'text')
+        self.env.config.set('ticket-custom', 'bar', 'select')
+        self.env.config.set('ticket-custom', 'bar.options', '|one|two')
+        self.table = CustomFieldTable(self.env)
+
+    def tearDown(self):
+        self.env.reset_db()
+
+    def _get_rows(self):
+        return self.env.db_query("""
+            SELECT id, foo, bar FROM ticket_custom_table ORDER BY id
+            """)
+
+    def test_rebuild(self):
+        insert_ticket(self.env, summary='Ticket 1', foo='x', bar='one')
+        insert_ticket(self.env, summary='Ticket 2')
+        self.assertEqual([], self.table.fields)
+
+        self.assertEqual(2, self.table.rebuild())
+
+        self.assertEqual(['bar', 'foo'], self.table.fields)
+        self.assertEqual([(1, 'x', 'one'), (2, None, None)],
+                         self._get_rows())
+
+    def test_drop(self):
+        self.table.rebuild()
+        self.table.drop()
+
+        self.assertEqual([], self.table.fields)
+        with self.env.db_query as db:
+            self.assertFalse(db.has_table('ticket_custom_table'))
+        insert_ticket(self.env, summary='Ticket 1', foo='x')
+
+    def test_ticket_changes(self):
+        self.table.rebuild()
+        when = datetime(2001, 1, 1, tzinfo=utc)
+        ticket = insert_ticket(self.env, summary='Ticket 1', foo='x',
+                               when=when)
+        self.assertEqual([(1, 'x', None)], self._get_rows())
+
+        ticket['bar'] = 'two'
+        ticket.save_changes('joe', when=when + timedelta(seconds=1))
+        ticket['foo'] = 'y'
+        ticket.save_changes('joe', when=when + timedelta(seconds=2))
+        self.assertEqual([(1, 'y', 'two')], self._get_rows())
+
+        ticket.delete_change(cdate=when + timedelta(seconds=2))
+        self.assertEqual([(1, 'x', 'two')], self._get_rows())
+
+        ticket.delete()
+        self.assertEqual([], self._get_rows())
+
+
 def test_suite():
     suite = unittest.TestSuite()
     suite.addTest(makeSuite(TicketTestCase))
@@ -1849,6 +1910,7 @@ def test_suite():
     suite.addTest(makeSuite(ComponentTestCase))
     suite.addTest(makeSuite(ReportTestCase))
     suite.addTest(makeSuite(VersionTestCase))
+    suite.addTest(makeSuite(CustomFieldTableTestCase))
     return suite
 
 if __name__ == '__main__':
@@ -16,10 +16,12 @@ import difflib
 import re
 import unittest
 
+from trac.core import TracError
 from trac.mimeview.api import Mimeview
 from trac.test import Mock, EnvironmentStub, MockPerm, MockRequest, makeSuite
 from trac.ticket.api import TicketSystem
-from trac.ticket.model import Milestone, Severity, Ticket, Version
+from trac.ticket.model import (CustomFieldTable, Milestone,
+                               QueryCountCache, Severity, Ticket, Version)
 from trac.ticket.query import Query, QueryModule, TicketQueryMacro
 from trac.ticket.test import insert_ticket
 from trac.util.datefmt import utc
@@ -520,6 +522,106 @@ ORDER BY COALESCE(t.id,0)=0,t.id""")
         query = Query.from_string(self.env, 'col_00=notfound')
         self.assertEqual([], query.execute(self.req))
 
+    def test_custom_field_table(self):
+        self.env.config.set('ticket-custom', 'foo', 'text')
+        self.env.config.set('ticket-custom', 'bar', 'text')
+        self._update_tickets('foo', [None, '', 'something'])
+        self._update_tickets('bar', ['x', 'y'])
+        CustomFieldTable(self.env).rebuild()
+        self._update_tickets('bar', ['y', 'x'])
+        query = Query.from_string(self.env, 'foo=something&bar=y|x&'
+                                            'order=bar&col=id&col=foo&col=bar')
+        sql, args = query.get_sql()
+        with self.env.db_query as db:
+            foo = db.quote('foo')
+            bar = db.quote('bar')
+            table = db.quote('ticket_custom_table')
+        self.assertEqualSQL(sql,
+"""SELECT t.id AS id,t.status AS status,t.priority AS priority,t.time AS time,t.changetime AS changetime,priority.value AS _priority_value,c.%(foo)s AS %(foo)s,c.%(bar)s AS %(bar)s
+FROM ticket AS t
+  LEFT OUTER JOIN %(table)s AS c ON c.id=t.id
+  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=t.priority)
+WHERE (COALESCE(c.%(bar)s,'') IN (%%s,%%s) AND (COALESCE(c.%(foo)s,'')=%%s))
+ORDER BY COALESCE(c.%(bar)s,'')='',c.%(bar)s,t.id"""
+        % {'foo': foo, 'bar': bar, 'table': table})
+        self.assertEqual(['y', 'x', 'something'], args)
+        tickets = self._execute_query(query)
+        self.assertEqual([(self.tktids[5], 'x'), (self.tktids[2], 'y'),
+                          (self.tktids[8], 'y')],
+                         [(t['id'], t['bar']) for t in tickets])
+
+        CustomFieldTable(self.env).drop()
+        self.assertNotIn('ticket_custom_table', query.get_sql()[0])
+        self.assertEqual(tickets, self._execute_query(query))
+
+    def test_custom_field_table_without_field(self):
+        self.env.config.set('ticket-custom', 'foo', 'text')
+        CustomFieldTable(self.env).rebuild()
+        self.env.config.set('ticket-custom', 'bar', 'text')
+        TicketSystem(self.env).reset_ticket_fields()
+        del TicketSystem(self.env).custom_fields
+        self._update_tickets('bar', ['x', 'y'])
+
+        query = Query.from_string(self.env, 'bar=x&order=id&col=id&col=foo')
+        sql, args = query.get_sql()
+
+        self.assertNotIn('ticket_custom_table', sql)
+        self.assertEqual(self.tktids[0::2],
+                         [t['id'] for t in self._execute_query(query)])
+
+    def test_paginated_execute(self):
+        def execute(**kwargs):
+            query = Query(self.env, order='id', **kwargs)
+            ids = [t['id'] for t in query.execute(self.req)]
+            return ids, query.num_items, query.has_more_pages
+
+        self.assertEqual((self.tktids[3:6], 10, True),
+                         execute(max=3, page=2))
+        self.assertEqual((self.tktids[9:], 10, True), execute(max=3, page=4))
+        ids, num_items, has_more_pages = execute(max=3, page=2,
+                                                 group='milestone')
+        self.assertEqual((4, 10, True), (len(ids), num_items, has_more_pages))
+        self.assertEqual((self.tktids, 10, False), execute(max=0))
+        self.assertEqual((self.tktids, 10, False), execute(max=10, page=1))
+        self.assertEqual((self.tktids, 10, False), execute(max=20, page=2))
+        self.assertRaises(TracError, execute, max=3, page=5)
+
+    def test_paginated_execute_without_results(self):
+        query = Query.from_string(self.env, 'owner=joe&order=id')
+        query.max = 3
+        query.page = 2
+        query.offset = 3
+        self.assertEqual([], query.execute(self.req))
+        self.assertEqual(0, query.num_items)
+        self.assertFalse(query.has_more_pages)
+
+    def test_count_cache(self):
+        self.env.config.set('query', 'count_cache_size', 10)
+        count_cache = QueryCountCache(self.env)
+        query = Query.from_string(self.env, 'status=new&order=id&max=1')
+        sql, args = query.get_sql()
+        self.assertIsNone(count_cache.get(sql, args))
+
+        self.assertEqual(2, query.count())
+        self.assertEqual(2, count_cache.get(sql, args))
+        count_cache.set(sql, args, 42)
+        query.execute(self.req)
+        self.assertEqual(42, query.num_items)
+
+        insert_ticket(self.env, status='new')
+        self.assertIsNone(count_cache.get(sql, args))
+        query.execute(self.req)
+        self.assertEqual(3, query.num_items)
+        self.assertEqual(3, count_cache.get(sql, args))
+
+    def test_count_cache_disabled(self):
+        count_cache = QueryCountCache(self.env)
+        query = Query.from_string(self.env, 'status=new&order=id&max=1')
+        sql, args = query.get_sql()
+        query.execute(self.req)
+        self.assertEqual(2, query.num_items)
+        self.assertIsNone(count_cache.get(sql, args))
+
     def test_constrained_by_multiple_owners(self):
         query = Query.from_string(self.env, 'owner=someone|someone_else',
                                   order='id')
@@ -568,6 +568,31 @@ class ExecuteReportTestCase(unittest.TestCase):
         idx_color = cols.index('__color__')
         self.assertEqual({'2', '3', '4'}, {r[idx_color] for r in results})
 
+    def test_paginated_report(self):
+        attrs = dict(reporter='joe', owner='joe')
+        self._generate_tickets(('status', 'priority'), self.REPORT_1_DATA,
+                               attrs)
+        req = MockRequest(self.env)
+        sql = 'SELECT id AS ticket, summary FROM ticket ' \
+              'WHERE id > $MIN ORDER BY id'
+
+        rv = self.report_module.execute_paginated_report(
+            req, 9, sql, {'MIN': '0'}, limit=4, offset=4)
+        cols, results, num_items, missing_args, limit_offset = rv
+        self.assertEqual(['ticket', 'summary'], cols)
+        self.assertEqual([(5, 'closed major'), (6, 'closed critical')],
+                         results)
+        self.assertEqual(6, num_items)
+        self.assertEqual('LIMIT 4 OFFSET 4', limit_offset)
+
+        rv = self.report_module.execute_paginated_report(
+            req, 9, sql, {'MIN': '6'}, limit=4, offset=0)
+        cols, results, num_items, missing_args, limit_offset = rv
+        self.assertEqual(['ticket', 'summary'], cols)
+        self.assertEqual([], results)
+        self.assertEqual(0, num_items)
+        self.assertEqual('', limit_offset)
+
     REPORT_2_DATA = """\
         # status    version     priority
         new         2.0         minor
@@ -1150,6 +1150,52 @@ class TicketModuleTestCase(unittest.TestCase):
         """Custom fields with custom ticketlink_query."""
         self._test_custom_field_with_ticketlink_query_option('')
 
+    def test_ordered_timeline_events(self):
+        t0 = datetime(2018, 4, 1, 12, tzinfo=utc)
+        tkt1 = insert_ticket(self.env, summary='Ticket 1', when=t0)
+        tkt2 = insert_ticket(self.env, summary='Ticket 2',
+                             when=t0 + timedelta(hours=1))
+        tkt1.save_changes('joe', 'Comment 1', t0 + timedelta(hours=2))
+        tkt2['status'] = 'closed'
+        tkt2['resolution'] = 'fixed'
+        tkt2.save_changes('joe', None, t0 + timedelta(hours=3))
+        tkt1.save_changes('joe', 'Comment 2', t0 + timedelta(hours=4))
+        req = MockRequest(self.env)
+
+        events = self.ticket_module.get_ordered_timeline_events(
+            req, t0 - timedelta(days=1), t0 + timedelta(days=1),
+            ['ticket', 'ticket_details'])
+
+        self.assertEqual([('editedticket', 1, 4), ('closedticket', 2, 3),
+                          ('editedticket', 1, 2), ('newticket', 2, 1),
+                          ('newticket', 1, 0)],
+                         [(ev[0], ev[3][0].id,
+                           (ev[1] - t0) // timedelta(hours=1))
+                          for ev in events])
+
+    def test_timeline_permissions_checked_in_batches(self):
+        t0 = datetime(2018, 4, 1, 12, tzinfo=utc)
+        for idx in range(5):
+            insert_ticket(self.env, summary='Ticket %d' % (idx + 1),
+                          when=t0 + timedelta(hours=idx))
+        self.ticket_module.timeline_batch_size = 2
+        req = MockRequest(self.env)
+        checked = []
+        filter_allowed = req.perm.filter_allowed
+        def check(action, resources):
+            resources = list(resources)
+            checked.append([resource.id for resource in resources])
+            return filter_allowed(action, resources)
+        req.perm.filter_allowed = check
+
+        events = self.ticket_module.get_ordered_timeline_events(
+            req, t0 - timedelta(days=1), t0 + timedelta(days=1), ['ticket'])
+
+        self.assertEqual(5, next(events)[3][0].id)
+        self.assertEqual([[4, 5]], checked)
+        self.assertEqual([4, 3, 2, 1], [ev[3][0].id for ev in events])
+        self.assertEqual([[4, 5], [2, 3], [1]], checked)
+
     def _reset_ticket_fields(self):
         tktsys = TicketSystem(self.env)
         tktsys.reset_ticket_fields()
@@ -17,7 +17,9 @@
 import csv
 from datetime import datetime
 import functools
+import heapq
 import io
+from operator import itemgetter
 import pkg_resources
 import re
 
@@ -31,12 +33,17 @@ from trac.resource import (
     Resource, ResourceNotFound, get_resource_url, render_resource_link,
     get_resource_shortname
 )
-from trac.search import ISearchSource, search_to_sql, shorten_result
+from trac.search import (
+    ISearchIndexer, ISearchSource, SearchIndex, expand_search_result,
+    iter_search_rows, merge_search_results, search_to_sql, shorten_result
+)
 from trac.ticket import model
-from trac.ticket.api import TicketSystem, ITicketManipulator, TicketFieldList
+from trac.ticket.api import (
+    ITicketChangeListener, ITicketManipulator, TicketFieldList, TicketSystem
+)
 from trac.ticket.notification import TicketChangeEvent
 from trac.ticket.roadmap import group_milestones
-from trac.timeline.api import ITimelineEventProvider
+from trac.timeline.api import ITimelineEventProvider, TimelineEventCache
 from trac.util import as_bool, as_int, get_reporter_id, lazy, to_list
 from trac.util.datefmt import (
     datetime_now, format_datetime, format_date_or_datetime, from_utimestamp,
@@ -63,12 +70,16 @@ from trac.wiki.formatter import format_to, format_to_html
 class TicketModule(Component):
 
     implements(IContentConverter, INavigationContributor, IRequestHandler,
-               ISearchSource, ITemplateProvider, ITimelineEventProvider)
+               ISearchIndexer, ISearchSource, ITemplateProvider,
+               ITicketChangeListener, ITimelineEventProvider)
 
     ticket_manipulators = ExtensionPoint(ITicketManipulator)
 
     realm = TicketSystem.realm
 
+    # Number of timeline rows fetched and checked for permissions at once
+    timeline_batch_size = 100
+
     timeline_details = BoolOption('timeline', 'ticket_show_details', 'true',
         """Enable the display of all ticket changes in the timeline, not only
         open / close operations.""")
@@ -176,46 +187,49 @@ class TicketModule(Component):
             yield ('ticket', _("Tickets"))
 
     def get_search_results(self, req, terms, filters):
+        for result in self.get_ranked_search_results(req, terms, filters,
+                                                     None):
+            yield expand_search_result(result)
+
+    def get_ranked_search_results(self, req, terms, filters, limit):
         if 'ticket' not in filters:
-            return
+            return ()
         ticket_realm = Resource(self.realm)
-        with self.env.db_query as db:
-            sql, args = search_to_sql(db, ['summary', 'keywords',
-                                           'description', 'reporter', 'cc',
-                                           db.cast('id', 'text')], terms)
-            sql2, args2 = search_to_sql(db, ['newvalue'], terms)
-            sql3, args3 = search_to_sql(db, ['value'], terms)
-            ticketsystem = TicketSystem(self.env)
-            for summary, desc, author, type, tid, ts, status, resolution in \
-                    db("""SELECT summary, description, reporter, type, id,
-                                 time, status, resolution
-                          FROM ticket
-                          WHERE id IN (
-                              SELECT id FROM ticket WHERE %s
-                            UNION
-                              SELECT ticket FROM ticket_change
-                              WHERE field='comment' AND %s
-                            UNION
-                              SELECT ticket FROM ticket_custom WHERE %s
-                          )
-                          """ % (sql, sql2, sql3),
-                          args + args2 + args3):
-                t = ticket_realm(id=tid)
-                if 'TICKET_VIEW' in req.perm(t):
-                    yield (req.href.ticket(tid),
-                           tag_("%(title)s: %(message)s",
-                                title=tag.span(
-                                    get_resource_shortname(self.env, t),
-                                    class_=status),
-                                message=ticketsystem.format_summary(
-                                    summary, status, resolution, type)),
-                           from_utimestamp(ts), author,
-                           shorten_result(desc, terms))
+        return merge_search_results(
+            self._get_ranked_ticket_results(req, terms, limit),
+            AttachmentModule(self.env).get_ranked_search_results(
+                req, ticket_realm, terms, limit))
+
+    # ISearchIndexer methods
+
+    def get_search_index_realms(self):
+        yield self.realm
+
+    def get_search_index_documents(self, realm):
+        return self._get_search_index_documents()
+
+    # ITicketChangeListener methods
+
+    def ticket_created(self, ticket):
+        self._update_search_index(ticket)
+        TimelineEventCache(self.env).invalidate()
+
+    def ticket_changed(self, ticket, comment, author, old_values):
+        self._update_search_index(ticket)
+        TimelineEventCache(self.env).invalidate()
 
-        # Attachments
-        for result in AttachmentModule(self.env).get_search_results(
-            req, ticket_realm, terms):
-            yield result
+    def ticket_deleted(self, ticket):
+        SearchIndex(self.env).remove_document(self.realm, ticket.id)
+        TimelineEventCache(self.env).invalidate()
+
+    def ticket_comment_modified(self, ticket, cdate, author, comment,
+                                old_comment):
+        self._update_search_index(ticket)
+        TimelineEventCache(self.env).invalidate()
+
+    def ticket_change_deleted(self, ticket, cdate, changes):
+        self._update_search_index(ticket)
+        TimelineEventCache(self.env).invalidate()
 
     # ITimelineEventProvider methods
 
@@ -226,6 +240,9 @@ class TicketModule(Component):
                 yield ('ticket_details', _("Ticket updates"), True)
 
     def get_timeline_events(self, req, start, stop, filters):
+        return self.get_ordered_timeline_events(req, start, stop, filters)
+
+    def get_ordered_timeline_events(self, req, start, stop, filters):
         ts_start = to_utimestamp(start)
         ts_stop = to_utimestamp(stop)
 
@@ -269,10 +286,25 @@ class TicketModule(Component):
                     (ticket, verb, info, summary, status, resolution, type,
                      description, component, comment, cid))
 
+        def iter_rows(db, sql, args):
+            # Fetch the rows as the events are consumed and check the
+            # permissions on the tickets of each batch of rows at once,
+            # the checks done for each event then use the cached decisions
+            cursor = db.cursor()
+            cursor.execute(sql, args)
+            while True:
+                rows = cursor.fetchmany(self.timeline_batch_size)
+                if not rows:
+                    break
+                req.perm.filter_allowed('TICKET_VIEW',
+                                        [ticket_realm(id=id) for id
+                                         in sorted({row[0] for row in rows})])
+                for row in rows:
+                    yield row
+
         def produce_ticket_change_events(db):
             data = None
-            for (id, t, author, type, summary,
-                 component, field, oldvalue, newvalue) in db("""
+            rows = iter_rows(db, """
                     SELECT t.id, tc.time, tc.author, t.type, t.summary,
                            t.component, tc.field, tc.oldvalue, tc.newvalue
                     FROM ticket_change tc
@@ -280,8 +312,11 @@ class TicketModule(Component):
                         t.id = tc.ticket AND tc.time>=%%s AND tc.time<=%%s
                     LEFT OUTER JOIN enum p ON
                         p.type='priority' AND p.name=t.priority
-                    ORDER BY tc.time, COALESCE(p.value,'')='', %s, tc.ticket
-                    """ % db.cast('p.value', 'int'), (ts_start, ts_stop)):
+                    ORDER BY tc.time DESC, COALESCE(p.value,'')='', %s,
+                             tc.ticket
+                    """ % db.cast('p.value', 'int'), (ts_start, ts_stop))
+            for (id, t, author, type, summary,
+                 component, field, oldvalue, newvalue) in rows:
                 if not (oldvalue or newvalue):
                     # ignore empty change corresponding to custom field
                     # created (None -> '') or deleted ('' -> None)
@@ -310,53 +345,62 @@ class TicketModule(Component):
                 if ev:
                     yield (ev, data[1])
 
-        # Ticket changes
-        with self.env.db_query as db:
-            if 'ticket' in filters or 'ticket_details' in filters:
-                prev_t = None
-                prev_ev = None
-                batch_ev = None
-                for ev, t in produce_ticket_change_events(db):
-                    if batch_ev:
-                        if prev_t == t:
-                            ticket = ev[3][0]
-                            batch_ev[3][0].append(ticket.id)
-                        else:
-                            yield batch_ev
-                            prev_ev = ev
-                            prev_t = t
-                            batch_ev = None
-                    elif prev_t and prev_t == t:
-                        prev_ticket = prev_ev[3][0]
+        def produce_batched_ticket_change_events(db):
+            prev_t = None
+            prev_ev = None
+            batch_ev = None
+            for ev, t in produce_ticket_change_events(db):
+                if batch_ev:
+                    if prev_t == t:
                         ticket = ev[3][0]
-                        tickets = [prev_ticket.id, ticket.id]
-                        batch_data = (tickets,) + ev[3][1:]
-                        batch_ev = ('batchmodify', ev[1], ev[2], batch_data)
+                        batch_ev[3][0].append(ticket.id)
                     else:
-                        if prev_ev:
-                            yield prev_ev
+                        yield batch_ev
                         prev_ev = ev
                         prev_t = t
-                if batch_ev:
-                    yield batch_ev
-                elif prev_ev:
-                    yield prev_ev
-
-                # New tickets
-                if 'ticket' in filters:
-                    for row in db("""SELECT id, time, reporter, type, summary,
-                                            description, component
-                                     FROM ticket WHERE time>=%s AND time<=%s
-                                     """, (ts_start, ts_stop)):
-                        ev = produce_event(row, 'new', {}, None, None)
-                        if ev:
-                            yield ev
+                        batch_ev = None
+                elif prev_t and prev_t == t:
+                    prev_ticket = prev_ev[3][0]
+                    ticket = ev[3][0]
+                    tickets = [prev_ticket.id, ticket.id]
+                    batch_data = (tickets,) + ev[3][1:]
+                    batch_ev = ('batchmodify', ev[1], ev[2], batch_data)
+                else:
+                    if prev_ev:
+                        yield prev_ev
+                    prev_ev = ev
+                    prev_t = t
+            if batch_ev:
+                yield batch_ev
+            elif prev_ev:
+                yield prev_ev
+
+        def produce_new_ticket_events(db):
+            for row in iter_rows(db, """
+                    SELECT id, time, reporter, type, summary,
+                           description, component
+                    FROM ticket WHERE time>=%s AND time<=%s
+                    ORDER BY time DESC, id
+                    """, (ts_start, ts_stop)):
+                ev = produce_event(row, 'new', {}, None, None)
+                if ev:
+                    yield ev
 
+        with self.env.db_query as db:
+            events = []
+            # Ticket changes
+            if 'ticket' in filters or 'ticket_details' in filters:
+                events.append(produce_batched_ticket_change_events(db))
+            # New tickets
+            if 'ticket' in filters:
+                events.append(produce_new_ticket_events(db))
             # Attachments
             if 'ticket_details' in filters:
-                for event in AttachmentModule(self.env).get_timeline_events(
-                    req, ticket_realm, start, stop):
-                    yield event
+                events.append(AttachmentModule(self.env).get_timeline_events(
+                    req, ticket_realm, start, stop))
+            for event in heapq.merge(*events, key=itemgetter(1),
+                                     reverse=True):
+                yield event
 
     def render_timeline_event(self, context, field, event):
         kind = event[0]
@@ -419,6 +463,87 @@ class TicketModule(Component):
 
     # Internal methods
 
+    def _get_ranked_ticket_results(self, req, terms, limit):
+        ticket_realm = Resource(self.realm)
+        with self.env.db_query as db:
+            index_query = SearchIndex(self.env).get_documents_query(
+                db, self.realm, terms)
+            if index_query is None:
+                sql, args = search_to_sql(db, ['summary', 'keywords',
+                                               'description', 'reporter',
+                                               'cc', db.cast('id', 'text')],
+                                          terms)
+                sql2, args2 = search_to_sql(db, ['newvalue'], terms)
+                sql3, args3 = search_to_sql(db, ['value'], terms)
+                sql = """
+                    SELECT id FROM ticket WHERE %s
+                  UNION
+                    SELECT ticket FROM ticket_change
+                    WHERE field='comment' AND %s
+                  UNION
+                    SELECT ticket FROM ticket_custom WHERE %s
+                    """ % (sql, sql2, sql3)
+                args = args + args2 + args3
+            else:
+                sql, args = index_query
+                sql = 'SELECT %s FROM (%s) AS search_ids' % \
+                      (db.cast('id', 'int'), sql)
+            ticketsystem = TicketSystem(self.env)
+            for summary, desc, author, type, tid, ts, status, resolution in \
+                    iter_search_rows(db, """
+                        SELECT summary, description, reporter, type, id,
+                               time, status, resolution
+                        FROM ticket
+                        WHERE id IN (%s)
+                        ORDER BY time DESC, id
+                        """ % sql, args, limit):
+                t = ticket_realm(id=tid)
+                if 'TICKET_VIEW' in req.perm(t):
+                    yield (req.href.ticket(tid),
+                           tag_("%(title)s: %(message)s",
+                                title=tag.span(
+                                    get_resource_shortname(self.env, t),
+                                    class_=status),
+                                message=ticketsystem.format_summary(
+                                    summary, status, resolution, type)),
+                           from_utimestamp(ts), author,
+                           functools.partial(shorten_result, desc, terms))
+
+    def _get_search_index_documents(self, tid=None):
+        """Return the searchable text of all tickets, or of ticket `tid`,
+        as `(id, text)` tuples.
+        """
+        if tid is not None:
+            where, change_where, custom_where = \
+                'WHERE id=%s', 'AND ticket=%s', 'WHERE ticket=%s'
+            args = (tid,)
+        else:
+            where = change_where = custom_where = ''
+            args = ()
+        texts = {}
+        with self.env.db_query as db:
+            for row in db("""
+                    SELECT id, summary, keywords, description, reporter, cc
+                    FROM ticket %s""" % where, args):
+                texts[row[0]] = [str(row[0])] + [v for v in row[1:] if v]
+            for id_, value in db("""
+                    SELECT ticket, newvalue FROM ticket_change
+                    WHERE field='comment' %s""" % change_where, args):
+                if value and id_ in texts:
+                    texts[id_].append(value)
+            for id_, value in db("""
+                    SELECT ticket, value FROM ticket_custom %s
+                    """ % custom_where, args):
+                if value and id_ in texts:
+                    texts[id_].append(value)
+        return [(id_, '\n'.join(parts)) for id_, parts in texts.items()]
+
+    def _update_search_index(self, ticket):
+        search_index = SearchIndex(self.env)
+        if search_index.use_index:
+            for id_, text in self._get_search_index_documents(ticket.id):
+                search_index.index_document(self.realm, id_, text)
+
     def _get_action_controls(self, req, ticket):
         # action_controls is an ordered list of "renders" tuples, where
         # renders is a list of (action_key, label, widgets, hints)
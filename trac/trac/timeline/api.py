@@ -17,6 +17,11 @@
 # Author: Jonas Borgström <jonas@edgewall.com>
 #         Christopher Lenz <cmlenz@gmx.de>
 
+import threading
+from collections import OrderedDict
+
+from trac.cache import cached
+from trac.config import IntOption
 from trac.core import *
 
 
@@ -54,6 +59,19 @@ class ITimelineEventProvider(Interface):
         of the following form: `(kind, date, author, data, provider)`.
         """
 
+    def get_ordered_timeline_events(req, start, stop, filters):
+        """Return the events in the time range given by the `start` and
+        `stop` parameters, ordered by decreasing date.
+
+        This method is optional. When it is implemented, it is used instead
+        of `get_timeline_events`, and the events are consumed lazily: the
+        timeline stops iterating as soon as enough events have been
+        gathered. The events are tuples of the same form as the ones
+        returned by `get_timeline_events`.
+
+        (''since 1.7.1'')
+        """
+
     def render_timeline_event(context, field, event):
         """Display the title of the event in the given context.
 
@@ -64,3 +82,72 @@ class ITimelineEventProvider(Interface):
                       the 'url'
         :param event: the event tuple, as returned by `get_timeline_events`
         """
+
+
+class TimelineEventCache(Component):
+    """Cache of the timeline event windows.
+
+    The windows hold the rendered fields of the events rather than the
+    event tuples, which can refer to objects only valid during the
+    request that produced them, like the repository of a changeset.
+
+    The cached windows are discarded in all the processes of an
+    environment through the cache generations: event providers call
+    `invalidate()` when the events they produce are created, changed or
+    deleted.
+    """
+
+    cache_size = IntOption('timeline', 'event_cache_size', 0,
+        """Maximum number of timeline event windows kept in the cache of
+        each process. A window is the list of events displayed for a
+        given combination of time range, filters, authors and user
+        permissions, and is reused until an event provider signals a
+        change. The default is 0, which disables the cache. Note that
+        event providers from plugins which don't invalidate the cache
+        may show outdated events when it is enabled.
+        (''since 1.7.1'')
+        """)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._windows = OrderedDict()
+        self._token = None
+
+    @cached
+    def _generation(self):
+        """A new token each time the cache is invalidated."""
+        return object()
+
+    def get(self, key):
+        """Return the events cached for `key`, or `None`."""
+        if self.cache_size <= 0:
+            return None
+        token = self._generation
+        with self._lock:
+            self._check_token(token)
+            events = self._windows.get(key)
+            if events is not None:
+                self._windows.move_to_end(key)
+            return events
+
+    def set(self, key, events):
+        """Store the list of `events` for `key`."""
+        if self.cache_size <= 0:
+            return
+        token = self._generation
+        with self._lock:
+            self._check_token(token)
+            self._windows[key] = events
+            self._windows.move_to_end(key)
+            while len(self._windows) > self.cache_size:
+                self._windows.popitem(last=False)
+
+    def invalidate(self):
+        """Discard the cached windows in all the processes."""
+        if self.cache_size > 0:
+            del self._generation
+
+    def _check_token(self, token):
+        if token is not self._token:
+            self._windows.clear()
+            self._token = token
@@ -18,7 +18,7 @@ from xml.dom import minidom
 from trac.core import Component, ComponentMeta, implements
 from trac.perm import PermissionError, PermissionSystem
 from trac.test import EnvironmentStub, Mock, MockRequest, locale_en, makeSuite
-from trac.timeline.api import ITimelineEventProvider
+from trac.timeline.api import ITimelineEventProvider, TimelineEventCache
 from trac.timeline.web_ui import TimelineModule
 from trac.util.datefmt import (
     datetime_now, format_date, format_datetime, format_time,
@@ -220,18 +220,37 @@ class TimelineEventProviderTestCase(unittest.TestCase):
 
             def __init__(self):
                 self._events = None
+                self._calls = 0
 
             def get_timeline_filters(self, req):
                 yield ('test', 'Test')
 
             def get_timeline_events(self, req, start, stop, filters):
+                self._calls += 1
                 return iter(self._events or ())
 
             def render_timeline_event(self, context, field, event):
-                return event[3].render(context, field, event)
+                if event[3] is not None:
+                    return event[3].render(context, field, event)
+
+        class OrderedTimelineEventProvider(TimelineEventProvider):
+
+            def __init__(self):
+                super().__init__()
+                self._consumed = 0
+
+            def get_timeline_events(self, req, start, stop, filters):
+                raise AssertionError('get_timeline_events called')
+
+            def get_ordered_timeline_events(self, req, start, stop, filters):
+                self._calls += 1
+                for event in self._events or ():
+                    self._consumed += 1
+                    yield event
 
         cls.timeline_event_providers = {
             'normal': TimelineEventProvider,
+            'ordered': OrderedTimelineEventProvider,
         }
 
     @classmethod
@@ -246,6 +265,108 @@ class TimelineEventProviderTestCase(unittest.TestCase):
     def tearDown(self):
         self.env.reset_db()
 
+    def _set_events(self, name, *days):
+        provider = self.timeline_event_providers[name](self.env)
+        provider._events = [
+            (name, datetime(2018, 4, day, 12, tzinfo=utc), 'joe', None)
+            for day in days]
+        return provider
+
+    def _get_events(self, authname=None, **args):
+        req = MockRequest(self.env, authname=authname, path_info='/timeline',
+                          args=args)
+        data = TimelineModule(self.env).process_request(req)[1]
+        return [(e['kind'], e['datetime'].day) for e in data['events']]
+
+    def test_events_merged_by_date(self):
+        self._set_events('normal', 1, 5, 3)
+        ordered = self._set_events('ordered', 6, 4, 2)
+
+        self.assertEqual([('ordered', 6), ('normal', 5), ('ordered', 4),
+                          ('normal', 3), ('ordered', 2), ('normal', 1)],
+                         self._get_events())
+        self.assertEqual(3, ordered._consumed)
+
+    def test_ordered_events_consumed_lazily(self):
+        self._set_events('normal', 3, 29)
+        ordered = self._set_events('ordered', *range(28, 0, -1))
+
+        self.assertEqual([('normal', 29), ('ordered', 28), ('ordered', 27)],
+                         self._get_events(max='3'))
+        self.assertGreater(5, ordered._consumed)
+
+    def test_events_filtered_by_author(self):
+        normal = self._set_events('normal', 3, 1)
+        normal._events.append(('normal', datetime(2018, 4, 2, tzinfo=utc),
+                               'Jim', None))
+        self._set_events('ordered', 4)
+
+        self.assertEqual([('normal', 2)], self._get_events(authors='jim'))
+        self.assertEqual([('ordered', 4), ('normal', 3)],
+                         self._get_events(authors='-jim', max='2'))
+
+    def test_events_cache(self):
+        self.env.config.set('timeline', 'event_cache_size', 10)
+        normal = self._set_events('normal', 2)
+        ordered = self._set_events('ordered', 1)
+
+        self.assertEqual([('normal', 2), ('ordered', 1)], self._get_events())
+        normal._events = ordered._events = []
+        self.assertEqual([('normal', 2), ('ordered', 1)], self._get_events())
+        self.assertEqual(1, normal._calls)
+        self.assertEqual(1, ordered._calls)
+
+        PermissionSystem(self.env).grant_permission('user1', 'TIMELINE_VIEW')
+        self.assertEqual([], self._get_events(authname='user1'))
+        self.assertEqual([('normal', 2), ('ordered', 1)], self._get_events())
+        TimelineEventCache(self.env).invalidate()
+        self.assertEqual([], self._get_events())
+        self.assertEqual(3, normal._calls)
+
+    def test_events_cache_holds_rendered_events(self):
+        """The cached events don't refer to objects only valid during
+        the request which produced them."""
+        self.env.config.set('timeline', 'event_cache_size', 10)
+        closed = []
+        def render(context, field, event):
+            if closed:
+                raise AssertionError('rendered after the request')
+            return '%s of %s' % (field, event[0])
+        normal = self._set_events('normal', 2)
+        normal._events = [event[:3] + (Mock(render=render),)
+                          for event in normal._events]
+
+        def get_titles():
+            req = MockRequest(self.env, path_info='/timeline')
+            data = TimelineModule(self.env).process_request(req)[1]
+            return [e['render']('title', data['context'])
+                    for e in data['events']]
+        self.assertEqual(['title of normal'], get_titles())
+        closed.append(True)
+        self.assertEqual(['title of normal'], get_titles())
+        self.assertEqual(1, normal._calls)
+
+    def test_events_cache_size(self):
+        self.env.config.set('timeline', 'event_cache_size', 2)
+        cache = TimelineEventCache(self.env)
+        cache.set('a', [1])
+        cache.set('b', [2])
+        self.assertEqual([1], cache.get('a'))
+        cache.set('c', [3])
+        self.assertEqual([1], cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual([3], cache.get('c'))
+        cache.invalidate()
+        self.assertIsNone(cache.get('a'))
+
+    def test_events_cache_disabled(self):
+        normal = self._set_events('normal', 2)
+
+        self.assertEqual([('normal', 2)], self._get_events())
+        normal._events = []
+        self.assertEqual([], self._get_events())
+        self.assertEqual(2, normal._calls)
+
     def test_rss(self):
         def render(context, field, event):
             if event[0] == 'test&1':
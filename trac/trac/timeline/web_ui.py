@@ -17,14 +17,16 @@
 # Author: Jonas Borgström <jonas@edgewall.com>
 #         Christopher Lenz <cmlenz@gmx.de>
 
+import heapq
 import pkg_resources
 import re
 from datetime import datetime, timedelta
+from itertools import islice
 
 from trac.config import IntOption, BoolOption
 from trac.core import *
-from trac.perm import IPermissionRequestor
-from trac.timeline.api import ITimelineEventProvider
+from trac.perm import IPermissionRequestor, PermissionSystem
+from trac.timeline.api import ITimelineEventProvider, TimelineEventCache
 from trac.util.datefmt import (datetime_now, format_date, format_datetime,
                                format_time, localtz, parse_date,
                                pretty_timedelta, to_datetime, to_utimestamp,
@@ -186,29 +188,55 @@ class TimelineModule(Component):
             else:
                 include.add(name)
 
-        # gather all events for the given period of time
-        events = []
-        for provider in self.event_providers:
-            with component_guard(self.env, req, provider):
-                for event in provider.get_timeline_events(req, start, stop,
-                                                          filters) or []:
-                    author = (event[2] or '').lower()
-                    if ((not include or author in include) and
-                        author not in exclude):
-                        events.append(
-                            self._event_data(req, provider, event, lastvisit))
-
-        # prepare sorted global list
-        events = sorted(events, key=lambda e: e['datetime'], reverse=True)
-        if maxrows:
-            events = events[:maxrows]
+        if format == 'rss':
+            context = web_context(req, absurls=True)
+            context.set_hints(wiki_flavor='html', shorten_lines=False)
+            fields = ('url', 'title', 'summary', 'description')
+        else:
+            context = web_context(req)
+            context.set_hints(wiki_flavor='oneliner',
+                              shorten_lines=self.abbreviated_messages)
+            fields = ('url', 'title', 'description')
+
+        # gather the events for the given period of time, most recent first
+        cache = TimelineEventCache(self.env)
+        key = events = None
+        if cache.cache_size > 0:
+            permissions = PermissionSystem(self.env) \
+                          .get_user_permissions(req.authname)
+            key = (req.authname, frozenset(permissions), str(req.locale),
+                   str(req.tz), req.abs_href.base, format, start, stop,
+                   tuple(filters), frozenset(include), frozenset(exclude),
+                   maxrows)
+            events = cache.get(key)
+        if events is None:
+            num_warnings = len(req.chrome['warnings'])
+            events = heapq.merge(*[self._provider_events(req, provider,
+                                                         start, stop, filters,
+                                                         include, exclude,
+                                                         maxrows)
+                                   for provider in self.event_providers],
+                                 key=lambda item: item[1][1], reverse=True)
+            events = list(islice(events, maxrows or None))
+            if key:
+                # The event tuples can't be reused by other requests,
+                # only their rendered fields are cached
+                events = [self._render_event(provider, event, context,
+                                             fields)
+                          for provider, event in events]
+                if len(req.chrome['warnings']) == num_warnings:
+                    cache.set(key, events)
+        if key:
+            events = [self._rendered_event_data(req, event, lastvisit)
+                      for event in events]
+        else:
+            events = [self._event_data(req, provider, event, lastvisit)
+                      for provider, event in events]
 
         data['events'] = events
+        data['context'] = context
 
         if format == 'rss':
-            rss_context = web_context(req, absurls=True)
-            rss_context.set_hints(wiki_flavor='html', shorten_lines=False)
-            data['context'] = rss_context
             return 'timeline.rss', data, {'content_type': 'application/rss+xml'}
         else:
             req.session.set('timeline.daysback', daysback,
@@ -219,10 +247,6 @@ class TimelineModule(Component):
                 lastviewed = to_utimestamp(events[0]['datetime'])
                 req.session['timeline.lastvisit'] = max(lastvisit, lastviewed)
                 req.session['timeline.nextlastvisit'] = lastvisit
-            html_context = web_context(req)
-            html_context.set_hints(wiki_flavor='oneliner',
-                                   shorten_lines=self.abbreviated_messages)
-            data['context'] = html_context
 
         add_stylesheet(req, 'common/css/timeline.css')
         rss_href = req.href.timeline([(f, 'on') for f in filters],
@@ -362,6 +386,31 @@ class TimelineModule(Component):
 
     # Internal methods
 
+    def _provider_events(self, req, provider, start, stop, filters,
+                         include, exclude, maxrows):
+        """Generate `(provider, event)` tuples for the events of `provider`
+        by the selected authors, by decreasing date.
+        """
+        def selected(event):
+            author = (event[2] or '').lower()
+            return (not include or author in include) and \
+                   author not in exclude
+
+        with component_guard(self.env, req, provider):
+            if hasattr(provider, 'get_ordered_timeline_events'):
+                events = filter(selected, provider.get_ordered_timeline_events(
+                                    req, start, stop, filters) or [])
+            else:
+                events = filter(selected, provider.get_timeline_events(
+                                    req, start, stop, filters) or [])
+                key = lambda event: event[1]
+                if maxrows:
+                    events = heapq.nlargest(maxrows, events, key=key)
+                else:
+                    events = sorted(events, key=key, reverse=True)
+            for event in events:
+                yield provider, event
+
     def _event_data(self, req, provider, event, lastvisit):
         """Compose the timeline event date from the event tuple and prepared
         provider methods"""
@@ -379,3 +428,29 @@ class TimelineModule(Component):
                 'render': render,
                 'unread': lastvisit and lastvisit < datetime_uid,
                 'event': event, 'data': data, 'provider': provider}
+
+    def _render_event(self, provider, event, context, fields):
+        """Return a tuple holding the kind, date and author of the event,
+        its provider and the `fields` rendered in `context`.
+        """
+        if len(event) == 5:  # with special provider
+            provider = event[4]
+        rendered = {field: provider.render_timeline_event(context, field,
+                                                          event)
+                    for field in fields}
+        return event[0], event[1], event[2], provider, rendered
+
+    def _rendered_event_data(self, req, event, lastvisit):
+        """Compose the timeline event data from a tuple returned by
+        `_render_event`. The event tuple itself is not available.
+        """
+        kind, datetime, author, provider, rendered = event
+        render = lambda field, context: rendered.get(field)
+        localized_datetime = to_datetime(datetime, tzinfo=req.tz)
+        localized_date = truncate_datetime(localized_datetime)
+        datetime_uid = to_utimestamp(localized_datetime)
+        return {'kind': kind, 'author': author, 'date': localized_date,
+                'datetime': localized_datetime, 'datetime_uid': datetime_uid,
+                'render': render,
+                'unread': lastvisit and lastvisit < datetime_uid,
+                'event': None, 'data': None, 'provider': provider}
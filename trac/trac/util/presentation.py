@@ -376,6 +376,8 @@ class Paginator(object):
         self.num_pages = num_pages
         self.span = offset, offset + len(items)
         self.show_index = True
+        # Set when `num_items` is only a lower bound of the number of items
+        self.has_more_items = False
 
     def __iter__(self):
         return iter(self.items)
@@ -423,6 +425,9 @@ class Paginator(object):
         from trac.util.translation import _
         start, stop = self.span
         total = self.num_items
+        if self.has_more_items:
+            return _("%(start)d - %(stop)d of more than %(total)d",
+                     start=start + 1, stop=stop, total=total - 1)
         if start + 1 == stop:
             return _("%(last)d of %(total)d", last=stop, total=total)
         else:
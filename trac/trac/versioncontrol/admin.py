@@ -11,18 +11,23 @@
 # individuals. For the exact contribution history, see the revision
 # history and logs, available at https://trac.edgewall.org/.
 
+import multiprocessing
 import os.path
+import queue
 import sys
+import time
 
-from trac.admin import IAdminCommandProvider, IAdminPanelProvider
+from trac.admin import AdminCommandError, IAdminCommandProvider, \
+                       IAdminPanelProvider
 from trac.api import IEnvironmentSetupParticipant
 from trac.config import ListOption
 from trac.core import *
 from trac.perm import IPermissionRequestor
-from trac.util import as_bool, is_path_below
+from trac.util import as_bool, as_int, is_path_below
 from trac.util.html import tag
-from trac.util.text import breakable_path, normalize_whitespace, print_table, \
-                           printerr, printout
+from trac.util.text import breakable_path, exception_to_unicode, \
+                           normalize_whitespace, print_table, printerr, \
+                           printout
 from trac.util.translation import _, ngettext, tag_
 from trac.versioncontrol import DbRepositoryProvider, InvalidRepository, \
                                 NoSuchChangeset, RepositoryManager, is_default
@@ -57,7 +62,7 @@ class VersionControlAdmin(Component):
         yield ('repository list', '',
                'List source repositories',
                None, self._do_list)
-        yield ('repository resync', '<repos> [rev]',
+        yield ('repository resync', '<repos> [rev] [--jobs=N]',
                """Re-synchronize trac with repositories
 
                When [rev] is specified, only that revision is synchronized.
@@ -71,9 +76,12 @@ class VersionControlAdmin(Component):
                paths. To synchronize all repositories, specify "*" for
                <repos>. The default repository can be specified
                using "(default)".
+
+               With --jobs=N, up to N repositories are synchronized
+               concurrently, each one in a separate process.
                """,
                self._complete_repos, self._do_resync)
-        yield ('repository sync', '<repos> [rev]',
+        yield ('repository sync', '<repos> [rev] [--jobs=N]',
                """Resume synchronization of repositories
 
                It works like `resync`, except that it doesn't clear the already
@@ -122,7 +130,21 @@ class VersionControlAdmin(Component):
                            alias, info.get('dir', '')))
         print_table(values, [_('Name'), _('Type'), _('Alias'), _('Directory')])
 
-    def _sync(self, reponame, rev, clean):
+    def _sync(self, reponame, args, clean):
+        rev = None
+        jobs = 1
+        for arg in args:
+            if arg.startswith('--jobs='):
+                jobs = as_int(arg[7:], 0)
+                if jobs < 1:
+                    raise AdminCommandError(_("Invalid number of jobs: "
+                                              "%(jobs)s", jobs=arg[7:]))
+            elif rev is None:
+                rev = arg
+            else:
+                raise AdminCommandError(_("Invalid arguments"),
+                                        show_usage=True)
+
         rm = RepositoryManager(self.env)
         if reponame == '*':
             if rev is not None:
@@ -138,7 +160,11 @@ class VersionControlAdmin(Component):
                                   repo=reponame or '(default)'))
             repositories = [repos]
 
-        for repos in sorted(repositories, key=lambda r: r.reponame):
+        repositories = sorted(repositories, key=lambda r: r.reponame)
+        if jobs > 1 and len(repositories) > 1:
+            return self._sync_concurrently(repositories, clean, jobs)
+
+        for repos in repositories:
             pretty_name = repos.reponame or '(default)'
             if rev is not None:
                 repos.sync_changeset(rev)
@@ -156,6 +182,63 @@ class VersionControlAdmin(Component):
                                       '%(num)s revisions cached.', num=cnt))
         printout(_('Done.'))
 
+    def _sync_concurrently(self, repositories, clean, jobs):
+        """Synchronize the repositories in a pool of `jobs` processes,
+        each one opening the environment on its own.
+        """
+        ctx = multiprocessing.get_context('spawn')
+        progress = ctx.Queue()
+        pool = ctx.Pool(min(jobs, len(repositories)), _init_sync_worker,
+                        (progress,))
+        try:
+            pending = [(repos.reponame,
+                        pool.apply_async(_sync_repository,
+                                         (self.env.path, repos.reponame,
+                                          clean)))
+                       for repos in repositories]
+            synced = {}
+            failed = []
+            while pending:
+                try:
+                    reponame, num = progress.get(timeout=0.2)
+                except queue.Empty:
+                    pass
+                else:
+                    synced[reponame] = num
+                for reponame, result in [item for item in pending
+                                         if item[1].ready()]:
+                    pending.remove((reponame, result))
+                    pretty_name = reponame or '(default)'
+                    num, error = result.get()
+                    self._sync_feedback(None)
+                    if error:
+                        failed.append(pretty_name)
+                        printerr(_("Failed to synchronize %(reponame)s: "
+                                   "%(error)s", reponame=pretty_name,
+                                   error=error))
+                    else:
+                        printout(ngettext("%(reponame)s: %(num)s revision "
+                                          "cached.",
+                                          "%(reponame)s: %(num)s revisions "
+                                          "cached.", num=num,
+                                          reponame=pretty_name))
+                sys.stdout.write(' [%d/%d repositories, %d revisions]\r' %
+                                 (len(repositories) - len(pending),
+                                  len(repositories), sum(synced.values())))
+                sys.stdout.flush()
+            self._sync_feedback(None)
+        finally:
+            pool.terminate()
+            pool.join()
+        if failed:
+            printerr(ngettext("%(num)s repository failed to synchronize: "
+                              "%(names)s",
+                              "%(num)s repositories failed to synchronize: "
+                              "%(names)s", num=len(failed),
+                              names=', '.join(failed)))
+            return 2
+        printout(_('Done.'))
+
     def _sync_feedback(self, rev):
         if rev is not None:
             sys.stdout.write(' [%s]\r' % rev)
@@ -164,11 +247,11 @@ class VersionControlAdmin(Component):
             sys.stdout.write('\033[K')
         sys.stdout.flush()
 
-    def _do_resync(self, reponame, rev=None):
-        self._sync(reponame, rev, clean=True)
+    def _do_resync(self, reponame, *args):
+        return self._sync(reponame, args, clean=True)
 
-    def _do_sync(self, reponame, rev=None):
-        self._sync(reponame, rev, clean=False)
+    def _do_sync(self, reponame, *args):
+        return self._sync(reponame, args, clean=False)
 
     # IEnvironmentSetupParticipant methods
 
@@ -208,6 +291,50 @@ class VersionControlAdmin(Component):
                                           'FILE_VIEW', 'LOG_VIEW'])]
 
 
+_sync_progress = None
+
+
+def _init_sync_worker(progress):
+    global _sync_progress
+    _sync_progress = progress
+
+
+def _sync_repository(env_path, reponame, clean):
+    """Synchronize a repository in a worker process of `repository sync
+    --jobs=N`, and return the number of cached revisions and the error
+    message if the synchronization failed.
+    """
+    from trac.env import open_environment
+    try:
+        env = open_environment(env_path)
+    except Exception as e:
+        return None, exception_to_unicode(e)
+    try:
+        repos = RepositoryManager(env).get_repository(reponame)
+        if repos is None:
+            raise TracError(_("Repository \"%(repo)s\" doesn't exist",
+                              repo=reponame or '(default)'))
+        synced = [0, time.time()]
+        def feedback(rev):
+            synced[0] += 1
+            if time.time() - synced[1] >= 0.5:
+                synced[1] = time.time()
+                _sync_progress.put((reponame, synced[0]))
+        repos.sync(feedback, clean=clean)
+        _sync_progress.put((reponame, synced[0]))
+        for cnt, in env.db_query(
+                "SELECT count(rev) FROM revision WHERE repos=%s",
+                (repos.id,)):
+            return cnt, None
+    except Exception as e:
+        env.log.error("Failed to synchronize repository '%s': %s",
+                      reponame or '(default)',
+                      exception_to_unicode(e, traceback=True))
+        return None, exception_to_unicode(e)
+    finally:
+        env.shutdown()
+
+
 class RepositoryAdminPanel(Component):
     """Web admin panel for repository administration."""
 
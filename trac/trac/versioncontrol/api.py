@@ -19,8 +19,9 @@ from abc import ABCMeta, abstractmethod
 from datetime import datetime
 
 from trac.admin import AdminCommandError, IAdminCommandProvider, get_dir_list
-from trac.config import ConfigSection, Option
+from trac.config import BoolOption, ConfigSection, IntOption, Option
 from trac.core import *
+from trac.db.api import DatabaseManager
 from trac.resource import IResourceManager, Resource, ResourceNotFound
 from trac.util import as_bool, native_path
 from trac.util.concurrency import get_thread_id, threading
@@ -98,7 +99,9 @@ class IRepositoryProvider(Interface):
                        from the repository index (default: `'false'`).
 
          - `'sync_per_request'`: if set to `'true'`, the repository will be
-                                 synchronized on every request (default:
+                                 synchronized on every request, in the
+                                 background unless `[versioncontrol]
+                                 background_sync` is disabled (default:
                                  `'false'`).
 
          - `'url'`: the base URL for checking out the repository.
@@ -353,48 +356,59 @@ class RepositoryManager(Component):
         or using the "Repositories" admin panel.
         """)
 
+    background_sync = BoolOption('versioncontrol', 'background_sync', 'true',
+        """Synchronize the repositories with `sync_per_request` enabled
+        in a background thread. A request only schedules the
+        synchronization and doesn't wait for it, so it may show the
+        repository as of the previous synchronization. Use 'false' to
+        synchronize before handling each request. (''since 1.7.1'')""")
+
+    sync_poll_interval = IntOption('versioncontrol', 'sync_poll_interval', 0,
+        """Number of seconds after which the background thread
+        synchronizes the repositories with `sync_per_request` enabled
+        even without any request. Use '0' to only synchronize them when
+        a request is made. (''since 1.7.1'')""")
+
     def __init__(self):
         self._cache = {}
         self._lock = threading.Lock()
         self._connectors = None
         self._all_repositories = None
+        self._sync_cond = threading.Condition()
+        self._sync_pending = set()
+        self._sync_errors = {}
+        self._sync_thread = None
+        self._sync_stopped = False
 
     # IRequestFilter methods
 
     def pre_process_request(self, req, handler):
         if handler is not Chrome(self.env):
-            for repo_info in self.get_all_repositories().values():
-                if not as_bool(repo_info.get('sync_per_request')):
-                    continue
-                start = time_now()
-                repo_name = repo_info['name'] or '(default)'
-                try:
-                    repo = self.get_repository(repo_info['name'])
-                    repo.sync()
-                except InvalidConnector:
+            reponames = [repo_info['name'] for repo_info
+                         in self.get_all_repositories().values()
+                         if as_bool(repo_info.get('sync_per_request'))]
+            if reponames:
+                if self.background_sync:
+                    self.schedule_sync(reponames)
+                else:
+                    self._sync_repositories(reponames)
+            for reponame in reponames:
+                error = self._sync_errors.get(reponame)
+                if error is None:
                     continue
-                except TracError as e:
+                repo_name = reponame or '(default)'
+                if error[0]:
                     add_warning(req,
                         _("Can't synchronize with repository \"%(name)s\" "
                           "(%(error)s). Look in the Trac log for more "
-                          "information.", name=repo_name,
-                          error=to_unicode(e)))
-                except Exception as e:
+                          "information.", name=repo_name, error=error[1]))
+                else:
                     add_warning(req,
                         _("Failed to sync with repository \"%(name)s\": "
                           "%(error)s; repository information may be out of "
                           "date. Look in the Trac log for more information "
                           "including mitigation strategies.",
-                          name=repo_name, error=to_unicode(e)))
-                    self.log.error(
-                        "Failed to sync with repository \"%s\"; You may be "
-                        "able to reduce the impact of this issue by "
-                        "configuring the sync_per_request option; see "
-                        "https://trac.edgewall.org/wiki/TracRepositoryAdmin"
-                        "#ExplicitSync for more detail: %s", repo_name,
-                        exception_to_unicode(e, traceback=True))
-                self.log.info("Synchronized '%s' repository in %0.2f seconds",
-                              repo_name, time_now() - start)
+                          name=repo_name, error=error[1]))
         return handler
 
     def post_process_request(self, req, template, data, metadata):
@@ -750,14 +764,47 @@ class RepositoryManager(Component):
                     getattr(listener, event)(repos, changeset, *args)
         return errors
 
+    def schedule_sync(self, reponames):
+        """Schedule the synchronization of the given repositories by the
+        background thread, which is started if needed, and return
+        without waiting for it.
+
+        Repositories already scheduled are synchronized only once.
+
+        :since: 1.7.1
+        """
+        # The in-memory database has a single connection shared by
+        # all the threads, which can't be used concurrently
+        if DatabaseManager(self.env).connection_uri == 'sqlite::memory:':
+            self._sync_repositories(reponames)
+            return
+        with self._sync_cond:
+            self._sync_pending.update(reponames)
+            self._sync_stopped = False
+            self._sync_cond.notify()
+            if self._sync_thread is None or \
+                    not self._sync_thread.is_alive():
+                self._sync_thread = threading.Thread(
+                    target=self._sync_in_background,
+                    name='Repository sync')
+                self._sync_thread.daemon = True
+                self._sync_thread.start()
+
     def shutdown(self, tid=None):
-        """Free `Repository` instances bound to a given thread identifier"""
+        """Free `Repository` instances bound to a given thread identifier,
+        or stop the background synchronization after the repository
+        being synchronized if `tid` is `None`.
+        """
         if tid:
             assert tid == get_thread_id()
             with self._lock:
                 repositories = self._cache.pop(tid, {})
                 for reponame, repos in repositories.items():
                     repos.close()
+        else:
+            with self._sync_cond:
+                self._sync_stopped = True
+                self._sync_cond.notify()
 
     def read_file_by_path(self, path):
         """Read the file specified by `path`
@@ -786,6 +833,56 @@ class RepositoryManager(Component):
 
     # private methods
 
+    def _sync_in_background(self):
+        while True:
+            with self._sync_cond:
+                if not self._sync_pending and not self._sync_stopped:
+                    interval = self.sync_poll_interval
+                    self._sync_cond.wait(interval if interval > 0 else None)
+                    if not self._sync_pending and interval > 0:
+                        self._sync_pending.update(
+                            repo_info['name'] for repo_info
+                            in self.get_all_repositories().values()
+                            if as_bool(repo_info.get('sync_per_request')))
+                if self._sync_stopped:
+                    return
+                reponames = sorted(self._sync_pending)
+                self._sync_pending.clear()
+            tid = get_thread_id()
+            try:
+                for reponame in reponames:
+                    if self._sync_stopped:
+                        break
+                    self._sync_repositories([reponame])
+            finally:
+                self.shutdown(tid)
+                DatabaseManager(self.env).shutdown(tid)
+
+    def _sync_repositories(self, reponames):
+        for reponame in reponames:
+            start = time_now()
+            repo_name = reponame or '(default)'
+            try:
+                repo = self.get_repository(reponame)
+                repo.sync()
+            except InvalidConnector:
+                continue
+            except TracError as e:
+                self._sync_errors[reponame] = (True, to_unicode(e))
+            except Exception as e:
+                self._sync_errors[reponame] = (False, to_unicode(e))
+                self.log.error(
+                    "Failed to sync with repository \"%s\"; You may be "
+                    "able to reduce the impact of this issue by "
+                    "configuring the sync_per_request option; see "
+                    "https://trac.edgewall.org/wiki/TracRepositoryAdmin"
+                    "#ExplicitSync for more detail: %s", repo_name,
+                    exception_to_unicode(e, traceback=True))
+            else:
+                self._sync_errors.pop(reponame, None)
+            self.log.info("Synchronized '%s' repository in %0.2f seconds",
+                          repo_name, time_now() - start)
+
     def _get_connector(self, rtype):
         """Retrieve the appropriate connector for the given repository type.
 
@@ -945,6 +1042,24 @@ class Repository(object, metaclass=ABCMeta):
         the ''very same'' changeset (e.g. the repositories are clones).
         """
 
+    def get_changesets_by_rev(self, revs):
+        """Return a dictionary of the Changeset corresponding to each of
+        the revisions `revs`, indexed by the given revision. Revisions
+        which don't exist are not in the dictionary.
+
+        The default implementation calls `get_changeset` for each
+        revision, and repositories may retrieve them in bulk instead.
+
+        :since: 1.7.1
+        """
+        changesets = {}
+        for rev in revs:
+            try:
+                changesets[rev] = self.get_changeset(rev)
+            except NoSuchChangeset:
+                pass
+        return changesets
+
     def get_changesets(self, start, stop):
         """Generate Changeset belonging to the given time period (start, stop).
         """
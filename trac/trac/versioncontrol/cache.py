@@ -69,11 +69,34 @@ class CachedRepository(Repository):
         return self.repos.get_path_url(path, rev)
 
     def get_changeset(self, rev):
-        return CachedChangeset(self, self.normalize_rev(rev), self.env)
+        return self._new_changeset(self.normalize_rev(rev))
 
     def get_changeset_uid(self, rev):
         return self.repos.get_changeset_uid(rev)
 
+    def get_changesets_by_rev(self, revs):
+        drevs = {}
+        for rev in revs:
+            try:
+                nrev = self.normalize_rev(rev)
+            except NoSuchChangeset:
+                continue
+            drevs[self.db_rev(nrev)] = rev, nrev
+        changesets = {}
+        drev_list = list(drevs)
+        with self.env.db_query as db:
+            for idx in range(0, len(drev_list), 500):
+                chunk = drev_list[idx:idx + 500]
+                for drev, time, author, message in db("""
+                        SELECT rev, time, author, message FROM revision
+                        WHERE repos=%%s AND rev IN (%s)
+                        """ % ','.join(['%s'] * len(chunk)),
+                        [self.id] + chunk):
+                    rev, nrev = drevs[drev]
+                    changesets[rev] = self._new_changeset(
+                        nrev, (time, author, message))
+        return changesets
+
     def get_changesets(self, start, stop):
         for rev, in self.env.db_query("""
                 SELECT rev FROM revision
@@ -85,6 +108,11 @@ class CachedRepository(Repository):
             except NoSuchChangeset:
                 pass # skip changesets currently being resync'ed
 
+    def _new_changeset(self, rev, values=None):
+        """Return the changeset for the normalized revision `rev`, from
+        its `(time, author, message)` values if already retrieved."""
+        return CachedChangeset(self, rev, self.env, values)
+
     def sync_changeset(self, rev):
         cset = self.repos.get_changeset(rev)
         srev = self.db_rev(cset.rev)
@@ -282,30 +310,48 @@ class CachedRepository(Repository):
     def insert_changeset(self, rev, cset):
         """Create revision and node_change records for the given changeset
         instance."""
-        srev = self.db_rev(rev)
+        self.insert_changesets([(rev, cset)])
+
+    def insert_changesets(self, changesets):
+        """Create revision and node_change records for the given
+        `(rev, changeset)` pairs, in a single transaction and with one
+        multi-row insert per table.
+
+        :since: 1.7.1
+        """
+        revisions = []
+        node_changes = []
+        for rev, cset in changesets:
+            srev = self.db_rev(rev)
+            revisions.append((self.id, srev, to_utimestamp(cset.date),
+                              cset.author, cset.message))
+            for path, kind, action, bpath, brev in cset.get_changes():
+                self.log.debug("Caching node change in [%s] in '%s': %r",
+                               rev, _norm_reponame(self.repos),
+                               (path, kind, action, bpath, brev))
+                node_changes.append((self.id, srev, path,
+                                     _inverted_kindmap[kind],
+                                     _inverted_actionmap[action], bpath,
+                                     brev))
+        if not revisions:
+            return
         with self.env.db_transaction as db:
             # 1. Attempt to resync the 'revision' table.  In case of
             # concurrent syncs, only such insert into the `revision` table
             # will succeed, the others will fail and raise an exception.
-            db("""
+            db.executemany("""
                 INSERT INTO revision (repos,rev,time,author,message)
                 VALUES (%s,%s,%s,%s,%s)
-                """, (self.id, srev, to_utimestamp(cset.date),
-                      cset.author, cset.message))
+                """, revisions)
             # 2. now *only* one process was able to get there (i.e. there
             # *shouldn't* be any race condition here)
-            for path, kind, action, bpath, brev in cset.get_changes():
-                self.log.debug("Caching node change in [%s] in '%s': %r",
-                               rev, _norm_reponame(self.repos),
-                               (path, kind, action, bpath, brev))
-                kind = _inverted_kindmap[kind]
-                action = _inverted_actionmap[action]
-                db("""
+            if node_changes:
+                db.executemany("""
                     INSERT INTO node_change
                         (repos,rev,path,node_type,change_type,base_path,
                          base_rev)
                     VALUES (%s,%s,%s,%s,%s,%s,%s)
-                    """, (self.id, srev, path, kind, action, bpath, brev))
+                    """, node_changes)
 
     def get_node(self, path, rev=None):
         return self.repos.get_node(path, self.normalize_rev(rev))
@@ -491,13 +537,17 @@ class CachedRepository(Repository):
 
 class CachedChangeset(Changeset):
 
-    def __init__(self, repos, rev, env):
+    def __init__(self, repos, rev, env, values=None):
         self.env = env
         drev = repos.db_rev(rev)
-        for _date, author, message in self.env.db_query("""
+        if values is not None:
+            rows = [values]
+        else:
+            rows = self.env.db_query("""
                 SELECT time, author, message FROM revision
                 WHERE repos=%s AND rev=%s
-                """, (repos.id, drev)):
+                """, (repos.id, drev))
+        for _date, author, message in rows:
             date = from_utimestamp(_date)
             Changeset.__init__(self, repos, repos.rev_db(rev), message, author,
                                date)
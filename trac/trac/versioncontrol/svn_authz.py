@@ -17,6 +17,7 @@
 #         Matthew Good <trac@matt-good.net>
 
 import os.path
+from collections import OrderedDict
 
 from trac.config import ConfigurationError, Option, ParsingError, \
                         PathOption, UnicodeConfigParser
@@ -127,83 +128,156 @@ class AuthzSourcePolicy(Component):
                                 ('source', 'LOG_VIEW'),
                                 ('changeset', 'CHANGESET_VIEW')])
 
+    # Maximum number of sets of users for which the decisions on the
+    # paths are remembered, the least recently used ones are dropped.
+    PATH_INDEX_CACHE_SIZE = 100
+
     def __init__(self):
         self._mtime = 0
         self._authz = {}
         self._users = set()
+        self._path_indexes = None, OrderedDict()
 
     # IPermissionPolicy methods
 
     def check_permission(self, action, username, resource, perm):
-        realm = resource.realm if resource else None
-        if (realm, action) in self._handled_perms:
-            authz, users = self._get_authz_info()
-            if authz is None:
-                return False
+        return self.check_permissions(action, username, [resource], perm)[0]
 
-            if username == 'anonymous':
-                usernames = '$anonymous', '*'
-            else:
-                usernames = username, '$authenticated', '*'
-            if resource is None:
-                return True if users & set(usernames) else None
+    def check_permissions(self, action, username, resources, perm):
+        decisions = [None] * len(resources)
+        handled = [idx for idx, resource in enumerate(resources)
+                       if (resource.realm if resource else None, action)
+                          in self._handled_perms]
+        if not handled:
+            return decisions
+        authz, users = self._get_authz_info()
+        if authz is None:
+            for idx in handled:
+                decisions[idx] = False
+            return decisions
 
-            rm = RepositoryManager(self.env)
-            try:
-                repos = rm.get_repository(resource.parent.id)
-            except TracError:
-                return True  # Allow error to be displayed in the repo index
+        if username == 'anonymous':
+            usernames = '$anonymous', '*'
+        else:
+            usernames = username, '$authenticated', '*'
+
+        # The repositories and the decisions on their paths are shared
+        # by the resources
+        checkers = {}
+        for idx in handled:
+            resource = resources[idx]
+            if resource is None:
+                decisions[idx] = True if users & set(usernames) else None
+                continue
+            reponame = resource.parent.id
+            if reponame not in checkers:
+                checkers[reponame] = self._get_path_checker(authz, usernames,
+                                                            reponame)
+            repos, check_path = checkers[reponame]
             if repos is None:
+                decisions[idx] = True
+            elif resource.realm == 'source':
+                decisions[idx] = check_path(resource.id)
+            elif resource.realm == 'changeset':
+                changes = list(repos.get_changeset(resource.id).get_changes())
+                if not changes or any(check_path(change[0])
+                                      for change in changes):
+                    decisions[idx] = True
+        return decisions
+
+    def _get_path_checker(self, authz, usernames, reponame):
+        """Return the repository and a function returning the decision
+        for a path in that repository, or `None` for both if access is
+        allowed to all the paths.
+        """
+        rm = RepositoryManager(self.env)
+        try:
+            repos = rm.get_repository(reponame)
+        except TracError:
+            return None, None  # Allow error to be displayed in the repo index
+        if repos is None:
+            return None, None
+        modules = [reponame or self.authz_module_name]
+        if modules[0]:
+            modules.append('')
+        decisions, readable_dirs = self._get_path_index(authz, modules,
+                                                        usernames)
+
+        def check_path(path):
+            path = '/' + pathjoin(repos.scope, path)
+            if path != '/':
+                path += '/'
+
+            # Allow access to parent directories of allowed resources
+            if path in readable_dirs:
                 return True
-            modules = [resource.parent.id or self.authz_module_name]
-            if modules[0]:
-                modules.append('')
-
-            def check_path_0(spath):
-                sections = [authz.get(module, {}).get(spath)
-                            for module in modules]
-                sections = [section for section in sections if section]
-                denied = False
-                for user in usernames:
-                    for section in sections:
-                        if user in section:
-                            if section[user]:
-                                return True
-                            denied = True
-                            # Don't check section without module name
-                            # because the section with module name defines
-                            # the user's permissions.
-                            break
-                if denied:  # All users has no readable permission.
-                    return False
-
-            def check_path(path):
-                path = '/' + pathjoin(repos.scope, path)
-                if path != '/':
-                    path += '/'
-
-                # Allow access to parent directories of allowed resources
-                for spath in set(sum((list(authz.get(module, {}))
-                                      for module in modules), [])):
-                    if spath.startswith(path):
-                        result = check_path_0(spath)
-                        if result is True:
-                            return True
 
-                # Walk from resource up parent directories
-                for spath in parent_iter(path):
-                    result = check_path_0(spath)
-                    if result is not None:
-                        return result
+            # Walk from resource up parent directories
+            for spath in parent_iter(path):
+                result = decisions.get(spath)
+                if result is not None:
+                    return result
 
-            if realm == 'source':
-                return check_path(resource.id)
+        return repos, check_path
 
-            elif realm == 'changeset':
-                changes = list(repos.get_changeset(resource.id).get_changes())
-                if not changes or any(check_path(change[0])
-                                      for change in changes):
-                    return True
+    def _get_path_index(self, authz, modules, usernames):
+        """Return the decisions for `usernames` on the paths of the
+        authz file sections for `modules`, and the set of directories
+        containing a path on which access is granted.
+
+        The index is computed once for each set of users, until the
+        authz file is modified or the set of users is among the least
+        recently used ones when more than `PATH_INDEX_CACHE_SIZE` are
+        indexed.
+        """
+        indexed_authz, indexes = self._path_indexes
+        if indexed_authz is not authz:
+            indexes = OrderedDict()
+            self._path_indexes = authz, indexes
+        key = tuple(modules), usernames
+        try:
+            indexes.move_to_end(key)
+            return indexes[key]
+        except KeyError:
+            pass
+
+        def check_path_0(spath):
+            sections = [authz.get(module, {}).get(spath)
+                        for module in modules]
+            sections = [section for section in sections if section]
+            denied = False
+            for user in usernames:
+                for section in sections:
+                    if user in section:
+                        if section[user]:
+                            return True
+                        denied = True
+                        # Don't check section without module name
+                        # because the section with module name defines
+                        # the user's permissions.
+                        break
+            if denied:  # All users has no readable permission.
+                return False
+
+        decisions = {}
+        readable_dirs = set()
+        for module in modules:
+            for spath in authz.get(module, {}):
+                if spath in decisions:
+                    continue
+                result = decisions[spath] = check_path_0(spath)
+                if result is True:
+                    idx = spath.find('/')
+                    while idx != -1:
+                        readable_dirs.add(spath[:idx + 1])
+                        idx = spath.find('/', idx + 1)
+        index = indexes[key] = decisions, readable_dirs
+        if len(indexes) > self.PATH_INDEX_CACHE_SIZE:
+            try:
+                indexes.popitem(last=False)
+            except KeyError:
+                pass  # Dropped by a concurrent request
+        return index
 
     def _get_authz_info(self):
         if not self.authz_file:
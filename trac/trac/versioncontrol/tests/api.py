@@ -14,16 +14,20 @@
 #
 # Author: Eli Carter <eli.carter@commprove.com>
 
+import os.path
+import threading
 import unittest
 from datetime import datetime
 
-from trac.core import TracError
+from trac.core import Component, ComponentMeta, TracError, implements
+from trac.env import Environment
 from trac.resource import Resource, get_resource_description, get_resource_url
-from trac.test import EnvironmentStub, Mock, MockRequest, makeSuite
+from trac.test import EnvironmentStub, Mock, MockRequest, makeSuite, \
+                      mkdtemp, rmtree
 from trac.util.datefmt import utc
 from trac.versioncontrol.api import Changeset, DbRepositoryProvider, \
-                                    EmptyChangeset, Node, Repository, \
-                                    RepositoryManager
+                                    EmptyChangeset, IRepositoryConnector, \
+                                    Node, Repository, RepositoryManager
 
 
 class ApiTestCase(unittest.TestCase):
@@ -263,12 +267,133 @@ class RepositoryManagerTestCase(unittest.TestCase):
         self.assertEqual([], req.chrome['warnings'])
 
 
+class RepositorySyncTestCase(unittest.TestCase):
+
+    RepositoryConnector = None
+    syncs = None
+
+    @classmethod
+    def setUpClass(cls):
+        class RepositoryConnector(Component):
+            implements(IRepositoryConnector)
+
+            def get_supported_types(self):
+                yield 'sync_type', 1
+
+            def get_repository(self, repos_type, repos_dir, params):
+                def sync():
+                    cls.syncs.append(threading.current_thread().name)
+                    if cls.sync_error:
+                        raise cls.sync_error
+                    cls.synced.set()
+                    cls.release.wait(10)
+                return Mock(Repository, params['name'], params, self.log,
+                            sync=sync, close=lambda: None)
+
+        cls.RepositoryConnector = RepositoryConnector
+
+    @classmethod
+    def tearDownClass(cls):
+        ComponentMeta.deregister(cls.RepositoryConnector)
+
+    def setUp(self):
+        cls = self.__class__
+        cls.syncs = []
+        cls.sync_error = None
+        cls.synced = threading.Event()
+        cls.release = threading.Event()
+        self.tmpdir = None
+
+    def tearDown(self):
+        self.release.set()
+        RepositoryManager(self.env).shutdown()
+        thread = RepositoryManager(self.env)._sync_thread
+        if thread:
+            thread.join(10)
+        if self.tmpdir:
+            self.env.shutdown()
+            rmtree(self.tmpdir)
+        else:
+            self.env.reset_db()
+
+    def _create_env(self, on_disk=False, **options):
+        options = [('versioncontrol', name, value)
+                   for name, value in options.items()]
+        if on_disk:
+            self.tmpdir = mkdtemp()
+            self.env = Environment(os.path.join(self.tmpdir, 'env'),
+                                   create=True, options=options)
+            self.env.enable_component(self.RepositoryConnector)
+        else:
+            self.env = EnvironmentStub(enable=('trac.*',
+                                               self.RepositoryConnector))
+            for option in options:
+                self.env.config.set(*option)
+        self.env.config.set('repositories', 'repos.dir', '/')
+        self.env.config.set('repositories', 'repos.type', 'sync_type')
+        self.env.config.set('repositories', 'repos.sync_per_request', True)
+
+    def _pre_process_request(self):
+        req = MockRequest(self.env)
+        RepositoryManager(self.env).pre_process_request(req, Mock())
+        return req
+
+    def test_sync_in_background(self):
+        self._create_env(on_disk=True)
+        self._pre_process_request()
+        self.assertTrue(self.synced.wait(10))
+        # the request isn't blocked by the synchronization in progress,
+        # which is only scheduled once more
+        self._pre_process_request()
+        self._pre_process_request()
+        self.assertEqual(['Repository sync'], self.syncs)
+        self.synced.clear()
+        self.release.set()
+        self.assertTrue(self.synced.wait(10))
+        self.assertEqual(['Repository sync'] * 2, self.syncs)
+
+    def test_sync_poll_interval(self):
+        self._create_env(on_disk=True, sync_poll_interval='1')
+        self.release.set()
+        self._pre_process_request()
+        self.assertTrue(self.synced.wait(10))
+        self.synced.clear()
+        self.assertTrue(self.synced.wait(10))
+        self.assertEqual(['Repository sync'] * 2, self.syncs)
+
+    def test_sync_before_request(self):
+        self._create_env(background_sync='disabled')
+        self.release.set()
+        self._pre_process_request()
+        self.assertEqual([threading.current_thread().name], self.syncs)
+
+    def test_sync_error_warning(self):
+        self._create_env(background_sync='disabled')
+        self.__class__.sync_error = Exception('the error')
+        req = self._pre_process_request()
+        self.assertEqual(1, len(req.chrome['warnings']))
+        self.assertIn('Failed to sync with repository "repos": the error',
+                      str(req.chrome['warnings'][0]))
+
+        self.__class__.sync_error = TracError('the error')
+        req = self._pre_process_request()
+        self.assertEqual(1, len(req.chrome['warnings']))
+        self.assertIn('Can\'t synchronize with repository "repos" '
+                      '(the error)', str(req.chrome['warnings'][0]))
+
+        self.__class__.sync_error = None
+        self.release.set()
+        req = self._pre_process_request()
+        self.assertEqual([], req.chrome['warnings'])
+
+
 def test_suite():
     suite = unittest.TestSuite()
     suite.addTest(makeSuite(ApiTestCase))
     suite.addTest(makeSuite(ResourceManagerTestCase))
     suite.addTest(makeSuite(DbRepositoryProviderTestCase))
     suite.addTest(makeSuite(RepositoryManagerTestCase))
+    suite.addTest(makeSuite(RepositorySyncTestCase))
     return suite
 
 
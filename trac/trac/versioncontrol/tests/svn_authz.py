@@ -378,6 +378,48 @@ class AuthzSourcePolicyTestCase(unittest.TestCase):
         self.assertPathPerm(True, 'anonymous')
         self.assertRevPerm(True, 'anonymous')
 
+    def test_readable_descendant(self):
+        policy = AuthzSourcePolicy(self.env)
+        policy._mtime = 0
+        create_file(self.authz_file, textwrap.dedent("""\
+            [/private]
+            * =
+            [/private/dir/public]
+            joe = r
+            [module:/private/other]
+            Jane = r
+            """))
+        self.assertPathPerm(True, 'joe', '', '/')
+        self.assertPathPerm(True, 'joe', '', '/private')
+        self.assertPathPerm(True, 'joe', '', '/private/dir')
+        self.assertPathPerm(True, 'joe', '', '/private/dir/public/file')
+        self.assertPathPerm(False, 'joe', '', '/private/di')
+        self.assertPathPerm(False, 'joe', '', '/private/dir/other')
+        self.assertPathPerm(False, 'Jane', '', '/private')
+        self.assertPathPerm(True, 'Jane', 'module', '/private')
+        self.assertPathPerm(True, 'joe', 'module', '/private')
+
+    def test_index_updated_on_change(self):
+        policy = AuthzSourcePolicy(self.env)
+        self.assertPathPerm(True, 'user', '', '/readonly')
+        policy._mtime = 0
+        create_file(self.authz_file, textwrap.dedent("""\
+            [/readonly]
+            user =
+            """))
+        self.assertPathPerm(False, 'user', '', '/readonly')
+
+    def test_index_cache_size(self):
+        policy = AuthzSourcePolicy(self.env)
+        policy.PATH_INDEX_CACHE_SIZE = 3
+        self.assertPathPerm(True, 'user', '', '/readonly')
+        for username in ('joe', 'jane', 'user', 'jack'):
+            self.assertPathPerm(None, username, '', '/not_defined')
+        self.assertEqual(3, len(policy._path_indexes[1]))
+        self.assertEqual(['jane', 'user', 'jack'],
+                         [key[1][0] for key in policy._path_indexes[1]])
+        self.assertPathPerm(True, 'user', '', '/readonly')
+
     def test_default_permission(self):
         # By default, permissions are undecided
         self.assertPathPerm(None, 'joe', '', '/not_defined')
@@ -29,8 +29,11 @@ from trac.core import *
 from trac.mimeview.api import Mimeview
 from trac.perm import IPermissionRequestor
 from trac.resource import ResourceNotFound
-from trac.search import ISearchSource, search_to_sql, shorten_result
-from trac.timeline.api import ITimelineEventProvider
+from trac.search import (
+    ISearchIndexer, ISearchSource, SearchIndex, expand_search_result,
+    iter_search_rows, search_to_sql, shorten_result
+)
+from trac.timeline.api import ITimelineEventProvider, TimelineEventCache
 from trac.util import as_bool, content_disposition, embedded_numbers, pathjoin
 from trac.util.datefmt import from_utimestamp, pretty_timedelta
 from trac.util.html import tag
@@ -38,8 +41,9 @@ from trac.util.presentation import to_json
 from trac.util.text import CRLF, exception_to_unicode, shorten_line, \
                            to_unicode, unicode_urlencode
 from trac.util.translation import _, ngettext, tag_
-from trac.versioncontrol.api import Changeset, NoSuchChangeset, Node, \
-                                    RepositoryManager
+from trac.versioncontrol.api import Changeset, IRepositoryChangeListener, \
+                                    NoSuchChangeset, Node, RepositoryManager
+from trac.versioncontrol.cache import CachedRepository
 from trac.versioncontrol.diff import diff_blocks, get_diff_options, \
                                      unified_diff
 from trac.versioncontrol.web_ui.browser import BrowserModule
@@ -119,8 +123,10 @@ class ChangesetModule(Component):
     In that case, there's no changeset information displayed.
     """
 
-    implements(INavigationContributor, IPermissionRequestor, IRequestHandler,
-               ITimelineEventProvider, IWikiSyntaxProvider, ISearchSource)
+    implements(INavigationContributor, IPermissionRequestor,
+               IRepositoryChangeListener, IRequestHandler,
+               ITimelineEventProvider, IWikiSyntaxProvider, ISearchIndexer,
+               ISearchSource)
 
     property_diff_renderers = ExtensionPoint(IPropertyDiffRenderer)
 
@@ -1071,7 +1077,10 @@ class ChangesetModule(Component):
 
             # rendering changeset link
             if repos:
-                changeset = repos.get_changeset(rev)
+                changeset = formatter.link_cache.get(
+                    ('changeset', repos.reponame, rev))
+                if changeset is None:
+                    changeset = repos.get_changeset(rev)
                 if changeset.is_viewable(formatter.perm):
                     href = formatter.href.changeset(rev,
                                                     repos.reponame or None,
@@ -1090,6 +1099,42 @@ class ChangesetModule(Component):
             errmsg = to_unicode(e)
         return tag.a(label, class_="missing changeset", title=errmsg)
 
+    def prefetch_links(self, formatter, links):
+        rm = RepositoryManager(self.env)
+        cache = formatter.link_cache
+        revs = {}
+        for ns, chgset in links:
+            if ns is None:  # "[1]" or "r1" shorthand syntax
+                chgset = chgset[1:] if chgset[0] == 'r' else chgset[1:-1]
+            elif ns != 'changeset':
+                continue
+            chgset = formatter.split_link(chgset)[0]
+            sep = chgset.find('/')
+            if sep > 0:
+                rev, path = chgset[:sep], chgset[sep:]
+            else:
+                rev, path = chgset, '/'
+            if not re.match(self.CHANGESET_ID + '$', rev):
+                continue  # e.g. InterTrac shorthand "[T1]"
+            try:
+                reponame, repos, path = rm.get_repository_by_path(path)
+                if not reponame:
+                    reponame = rm.get_default_repository(formatter.context)
+                    if reponame is not None:
+                        repos = rm.get_repository(reponame)
+            except TracError:
+                continue
+            if hasattr(repos, 'get_changesets_by_rev') and \
+                    ('changeset', repos.reponame, rev) not in cache:
+                revs.setdefault(repos, set()).add(rev)
+        for repos, repos_revs in revs.items():
+            try:
+                changesets = repos.get_changesets_by_rev(repos_revs)
+            except TracError:
+                continue
+            for rev, changeset in changesets.items():
+                cache[('changeset', repos.reponame, rev)] = changeset
+
     def _format_diff_link(self, formatter, ns, target, label):
         params, query, fragment = formatter.split_link(target)
         def pathrev(path):
@@ -1129,6 +1174,11 @@ class ChangesetModule(Component):
             yield ('changeset', _('Changesets'))
 
     def get_search_results(self, req, terms, filters):
+        for result in self.get_ranked_search_results(req, terms, filters,
+                                                     None):
+            yield expand_search_result(result)
+
+    def get_ranked_search_results(self, req, terms, filters, limit):
         if 'changeset' not in filters:
             return
         rm = RepositoryManager(self.env)
@@ -1136,10 +1186,21 @@ class ChangesetModule(Component):
                         for repos in rm.get_real_repositories()}
         uids_seen = set()
         with self.env.db_query as db:
-            sql, args = search_to_sql(db, ['rev', 'message', 'author'], terms)
-            for id, rev, ts, author, log in db("""
+            index_query = SearchIndex(self.env).get_documents_query(
+                db, self.realm, terms)
+            if index_query is None:
+                sql, args = search_to_sql(db, ['rev', 'message', 'author'],
+                                          terms)
+            else:
+                # the documents are identified by "<repos id>:<rev>"
+                sql = '%s IN (%s)' % (db.concat(db.cast('repos', 'text'),
+                                                "':'", 'rev'),
+                                      index_query[0])
+                args = index_query[1]
+            for id, rev, ts, author, log in iter_search_rows(db, """
                     SELECT repos, rev, time, author, message
-                    FROM revision WHERE """ + sql, args):
+                    FROM revision WHERE """ + sql + """
+                    ORDER BY time DESC, repos, rev""", args, limit):
                 repos = repositories.get(id)
                 if not repos:
                     continue  # revisions for a no longer active repository
@@ -1157,7 +1218,42 @@ class ChangesetModule(Component):
                     yield (req.href.changeset(rev, repos.reponame or None),
                            '[%s]: %s' % (drev, shorten_line(log)),
                            from_utimestamp(ts), author,
-                           shorten_result(log, terms))
+                           partial(shorten_result, log, terms))
+
+    # ISearchIndexer methods
+
+    def get_search_index_realms(self):
+        yield self.realm
+
+    def get_search_index_documents(self, realm):
+        for repos_id, rev, author, message in self.env.db_query("""
+                SELECT repos, rev, author, message FROM revision"""):
+            yield ('%s:%s' % (repos_id, rev),
+                   '\n'.join((rev, author or '', message or '')))
+
+    # IRepositoryChangeListener methods
+
+    def changeset_added(self, repos, changeset):
+        self._update_search_index(repos, changeset.rev)
+        TimelineEventCache(self.env).invalidate()
+
+    def changeset_modified(self, repos, changeset, old_changeset):
+        self._update_search_index(repos, changeset.rev)
+        TimelineEventCache(self.env).invalidate()
+
+    def _update_search_index(self, repos, rev):
+        # Only the `revision` table of cached repositories is searched
+        search_index = SearchIndex(self.env)
+        if not search_index.use_index or \
+                not isinstance(repos, CachedRepository):
+            return
+        for db_rev, author, message in self.env.db_query("""
+                SELECT rev, author, message FROM revision
+                WHERE repos=%s AND rev=%s
+                """, (repos.id, repos.db_rev(rev))):
+            search_index.index_document(
+                self.realm, '%s:%s' % (repos.id, db_rev),
+                '\n'.join((db_rev, author or '', message or '')))
 
 
 class AnyDiffModule(Component):
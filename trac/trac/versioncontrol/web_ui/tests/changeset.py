@@ -13,23 +13,69 @@
 
 import unittest
 
-from trac.core import TracError
-from trac.test import EnvironmentStub, MockRequest, makeSuite
+from trac.core import Component, TracError, implements
+from trac.search.api import SearchIndex
+from trac.test import EnvironmentStub, Mock, MockRequest, makeSuite
+from trac.versioncontrol.api import (
+    DbRepositoryProvider, IRepositoryConnector, Repository)
 from trac.versioncontrol.web_ui.changeset import AnyDiffModule, ChangesetModule
 from trac.web.api import RequestDone
 
 
+mock_repotype = 'mock:' + __name__
+
+
+class MockRepositoryConnector(Component):
+
+    implements(IRepositoryConnector)
+
+    def get_supported_types(self):
+        yield mock_repotype, 8
+
+    def get_repository(self, repos_type, repos_dir, params):
+        return Mock(Repository, 'mock:' + repos_dir, params, self.log,
+                    normalize_rev=lambda rev: rev,
+                    display_rev=lambda rev: rev,
+                    get_changeset_uid=lambda rev: rev,
+                    close=lambda: None)
+
+
 class ChangesetModuleTestCase(unittest.TestCase):
 
     def setUp(self):
         self.env = EnvironmentStub()
         self.cm = ChangesetModule(self.env)
 
+    def tearDown(self):
+        self.env.reset_db()
+
     def test_default_repository_not_configured(self):
         """Test for regression of https://trac.edgewall.org/ticket/11599."""
         req = MockRequest(self.env, args={'new_path': '/'})
         self.assertRaises(TracError, self.cm.process_request, req)
 
+    def test_search_index_with_many_hits(self):
+        """The number of documents found in the search index doesn't
+        affect the size of the search query."""
+        self.env.config.set('search', 'use_index', 'enabled')
+        DbRepositoryProvider(self.env).add_repository('', '/',
+                                                      mock_repotype)
+        self.env.db_transaction.executemany("""
+            INSERT INTO revision (repos, rev, time, author, message)
+            VALUES (1,%s,%s,'joe',%s)
+            """, [('%04d' % i, i, 'fix stuff' if i else 'initial import')
+                   for i in range(1201)])
+        SearchIndex(self.env).reindex(['changeset'])
+        req = MockRequest(self.env)
+
+        results = list(self.cm.get_search_results(req, ['fix'],
+                                                  ['changeset']))
+
+        self.assertEqual(1200, len(results))
+        self.assertEqual(['/trac.cgi/changeset/0000'],
+                         [r[0] for r in self.cm.get_search_results(
+                             req, ['import'], ['changeset'])])
+
 
 class AnyDiffModuleTestCase(unittest.TestCase):
 
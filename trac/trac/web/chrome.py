@@ -1058,11 +1058,10 @@ class Chrome(Component):
             return _("anonymous")
         if not author:
             return _("(none)")
-        users = self.env.get_known_users(as_dict=True)
-        if self.show_full_names and author in users:
-            name = users[author][0]
-            if name:
-                return name
+        if self.show_full_names:
+            info = self.env.get_known_user_info(author)
+            if info and info[0]:
+                return info[0]
         if show_email is None:
             show_email = self.show_email_addresses
             if not show_email and req:
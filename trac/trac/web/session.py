@@ -19,20 +19,26 @@
 #         Christopher Lenz <cmlenz@gmx.de>
 
 import re
+import sys
+import time
 
 from trac.admin.api import AdminCommandError, IAdminCommandProvider, \
                            console_date_format, get_console_locale
+from trac.config import FloatOption, IntOption, ListOption
 from trac.core import Component, ExtensionPoint, TracError, TracValueError, \
                       implements
+from trac.db.api import DatabaseManager
 from trac.util import as_bool, as_float, as_int, hex_entropy, lazy
+from trac.util.concurrency import threading
 from trac.util.datefmt import get_datetime_format_hint, format_date, \
                               parse_date, time_now, to_datetime, to_timestamp
-from trac.util.text import print_table
-from trac.util.translation import _
+from trac.util.text import exception_to_unicode, print_table, printout
+from trac.util.translation import _, ngettext
 from trac.web.api import IRequestHandler, is_valid_default_handler
 
 UPDATE_INTERVAL = 3600 * 24 # Update session last_visit time stamp after 1 day
 PURGE_AGE = 3600 * 24 * 90 # Expire cookie after 90 days
+PURGE_INTERVAL = 3600 # Purge expired sessions at most every hour
 COOKIE_KEY = 'trac_session'
 
 
@@ -146,6 +152,7 @@ class DetachedSession(SessionDict):
                     SELECT name, value FROM session_attribute
                     WHERE sid=%s and authenticated=%s
                     """, (sid, int(authenticated))))
+                SessionStore(self.env).apply_pending(self)
                 self._old = self.copy()
                 break
             else:
@@ -169,6 +176,21 @@ class DetachedSession(SessionDict):
         # eventually purge the tables.
 
         session_saved = False
+        changes = {name: self.get(name)
+                   for name in set(self._old) | set(self)
+                   if self._old.get(name) != self.get(name)}
+        store = SessionStore(self.env)
+
+        if not self._new and changes and store.is_buffered(changes):
+            # Coalesce the changes to the non-critical attributes
+            last_visit = None
+            if now - self.last_visit > UPDATE_INTERVAL:
+                self.last_visit = last_visit = now
+            store.buffer(self.sid, authenticated, changes, last_visit)
+            self._old = dict(items)
+            if last_visit:
+                store.schedule_purge()
+            return
 
         with self.env.db_transaction as db:
             # Try to save the session if it's a new one. A failure to
@@ -190,22 +212,24 @@ class DetachedSession(SessionDict):
                     db.rollback()
                     return
 
-            if authenticated and \
-                    (new or self._old.get('name') != self.get('name') or
-                     self._old.get('email') != self.get('email')):
-                self.env.invalidate_known_users_cache()
+            known_user_changed = authenticated and \
+                (new or 'name' in changes or 'email' in changes)
 
-            # Remove former values for session_attribute and save the
-            # new ones. The last concurrent request to do so "wins".
+            # Remove former values of the changed session_attribute and
+            # save the new ones. The last concurrent request to do so
+            # "wins".
 
-            if self._old != self:
+            if changes:
                 if not items and not authenticated:
                     # No need to keep around empty unauthenticated sessions
                     db("DELETE FROM session WHERE sid=%s AND authenticated=0",
                        (self.sid,))
-                db("""DELETE FROM session_attribute
-                      WHERE sid=%s AND authenticated=%s
-                      """, (self.sid, authenticated))
+                store.discard(self.sid, authenticated, changes)
+                db.executemany("""
+                    DELETE FROM session_attribute
+                    WHERE sid=%s AND authenticated=%s AND name=%s
+                    """, [(self.sid, authenticated, name)
+                          for name in sorted(changes)])
                 self._old = dict(self.items())
                 # The session variables might already have been updated by a
                 # concurrent request.
@@ -215,7 +239,8 @@ class DetachedSession(SessionDict):
                           (sid,authenticated,name,value)
                         VALUES (%s,%s,%s,%s)
                         """, [(self.sid, authenticated, k, v)
-                              for k, v in items])
+                              for k, v in sorted(changes.items())
+                              if v is not None])
                 except self.env.db_exc.IntegrityError:
                     self.env.log.warning('Attributes for session %s already '
                                          'updated', self.sid)
@@ -223,13 +248,13 @@ class DetachedSession(SessionDict):
                     return
                 session_saved = True
 
-        # Purge expired sessions. We do this only when the session was
-        # changed as to minimize the purging.
+            # Update the known users without reloading them all
+            if known_user_changed:
+                self.env.update_known_user(self.sid, self.get('name'),
+                                           self.get('email'))
 
         if session_saved and now - self.last_visit > UPDATE_INTERVAL:
             self.last_visit = now
-            lifetime = self.env.anonymous_session_lifetime
-            mintime = now - lifetime * 86400 if lifetime > 0 else None
 
             with self.env.db_transaction as db:
                 # Update the session last visit time if it is over an
@@ -238,23 +263,10 @@ class DetachedSession(SessionDict):
                 db("""UPDATE session SET last_visit=%s
                       WHERE sid=%s AND authenticated=%s
                       """, (self.last_visit, self.sid, authenticated))
-                if mintime:
-                    self.env.log.debug('Purging old, expired, sessions.')
-                    db("""DELETE FROM session_attribute
-                          WHERE authenticated=0 AND sid IN (
-                              SELECT sid FROM session
-                              WHERE authenticated=0 AND last_visit < %s
-                          )
-                          """, (mintime,))
-
-            # Avoid holding locks on lot of rows on both session_attribute
-            # and session tables
-            if mintime:
-                with self.env.db_transaction as db:
-                    db("""
-                        DELETE FROM session
-                        WHERE authenticated=0 AND last_visit < %s
-                        """, (mintime,))
+
+            # Purge expired sessions. We do this only when the session was
+            # changed as to minimize the purging.
+            store.schedule_purge()
 
 
 class Session(DetachedSession):
@@ -312,6 +324,7 @@ class Session(DetachedSession):
         if not self._valid_sid_re.match(new_sid):
             raise TracValueError(_("Session ID must be alphanumeric."),
                                  _("Error renaming session"))
+        SessionStore(self.env).flush(force=True)
         with self.env.db_transaction as db:
             if db("SELECT sid FROM session WHERE sid=%s", (new_sid,)):
                 raise TracError(_("Session '%(id)s' already exists. "
@@ -335,6 +348,7 @@ class Session(DetachedSession):
         assert self.req.is_authenticated, \
                "Cannot promote session of anonymous user"
 
+        SessionStore(self.env).flush(force=True)
         with self.env.db_transaction as db:
             authenticated_flags = [authenticated for authenticated, in db(
                 "SELECT authenticated FROM session WHERE sid=%s OR sid=%s",
@@ -379,6 +393,272 @@ class Session(DetachedSession):
         self.bake_cookie(0)  # expire the cookie
 
 
+class SessionStore(Component):
+    """Write-behind buffer for the changes to the non-critical session
+    attributes, and purge of the expired sessions.
+
+    When `[trac] session_write_delay` is set, the changes to the
+    `session_buffered_attributes` of existing sessions are kept in
+    memory and written in a single transaction at most every
+    `session_write_delay` seconds, along with the `last_visit` updates.
+
+    The expired anonymous sessions are purged in a background thread,
+    in batches of `session_purge_batch_size` sessions.
+
+    :since: 1.7.1
+    """
+
+    write_delay = IntOption('trac', 'session_write_delay', 0,
+        """Maximum number of seconds during which the changes to the
+        `session_buffered_attributes` are buffered in memory before
+        being written to the database in a batch. The buffered changes
+        are only visible to the process which made them until they are
+        written. Use '0' to write the changes right away.
+        (''since 1.7.1'')""")
+
+    buffered_attributes = ListOption('trac', 'session_buffered_attributes',
+        'query_constraints, query_href, query_tickets, query_time, '
+        'timeline.lastvisit, timeline.nextlastvisit',
+        doc="""Session attributes whose changes can be buffered when
+        `session_write_delay` is set. (''since 1.7.1'')""")
+
+    purge_batch_size = IntOption('trac', 'session_purge_batch_size', 1000,
+        """Number of expired anonymous sessions deleted in each
+        transaction when purging the sessions. (''since 1.7.1'')""")
+
+    purge_pause = FloatOption('trac', 'session_purge_pause', 0.1,
+        """Number of seconds to pause between the transactions deleting
+        the expired sessions, to let the requests access the session
+        tables in the meantime. (''since 1.7.1'')""")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Serializes the writes of the buffered changes with the purge
+        self._flush_lock = threading.Lock()
+        self._pending = {}  # (sid, authenticated) -> [last_visit, changes]
+        self._flushed = time_now()
+        self._purged = 0
+        self._purge_thread = None
+        self._stop_purge = threading.Event()
+
+    def is_buffered(self, changes):
+        """Return whether the `changes` to the attributes of a session
+        can be buffered.
+        """
+        if self.write_delay <= 0:
+            return False
+        buffered = set(self.buffered_attributes) - {'name', 'email'}
+        return all(name in buffered for name in changes)
+
+    def buffer(self, sid, authenticated, changes, last_visit=None):
+        """Buffer the `changes` to the attributes of a session, a `dict`
+        of the new values where `None` stands for a removed attribute,
+        and the new `last_visit` time if not `None`.
+        """
+        with self._lock:
+            pending = self._pending.setdefault((sid, int(authenticated)),
+                                               [None, {}])
+            if last_visit is not None:
+                pending[0] = last_visit
+            pending[1].update(changes)
+
+    def discard(self, sid, authenticated, names):
+        """Discard the buffered changes to the attributes `names` of a
+        session, as they are about to be overwritten.
+        """
+        with self._lock:
+            pending = self._pending.get((sid, int(authenticated)))
+            if pending:
+                for name in names:
+                    pending[1].pop(name, None)
+
+    def apply_pending(self, session):
+        """Apply the buffered changes to a session read from the
+        database.
+        """
+        if not self._pending:
+            return
+        with self._lock:
+            pending = self._pending.get((session.sid,
+                                         int(session.authenticated)))
+            if pending:
+                last_visit, changes = pending
+                if last_visit is not None:
+                    session.last_visit = last_visit
+                for name, value in changes.items():
+                    if value is None:
+                        session.pop(name, None)
+                    else:
+                        session[name] = value
+
+    def flush(self, force=False):
+        """Write the buffered changes to the database, if they have been
+        buffered for longer than `session_write_delay` or if `force` is
+        `True`.
+        """
+        with self._flush_lock:
+            self._flush(force)
+
+    def _flush(self, force):
+        with self._lock:
+            now = time_now()
+            if not self._pending or \
+                    not force and now - self._flushed < self.write_delay:
+                return
+            pending, self._pending = self._pending, {}
+            self._flushed = now
+
+        last_visits = []
+        deleted = []
+        inserted = []
+        for (sid, authenticated), (last_visit, changes) in \
+                sorted(pending.items()):
+            if last_visit is not None:
+                last_visits.append((last_visit, sid, authenticated))
+            for name, value in sorted(changes.items()):
+                deleted.append((sid, authenticated, name))
+                if value is not None:
+                    inserted.append((sid, authenticated, name, value))
+        try:
+            with self.env.db_transaction as db:
+                db.executemany("""
+                    UPDATE session SET last_visit=%s
+                    WHERE sid=%s AND authenticated=%s
+                    """, last_visits)
+                db.executemany("""
+                    DELETE FROM session_attribute
+                    WHERE sid=%s AND authenticated=%s AND name=%s
+                    """, deleted)
+                db.executemany("""
+                    INSERT INTO session_attribute
+                      (sid,authenticated,name,value)
+                    VALUES (%s,%s,%s,%s)
+                    """, inserted)
+        except self.env.db_exc.DatabaseError as e:
+            self.log.warning("Buffered changes of %d sessions lost: %s",
+                             len(pending), exception_to_unicode(e))
+        else:
+            self.log.debug("Saved the buffered changes of %d sessions",
+                           len(pending))
+
+    def schedule_purge(self):
+        """Purge the expired anonymous sessions in a background thread,
+        unless a purge is in progress or has been started less than
+        `PURGE_INTERVAL` seconds ago.
+        """
+        lifetime = self.env.anonymous_session_lifetime
+        if lifetime <= 0:
+            return
+        with self._lock:
+            now = time_now()
+            if self._purge_thread and self._purge_thread.is_alive() or \
+                    now - self._purged < PURGE_INTERVAL:
+                return
+            self._purged = now
+            self._stop_purge.clear()
+            mintime = int(now - lifetime * 86400)
+            # The in-memory database has a single connection shared by
+            # all the threads, which can't be used concurrently
+            in_memory = DatabaseManager(self.env).connection_uri == \
+                        'sqlite::memory:'
+            if not in_memory:
+                self._purge_thread = threading.Thread(
+                    target=self._purge_in_background, args=(mintime,),
+                    name='Session purge')
+                self._purge_thread.daemon = True
+                self._purge_thread.start()
+        if in_memory:
+            self._purge_in_background(mintime)
+
+    def _purge_in_background(self, mintime):
+        self.log.debug("Purging old, expired, sessions.")
+        try:
+            count = self.purge(mintime)
+        except Exception as e:
+            self.log.error("Failed to purge the expired sessions: %s",
+                           exception_to_unicode(e, traceback=True))
+        else:
+            self.log.info("Purged %d expired sessions", count)
+
+    def purge(self, mintime, feedback=None):
+        """Delete the anonymous sessions last visited before `mintime`
+        and the attributes of the deleted anonymous sessions.
+
+        The sessions are deleted in transactions of at most
+        `session_purge_batch_size` sessions, pausing for
+        `session_purge_pause` seconds between the transactions. After
+        each transaction, `feedback` is called with the number of
+        sessions deleted so far.
+
+        :return: the number of deleted sessions.
+        """
+        batch_size = max(1, self.purge_batch_size)
+        count = 0
+        orphans = False
+        while not self._stop_purge.is_set():
+            if not orphans:
+                sids = [sid for sid, in self.env.db_query("""
+                    SELECT sid FROM session
+                    WHERE authenticated=0 AND last_visit < %s
+                    LIMIT %s
+                    """, (mintime, batch_size))]
+                orphans = not sids
+            if orphans:
+                # Attributes left by sessions deleted otherwise
+                sids = [sid for sid, in self.env.db_query("""
+                    SELECT DISTINCT sid FROM session_attribute
+                    WHERE authenticated=0
+                          AND NOT EXISTS (SELECT * FROM session AS s
+                                          WHERE s.sid=session_attribute.sid
+                                          AND s.authenticated=0)
+                    LIMIT %s
+                    """, (batch_size,))]
+                if not sids:
+                    break
+            with self._flush_lock:
+                # The sessions having buffered changes may have been
+                # visited recently, they are left for the next batch
+                # once the changes are written
+                with self._lock:
+                    pending = {sid for sid in sids
+                               if (sid, 0) in self._pending}
+                if pending:
+                    self._flush(force=True)
+                    sids = [sid for sid in sids if sid not in pending]
+                holders = ','.join(['%s'] * len(sids)) or 'NULL'
+                with self.env.db_transaction as db:
+                    db("""
+                        DELETE FROM session
+                        WHERE authenticated=0 AND last_visit < %%s
+                              AND sid IN (%s)
+                        """ % holders, [mintime] + sids)
+                    db("""
+                        DELETE FROM session_attribute
+                        WHERE authenticated=0 AND sid IN (%s)
+                              AND NOT EXISTS (SELECT * FROM session AS s
+                                              WHERE s.sid=session_attribute.sid
+                                              AND s.authenticated=0)
+                        """ % holders, sids)
+            if not orphans:
+                count += len(sids)
+            if feedback:
+                feedback(count)
+            if len(sids) == batch_size and self.purge_pause > 0:
+                time.sleep(self.purge_pause)
+        return count
+
+    def shutdown(self, tid=None):
+        """Write the buffered changes which are due, or all of them if
+        `tid` is `None`, in which case a purge in progress is also
+        stopped.
+        """
+        self.flush(force=tid is None)
+        if tid is None and self._purge_thread:
+            self._stop_purge.set()
+            self._purge_thread.join()
+            self._purge_thread = None
+
+
 class SessionAdmin(Component):
     """trac-admin command provider for session management"""
 
@@ -525,7 +805,8 @@ class SessionAdmin(Component):
             if email:
                 db("INSERT INTO session_attribute VALUES (%s,%s,'email',%s)",
                     (sid, authenticated, email))
-        self.env.invalidate_known_users_cache()
+            if authenticated:
+                self.env.update_known_user(sid, name or None, email or None)
 
     def _do_set(self, attr, sid, val):
         if attr not in ('name', 'email', 'default_handler'):
@@ -572,19 +853,19 @@ class SessionAdmin(Component):
     def _do_purge(self, age):
         when = parse_date(age, hint='datetime',
                           locale=get_console_locale(self.env))
-        with self.env.db_transaction as db:
-            ts = to_timestamp(when)
-            db("""
-                DELETE FROM session
-                WHERE authenticated=0 AND last_visit<%s
-                """, (ts,))
-            db("""
-                DELETE FROM session_attribute
-                WHERE authenticated=0
-                      AND NOT EXISTS (SELECT * FROM session AS s
-                                      WHERE s.sid=session_attribute.sid
-                                      AND s.authenticated=0)
-                """)
+        count = SessionStore(self.env).purge(to_timestamp(when),
+                                             self._purge_feedback)
+        self._purge_feedback(None)
+        printout(ngettext('%(num)s session purged.',
+                          '%(num)s sessions purged.', num=count))
+
+    def _purge_feedback(self, count):
+        if count is not None:
+            sys.stdout.write(' [%s]\r' % count)
+        else:
+            # Erase to end of line.
+            sys.stdout.write('\033[K')
+        sys.stdout.flush()
 
 
 def get_session_attribute(env, sid, authenticated, name, default=None):
@@ -11,6 +11,8 @@
 # individuals. For the exact contribution history, see the revision
 # history and logs, available at https://trac.edgewall.org/log/.
 
+import contextlib
+import io
 import time
 from datetime import datetime
 import unittest
@@ -24,7 +26,8 @@ from trac.util.datefmt import format_date, get_datetime_format_hint, \
                               time_now, to_datetime
 from trac.web.api import IRequestHandler
 from trac.web.session import DetachedSession, PURGE_AGE, Session, \
-                             SessionAdmin, SessionDict, UPDATE_INTERVAL
+                             SessionAdmin, SessionDict, SessionStore, \
+                             UPDATE_INTERVAL
 
 
 def _prep_session_table(env, spread_visits=False):
@@ -378,6 +381,65 @@ class SessionTestCase(unittest.TestCase):
         sids = self._purge_anonymous_session()
         self.assertEqual(['123456', '765432', '876543', '987654'], sids)
 
+    def test_purge_in_batches(self):
+        self.env.config.set('trac', 'session_purge_batch_size', 2)
+        self.env.config.set('trac', 'session_purge_pause', 0)
+        with self.env.db_transaction as db:
+            db.executemany("INSERT INTO session VALUES (%s, 0, %s)",
+                           [('s%d' % idx, idx) for idx in range(10)])
+            db.executemany("""
+                INSERT INTO session_attribute VALUES (%s, 0, 'foo', 'bar')
+                """, [('s%d' % idx,) for idx in range(10)] +
+                     [('orphan%d' % idx,) for idx in range(3)])
+        counts = []
+
+        self.assertEqual(5, SessionStore(self.env).purge(5, counts.append))
+        self.assertEqual([2, 4, 5, 5, 5], counts)
+        self.assertEqual(['s5', 's6', 's7', 's8', 's9'], [
+            sid for sid, in self.env.db_query("""
+                SELECT sid FROM session ORDER BY sid""")])
+        self.assertEqual(['s5', 's6', 's7', 's8', 's9'], [
+            sid for sid, in self.env.db_query("""
+                SELECT sid FROM session_attribute ORDER BY sid""")])
+
+    def test_purge_with_buffered_last_visit(self):
+        """Verify that a session whose refreshed last visit is buffered
+        isn't purged.
+        """
+        self.env.config.set('trac', 'session_write_delay', 3600)
+        self.env.config.set('trac', 'session_purge_batch_size', 2)
+        self.env.config.set('trac', 'session_purge_pause', 0)
+        with self.env.db_transaction as db:
+            db.executemany("INSERT INTO session VALUES (%s, 0, %s)",
+                           [('s%d' % idx, idx) for idx in range(3)])
+            db.executemany("""
+                INSERT INTO session_attribute VALUES (%s, 0, 'foo', 'bar')
+                """, [('s%d' % idx,) for idx in range(3)])
+        store = SessionStore(self.env)
+        store.buffer('s0', False, {'timeline.lastvisit': '42'},
+                     last_visit=100)
+
+        self.assertEqual(2, store.purge(50))
+        self.assertEqual([('s0', 100)], self.env.db_query("""
+            SELECT sid, last_visit FROM session"""))
+        self.assertEqual([('s0', 'foo', 'bar'),
+                          ('s0', 'timeline.lastvisit', '42')],
+                         self.env.db_query("""
+            SELECT sid, name, value FROM session_attribute
+            ORDER BY sid, name"""))
+        store.shutdown()
+        self.assertEqual(2, len(self.env.db_query("""
+            SELECT * FROM session_attribute""")))
+
+    def test_purge_scheduled_once_per_interval(self):
+        store = SessionStore(self.env)
+        self.env.db_transaction("INSERT INTO session VALUES ('old', 0, 0)")
+        store.schedule_purge()
+        self.env.db_transaction("INSERT INTO session VALUES ('old', 0, 0)")
+        store.schedule_purge()
+        self.assertEqual([('old',)],
+                         self.env.db_query("SELECT sid FROM session"))
+
     def test_delete_empty_session(self):
         """
         Verify that a session gets deleted when it doesn't have any data except
@@ -590,6 +652,99 @@ class SessionTestCase(unittest.TestCase):
             WHERE sid='john' AND name='foo'
             """)[0][0])
 
+    def test_save_changed_attributes_only(self):
+        """Verify that only the changed variables are written, keeping
+        the concurrent changes to the other variables.
+        """
+        with self.env.db_transaction as db:
+            db("INSERT INTO session VALUES ('john', 1, 0)")
+            db.executemany("""
+                INSERT INTO session_attribute VALUES (%s,%s,%s,%s)
+                """, [('john', 1, 'foo', 'bar'),
+                      ('john', 1, 'baz', 'qux')])
+
+        session = DetachedSession(self.env, 'john')
+        self.env.db_transaction("""
+            UPDATE session_attribute SET value='concurrent'
+            WHERE sid='john' AND name='baz'
+            """)
+        session['foo'] = 'changed'
+        session['new'] = 'value'
+        session.save()
+
+        self.assertEqual([('baz', 'concurrent'), ('foo', 'changed'),
+                          ('new', 'value')], self.env.db_query("""
+            SELECT name, value FROM session_attribute
+            WHERE sid='john' ORDER BY name
+            """))
+
+    def test_write_behind_buffered_attributes(self):
+        """Verify that the changes to the buffered variables are written
+        when the buffer is flushed.
+        """
+        self.env.config.set('trac', 'session_write_delay', 3600)
+        with self.env.db_transaction as db:
+            db("INSERT INTO session VALUES ('john', 1, 0)")
+            db.executemany("""
+                INSERT INTO session_attribute VALUES (%s,%s,%s,%s)
+                """, [('john', 1, 'foo', 'bar'),
+                      ('john', 1, 'query_href', '/query')])
+
+        session = DetachedSession(self.env, 'john')
+        session['timeline.lastvisit'] = '42'
+        del session['query_href']
+        session.save()
+
+        def get_attributes():
+            return self.env.db_query("""
+                SELECT name, value FROM session_attribute
+                WHERE sid='john' ORDER BY name
+                """)
+        self.assertEqual([('foo', 'bar'), ('query_href', '/query')],
+                         get_attributes())
+        self.assertEqual(0, self.env.db_query("""
+            SELECT last_visit FROM session WHERE sid='john'
+            """)[0][0])
+        session = DetachedSession(self.env, 'john')
+        self.assertEqual({'foo': 'bar', 'timeline.lastvisit': '42'},
+                         dict(session))
+
+        SessionStore(self.env).shutdown()
+        self.assertEqual([('foo', 'bar'), ('timeline.lastvisit', '42')],
+                         get_attributes())
+        self.assertNotEqual(0, self.env.db_query("""
+            SELECT last_visit FROM session WHERE sid='john'
+            """)[0][0])
+
+    def test_write_behind_critical_attributes(self):
+        """Verify that the changes to other variables are written right
+        away, along with the buffered variables.
+        """
+        self.env.config.set('trac', 'session_write_delay', 3600)
+        with self.env.db_transaction as db:
+            db("INSERT INTO session VALUES ('john', 1, 0)")
+
+        session = DetachedSession(self.env, 'john')
+        session['query_href'] = '/query?status=new'
+        session.save()
+        session['query_href'] = '/query?status=closed'
+        session['foo'] = 'bar'
+        session.save()
+
+        self.assertEqual([('foo', 'bar'),
+                          ('query_href', '/query?status=closed')],
+                         self.env.db_query("""
+            SELECT name, value FROM session_attribute
+            WHERE sid='john' ORDER BY name
+            """))
+        SessionStore(self.env).shutdown()
+        self.assertEqual([('foo', 'bar'),
+                          ('query_href', '/query?status=closed')],
+                         self.env.db_query("""
+            SELECT name, value FROM session_attribute
+            WHERE sid='john' ORDER BY name
+            """))
+
     def test_session_set(self):
         """Verify that setting a variable in a session to the default value
         removes it from the session.
@@ -799,7 +954,9 @@ class SessionTestCase(unittest.TestCase):
 
         auth_list, anon_list, all_list = \
             _prep_session_table(self.env, spread_visits=True)
-        sess_admin._do_purge('2010-01-02')
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            sess_admin._do_purge('2010-01-02')
+        self.assertIn('0 sessions purged.', output.getvalue())
         result = [i for i in sess_admin._get_list(['*'])]
         self.assertEqual(result, auth_list + anon_list)
         self.assertEqual({'name': 'val10', 'email': 'val10'},
@@ -809,7 +966,9 @@ class SessionTestCase(unittest.TestCase):
 
         auth_list, anon_list, all_list = \
             _prep_session_table(self.env, spread_visits=True)
-        sess_admin._do_purge('2010-01-12')
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            sess_admin._do_purge('2010-01-12')
+        self.assertIn('1 session purged.', output.getvalue())
         result = [i for i in sess_admin._get_list(['*'])]
         self.assertEqual(result, auth_list + anon_list[1:])
         rows = self.env.db_query("""
@@ -173,6 +173,19 @@ class IWikiMacroProvider(Interface):
           `parse_args` function to conveniently extract them.
         """
 
+    def is_macro_cacheable(name):
+        """Return `True` if the output of the macro with the specified
+        name only depends on its arguments, on the rendering context
+        and on the resources it links to, which are handled like the
+        links of the wiki text by the `WikiRenderCache`.
+
+        Wiki text calling a macro which is not cacheable is rendered on
+        each request. This method is optional: macros of providers not
+        implementing it are not cacheable.
+
+        .. versionadded :: 1.7.1
+        """
+
 
 class IWikiSyntaxProvider(Interface):
     """Enrich the Wiki syntax with new markup."""
@@ -200,6 +213,25 @@ class IWikiSyntaxProvider(Interface):
         for the link.
         """
 
+    def prefetch_links(formatter, links):
+        """Resolve in bulk the links found in the wiki text about to be
+        formatted, instead of one at a time when each link is rendered.
+
+        `links` is a list of `(ns, target)` tuples for the links handled
+        by this provider: `ns` is one of the namespaces returned by
+        `get_link_resolvers` and `target` is the link target, or `ns`
+        is `None` and `target` is the text matched by one of the
+        regexps returned by `get_wiki_syntax`. The list may contain
+        links which won't be rendered, e.g. from code blocks.
+
+        The resolved data should be stored in the `formatter.link_cache`
+        dictionary, which the link formatters can then look up. This
+        method is optional.
+
+        .. versionadded :: 1.7.1
+        """
+
+
 def parse_args(args, strict=True):
     r"""Utility for parsing macro "content" and splitting them into arguments.
 
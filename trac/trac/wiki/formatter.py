@@ -20,11 +20,17 @@
 
 import io
 import re
+import threading
+from collections import OrderedDict
 
+from trac.cache import cached
+from trac.config import IntOption
 from trac.core import *
 from trac.mimeview import *
+from trac.perm import PermissionSystem
 from trac.resource import get_relative_resource, get_resource_url
 from trac.util import arity, as_int
+from trac.util.datefmt import time_now
 from trac.util.text import (
     exception_to_unicode, shorten_line, to_unicode, unicode_quote,
     unquote_label
@@ -37,7 +43,7 @@ from trac.util.translation import _, tag_
 from trac.wiki.api import WikiSystem, parse_args
 from trac.wiki.parser import WikiParser, parse_processor_args
 
-__all__ = ['Formatter', 'MacroError', 'ProcessorError',
+__all__ = ['Formatter', 'MacroError', 'ProcessorError', 'WikiRenderCache',
            'concat_path_query_fragment', 'extract_link', 'format_to',
            'format_to_html', 'format_to_oneliner',
            'split_url_into_path_query_fragment', 'wiki_to_outline']
@@ -344,6 +350,11 @@ class WikiProcessor(object):
     def _macro_processor(self, text):
         self.env.log.debug('Executing Wiki macro %s by provider %s',
                            self.name, self.macro_provider)
+        state = self.formatter.context.get_hint(WikiRenderCache.hint)
+        if state is not None and not \
+                (hasattr(self.macro_provider, 'is_macro_cacheable') and
+                 self.macro_provider.is_macro_cacheable(self.name)):
+            state['cacheable'] = False
         if arity(self.macro_provider.expand_macro) == 4:
             return self.macro_provider.expand_macro(self.formatter, self.name,
                                                     text, self.args)
@@ -428,7 +439,16 @@ class Formatter(object):
     def __init__(self, env, context):
         self.env = env
         self.context = context.child()
-        self.context.set_hints(disable_warnings=True)
+        #: Data of the links resolved by `IWikiSyntaxProvider.prefetch_links`,
+        #: shared with the formatters of nested rendering contexts
+        self.link_cache = context.get_hint('link_cache')
+        # The links of nested contexts are prefetched by the outermost
+        # formatter, as they are part of its text
+        self._prefetch = self.link_cache is None
+        if self.link_cache is None:
+            self.link_cache = {}
+        self.context.set_hints(disable_warnings=True,
+                               link_cache=self.link_cache)
         self.req = context.req
         self.href = context.href
         self.resource = context.resource
@@ -1259,18 +1279,59 @@ class Formatter(object):
 
     # -- Wiki engine
 
-    def handle_match(self, fullmatch):
-        for itype, match in fullmatch.groupdict().items():
-            if match and itype not in self.wikiparser.helper_patterns:
-                # Check for preceding escape character '!'
-                if match[0] == '!':
-                    return escape(match[1:])
-                if itype in self.wikiparser.external_handlers:
-                    external_handler = self.wikiparser.external_handlers[itype]
-                    return external_handler(self, match, fullmatch)
+    _link_groups = {
+        'shref': ('sns', 'stgt'),
+        'shrefbr': ('snsbr', 'stgtbr'),
+        'lhref': ('lns', 'ltgt'),
+    }
+
+    def _prefetch_links(self, lines):
+        """Let the syntax providers resolve in bulk the links found in
+        `lines`, before they are formatted one at a time."""
+        if not self._prefetch:
+            return
+        parser = self.wikiparser
+        external_providers = parser.external_providers
+        link_providers = parser.link_providers
+        intertrac = self.env.config['intertrac']
+        links = {}
+        for line in lines:
+            for fullmatch in parser.finditer(line):
+                itype = fullmatch.lastgroup
+                match = fullmatch.group(itype)
+                if not match or match[0] == '!':
+                    continue
+                if itype in external_providers:
+                    provider = external_providers[itype]
+                    ns, target = None, match
+                elif itype in self._link_groups:
+                    ns, target = self._link_groups[itype]
+                    ns = fullmatch.group(ns) or 'wiki'
+                    ns = intertrac.get(ns, ns)
+                    target = unquote_label(fullmatch.group(target) or '')
+                    provider = link_providers.get(ns)
                 else:
-                    internal_handler = getattr(self, '_%s_formatter' % itype)
-                    return internal_handler(match, fullmatch)
+                    continue
+                if hasattr(provider, 'prefetch_links'):
+                    links.setdefault(provider, []).append((ns, target))
+        for provider, provider_links in links.items():
+            provider.prefetch_links(self, provider_links)
+
+    def handle_match(self, fullmatch):
+        # Each rule is enclosed in a named group, which is therefore the
+        # last group closed by the match
+        itype = fullmatch.lastgroup
+        match = fullmatch.group(itype)
+        if match:
+            # Check for preceding escape character '!'
+            if match[0] == '!':
+                return escape(match[1:])
+            external_handlers = self.wikiparser.external_handlers
+            if itype in external_handlers:
+                return external_handlers[itype](self, match, fullmatch)
+            else:
+                internal_handler = getattr(self, '_%s_formatter' % itype)
+                return internal_handler(match, fullmatch)
 
     def replace(self, fullmatch):
         """Replace one match with its corresponding expansion"""
@@ -1308,6 +1369,7 @@ class Formatter(object):
         text = self.reset(text, out)
         if isinstance(text, str):
             text = text.splitlines()
+        self._prefetch_links(text)
 
         for line in text:
             # Detect start of code block (new block or embedded block)
@@ -1359,7 +1421,7 @@ class Formatter(object):
             self.in_quote = False
             # Throw a bunch of regexps on the problem
             self.line = line
-            result = re.sub(self.wikiparser.rules, self.replace, line)
+            result = self.wikiparser.sub(self.replace, line)
 
             if not self.in_list_item:
                 self.close_list()
@@ -1434,6 +1496,7 @@ class OneLinerFormatter(Formatter):
         if not text:
             return
         text = self.reset(text, out)
+        self._prefetch_links(text.splitlines())
 
         # Simplify code blocks
         in_code_block = 0
@@ -1461,7 +1524,7 @@ class OneLinerFormatter(Formatter):
         if shorten:
             result = shorten_line(result)
 
-        result = re.sub(self.wikiparser.rules, self.replace, result)
+        result = self.wikiparser.sub(self.replace, result)
         result = result.replace('[...]', '[\u2026]')
         if result.endswith('...'):
             result = result[:-3] + '\u2026'
@@ -1495,6 +1558,9 @@ class OutlineFormatter(Formatter):
         elif line.strip() == WikiParser.ENDBLOCK:
             self.in_code_block -= 1
 
+    def _prefetch_links(self, lines):
+        pass  # links are stripped from the outline
+
     def format(self, text, out, max_depth=6, min_depth=1, shorten=True):
         self.shorten = shorten
         whitespace_indent = '  '
@@ -1609,6 +1675,127 @@ class InlineHtmlFormatter(object):
         return Markup(out.getvalue())
 
 
+class WikiRenderCache(Component):
+    """Cache of the wiki text rendered to HTML.
+
+    The output is keyed by the resource of the rendering context and
+    its version, the wiki flavor and the rendering hints, the locale
+    and the permissions of the user. It is only cached when the macros
+    called by the wiki text declare themselves cacheable with
+    `IWikiMacroProvider.is_macro_cacheable`. The cached output is shared
+    by the processes of an environment through the cache generations:
+    the modules providing the wiki pages and milestones call
+    `invalidate()` when these change, as the links to them are rendered
+    according to their state.
+
+    Tickets, attachments and changesets change too often for that, the
+    links to them can be stale for at most `render_cache_max_age`
+    seconds.
+    """
+
+    cache_size = IntOption('wiki', 'render_cache_size', 0,
+        """Maximum number of rendered wiki pages kept in the cache of
+        each process, the least recently used being evicted first.
+        Pages calling macros that are not cacheable, like
+        `[[TicketQuery]]` or `[[RecentChanges]]`, are always rendered.
+        The default is 0, which disables the cache.
+        (''since 1.7.1'')
+        """)
+
+    max_age = IntOption('wiki', 'render_cache_max_age', 300,
+        """Number of seconds for which a rendered wiki page is served
+        from the cache. The cache is discarded when a wiki page or a
+        milestone changes, but not when a ticket, an attachment or a
+        changeset changes: the links to these resources, like a link to
+        a ticket that has been closed, are only updated after that
+        delay. A value of 0 serves the output until it is evicted.
+        (''since 1.7.1'')
+        """)
+
+    #: Name of the rendering hint used to track the cacheability of
+    #: the output while formatting
+    hint = 'render_cache'
+
+    _key_hints = ('wiki_flavor', 'preserve_newlines', 'shorten_lines',
+                  'disable_warnings')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._token = None
+
+    @cached
+    def _generation(self):
+        """A new token each time the cache is invalidated."""
+        return object()
+
+    def format_to(self, flavor, context, wikidom, **options):
+        """Render `wikidom` like `format_to()`, reusing the output
+        cached for the resource of `context`.
+        """
+        if self.cache_size <= 0 or not wikidom or \
+                not isinstance(wikidom, str) or \
+                context.get_hint(self.hint) is not None:
+            return format_to(self.env, flavor, context, wikidom, **options)
+
+        key = self._get_key(flavor, context, options)
+        token = self._generation
+        with self._lock:
+            self._check_token(token)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == wikidom and \
+                    (self.max_age <= 0 or
+                     entry[2] > time_now() - self.max_age):
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        state = {'cacheable': True}
+        render_context = context.child()
+        render_context.set_hints(**{self.hint: state})
+        output = format_to(self.env, flavor, render_context, wikidom,
+                           **options)
+        if state['cacheable']:
+            with self._lock:
+                self._check_token(token)
+                self._entries[key] = (wikidom, output, time_now())
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.cache_size:
+                    self._entries.popitem(last=False)
+        return output
+
+    def format_to_html(self, context, wikidom, **options):
+        """Render `wikidom` like `format_to_html()`, reusing the output
+        cached for the resource of `context`.
+        """
+        return self.format_to('html', context, wikidom, **options)
+
+    def invalidate(self):
+        """Discard the cached output in all the processes."""
+        if self.cache_size > 0:
+            del self._generation
+
+    def _check_token(self, token):
+        if token is not self._token:
+            self._entries.clear()
+            self._token = token
+
+    def _get_key(self, flavor, context, options):
+        req = getattr(context, 'req', None)
+        if req is not None:
+            authname = req.authname
+            locale = str(req.locale)
+            perms = frozenset(PermissionSystem(self.env)
+                              .get_user_permissions(authname))
+        else:
+            authname = locale = perms = None
+        return (context.resource,
+                flavor or context.get_hint('wiki_flavor', 'html'),
+                tuple(context.get_hint(name) for name in self._key_hints),
+                tuple(sorted(options.items())),
+                context.href.base if context.href else None,
+                authname, locale, perms)
+
+
 def format_to(env, flavor, context, wikidom, **options):
     if flavor is None:
         flavor = context.get_hint('wiki_flavor', 'html')
@@ -56,6 +56,11 @@ class WikiMacroBase(Component):
     displaying help in the macro index (`[[MacroList]]`). If the
     default value of `False` and the `_description` is empty,
     "No documentation found" will be displayed.
+
+    Set the `cacheable` attribute to `True` when the output of the
+    macro only depends on its arguments and on the rendering context,
+    so that the pages calling it can be served from the
+    `WikiRenderCache`.
     """
 
     implements(IWikiMacroProvider)
@@ -70,6 +75,10 @@ class WikiMacroBase(Component):
     #: Hide from macro index
     hide_from_macro_index = False
 
+    #: Whether the output of the macro can be stored in the
+    #: `WikiRenderCache` along with the wiki text calling it
+    cacheable = False
+
     def get_macros(self):
         """Yield the name of the macro based on the class name."""
         name = self.__class__.__name__
@@ -89,6 +98,10 @@ class WikiMacroBase(Component):
         # hierarchy
         return inspect.cleandoc(self.__doc__) if self.__doc__ else ''
 
+    def is_macro_cacheable(self, name):
+        """Return whether the output of the macro can be cached."""
+        return self.cacheable
+
     def parse_macro(self, parser, name, content):
         raise NotImplementedError
 
@@ -429,6 +442,8 @@ class PageOutlineMacro(WikiMacroBase):
        default). This parameter only has an effect in `inline` style.
     """)
 
+    cacheable = True
+
     def expand_macro(self, formatter, name, content):
         min_depth, max_depth = 1, 6
         title = None
@@ -542,6 +557,8 @@ class ImageMacro(WikiMacroBase):
     <gotoh@taiyo.co.jp>''
     """)
 
+    cacheable = True
+
     def is_inline(self, content):
         args = [stripws(arg) for arg
                              in self._split_args_re.split(content or '')[1::2]]
@@ -953,6 +970,8 @@ class TracGuideTocMacro(WikiMacroBase):
     table of contents.
     """)
 
+    cacheable = True
+
     TOC = [('TracGuide',                    'Index'),
            ('TracInstall',                  'Installation'),
            ('TracInterfaceCustomization',   'Customization'),
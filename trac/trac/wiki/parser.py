@@ -20,6 +20,12 @@
 
 import re
 
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
 from trac.core import *
 from trac.notification import EMAIL_LOOKALIKE_PATTERN
 
@@ -169,15 +175,50 @@ class WikiParser(Component):
 
     def __init__(self):
         self._compiled_rules = None
+        self._tokenizer = None
         self._link_resolvers = None
+        self._link_providers = None
         self._helper_patterns = None
         self._external_handlers = None
+        self._external_providers = None
 
     @property
     def rules(self):
         self._prepare_rules()
         return self._compiled_rules
 
+    def finditer(self, text):
+        """Iterate on the matches of the `rules` in `text`.
+
+        Same as `self.rules.finditer(text)`, but faster as only the
+        rules which can match are searched for.
+
+        :since: 1.7.1
+        """
+        self._prepare_rules()
+        if self._tokenizer is None:
+            return self._compiled_rules.finditer(text)
+        return self._tokenizer.finditer(text)
+
+    def sub(self, repl, text):
+        """Replace the matches of the `rules` in `text` by the result
+        of the `repl` function.
+
+        Same as `self.rules.sub(repl, text)`, see `finditer`.
+
+        :since: 1.7.1
+        """
+        buf = []
+        pos = 0
+        for match in self.finditer(text):
+            buf.append(text[pos:match.start()])
+            buf.append(repl(match) or '')
+            pos = match.end()
+        if not buf:
+            return text
+        buf.append(text[pos:])
+        return ''.join(buf)
+
     @property
     def helper_patterns(self):
         self._prepare_rules()
@@ -188,16 +229,25 @@ class WikiParser(Component):
         self._prepare_rules()
         return self._external_handlers
 
+    @property
+    def external_providers(self):
+        """Dictionary of the `IWikiSyntaxProvider` of each additional
+        syntax, indexed like the `external_handlers`."""
+        self._prepare_rules()
+        return self._external_providers
+
     def _prepare_rules(self):
         from trac.wiki.api import WikiSystem
         if not self._compiled_rules:
             helpers = []
             handlers = {}
+            providers = {}
             syntax = self._pre_rules[:]
             i = 0
             for resolver in WikiSystem(self.env).syntax_providers:
                 for regexp, handler in resolver.get_wiki_syntax() or []:
                     handlers['i' + str(i)] = handler
+                    providers['i' + str(i)] = resolver
                     syntax.append('(?P<i%d>%s)' % (i, regexp))
                     i += 1
             syntax += self._post_rules[:]
@@ -206,19 +256,38 @@ class WikiParser(Component):
                 helpers += helper_re.findall(rule)[1:]
             rules = re.compile('(?:' + '|'.join(syntax) + ')', re.UNICODE)
             self._external_handlers = handlers
+            self._external_providers = providers
             self._helper_patterns = helpers
+            try:
+                self._tokenizer = _Tokenizer(syntax)
+            except (re.error, ValueError) as e:
+                self.log.warning("Wiki rules searched as a whole: %s", e)
+                self._tokenizer = None
             self._compiled_rules = rules
 
     @property
     def link_resolvers(self):
+        self._prepare_link_resolvers()
+        return self._link_resolvers
+
+    @property
+    def link_providers(self):
+        """Dictionary of the `IWikiSyntaxProvider` resolving the links
+        of each namespace."""
+        self._prepare_link_resolvers()
+        return self._link_providers
+
+    def _prepare_link_resolvers(self):
         if not self._link_resolvers:
             from trac.wiki.api import WikiSystem
             resolvers = {}
+            providers = {}
             for resolver in WikiSystem(self.env).syntax_providers:
                 for namespace, handler in resolver.get_link_resolvers() or []:
                     resolvers[namespace] = handler
+                    providers[namespace] = resolver
+            self._link_providers = providers
             self._link_resolvers = resolvers
-        return self._link_resolvers
 
     def parse(self, wikitext):
         """Parse `wikitext` and produce a WikiDOM tree."""
@@ -226,6 +295,158 @@ class WikiParser(Component):
         return wikitext
 
 
+# Maximal cost of the set of characters required by a rule for using it
+# to decide whether the rule can match in a text.
+_REQUIRED_CHARS_MAX_COST = 100
+
+
+def _char_cost(char):
+    # Letters and whitespace are found in most lines of text
+    return 10 if char.isalpha() or char.isspace() else 1
+
+
+def _required_chars(subpattern):
+    """Return a `(nullable, required)` tuple for a parsed `subpattern`.
+
+    `required` is a `(cost, chars)` tuple, with `chars` a set of
+    characters from which any non-empty match must contain at least
+    one, or `None` if no such set was found.
+    """
+    nullable = True
+    required = None
+    for op, av in subpattern:
+        if op is sre_constants.LITERAL:
+            char = chr(av)
+            elt_nullable, elt_required = False, (_char_cost(char), {char})
+        elif op is sre_constants.IN:
+            elt_nullable, elt_required = False, _charset_chars(av)
+        elif op is sre_constants.BRANCH:
+            elt_nullable = False
+            elt_required = (0, set())
+            for branch in av[1]:
+                branch_nullable, branch_required = _required_chars(branch)
+                elt_nullable = elt_nullable or branch_nullable
+                if branch_required is None or elt_required is None:
+                    elt_required = None
+                else:
+                    elt_required = (elt_required[0] + branch_required[0],
+                                    elt_required[1] | branch_required[1])
+        elif op is sre_constants.SUBPATTERN:
+            if len(av) == 4 and av[1] & re.IGNORECASE:
+                elt_nullable, elt_required = False, None
+            else:
+                elt_nullable, elt_required = _required_chars(av[-1])
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) or \
+                op is getattr(sre_constants, 'POSSESSIVE_REPEAT', None):
+            elt_nullable, elt_required = _required_chars(av[2])
+            elt_nullable = elt_nullable or av[0] == 0
+        elif op is getattr(sre_constants, 'ATOMIC_GROUP', None):
+            elt_nullable, elt_required = _required_chars(av)
+        elif op in (sre_constants.ANY, sre_constants.NOT_LITERAL):
+            elt_nullable, elt_required = False, None
+        else:
+            # Zero-width assertions, group references and conditionals
+            # don't constrain the characters of the match.
+            continue
+        if not elt_nullable:
+            nullable = False
+            if elt_required is not None and \
+                    (required is None or elt_required[0] < required[0]):
+                required = elt_required
+    return nullable, required
+
+
+def _charset_chars(charset):
+    chars = set()
+    for op, av in charset:
+        if op is sre_constants.LITERAL:
+            chars.add(chr(av))
+        elif op is sre_constants.RANGE and \
+                av[1] - av[0] < _REQUIRED_CHARS_MAX_COST:
+            chars.update(chr(code) for code in range(av[0], av[1] + 1))
+        else:  # negated sets, categories, large ranges
+            return None
+    return sum(_char_cost(char) for char in chars), chars
+
+
+def _is_anchored(subpattern):
+    """Tell whether a parsed `subpattern` only matches at the start of
+    the string."""
+    for op, av in subpattern:
+        if op is sre_constants.SUBPATTERN:
+            return _is_anchored(av[-1])
+        return op is sre_constants.AT and \
+               av in (sre_constants.AT_BEGINNING,
+                      sre_constants.AT_BEGINNING_STRING)
+    return False
+
+
+class _Tokenizer(object):
+    """Find the matches of an alternation of rules, by searching
+    separately for each rule and keeping the leftmost match.
+
+    A rule is only searched for in the texts containing at least one
+    of the characters any of its matches requires, so most rules are
+    skipped for a given line of text.
+    """
+
+    def __init__(self, syntax):
+        self.searches = []
+        self.always = []
+        self.dispatch = {}
+        for idx, rule in enumerate(syntax):
+            parsed = sre_parse.parse(rule, re.UNICODE)
+            state = getattr(parsed, 'state', None) or parsed.pattern
+            if state.flags & (re.IGNORECASE | re.MULTILINE):
+                raise ValueError("unsupported flags in %r" % rule)
+            nullable, required = _required_chars(parsed)
+            if nullable:
+                raise ValueError("%r can match the empty string" % rule)
+            regexp = re.compile(rule, re.UNICODE)
+            if _is_anchored(parsed):
+                search = self._anchored_search(regexp)
+            else:
+                search = regexp.search
+            self.searches.append(search)
+            if required is None or required[0] > _REQUIRED_CHARS_MAX_COST:
+                self.always.append(idx)
+            else:
+                for char in required[1]:
+                    self.dispatch.setdefault(char, []).append(idx)
+
+    @staticmethod
+    def _anchored_search(regexp):
+        def search(text, pos=0):
+            return regexp.match(text) if pos == 0 else None
+        return search
+
+    def finditer(self, text):
+        indexes = set(self.always)
+        for char in self.dispatch.keys() & set(text):
+            indexes.update(self.dispatch[char])
+        if not indexes:
+            return
+        searches = [self.searches[idx] for idx in sorted(indexes)]
+        matches = [search(text) for search in searches]
+        pos = 0
+        while True:
+            best = None
+            for idx, match in enumerate(matches):
+                if match is None:
+                    continue
+                if match.start() < pos:
+                    match = matches[idx] = searches[idx](text, pos)
+                    if match is None:
+                        continue
+                # On a tie, the first rule wins as in the alternation
+                if best is None or match.start() < best.start():
+                    best = match
+            if best is None:
+                return
+            yield best
+            pos = best.end()
+
+
 _processor_pname_re = re.compile(r'[-\w]+$')
 
 
@@ -18,7 +18,8 @@ import trac.wiki.api
 import trac.wiki.formatter
 import trac.wiki.parser
 from trac.wiki.tests import (
-    admin, formatter, intertrac, macros, model, web_api, web_ui, wikisyntax)
+    admin, formatter, intertrac, macros, model, parser, web_api, web_ui,
+    wikisyntax)
 from trac.wiki.tests.functional import functionalSuite
 
 def test_suite():
@@ -29,6 +30,7 @@ def test_suite():
     suite.addTest(intertrac.test_suite())
     suite.addTest(macros.test_suite())
     suite.addTest(model.test_suite())
+    suite.addTest(parser.test_suite())
     suite.addTest(web_api.test_suite())
     suite.addTest(web_ui.test_suite())
     suite.addTest(wikisyntax.test_suite())
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2023 Edgewall Software
+# All rights reserved.
+#
+# This software is licensed as described in the file COPYING, which
+# you should have received as part of this distribution. The terms
+# are also available at https://trac.edgewall.org/wiki/TracLicense.
+#
+# This software consists of voluntary contributions made by many
+# individuals. For the exact contribution history, see the revision
+# history and logs, available at https://trac.edgewall.org/log/.
+
+import os
+import unittest
+
+import pkg_resources
+
+from trac.core import Component, ComponentMeta, implements
+from trac.test import EnvironmentStub, makeSuite
+from trac.wiki.api import IWikiSyntaxProvider
+from trac.wiki.parser import WikiParser
+
+
+class WikiParserTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        class OptionalSyntaxProvider(Component):
+            implements(IWikiSyntaxProvider)
+            def get_wiki_syntax(self):
+                yield r'(?:\$[0-9]+)?', lambda f, m, fm: m
+            def get_link_resolvers(self):
+                return []
+        cls.optional_syntax_provider = OptionalSyntaxProvider
+
+    @classmethod
+    def tearDownClass(cls):
+        ComponentMeta.deregister(cls.optional_syntax_provider)
+
+    def setUp(self):
+        self.env = EnvironmentStub(enable=['trac.*'],
+                                   disable=['trac.wiki.tests.parser.*'])
+        self.parser = WikiParser(self.env)
+
+    def tearDown(self):
+        self.env.reset_db()
+
+    def _spans(self, matches):
+        return [(match.lastgroup, match.span()) for match in matches]
+
+    def test_finditer_default_pages(self):
+        dir = pkg_resources.resource_filename('trac.wiki', 'default-pages')
+        for name in sorted(os.listdir(dir)):
+            with open(os.path.join(dir, name), encoding='utf-8') as f:
+                text = f.read()
+            for line in text.splitlines():
+                self.assertEqual(
+                    self._spans(self.parser.rules.finditer(line)),
+                    self._spans(self.parser.finditer(line)),
+                    '%s: %r' % (name, line))
+
+    def test_finditer_leftmost_first_rule(self):
+        self.assertEqual([('bolditalic', (0, 5)), ('bold', (9, 12))],
+                         self._spans(self.parser.finditer("'''''Text'''")))
+        self.assertEqual([('heading', (0, 11))],
+                         self._spans(self.parser.finditer("== ''a'' ==")))
+
+    def test_finditer_anchored_rules(self):
+        self.assertEqual([('list', (0, 3))],
+                         self._spans(self.parser.finditer(" * item")))
+        self.assertEqual([], self._spans(self.parser.finditer("a * item")))
+
+    def test_sub(self):
+        self.assertEqual("plain text",
+                         self.parser.sub(lambda m: 'X', "plain text"))
+        self.assertEqual("<bold>b<bold> &amp; c",
+                         self.parser.sub(lambda m: '<%s>' % m.lastgroup
+                                         if m.lastgroup == 'bold' else
+                                         '&amp;', "'''b''' & c"))
+        self.assertEqual("a  c", self.parser.sub(lambda m: None, "a `b` c"))
+
+    def test_rule_matching_empty_string(self):
+        self.env.enable_component(self.optional_syntax_provider)
+        text = "a$1 '''b'''"
+
+        self.assertEqual(self._spans(self.parser.rules.finditer(text)),
+                         self._spans(self.parser.finditer(text)))
+        self.assertIsNone(self.parser._tokenizer)
+        self.assertEqual(text, self.parser.sub(lambda m: m.group(0), text))
+
+
+def test_suite():
+    return makeSuite(WikiParserTestCase)
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')
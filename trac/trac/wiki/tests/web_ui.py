@@ -16,8 +16,11 @@ import unittest
 
 from trac.perm import DefaultPermissionStore, PermissionCache
 from trac.test import EnvironmentStub, MockRequest, makeSuite
+from trac.ticket.test import insert_ticket
 from trac.web.api import HTTPBadRequest, RequestDone
-from trac.web.chrome import Chrome
+from trac.web.chrome import Chrome, web_context
+from trac.wiki.api import WikiSystem
+from trac.wiki.formatter import WikiRenderCache
 from trac.wiki.model import WikiPage
 from trac.wiki.web_ui import DefaultWikiPolicy, WikiModule
 
@@ -211,10 +214,114 @@ class WikiModuleTestCase(unittest.TestCase):
         return self._render_template(req, resp[0], resp[1])
 
 
+class WikiRenderCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentStub(default_data=True)
+        self.env.config.set('wiki', 'render_cache_size', 10)
+        self.req = MockRequest(self.env)
+
+    def tearDown(self):
+        self.env.reset_db()
+
+    def _save_page(self, name, text):
+        page = WikiPage(self.env, name)
+        page.text = text
+        page.save('joe', 'Initial')
+        return page
+
+    def _insert_page_silently(self, name):
+        """Insert a page without notifying the change listeners."""
+        self.env.db_transaction("""
+            INSERT INTO wiki (name, version, time, author, text)
+            VALUES (%s, 1, 0, 'joe', 'text')
+            """, (name,))
+        del WikiSystem(self.env).pages
+
+    def _render(self, page):
+        context = web_context(self.req, page.resource)
+        return str(WikiRenderCache(self.env).format_to_html(context,
+                                                            page.text))
+
+    def test_cacheable_page(self):
+        page = self._save_page('SandBox',
+                               '[[PageOutline]]\n= Title =\n[wiki:Other]')
+        self.assertIn('missing wiki', self._render(page))
+        self._insert_page_silently('Other')
+
+        self.assertIn('missing wiki', self._render(page))
+        WikiRenderCache(self.env).invalidate()
+        self.assertNotIn('missing wiki', self._render(page))
+
+    def test_page_with_macro_not_cacheable(self):
+        page = self._save_page('SandBox', '[[RecentChanges]]\n[wiki:Other]')
+        self.assertIn('missing wiki', self._render(page))
+        self._insert_page_silently('Other')
+
+        self.assertNotIn('missing wiki', self._render(page))
+
+    def test_invalidated_by_wiki_change(self):
+        page = self._save_page('SandBox', '[wiki:Other]')
+        self.assertIn('missing wiki', self._render(page))
+
+        self._save_page('Other', 'text')
+        self.assertNotIn('missing wiki', self._render(page))
+
+    def test_not_invalidated_by_ticket_change(self):
+        page = self._save_page('SandBox', '#1')
+        self.assertIn('missing ticket', self._render(page))
+
+        insert_ticket(self.env, summary='Crash')
+        self.assertIn('missing ticket', self._render(page))
+
+    def test_max_age(self):
+        page = self._save_page('SandBox', '[wiki:Other]')
+        self.assertIn('missing wiki', self._render(page))
+        self._insert_page_silently('Other')
+        self.assertIn('missing wiki', self._render(page))
+
+        entries = WikiRenderCache(self.env)._entries
+        for key, (wikidom, output, time) in list(entries.items()):
+            entries[key] = wikidom, output, time - 301
+        self.assertNotIn('missing wiki', self._render(page))
+
+    def test_changed_text(self):
+        page = self._save_page('SandBox', '[wiki:Other]')
+        self.assertIn('missing wiki', self._render(page))
+
+        page.text = 'Other text'
+        self.assertIn('Other text', self._render(page))
+
+    def test_cache_disabled(self):
+        self.env.config.set('wiki', 'render_cache_size', 0)
+        page = self._save_page('SandBox', '[wiki:Other]')
+        self.assertIn('missing wiki', self._render(page))
+        self._insert_page_silently('Other')
+
+        self.assertNotIn('missing wiki', self._render(page))
+
+    def test_page_view(self):
+        def render_view():
+            req = MockRequest(self.env, path_info='/wiki/SandBox')
+            mod = WikiModule(self.env)
+            self.assertTrue(mod.match_request(req))
+            template, data = mod.process_request(req)
+            return Chrome(self.env).render_template(
+                req, template, data, {'iterable': False, 'fragment': False}
+            ).decode('utf-8')
+
+        self._save_page('SandBox', '= Title =\n[wiki:Other]')
+        self.assertIn('missing wiki', render_view())
+        self._insert_page_silently('Other')
+
+        self.assertIn('missing wiki', render_view())
+
+
 def test_suite():
     suite = unittest.TestSuite()
     suite.addTest(makeSuite(DefaultWikiPolicyTestCase))
     suite.addTest(makeSuite(WikiModuleTestCase))
+    suite.addTest(makeSuite(WikiRenderCacheTestCase))
     return suite
 
 
@@ -16,6 +16,9 @@
 # Author: Jonas Borgström <jonas@edgewall.com>
 #         Christopher Lenz <cmlenz@gmx.de>
 
+from functools import partial
+import heapq
+from operator import itemgetter
 import pkg_resources
 import re
 
@@ -25,8 +28,11 @@ from trac.core import *
 from trac.mimeview.api import IContentConverter, Mimeview
 from trac.perm import IPermissionPolicy, IPermissionRequestor
 from trac.resource import *
-from trac.search import ISearchSource, search_to_sql, shorten_result
-from trac.timeline.api import ITimelineEventProvider
+from trac.search import (
+    ISearchIndexer, ISearchSource, SearchIndex, expand_search_result,
+    iter_search_rows, merge_search_results, search_to_sql, shorten_result
+)
+from trac.timeline.api import ITimelineEventProvider, TimelineEventCache
 from trac.util import as_int, get_reporter_id
 from trac.util.datefmt import from_utimestamp, to_utimestamp
 from trac.util.html import tag
@@ -38,8 +44,10 @@ from trac.web.chrome import (Chrome, INavigationContributor, ITemplateProvider,
                              accesskey, add_ctxtnav, add_link,
                              add_notice, add_script, add_stylesheet,
                              add_warning, prevnext_nav, web_context)
-from trac.wiki.api import IWikiPageManipulator, WikiSystem, validate_page_name
-from trac.wiki.formatter import format_to, OneLinerFormatter
+from trac.wiki.api import (
+    IWikiChangeListener, IWikiPageManipulator, WikiSystem, validate_page_name
+)
+from trac.wiki.formatter import OneLinerFormatter, WikiRenderCache, format_to
 from trac.wiki.model import WikiPage
 
 
@@ -47,7 +55,8 @@ class WikiModule(Component):
 
     implements(IContentConverter, INavigationContributor,
                IPermissionRequestor, IRequestHandler, ITimelineEventProvider,
-               ISearchSource, ITemplateProvider)
+               ISearchIndexer, ISearchSource, ITemplateProvider,
+               IWikiChangeListener)
 
     page_manipulators = ExtensionPoint(IWikiPageManipulator)
 
@@ -724,6 +733,7 @@ class WikiModule(Component):
         data.update({
             'context': context,
             'text': text,
+            'text_to_html': WikiRenderCache(self.env).format_to_html,
             'latest_version': latest_page.version,
             'attachments': AttachmentModule(self.env).attachment_data(context),
             'start_page': self.START_PAGE,
@@ -747,6 +757,50 @@ class WikiModule(Component):
             add_ctxtnav(req, _("History"), req.href.wiki(page.name,
                                                          action='history'))
 
+    def _get_ranked_page_results(self, req, terms, limit):
+        with self.env.db_query as db:
+            index_query = SearchIndex(self.env).get_documents_query(
+                db, self.realm, terms)
+            if index_query is None:
+                sql_query, args = search_to_sql(db, ['w1.name', 'w1.author',
+                                                     'w1.text'], terms)
+            else:
+                sql_query = 'w1.name IN (%s)' % index_query[0]
+                args = tuple(index_query[1])
+            wiki_realm = Resource(self.realm)
+            for name, ts, author, text in iter_search_rows(db, """
+                    SELECT w1.name, w1.time, w1.author, w1.text
+                    FROM wiki w1,(SELECT name, max(version) AS ver
+                                  FROM wiki GROUP BY name) w2
+                    WHERE w1.version = w2.ver AND w1.name = w2.name
+                    AND """ + sql_query + """
+                    ORDER BY w1.time DESC, w1.name""", args, limit):
+                page = wiki_realm(id=name)
+                if 'WIKI_VIEW' in req.perm(page):
+                    yield (get_resource_url(self.env, page, req.href),
+                           '%s: %s' % (name, shorten_line(text)),
+                           from_utimestamp(ts), author,
+                           partial(shorten_result, text, terms))
+
+    def _get_search_index_documents(self, name=None):
+        """Return the searchable text of the last version of all pages,
+        or of page `name`, as `(name, text)` tuples.
+        """
+        where, args = ('WHERE name=%s', (name,)) if name else ('', ())
+        return [(name, '\n'.join((name, author or '', text or '')))
+                for name, author, text in self.env.db_query("""
+                    SELECT w1.name, w1.author, w1.text
+                    FROM wiki w1,(SELECT name, max(version) AS ver
+                                  FROM wiki %s GROUP BY name) w2
+                    WHERE w1.version = w2.ver AND w1.name = w2.name
+                    """ % where, args)]
+
+    def _update_search_index(self, name):
+        search_index = SearchIndex(self.env)
+        if search_index.use_index:
+            for name, text in self._get_search_index_documents(name):
+                search_index.index_document(self.realm, name, text)
+
     # ITimelineEventProvider methods
 
     def get_timeline_filters(self, req):
@@ -754,21 +808,30 @@ class WikiModule(Component):
             yield ('wiki', _('Wiki changes'))
 
     def get_timeline_events(self, req, start, stop, filters):
+        return self.get_ordered_timeline_events(req, start, stop, filters)
+
+    def get_ordered_timeline_events(self, req, start, stop, filters):
         if 'wiki' in filters:
             wiki_realm = Resource(self.realm)
-            for ts, name, comment, author, version in self.env.db_query("""
-                    SELECT time, name, comment, author, version FROM wiki
-                    WHERE time>=%s AND time<=%s
-                    """, (to_utimestamp(start), to_utimestamp(stop))):
-                wiki_page = wiki_realm(id=name, version=version)
-                if 'WIKI_VIEW' not in req.perm(wiki_page):
-                    continue
-                yield ('wiki', from_utimestamp(ts), author,
-                       (wiki_page, comment))
+
+            def produce_wiki_events():
+                for ts, name, comment, author, version in self.env.db_query("""
+                        SELECT time, name, comment, author, version FROM wiki
+                        WHERE time>=%s AND time<=%s
+                        ORDER BY time DESC, name, version
+                        """, (to_utimestamp(start), to_utimestamp(stop))):
+                    wiki_page = wiki_realm(id=name, version=version)
+                    if 'WIKI_VIEW' not in req.perm(wiki_page):
+                        continue
+                    yield ('wiki', from_utimestamp(ts), author,
+                           (wiki_page, comment))
 
             # Attachments
-            for event in AttachmentModule(self.env).get_timeline_events(
-                    req, wiki_realm, start, stop):
+            attachment_events = AttachmentModule(self.env) \
+                                .get_timeline_events(req, wiki_realm, start,
+                                                     stop)
+            for event in heapq.merge(produce_wiki_events(), attachment_events,
+                                     key=itemgetter(1), reverse=True):
                 yield event
 
     def render_timeline_event(self, context, field, event):
@@ -798,29 +861,57 @@ class WikiModule(Component):
             yield ('wiki', _('Wiki'))
 
     def get_search_results(self, req, terms, filters):
-        if 'wiki' not in filters:
-            return
-        with self.env.db_query as db:
-            sql_query, args = search_to_sql(db, ['w1.name', 'w1.author',
-                                                 'w1.text'], terms)
-            wiki_realm = Resource(self.realm)
-            for name, ts, author, text in db("""
-                    SELECT w1.name, w1.time, w1.author, w1.text
-                    FROM wiki w1,(SELECT name, max(version) AS ver
-                                  FROM wiki GROUP BY name) w2
-                    WHERE w1.version = w2.ver AND w1.name = w2.name
-                    AND """ + sql_query, args):
-                page = wiki_realm(id=name)
-                if 'WIKI_VIEW' in req.perm(page):
-                    yield (get_resource_url(self.env, page, req.href),
-                           '%s: %s' % (name, shorten_line(text)),
-                           from_utimestamp(ts), author,
-                           shorten_result(text, terms))
+        for result in self.get_ranked_search_results(req, terms, filters,
+                                                     None):
+            yield expand_search_result(result)
 
-        # Attachments
-        for result in AttachmentModule(self.env).get_search_results(
-                req, wiki_realm, terms):
-            yield result
+    def get_ranked_search_results(self, req, terms, filters, limit):
+        if 'wiki' not in filters:
+            return ()
+        wiki_realm = Resource(self.realm)
+        return merge_search_results(
+            self._get_ranked_page_results(req, terms, limit),
+            AttachmentModule(self.env).get_ranked_search_results(
+                req, wiki_realm, terms, limit))
+
+    # ISearchIndexer methods
+
+    def get_search_index_realms(self):
+        yield self.realm
+
+    def get_search_index_documents(self, realm):
+        return self._get_search_index_documents()
+
+    # IWikiChangeListener methods
+
+    def wiki_page_added(self, page):
+        self._update_search_index(page.name)
+        TimelineEventCache(self.env).invalidate()
+        WikiRenderCache(self.env).invalidate()
+
+    def wiki_page_changed(self, page, version, t, comment, author):
+        self._update_search_index(page.name)
+        TimelineEventCache(self.env).invalidate()
+        WikiRenderCache(self.env).invalidate()
+
+    def wiki_page_deleted(self, page):
+        SearchIndex(self.env).remove_document(self.realm, page.name)
+        TimelineEventCache(self.env).invalidate()
+        WikiRenderCache(self.env).invalidate()
+
+    def wiki_page_version_deleted(self, page):
+        self._update_search_index(page.name)
+        TimelineEventCache(self.env).invalidate()
+        WikiRenderCache(self.env).invalidate()
+
+    def wiki_page_renamed(self, page, old_name):
+        SearchIndex(self.env).remove_document(self.realm, old_name)
+        self._update_search_index(page.name)
+        TimelineEventCache(self.env).invalidate()
+        WikiRenderCache(self.env).invalidate()
+
+    def wiki_page_comment_modified(self, page, old_comment):
+        TimelineEventCache(self.env).invalidate()
 
 
 class DefaultWikiPolicy(Component):
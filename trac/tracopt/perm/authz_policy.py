@@ -16,7 +16,8 @@
 
 import configparser
 import os
-from fnmatch import fnmatchcase
+import re
+from fnmatch import translate
 from itertools import groupby
 
 from trac.config import ConfigurationError, PathOption, UnicodeConfigParser
@@ -133,27 +134,53 @@ class AuthzPolicy(Component):
                             "Non-absolute paths are relative to the "
                             "Environment `conf` directory.")
 
+    # Maximum number of (resource descriptor, user) pairs for which the
+    # matched permissions are remembered.
+    MATCH_CACHE_SIZE = 10000
+
     def __init__(self):
         self.authz = None
         self.authz_mtime = None
         self.groups_by_user = {}
+        self._sections = []
+        self._matchers = {}
+        self._matches = {}
+        self._decisions = {}
 
     # IPermissionPolicy methods
 
     def check_permission(self, action, username, resource, perm):
+        return self.check_permissions(action, username, [resource], perm)[0]
+
+    def check_permissions(self, action, username, resources, perm):
         if not self.authz_mtime or \
                 os.path.getmtime(self.authz_file) != self.authz_mtime:
             self.parse_authz()
-        resource_key = self.normalise_resource(resource)
-        self.log.debug('Checking %s on %s', action, resource_key)
-        permissions = self.authz_permissions(resource_key, username)
+        ps = PermissionSystem(self.env)
+        decisions = []
+        for resource in resources:
+            resource_key = self.normalise_resource(resource)
+            self.log.debug('Checking %s on %s', action, resource_key)
+            permissions = self.authz_permissions(resource_key, username)
+            key = (action,
+                   tuple(permissions) if permissions is not None else None)
+            try:
+                decision = self._decisions[key]
+            except KeyError:
+                decision = self._decisions[key] = \
+                    self._decide(ps, action, permissions)
+            decisions.append(decision)
+        return decisions
+
+    # Internal methods
+
+    def _decide(self, ps, action, permissions):
         if permissions is None:
             return None                 # no match, can't decide
-        elif permissions == []:
+        elif not permissions:
             return False                # all actions are denied
 
         # FIXME: expand all permissions once for all
-        ps = PermissionSystem(self.env)
         for deny, perms in groupby(permissions,
                                    key=lambda p: p.startswith('!')):
             if deny and action in ps.expand_actions(p[1:] for p in perms):
@@ -163,8 +190,6 @@ class AuthzPolicy(Component):
 
         return None                     # no match for action, can't decide
 
-    # Internal methods
-
     def parse_authz(self):
         self.log.debug("Parsing authz security policy %s",
                        self.authz_file)
@@ -206,17 +231,29 @@ class AuthzPolicy(Component):
 
         all_actions = set(PermissionSystem(self.env).get_actions())
         authz_basename = os.path.basename(self.authz_file)
+        sections = []
         for section in self.authz.sections():
             if section == 'groups':
                 continue
+            items = []
             for user, actions in self.authz.items(section):
-                for action in to_list(actions):
+                actions = to_list(actions)
+                for action in actions:
                     if action.startswith('!'):
                         action = action[1:]
                     if action not in all_actions:
                         self.log.warning("The action %s in the [%s] section "
                                          "of %s is not a valid action.",
                                          action, section, authz_basename)
+                items.append((user, actions))
+            resource_glob = section
+            if '@' not in resource_glob:
+                resource_glob += '@*'
+            sections.append((resource_glob, items))
+        self._sections = sections
+        self._matchers = {}
+        self._matches = {}
+        self._decisions = {}
         self.authz_mtime = authz_mtime
 
     def normalise_resource(self, resource):
@@ -248,25 +285,51 @@ class AuthzPolicy(Component):
     def authz_permissions(self, resource_key, username):
         # TODO: Handle permission negation in sections. eg. "if in this
         # ticket, remove TICKET_MODIFY"
+        key = resource_key, username
+        try:
+            return self._matches[key]
+        except KeyError:
+            pass
+        regexp, entries = self._get_matcher(username)
+        match = regexp.match(resource_key) if regexp else None
+        if match:
+            resource_glob, permissions = entries[int(match.lastgroup[1:])]
+            self.log.debug("%s matched section %s for user %s",
+                           resource_key, resource_glob, username)
+        else:
+            permissions = None
+        if len(self._matches) >= self.MATCH_CACHE_SIZE:
+            self._matches = {}
+        self._matches[key] = permissions
+        return permissions
+
+    def _get_matcher(self, username):
+        """Return a regular expression matching the resource descriptors
+        against the sections having an entry for `username`, in the
+        order of the file, and the section glob and permissions of that
+        entry for each alternative of the expression.
+        """
+        try:
+            return self._matchers[username]
+        except KeyError:
+            pass
         if username and username != 'anonymous':
-            valid_users = ['*', 'authenticated', 'anonymous', username]
+            valid_users = {'*', 'authenticated', 'anonymous', username}
         else:
-            valid_users = ['*', 'anonymous']
-        for resource_section in [a for a in self.authz.sections()
-                                   if a != 'groups']:
-            resource_glob = resource_section
-            if '@' not in resource_glob:
-                resource_glob += '@*'
-
-            if fnmatchcase(resource_key, resource_glob):
-                for who, permissions in self.authz.items(resource_section):
-                    permissions = to_list(permissions)
-                    if who in valid_users or \
-                            who in self.groups_by_user.get(username, []):
-                        self.log.debug("%s matched section %s for user %s",
-                                       resource_key, resource_glob, username)
-                        if isinstance(permissions, str):
-                            return [permissions]
-                        else:
-                            return permissions
-        return None
+            valid_users = {'*', 'anonymous'}
+        valid_users.update(self.groups_by_user.get(username, ()))
+        entries = []
+        for resource_glob, items in self._sections:
+            for who, permissions in items:
+                if who in valid_users:
+                    entries.append((resource_glob, permissions))
+                    break
+        if entries:
+            regexp = re.compile('|'.join('(?P<s%d>%s)' % (idx,
+                                                          translate(glob))
+                                         for idx, (glob, permissions)
+                                         in enumerate(entries)))
+        else:
+            regexp = None
+        matcher = self._matchers[username] = regexp, entries
+        return matcher
@@ -243,6 +243,45 @@ class AuthzPolicyTestCase(unittest.TestCase):
                        'section of trac-authz-policy is not a valid action.'),
                       self.env.log_messages)
 
+    def test_sections_without_entry_for_user_are_skipped(self):
+        create_file(self.authz_file, textwrap.dedent("""\
+            [groups]
+            editors = jane
+
+            [wiki:Page*]
+            @editors = WIKI_VIEW, WIKI_MODIFY
+
+            [wiki:PageA]
+            john = WIKI_MODIFY
+
+            [wiki:*]
+            * = WIKI_VIEW
+            """))
+        self.assertTrue(self.check_permission('WIKI_MODIFY', 'jane',
+                                              Resource('wiki', 'PageA')))
+        self.assertTrue(self.check_permission('WIKI_MODIFY', 'john',
+                                              Resource('wiki', 'PageA')))
+        self.assertIsNone(self.check_permission('WIKI_MODIFY', 'john',
+                                                Resource('wiki', 'PageB')))
+        self.assertTrue(self.check_permission('WIKI_VIEW', 'john',
+                                              Resource('wiki', 'PageB')))
+        self.assertIsNone(self.check_permission('WIKI_MODIFY', 'jane',
+                                                Resource('wiki', 'Other')))
+        self.assertIsNone(self.check_permission('WIKI_VIEW', 'jane',
+                                                Resource('ticket', 1)))
+
+    def test_changed_file_is_reloaded(self):
+        resource = Resource('wiki', 'WikiStart')
+        self.assertTrue(self.check_permission('WIKI_VIEW', 'John', resource))
+        mtime = os.path.getmtime(self.authz_file)
+        create_file(self.authz_file, textwrap.dedent("""\
+            [wiki:WikiStart]
+            John =
+            """))
+        os.utime(self.authz_file, (mtime + 1, mtime + 1))
+        self.assertFalse(self.check_permission('WIKI_VIEW', 'John',
+                                               resource))
+
     def test_get_authz_file(self):
         """get_authz_file should resolve a relative path."""
         authz_policy = AuthzPolicy(self.env)
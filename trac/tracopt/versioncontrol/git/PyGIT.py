@@ -12,21 +12,28 @@
 # individuals. For the exact contribution history, see the revision
 # history and logs, available at https://trac.edgewall.org/log/.
 
+import binascii
+import bisect
 import codecs
 import contextlib
+import hashlib
 import io
+import itertools
+import mmap
 import os
 import re
+import struct
 import subprocess
 import tempfile
 import weakref
+from array import array
 from collections import deque
 from functools import partial
 from subprocess import DEVNULL, PIPE
-from threading import Lock
+from threading import Lock, Thread
 
 from trac.core import TracBaseError
-from trac.util import as_int, terminate
+from trac.util import AtomicFile, as_int, terminate
 from trac.util.compat import close_fds
 from trac.util.datefmt import time_now
 from trac.util.text import exception_to_unicode, to_unicode
@@ -150,13 +157,14 @@ class GitCore(object):
         return subprocess.Popen(self.__build_git_cmd(git_cmd, *cmd_args),
                                 close_fds=close_fds, **kw)
 
-    def __execute(self, *args):
+    def __execute(self, *args, input=None):
         """execute git command and return file-like object of stdout"""
 
         #print("DEBUG:", args, file=sys.stderr)
 
-        with self.__pipe(*args, stdin=DEVNULL) as p:
-            stdout_data, stderr_data = p.communicate()
+        with self.__pipe(*args, stdin=DEVNULL if input is None else PIPE) \
+                as p:
+            stdout_data, stderr_data = p.communicate(input)
         if self.__log and (p.returncode != 0 or stderr_data):
             self.__log.debug('%s exits with %d, dir: %r, args: %r, stderr: %r',
                              self.__git_bin, p.returncode, self.__git_dir,
@@ -230,7 +238,7 @@ class StorageFactory(object):
     __dict_lock = Lock()
 
     def __init__(self, repo, log, weak=True, git_bin='git',
-                 git_fs_encoding=None):
+                 git_fs_encoding=None, rev_cache_dir=None):
         self.logger = log
 
         with self.__dict_lock:
@@ -245,7 +253,8 @@ class StorageFactory(object):
                 i = self.__dict[repo]
             except KeyError:
                 rev_cache = self.__dict_rev_cache.get(repo)
-                i = Storage(repo, log, git_bin, git_fs_encoding, rev_cache)
+                i = Storage(repo, log, git_bin, git_fs_encoding, rev_cache,
+                            rev_cache_dir)
                 self.__dict[repo] = i
 
             # create additional reference depending on 'weak' argument
@@ -278,37 +287,113 @@ class Storage(object):
 
     __SREV_MIN = 4 # minimum short-rev length
 
-    class RevCache(object):
+    # maximum number of rewound or deleted refs for an incremental update
+    # of the revision cache
+    __REV_CACHE_MAX_CHANGED = 100
+
+    # minimum number of commits appended to the revision cache before
+    # it's compacted and saved
+    __REV_CACHE_COMPACT_MIN = 1000
 
-        __slots__ = ('youngest_rev', 'oldest_rev', 'rev_dict', 'refs_dict',
-                     'srev_dict')
+    class RevCache(object):
+        """Commit graph of the repository, with the refs it was built
+        from.
+
+        Commits are identified by integer ids, assigned in reverse
+        topological order (parents before children), so that the
+        commits added to the repository are simply appended. The shas
+        and the parents and children of the commits are stored in
+        compact arrays, which are memory-mapped when the cache is
+        loaded from a snapshot file.
+
+        The commits appended since the cache was last compacted are
+        indexed by dictionaries, and their children by
+        `_new_children`.
+
+        The cache also holds a reachability index:
+         - the generation number of each commit, one more than the
+           greatest generation number of its parents;
+         - for the tree formed by the first parents, the depth of each
+           commit, a jump pointer to one of its ancestors so that the
+           ancestor at a given depth is found in a logarithmic number
+           of steps, and the nearest merge commit;
+         - the branches containing each commit, as a bitmap where each
+           branch has its own bit. The distinct bitmaps are stored
+           once in `_masks`.
+        """
 
-        def __init__(self, youngest_rev, oldest_rev, rev_dict, refs_dict,
-                     srev_dict):
-            self.youngest_rev = youngest_rev
-            self.oldest_rev = oldest_rev
-            self.rev_dict = rev_dict
+        __slots__ = ('refs_dict', '_shas', '_parent_offsets', '_parent_ids',
+                     '_sorted', '_child_offsets', '_child_ids', '_new_ids',
+                     '_new_sorted', '_new_children', '_generations',
+                     '_depths', '_jumps', '_merges', '_mask_ids', '_masks',
+                     '_branch_bits')
+
+        _snapshot_header = struct.Struct('=8sIIIIIIII')
+        _no_merge = 0xffffffff
+        _snapshot_magic = b'TRACREV2'
+        _snapshot_bom = 0x01020304
+
+        # maximum number of changed branches for which the reachability
+        # index is updated incrementally, instead of being rebuilt
+        _max_branch_updates = 8
+
+        def __init__(self, refs_dict, shas, parent_offsets, parent_ids,
+                     sorted_ids, child_offsets, child_ids, generations,
+                     depths, jumps, merges, mask_ids, masks, branch_bits,
+                     new_ids=None, new_children=None):
             self.refs_dict = refs_dict
-            self.srev_dict = srev_dict
-            if youngest_rev is not None and oldest_rev is not None and \
-                    rev_dict and refs_dict and srev_dict:
-                pass  # all fields are not empty
-            elif not youngest_rev and not oldest_rev and \
-                    not rev_dict and not refs_dict and not srev_dict:
-                pass  # all fields are empty
-            else:
-                raise ValueError('Invalid RevCache fields: %r' % self)
+            self._shas = shas
+            self._parent_offsets = parent_offsets
+            self._parent_ids = parent_ids
+            self._sorted = sorted_ids
+            self._child_offsets = child_offsets
+            self._child_ids = child_ids
+            self._generations = generations
+            self._depths = depths
+            self._jumps = jumps
+            self._merges = merges
+            self._mask_ids = mask_ids
+            self._masks = masks
+            self._branch_bits = branch_bits
+            self._new_ids = new_ids or {}
+            self._new_sorted = sorted(self._new_ids)
+            self._new_children = new_children or {}
 
         @classmethod
         def empty(cls):
-            return cls(None, None, {}, {}, {})
+            return cls({}, b'', array('I', [0]), array('I'), array('I'),
+                       array('I', [0]), array('I'), array('I'), array('I'),
+                       array('I'), array('I'), array('I'), [0], {})
+
+        def __len__(self):
+            return len(self._parent_offsets) - 1
+
+        def __iter__(self):
+            """Iterate on the shas, the youngest first."""
+            for id_ in range(len(self) - 1, -1, -1):
+                yield self.sha(id_)
+
+        def __contains__(self, rev):
+            return self.index(rev) is not None
 
         def __repr__(self):
             return 'RevCache(youngest_rev=%r, oldest_rev=%r, ' \
-                   'rev_dict=%d entries, refs_dict=%d entries, ' \
-                   'srev_dict=%d entries)' % \
-                   (self.youngest_rev, self.oldest_rev, len(self.rev_dict),
-                    len(self.refs_dict), len(self.srev_dict))
+                   '%d commits, %d new commits, refs_dict=%d entries)' % \
+                   (self.youngest_rev, self.oldest_rev, len(self),
+                    len(self._new_ids), len(self.refs_dict))
+
+        @property
+        def youngest_rev(self):
+            return self.sha(len(self) - 1) if len(self) else None
+
+        @property
+        def oldest_rev(self):
+            return self.sha(0) if len(self) else None
+
+        @property
+        def num_new(self):
+            """Number of commits appended since the last compaction."""
+            return len(self._new_ids)
 
         def iter_branches(self):
             head = self.refs_dict.get(b'HEAD')
@@ -321,13 +406,489 @@ class Storage(object):
                 if refname.startswith(b'refs/tags/'):
                     yield refname[10:], rev
 
-    @staticmethod
-    def __rev_key(rev):
-        assert len(rev) >= 4
-        #assert GitCore.is_sha(rev)
-        srev_key = int(rev[:4], 16)
-        assert 0 <= srev_key <= 0xffff
-        return srev_key
+        def sha(self, id_):
+            """Return the sha of the commit `id_`."""
+            return binascii.hexlify(self._key(id_))
+
+        def index(self, rev):
+            """Return the id of the commit with the sha `rev`, or `None`
+            if there's no such commit.
+            """
+            if not isinstance(rev, bytes) or len(rev) != 40 or \
+                    rev.lower() != rev:
+                return None
+            try:
+                key = binascii.unhexlify(rev)
+            except binascii.Error:
+                return None
+            id_ = self._new_ids.get(key)
+            if id_ is None:
+                sorted_ids = self._sorted
+                pos = self._bisect(key)
+                if pos < len(sorted_ids) and \
+                        self._key(sorted_ids[pos]) == key:
+                    id_ = sorted_ids[pos]
+            return id_
+
+        def parents(self, id_):
+            """Return the ids of the parents of the commit `id_`."""
+            offsets = self._parent_offsets
+            return tuple(self._parent_ids[offsets[id_]:offsets[id_ + 1]])
+
+        def children(self, id_):
+            """Return the ids of the children of the commit `id_`."""
+            offsets = self._child_offsets
+            if id_ < len(offsets) - 1:
+                children = tuple(self._child_ids[offsets[id_]:
+                                                 offsets[id_ + 1]])
+            else:
+                children = ()
+            return children + self._new_children.get(id_, ())
+
+        def generation(self, id_):
+            """Return the generation number of the commit `id_`."""
+            return self._generations[id_]
+
+        def iter_branches_containing(self, id_):
+            """Iterate on the branches from which the commit `id_` is
+            reachable, like `iter_branches`.
+            """
+            mask = self._masks[self._mask_ids[id_]]
+            if mask:
+                branch_bits = self._branch_bits
+                for name, rev, head in self.iter_branches():
+                    if mask >> branch_bits[b'refs/heads/' + name] & 1:
+                        yield name, rev, head
+
+        def is_ancestor(self, id1, id2):
+            """Return whether the commit `id1` is an ancestor of the
+            commit `id2`.
+            """
+            # The ancestors of a commit have smaller ids and generation
+            # numbers, and are contained in all the branches containing
+            # the commit
+            if id1 >= id2 or \
+                    self._generations[id1] >= self._generations[id2]:
+                return False
+            masks = self._masks
+            mask_ids = self._mask_ids
+            if masks[mask_ids[id2]] & ~masks[mask_ids[id1]]:
+                return False
+            return self._reaches(id2, id1)
+
+        def first_parent_ancestor(self, id_, depth):
+            """Return the id of the ancestor of the commit `id_`, at the
+            given `depth` in its first-parent history.
+            """
+            depths = self._depths
+            jumps = self._jumps
+            offsets = self._parent_offsets
+            parent_ids = self._parent_ids
+            while depths[id_] > depth:
+                if depths[jumps[id_]] >= depth:
+                    id_ = jumps[id_]
+                else:
+                    id_ = parent_ids[offsets[id_]]
+            return id_
+
+        def iter_prefix(self, prefix):
+            """Iterate on the shas starting with the hexadecimal
+            `prefix`.
+            """
+            try:
+                lower = binascii.unhexlify(prefix + b'0' * (len(prefix) % 2))
+            except (binascii.Error, TypeError):
+                return
+            sorted_ids = self._sorted
+            pos = self._bisect(lower)
+            while pos < len(sorted_ids):
+                sha = self.sha(sorted_ids[pos])
+                if not sha.startswith(prefix):
+                    break
+                yield sha
+                pos += 1
+            new_sorted = self._new_sorted
+            pos = bisect.bisect_left(new_sorted, lower)
+            while pos < len(new_sorted):
+                sha = binascii.hexlify(new_sorted[pos])
+                if not sha.startswith(prefix):
+                    break
+                yield sha
+                pos += 1
+
+        def unique_prefix_len(self, rev):
+            """Return the length of the shortest prefix of the sha `rev`
+            which isn't shared with another commit.
+            """
+            key = binascii.unhexlify(rev)
+            sorted_ids = self._sorted
+            neighbours = []
+            pos = self._bisect(key)
+            if pos > 0:
+                neighbours.append(self._key(sorted_ids[pos - 1]))
+            if pos < len(sorted_ids) and self._key(sorted_ids[pos]) == key:
+                pos += 1
+            if pos < len(sorted_ids):
+                neighbours.append(self._key(sorted_ids[pos]))
+            new_sorted = self._new_sorted
+            pos = bisect.bisect_left(new_sorted, key)
+            if pos > 0:
+                neighbours.append(new_sorted[pos - 1])
+            if pos < len(new_sorted) and new_sorted[pos] == key:
+                pos += 1
+            if pos < len(new_sorted):
+                neighbours.append(new_sorted[pos])
+            common = 0
+            for neighbour in neighbours:
+                neighbour = binascii.hexlify(neighbour)
+                common = max(common, len(os.path.commonprefix([rev,
+                                                               neighbour])))
+            return common + 1
+
+        def update(self, refs_dict, rev_list):
+            """Return a new cache for `refs_dict`, with the commits of
+            `rev_list` appended.
+
+            `rev_list` is the output of `git rev-list --parents
+            --topo-order`, for commits which are not in the cache yet.
+            `KeyError` is raised if the parent of a commit is neither in
+            the cache nor in `rev_list`.
+            """
+            shas = bytearray(self._shas)
+            parent_offsets = array('I', self._parent_offsets)
+            parent_ids = array('I', self._parent_ids)
+            generations = array('I', self._generations)
+            depths = array('I', self._depths)
+            jumps = array('I', self._jumps)
+            merges = array('I', self._merges)
+            new_ids = dict(self._new_ids)
+            new_children = dict(self._new_children)
+            index = self.index
+            id_ = len(self)
+            for line in reversed(rev_list.splitlines()):
+                revs = line.split()
+                key = binascii.unhexlify(revs[0])
+                if key in new_ids or index(revs[0]) is not None:
+                    continue
+                generation = 0
+                for parent in revs[1:]:
+                    parent_id = new_ids.get(binascii.unhexlify(parent))
+                    if parent_id is None:
+                        parent_id = index(parent)
+                        if parent_id is None:
+                            raise KeyError(parent)
+                    parent_ids.append(parent_id)
+                    new_children[parent_id] = \
+                        new_children.get(parent_id, ()) + (id_,)
+                    generation = max(generation, generations[parent_id])
+                parent_offsets.append(len(parent_ids))
+                generations.append(generation + 1)
+                if len(revs) > 1:
+                    parent_id = parent_ids[parent_offsets[-2]]
+                    depths.append(depths[parent_id] + 1)
+                    jump = jumps[parent_id]
+                    if depths[parent_id] - depths[jump] == \
+                            depths[jump] - depths[jumps[jump]]:
+                        jumps.append(jumps[jump])
+                    else:
+                        jumps.append(parent_id)
+                    merges.append(id_ if len(revs) > 2 else
+                                  merges[parent_id])
+                else:
+                    depths.append(0)
+                    jumps.append(id_)
+                    merges.append(self._no_merge)
+                shas += key
+                new_ids[key] = id_
+                id_ += 1
+            mask_ids = array('I', self._mask_ids)
+            mask_ids.extend([0] * (id_ - len(mask_ids)))
+            rev_cache = self.__class__(refs_dict, shas, parent_offsets,
+                                       parent_ids, self._sorted,
+                                       self._child_offsets, self._child_ids,
+                                       generations, depths, jumps, merges,
+                                       mask_ids,
+                                       list(self._masks),
+                                       dict(self._branch_bits), new_ids,
+                                       new_children)
+            rev_cache._update_branches(self.refs_dict)
+            return rev_cache
+
+        def compact(self):
+            """Return a new cache where the commits appended since the
+            last compaction are stored in arrays.
+            """
+            if not self._new_ids:
+                return self
+            new_ids = self._new_ids
+            base = memoryview(self._sorted).cast('B')
+            sorted_ids = array('I')
+            prev = 0
+            for key in self._new_sorted:
+                pos = 4 * self._bisect(key)
+                sorted_ids.frombytes(base[prev:pos])
+                sorted_ids.append(new_ids[key])
+                prev = pos
+            sorted_ids.frombytes(base[prev:])
+
+            # Build the children arrays from the parents arrays
+            num = len(self)
+            parent_offsets = self._parent_offsets
+            parent_ids = self._parent_ids
+            counts = array('I', bytes(4 * (num + 1)))
+            for parent_id in parent_ids:
+                counts[parent_id + 1] += 1
+            child_offsets = array('I', itertools.accumulate(counts))
+            child_ids = array('I', bytes(4 * len(parent_ids)))
+            fill = array('I', child_offsets)
+            for id_ in range(num):
+                for parent_id in parent_ids[parent_offsets[id_]:
+                                            parent_offsets[id_ + 1]]:
+                    child_ids[fill[parent_id]] = id_
+                    fill[parent_id] += 1
+
+            # Drop the branch bitmaps no longer used
+            masks = self._masks
+            used = {0: 0}
+            for mask_id in sorted(set(self._mask_ids)):
+                used.setdefault(mask_id, len(used))
+            mask_ids = array('I', map(used.__getitem__, self._mask_ids))
+            masks = [masks[mask_id] for mask_id in used]
+            return self.__class__(self.refs_dict, bytes(self._shas),
+                                  array('I', parent_offsets),
+                                  array('I', parent_ids), sorted_ids,
+                                  child_offsets, child_ids,
+                                  array('I', self._generations),
+                                  array('I', self._depths),
+                                  array('I', self._jumps),
+                                  array('I', self._merges), mask_ids, masks,
+                                  dict(self._branch_bits))
+
+        @classmethod
+        def load(cls, path):
+            """Load a cache from the snapshot file `path`, which is
+            memory-mapped.
+
+            `ValueError` is raised if the file isn't a valid snapshot.
+            """
+            with open(path, 'rb') as f:
+                view = memoryview(mmap.mmap(f.fileno(), 0,
+                                            access=mmap.ACCESS_READ))
+            header = cls._snapshot_header
+            if len(view) < header.size:
+                raise ValueError('Truncated snapshot')
+            magic, bom, num, num_parents, refs_len, branches_len, \
+                num_masks, mask_width, size = header.unpack_from(view)
+            if magic != cls._snapshot_magic or \
+                    bom != cls._snapshot_bom or size != len(view):
+                raise ValueError('Invalid snapshot')
+            pos = header.size
+
+            def take(length, format=None):
+                nonlocal pos
+                if pos + length > size:
+                    raise ValueError('Truncated snapshot')
+                data = view[pos:pos + length]
+                pos += length
+                return data.cast(format) if format else data
+
+            refs_dict = {}
+            for line in take(refs_len).tobytes().splitlines():
+                refname, rev = line.split(b'\0', 1)
+                refs_dict[refname] = rev
+            branch_bits = {}
+            for line in take(branches_len).tobytes().splitlines():
+                bit, refname = line.split(b'\0', 1)
+                branch_bits[refname] = int(bit)
+            take(-(refs_len + branches_len) % 4)
+            shas = take(20 * num)
+            parent_offsets = take(4 * (num + 1), 'I')
+            parent_ids = take(4 * num_parents, 'I')
+            sorted_ids = take(4 * num, 'I')
+            child_offsets = take(4 * (num + 1), 'I')
+            child_ids = take(4 * num_parents, 'I')
+            generations = take(4 * num, 'I')
+            depths = take(4 * num, 'I')
+            jumps = take(4 * num, 'I')
+            merges = take(4 * num, 'I')
+            mask_ids = take(4 * num, 'I')
+            masks = take(num_masks * mask_width).tobytes()
+            masks = [int.from_bytes(masks[idx:idx + mask_width], 'little')
+                     for idx in range(0, len(masks), mask_width)]
+            return cls(refs_dict, shas, parent_offsets, parent_ids,
+                       sorted_ids, child_offsets, child_ids, generations,
+                       depths, jumps, merges, mask_ids, masks, branch_bits)
+
+        def save(self, path):
+            """Write the compacted cache to the snapshot file `path`."""
+            assert not self._new_ids
+            refs = b''.join(refname + b'\0' + rev + b'\n'
+                            for refname, rev in self.refs_dict.items())
+            branches = b''.join(b'%d\0%s\n' % (bit, refname)
+                                for refname, bit
+                                in self._branch_bits.items())
+            mask_width = max(1, (max(self._masks).bit_length() + 7) // 8)
+            masks = b''.join(mask.to_bytes(mask_width, 'little')
+                             for mask in self._masks)
+            arrays = [self._parent_offsets, self._parent_ids, self._sorted,
+                      self._child_offsets, self._child_ids,
+                      self._generations, self._depths, self._jumps,
+                      self._merges, self._mask_ids]
+            padding = b'\0' * (-(len(refs) + len(branches)) % 4)
+            size = self._snapshot_header.size + len(refs) + \
+                   len(branches) + len(padding) + len(self._shas) + \
+                   sum(4 * len(a) for a in arrays) + len(masks)
+            with AtomicFile(path, 'wb') as f:
+                f.write(self._snapshot_header.pack(
+                    self._snapshot_magic, self._snapshot_bom, len(self),
+                    len(self._parent_ids), len(refs), len(branches),
+                    len(self._masks), mask_width, size))
+                f.write(refs)
+                f.write(branches)
+                f.write(padding)
+                f.write(self._shas)
+                for a in arrays:
+                    f.write(memoryview(a).cast('B'))
+                f.write(masks)
+
+        def _key(self, id_):
+            pos = id_ * 20
+            return bytes(self._shas[pos:pos + 20])
+
+        def _bisect(self, key):
+            sorted_ids = self._sorted
+            lo, hi = 0, len(sorted_ids)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._key(sorted_ids[mid]) < key:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            return lo
+
+        def _reaches(self, id_, ancestor):
+            # The ancestors of a commit are its first-parent history and
+            # the ancestors of the other parents of the merge commits
+            # in that history. Only the commits younger than `ancestor`
+            # are visited.
+            generations = self._generations
+            min_generation = generations[ancestor]
+            depth = self._depths[ancestor]
+            merges = self._merges
+            no_merge = self._no_merge
+            offsets = self._parent_offsets
+            parent_ids = self._parent_ids
+            seen = {id_}
+            stack = [id_]
+            while stack:
+                id_ = stack.pop()
+                if self._depths[id_] >= depth and \
+                        self.first_parent_ancestor(id_, depth) == ancestor:
+                    return True
+                merge = merges[id_]
+                while merge != no_merge and \
+                        generations[merge] > min_generation:
+                    first = offsets[merge]
+                    for parent in parent_ids[first + 1:offsets[merge + 1]]:
+                        if parent not in seen and parent >= ancestor and \
+                                generations[parent] >= min_generation:
+                            seen.add(parent)
+                            stack.append(parent)
+                    merge = merges[parent_ids[first]]
+            return False
+
+        def _update_branches(self, old_refs):
+            """Update the branch bitmaps of the commits, after the
+            branches have changed from `old_refs`.
+
+            The commits containing a branch are found by walking the
+            parents from the new head, until commits which already
+            contain the branch are reached.
+            """
+            old_heads = {refname: rev for refname, rev in old_refs.items()
+                         if refname.startswith(b'refs/heads/')}
+            heads = {refname: rev for refname, rev in self.refs_dict.items()
+                     if refname.startswith(b'refs/heads/')}
+            changed = [refname for refname, rev in heads.items()
+                       if old_heads.get(refname) != rev]
+            removed = [refname for refname in old_heads
+                       if refname not in heads]
+            if not changed and not removed:
+                return
+            if not old_heads or len(changed) > self._max_branch_updates:
+                self._build_branches(heads)
+                return
+
+            branch_bits = self._branch_bits
+            clear = 0
+            for refname in removed:
+                clear |= 1 << branch_bits.pop(refname)
+            free_bits = set(range(len(branch_bits) + len(changed))) - \
+                        set(branch_bits.values())
+            walks = []
+            for refname in changed:
+                id_ = self.index(heads[refname])
+                bit = branch_bits.get(refname)
+                if bit is None:
+                    bit = branch_bits[refname] = min(free_bits)
+                    free_bits.discard(bit)
+                else:
+                    # Start again when the branch has been rewound
+                    old_id = self.index(old_heads[refname])
+                    if old_id is None or id_ is None or \
+                            not (old_id == id_ or old_id < id_ and
+                                 self._reaches(id_, old_id)):
+                        clear |= 1 << bit
+                if id_ is not None:
+                    walks.append((id_, 1 << bit))
+            masks = self._masks
+            if clear:
+                masks[:] = [mask & ~clear for mask in masks]
+            interned = {}
+            for mask_id in range(len(masks) - 1, -1, -1):
+                interned[masks[mask_id]] = mask_id
+            mask_ids = self._mask_ids
+            for id_, bit in walks:
+                stack = [id_]
+                while stack:
+                    id_ = stack.pop()
+                    mask = masks[mask_ids[id_]]
+                    if mask & bit:
+                        continue
+                    mask |= bit
+                    mask_id = interned.get(mask)
+                    if mask_id is None:
+                        mask_id = interned[mask] = len(masks)
+                        masks.append(mask)
+                    mask_ids[id_] = mask_id
+                    stack.extend(self.parents(id_))
+
+        def _build_branches(self, heads):
+            """Build the branch bitmaps of all the commits, in a single
+            pass from the youngest commits to the oldest.
+            """
+            branch_bits = {refname: bit for bit, refname
+                           in enumerate(sorted(heads))}
+            num = len(self)
+            masks = [0] * num
+            for refname, rev in heads.items():
+                id_ = self.index(rev)
+                if id_ is not None:
+                    masks[id_] |= 1 << branch_bits[refname]
+            parent_offsets = self._parent_offsets
+            parent_ids = self._parent_ids
+            for id_ in range(num - 1, -1, -1):
+                mask = masks[id_]
+                if mask:
+                    for parent_id in parent_ids[parent_offsets[id_]:
+                                                parent_offsets[id_ + 1]]:
+                        masks[parent_id] |= mask
+            interned = {0: 0}
+            mask_ids = array('I', [interned.setdefault(mask, len(interned))
+                                   for mask in masks])
+            self._branch_bits = branch_bits
+            self._mask_ids = mask_ids
+            self._masks = sorted(interned, key=interned.__getitem__)
 
     @staticmethod
     def git_version(git_bin='git'):
@@ -360,7 +921,7 @@ class Storage(object):
         }
 
     def __init__(self, git_dir, log, git_bin='git', git_fs_encoding=None,
-                 rev_cache=None):
+                 rev_cache=None, rev_cache_dir=None):
         """Initialize PyGit.Storage instance
 
         `git_dir`: path to .git folder;
@@ -375,6 +936,10 @@ class Storage(object):
                 if `None`, no implicit decoding/encoding to/from
                 unicode objects is performed, and bytestrings are
                 returned instead
+
+        `rev_cache_dir`: directory where a snapshot of the revision
+                cache is saved, to be loaded by the other processes
+                instead of rebuilding the revision cache
         """
 
         self.logger = log
@@ -385,6 +950,7 @@ class Storage(object):
         self.__rev_cache = rev_cache or self.RevCache.empty()
         self.__rev_cache_refresh = True
         self.__rev_cache_lock = Lock()
+        self.__rev_cache_snapshot = None
 
         # cache the last 200 commit messages
         self.__commit_msg_cache = SizedDict(200)
@@ -437,6 +1003,13 @@ class Storage(object):
         self.repo = GitCore(git_dir, git_bin, log, git_fs_encoding)
         self.repo_path = git_dir
 
+        if rev_cache_dir:
+            name = hashlib.sha1(os.path.abspath(git_dir).encode('utf-8'))
+            self.__rev_cache_snapshot = os.path.join(
+                rev_cache_dir, name.hexdigest() + '.revcache')
+            if rev_cache is None:
+                self.__rev_cache = self._load_rev_cache()
+
         self.logger.debug("PyGIT.Storage instance for '%s' is constructed",
                           git_dir)
 
@@ -482,7 +1055,9 @@ class Storage(object):
             if self.__rev_cache.refs_dict != refs:
                 self.logger.debug("Detected changes in git repository "
                                   "'%s'", self.repo_path)
-                rev_cache = self._build_rev_cache(refs)
+                rev_cache = self._update_rev_cache(refs)
+                if rev_cache is None:
+                    rev_cache = self._build_rev_cache(refs)
                 self.__rev_cache = rev_cache
                 StorageFactory.set_rev_cache(self.repo_path, rev_cache)
                 refreshed = True
@@ -495,94 +1070,89 @@ class Storage(object):
         self.logger.debug("triggered rebuild of commit tree db for '%s'",
                           self.repo_path)
         ts0 = time_now()
+        rev_list = self.repo.rev_list('--parents', '--topo-order', '--all')
+        rev_cache = self.RevCache.empty().update(refs, rev_list).compact()
+        self.logger.debug("rebuilt commit tree db for '%s' with %d entries "
+                          "(took %.1f ms)", self.repo_path, len(rev_cache),
+                          1000 * (time_now() - ts0))
+        self._save_rev_cache(rev_cache)
+        return rev_cache
 
-        new_db = {} # db
-        new_sdb = {} # short_rev db
-
-        # helper for reusing strings
-        revs_seen = {}
-        def _rev_reuse(rev):
-            return revs_seen.setdefault(rev, rev)
+    def _update_rev_cache(self, refs):
+        """Append the commits which have been added since the revision
+        cache was built.
 
-        refs = {refname: _rev_reuse(rev) for refname, rev in refs.items()}
-        head_revs = {rev for refname, rev in refs.items()
-                         if refname.startswith(b'refs/heads/')}
-        rev_list = [list(map(_rev_reuse, line.split()))
-                    for line in self.repo.rev_list('--parents', '--topo-order',
-                                                   '--all').splitlines()]
-        revs_seen = None
-
-        if rev_list:
-            # first rev seen is assumed to be the youngest one
-            youngest = rev_list[0][0]
-            # last rev seen is assumed to be the oldest one
-            oldest = rev_list[-1][0]
-        else:
-            youngest = oldest = None
-
-        rheads_seen = {}
-        def _rheads_reuse(rheads):
-            rheads = frozenset(rheads)
-            return rheads_seen.setdefault(rheads, rheads)
-
-        __rev_key = self.__rev_key
-        for ord_rev, revs in enumerate(rev_list):
-            rev = revs[0]
-            parents = revs[1:]
-
-            # shortrev "hash" map
-            new_sdb.setdefault(__rev_key(rev), []).append(rev)
-
-            # new_db[rev] = (children(rev), parents(rev),
-            #                ordinal_id(rev), rheads(rev))
-            if rev in new_db:
-                # (incomplete) entry was already created by children
-                _children, _parents, _ord_rev, _rheads = new_db[rev]
-                assert _children
-                assert not _parents
-                assert _ord_rev == 0
-            else: # new entry
-                _children = set()
-                _rheads = set()
-            if rev in head_revs:
-                _rheads.add(rev)
-
-            # create/update entry
-            # transform into frozenset and tuple since entry will be final
-            new_db[rev] = (frozenset(_children), tuple(parents), ord_rev + 1,
-                           _rheads_reuse(_rheads))
-
-            # update parents(rev)s
-            for parent in parents:
-                # by default, a dummy ordinal_id is used for the mean-time
-                _children, _parents, _ord_rev, _rheads2 = \
-                    new_db.setdefault(parent, (set(), [], 0, set()))
-
-                # update parent(rev)'s children
-                _children.add(rev)
-
-                # update parent(rev)'s rheads
-                _rheads2.update(_rheads)
-
-        rheads_seen = None
-
-        # convert sdb either to dict or array depending on size
-        tmp = [()] * (max(new_sdb) + 1) if len(new_sdb) > 5000 else {}
+        Returns `None` if the revision cache needs to be rebuilt, i.e.
+        when commits are no longer reachable from the refs.
+        """
+        old_cache = self.__rev_cache
+        if not len(old_cache):
+            return None
+        ts0 = time_now()
+        old_tips = set()
+        changed_tips = set()
+        for refname, rev in old_cache.refs_dict.items():
+            if refname != b'HEAD' and rev in old_cache:
+                old_tips.add(rev)
+                if refs.get(refname) != rev:
+                    changed_tips.add(rev)
+        changed_tips -= {rev for refname, rev in refs.items()
+                         if refname != b'HEAD'}
+        if changed_tips:
+            # The commits are still reachable unless refs have been
+            # deleted or rewound
+            if len(changed_tips) > self.__REV_CACHE_MAX_CHANGED:
+                return None
+            count = self.repo.rev_list('--count', *sorted(changed_tips),
+                                       '--not', '--all')
+            if as_int(count.strip(), None) != 0:
+                return None
+        rev_list = self.repo.rev_list(
+            '--parents', '--topo-order', '--all', '--stdin',
+            input=b''.join(b'^%s\n' % rev for rev in sorted(old_tips)))
         try:
-            while True:
-                k, v = new_sdb.popitem()
-                tmp[k] = tuple(v)
-        except KeyError:
-            pass
-        assert len(new_sdb) == 0
-        new_sdb = tmp
-
-        rev_cache = self.RevCache(youngest, oldest, new_db, refs, new_sdb)
-        self.logger.debug("rebuilt commit tree db for '%s' with %d entries "
-                          "(took %.1f ms)", self.repo_path, len(new_db),
+            rev_cache = old_cache.update(refs, rev_list)
+        except (KeyError, ValueError) as e:
+            self.logger.warning("Failed to update commit tree db for '%s': "
+                                "%s", self.repo_path, exception_to_unicode(e))
+            return None
+        if any(rev not in rev_cache
+               for name, rev, head in rev_cache.iter_branches()):
+            return None
+        if rev_cache.num_new >= max(self.__REV_CACHE_COMPACT_MIN,
+                                    len(rev_cache) // 20):
+            rev_cache = rev_cache.compact()
+            self._save_rev_cache(rev_cache)
+        self.logger.debug("updated commit tree db for '%s' with %d new "
+                          "entries (took %.1f ms)", self.repo_path,
+                          len(rev_cache) - len(old_cache),
                           1000 * (time_now() - ts0))
         return rev_cache
 
+    def _load_rev_cache(self):
+        path = self.__rev_cache_snapshot
+        try:
+            rev_cache = self.RevCache.load(path)
+        except FileNotFoundError:
+            return self.RevCache.empty()
+        except (OSError, ValueError) as e:
+            self.logger.warning("Failed to load commit tree db from '%s': %s",
+                                path, exception_to_unicode(e))
+            return self.RevCache.empty()
+        self.logger.debug("loaded commit tree db for '%s' with %d entries "
+                          "from '%s'", self.repo_path, len(rev_cache), path)
+        return rev_cache
+
+    def _save_rev_cache(self, rev_cache):
+        path = self.__rev_cache_snapshot
+        if path:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                rev_cache.save(path)
+            except OSError as e:
+                self.logger.warning("Failed to save commit tree db to '%s': "
+                                    "%s", path, exception_to_unicode(e))
+
     def _get_refs(self):
         refs = {}
         tags = {}
@@ -624,7 +1194,7 @@ class Storage(object):
                 yield _fs_to_unicode(refname), _rev_u(rev)
 
     def get_commits(self):
-        return self.rev_cache.rev_dict
+        return self.rev_cache
 
     def oldest_rev(self):
         return _rev_u(self.rev_cache.oldest_rev)
@@ -642,43 +1212,39 @@ class Storage(object):
         sha = _rev_b(sha)
         _rev_cache = self.rev_cache
 
-        try:
-            rheads = _rev_cache.rev_dict[sha][3]
-        except KeyError:
+        id_ = _rev_cache.index(sha)
+        if id_ is None:
             return []
+        branches = _rev_cache.iter_branches_containing(id_)
 
         if resolve:
             _fs_to_unicode = self._fs_to_unicode
             rv = [(_fs_to_unicode(name), _rev_u(rev))
-                  for name, rev, head in _rev_cache.iter_branches()
-                  if rev in rheads]
+                  for name, rev, head in branches]
             rv.sort(key=lambda v: v[0])
             return rv
         else:
-            return list(map(_rev_u, rheads))
+            return list({_rev_u(rev) for name, rev, head in branches})
 
     def history_relative_rev(self, sha, rel_pos):
 
         def get_history_relative_rev(sha, rel_pos):
-            rev_dict = self.get_commits()
+            rev_cache = self.get_commits()
 
-            if sha not in rev_dict:
+            id_ = rev_cache.index(sha)
+            if id_ is None:
                 raise GitErrorSha()
 
             if rel_pos == 0:
                 return sha
 
-            lin_rev = rev_dict[sha][2] + rel_pos
+            # the ids are in reverse topological order
+            id_ -= rel_pos
 
-            if lin_rev < 1 or lin_rev > len(rev_dict):
+            if id_ < 0 or id_ >= len(rev_cache):
                 return None
 
-            for k, v in rev_dict.items():
-                if v[2] == lin_rev:
-                    return k
-
-            # should never be reached if rev_dict is consistent
-            raise GitError("internal inconsistency detected")
+            return rev_cache.sha(id_)
 
         result = get_history_relative_rev(_rev_b(sha), rel_pos)
         return _rev_u(result)
@@ -788,7 +1354,7 @@ class Storage(object):
             rc = self.repo.rev_parse('--verify', rev).strip()
             if not rc:
                 return None
-            if rc in _rev_cache.rev_dict:
+            if rc in _rev_cache:
                 return rc
 
             return None
@@ -808,25 +1374,12 @@ class Storage(object):
 
             _rev_cache = self.rev_cache
 
-            if rev not in _rev_cache.rev_dict:
+            if rev not in _rev_cache:
                 return None
 
-            srev = rev[:min_len]
-            srevs = set(_rev_cache.srev_dict[self.__rev_key(rev)])
-
-            if len(srevs) == 1:
-                return srev # we already got a unique id
-
             # find a shortened id for which rev doesn't conflict with
-            # the other ones from srevs
-            crevs = srevs - {rev}
-
-            for l in range(min_len+1, 40):
-                srev = rev[:l]
-                if srev not in [ r[:l] for r in crevs ]:
-                    return srev
-
-            return rev # worst-case, all except the last character match
+            # the other ones
+            return rev[:max(min_len, _rev_cache.unique_prefix_len(rev))]
 
         return _rev_u(get_shortrev(_rev_b(rev), min_len))
 
@@ -837,23 +1390,17 @@ class Storage(object):
         _rev_cache = self.rev_cache
 
         # short-cut
-        if len(rev) == 40 and rev in _rev_cache.rev_dict:
+        if len(rev) == 40 and rev in _rev_cache:
             return rev
 
         if not GitCore.is_sha(rev):
             return None
 
-        try:
-            srevs = _rev_cache.srev_dict[self.__rev_key(rev)]
-        except (KeyError, IndexError):
-            return None
-
         resolved = None
-        for s in srevs:
-            if s.startswith(rev):
-                if resolved is not None:
-                    return None
-                resolved = s
+        for s in _rev_cache.iter_prefix(rev):
+            if resolved is not None:
+                return None
+            resolved = s
         return resolved
 
     def get_tags(self, rev=None):
@@ -890,8 +1437,7 @@ class Storage(object):
         commit_id_orig = commit_id
         commit_id = self.fullrev(_rev_b(commit_id))
 
-        rev_dict = self.get_commits()
-        if commit_id not in rev_dict:
+        if commit_id not in self.get_commits():
             self.logger.info("read_commit failed for %r (%r)",
                              commit_id, commit_id_orig)
             raise GitErrorSha
@@ -910,6 +1456,83 @@ class Storage(object):
             self.__commit_msg_cache[commit_id] = result
         return result[0], dict(result[1])
 
+    def iter_commits(self, revs):
+        """Read the given commits in bulk and yield `(sha, msg, props,
+        changes)` tuples in the same order, where `msg` and `props` are
+        like the result of `read_commit()` and `changes` is the list of
+        differences against the first parent like `get_changes()`.
+
+        The requests are streamed to dedicated `cat-file --batch` and
+        `diff-tree --stdin` processes rather than sent one at a time.
+
+        :since: 1.7.1
+        """
+        rev_cache = self.get_commits()
+        shas = []
+        for rev in revs:
+            sha = _rev_b(rev)
+            if sha not in rev_cache:
+                raise GitErrorSha("commit '%s' not found" % rev)
+            shas.append(sha)
+
+        def diff_tree_requests():
+            for sha in shas:
+                parents = rev_cache.parents(rev_cache.index(sha))
+                yield b'%s %s\n\n' % (sha, rev_cache.sha(parents[0])) \
+                      if parents else b'%s\n\n' % sha
+
+        cat_file = self.repo.cat_file_batch()
+        diff_tree = self.repo.diff_tree_pipe()
+        writers = [self._start_writer(cat_file,
+                                      (sha + b'\n' for sha in shas)),
+                   self._start_writer(diff_tree, diff_tree_requests())]
+        try:
+            encoding = self.get_commit_encoding()
+            diffs = self._read_diff_tree_output(diff_tree.stdout)
+            for sha in shas:
+                line = cat_file.stdout.readline().split()
+                if len(line) != 3 or line[:2] != [sha, b'commit']:
+                    raise GitError("internal error (unexpected line %r)" %
+                                   line)
+                size = int(line[2])
+                raw = cat_file.stdout.read(size + 1)
+                if len(raw) != size + 1:
+                    raise GitError("internal error (expected to read %d "
+                                   "bytes, but only got %d)" %
+                                   (size + 1, len(raw)))
+                msg, props = parse_commit(str(raw[:-1], encoding,
+                                              'replace'))
+                entries = next(diffs, None)
+                if entries is None:
+                    raise GitError("internal error (diff-tree exits "
+                                   "unexpectedly)")
+                # skip first entry as a sha
+                if entries:
+                    assert not entries[0].startswith(b':')
+                    entries = entries[1:]
+                yield _rev_u(sha), msg, props, \
+                      list(self._iter_diff_tree(entries))
+        finally:
+            for proc in (cat_file, diff_tree):
+                terminate(proc)
+            for writer in writers:
+                writer.join()
+            for proc in (cat_file, diff_tree):
+                self._cleanup_proc(proc)
+
+    def _start_writer(self, proc, lines):
+        def write():
+            try:
+                for line in lines:
+                    proc.stdin.write(line)
+                proc.stdin.close()
+            except (EnvironmentError, ValueError):
+                pass  # the process has been terminated
+        thread = Thread(target=write, name='git-writer')
+        thread.daemon = True
+        thread.start()
+        return thread
+
     def get_file(self, sha):
         sha = _rev_b(sha)
         return self._cat_file_reader(b'blob', sha)
@@ -924,23 +1547,28 @@ class Storage(object):
 
     def children(self, sha):
         sha = _rev_b(sha)
-        rev_dict = self.get_commits()
-        try:
-            item = rev_dict[sha]
-        except KeyError:
+        rev_cache = self.get_commits()
+        id_ = rev_cache.index(sha)
+        if id_ is None:
             return ()
-        return sorted(map(_rev_u, item[0]))
+        return sorted(_rev_u(rev_cache.sha(child))
+                      for child in rev_cache.children(id_))
 
-    def children_recursive(self, sha, rev_dict=None):
+    def children_recursive(self, sha, rev_cache=None):
         """Recursively traverse children in breadth-first order"""
 
-        if rev_dict is None:
-            rev_dict = self.get_commits()
+        if rev_cache is None:
+            rev_cache = self.get_commits()
 
+        for id_ in self._children_ids_recursive(rev_cache,
+                                                rev_cache.index(sha)):
+            yield rev_cache.sha(id_)
+
+    def _children_ids_recursive(self, rev_cache, id_):
         work_list = deque()
         seen = set()
 
-        _children = rev_dict[sha][0]
+        _children = rev_cache.children(id_)
         seen.update(_children)
         work_list.extend(_children)
 
@@ -948,7 +1576,7 @@ class Storage(object):
             p = work_list.popleft()
             yield p
 
-            _children = rev_dict[p][0] - seen
+            _children = set(rev_cache.children(p)) - seen
             seen.update(_children)
             work_list.extend(_children)
 
@@ -956,12 +1584,12 @@ class Storage(object):
 
     def parents(self, sha):
         sha = _rev_b(sha)
-        rev_dict = self.get_commits()
-        try:
-            item = rev_dict[sha]
-        except KeyError:
+        rev_cache = self.get_commits()
+        id_ = rev_cache.index(sha)
+        if id_ is None:
             return []
-        return list(map(_rev_u, item[1]))
+        return [_rev_u(rev_cache.sha(parent))
+                for parent in rev_cache.parents(id_)]
 
     def all_revs(self):
         for rev in self.get_commits():
@@ -1051,11 +1679,12 @@ class Storage(object):
     def rev_is_anchestor_of(self, rev1, rev2):
         """return True if rev2 is successor of rev1"""
 
-        rev1 = _rev_b(rev1)
-        rev2 = _rev_b(rev2)
-        rev_dict = self.get_commits()
-        return (rev2 in rev_dict and
-                rev2 in self.children_recursive(rev1, rev_dict))
+        rev_cache = self.get_commits()
+        id1 = rev_cache.index(_rev_b(rev1))
+        id2 = rev_cache.index(_rev_b(rev2))
+        if id1 is None or id2 is None:
+            return False
+        return rev_cache.is_ancestor(id1, id2)
 
     def blame(self, commit_sha, path):
         in_metadata = False
@@ -1119,6 +1748,32 @@ class Storage(object):
 
         yield from self._iter_diff_tree(entries)
 
+    def _read_diff_tree_output(self, stdout):
+        """Yield the list of entries written by `diff-tree --stdin -z`
+        for each request followed by an empty line."""
+        buf = b''
+        entries = []
+        while True:
+            data = stdout.read1(65536)
+            if not data:
+                if buf or entries:
+                    raise EOFError()
+                return
+            buf += data
+            start = 0
+            while start < len(buf):
+                if buf[start] == 0x0a:  # the empty line ends the request
+                    yield entries
+                    entries = []
+                    start += 1
+                    continue
+                idx = buf.find(b'\0', start)
+                if idx == -1:
+                    break
+                entries.append(buf[start:idx])
+                start = idx + 1
+            buf = buf[start:]
+
     def diff_tree(self, tree1, tree2, path='', find_renames=False):
         """calls `git diff-tree` and returns tuples of the kind
         (mode1,mode2,obj1,obj2,action,path1,path2)"""
@@ -40,6 +40,8 @@ from tracopt.versioncontrol.git import PyGIT
 class GitCachedRepository(CachedRepository):
     """Git-specific cached repository."""
 
+    sync_batch_size = 1000  # number of revisions inserted per transaction
+
     def display_rev(self, rev):
         return self.short_rev(rev)
 
@@ -77,8 +79,16 @@ class GitCachedRepository(CachedRepository):
                 for rev in sorted(revs):
                     yield rev_csets.pop(rev)
 
-    def get_changeset(self, rev):
-        return GitCachedChangeset(self, self.normalize_rev(rev), self.env)
+    def _insert_changeset(self, rev, cset):
+        try:
+            self.insert_changeset(rev, cset)
+        except self.env.db_exc.IntegrityError as e:
+            self.log.info('Revision %s already cached: %r', rev, e)
+            return False
+        return True
+
+    def _new_changeset(self, rev, values=None):
+        return GitCachedChangeset(self, rev, self.env, values)
 
     def sync(self, feedback=None, clean=False):
         if clean:
@@ -89,13 +99,6 @@ class GitCachedRepository(CachedRepository):
         meta_youngest = metadata.get(CACHE_YOUNGEST_REV, '')
         repos = self.repos
 
-        def is_synced(rev):
-            for count, in self.env.db_query("""
-                    SELECT COUNT(*) FROM revision WHERE repos=%s AND rev=%s
-                    """, (self.id, rev)):
-                return count > 0
-            return False
-
         def needs_sync():
             max_holders = 999
             revs = sorted(set(rev for refname, rev in repos.git.get_refs()))
@@ -112,49 +115,39 @@ class GitCachedRepository(CachedRepository):
                         return True
             return False
 
-        def traverse(rev, seen):
-            revs = []
-            merge_revs = []
-            while True:
-                if rev in seen:
-                    break
-                seen.add(rev)
-                if is_synced(rev):
-                    break
-                revs.append(rev)
-                parent_revs = repos.parent_revs(rev)
-                if not parent_revs:  # root commit?
-                    break
-                rev = parent_revs[0]
-                if len(parent_revs) > 1:
-                    merge_revs.append((len(revs), parent_revs[1:]))
-            for idx, parent_revs in reversed(merge_revs):
-                for rev in parent_revs:
-                    revs[idx:idx] = traverse(rev, seen)
-            return revs
-
         def sync_revs():
+            synced = {rev for rev, in self.env.db_query(
+                        "SELECT rev FROM revision WHERE repos=%s",
+                        (self.id,))}
+            # sync revisions from older revisions to newer revisions
+            revs = [rev for rev in repos.git.all_revs() if rev not in synced]
+            revs.reverse()
+            if not revs:
+                return False
+            self.log.info("Trying to sync %d revisions", len(revs))
             updated = False
-            seen = set()
-
-            for rev in repos.git.all_revs():
-                if repos.child_revs(rev):
-                    continue
-                revs = traverse(rev, seen)  # topology ordered
-                while revs:
-                    # sync revision from older revision to newer revision
-                    rev = revs.pop()
-                    self.log.info("Trying to sync revision [%s]", rev)
-                    cset = repos.get_changeset(rev)
+            csets = repos.iter_changesets(revs)
+            try:
+                for idx in range(0, len(revs), self.sync_batch_size):
+                    batch = [(cset.rev, cset) for cset in
+                             itertools.islice(csets, self.sync_batch_size)]
                     try:
-                        self.insert_changeset(rev, cset)
-                        updated = True
+                        self.insert_changesets(batch)
                     except self.env.db_exc.IntegrityError as e:
-                        self.log.info('Revision %s already cached: %r', rev, e)
-                        continue
+                        # concurrent syncs, retry one revision at a time
+                        self.log.info('Revisions already cached: %r', e)
+                        batch = [(rev, cset) for rev, cset in batch
+                                 if self._insert_changeset(rev, cset)]
+                    self.log.info("Synced %d/%d revisions",
+                                  min(idx + self.sync_batch_size, len(revs)),
+                                  len(revs))
+                    if batch:
+                        updated = True
                     if feedback:
-                        feedback(rev)
-
+                        for rev, cset in batch:
+                            feedback(rev)
+            finally:
+                csets.close()
             return updated
 
         with self.env.db_query:
@@ -305,6 +298,16 @@ class GitConnector(Component):
     persistent_cache = BoolOption('git', 'persistent_cache', 'false',
         """Enable persistent caching of commit tree.""")
 
+    rev_cache_dir = PathOption('git', 'rev_cache_dir', '',
+        """Directory where a snapshot of the commit tree of each
+        repository is saved. The snapshot is memory-mapped by the
+        processes starting up, which then only read the commits added
+        since it was saved, rather than the whole history. Relative
+        paths are resolved relative to the `conf` directory of the
+        environment. When empty, no snapshot is saved.
+        (''since 1.7.1'')
+        """)
+
     cached_repository = BoolOption('git', 'cached_repository', 'false',
         """Wrap `GitRepository` in `CachedRepository`.""")
 
@@ -395,6 +398,7 @@ class GitConnector(Component):
 
         repos = GitRepository(self.env, dir, params, self.log,
                               persistent_cache=self.persistent_cache,
+                              rev_cache_dir=self.rev_cache_dir or None,
                               git_bin=self.git_bin,
                               git_fs_encoding=self.git_fs_encoding,
                               shortrev_len=self.shortrev_len,
@@ -504,6 +508,7 @@ class GitRepository(Repository):
 
     def __init__(self, env, path, params, log,
                  persistent_cache=False,
+                 rev_cache_dir=None,
                  git_bin='git',
                  git_fs_encoding='utf-8',
                  shortrev_len=7,
@@ -525,7 +530,8 @@ class GitRepository(Repository):
         try:
             factory = PyGIT.StorageFactory(path, log, not persistent_cache,
                                            git_bin=git_bin,
-                                           git_fs_encoding=git_fs_encoding)
+                                           git_fs_encoding=git_fs_encoding,
+                                           rev_cache_dir=rev_cache_dir)
             self._git = factory.getInstance()
         except PyGIT.GitError as e:
             log.error(exception_to_unicode(e))
@@ -602,6 +608,15 @@ class GitRepository(Repository):
         """GitChangeset factory method"""
         return GitChangeset(self, rev)
 
+    def iter_changesets(self, revs):
+        """Return the `GitChangeset`s of the given revisions in the same
+        order, reading the commits in bulk.
+
+        :since: 1.7.1
+        """
+        for commit in self.git.iter_commits(revs):
+            yield GitChangeset(self, commit[0], commit[1:])
+
     def get_changeset_uid(self, rev):
         return self.normalize_rev(rev)
 
@@ -836,14 +851,18 @@ class GitChangeset(Changeset):
         'C': Changeset.COPY
         } # TODO: U, X, B
 
-    def __init__(self, repos, sha):
+    def __init__(self, repos, sha, commit=None):
         if sha is None:
             raise NoSuchChangeset(sha)
 
-        try:
-            msg, props = repos.git.read_commit(sha)
-        except PyGIT.GitErrorSha:
-            raise NoSuchChangeset(sha)
+        if commit is None:
+            try:
+                msg, props = repos.git.read_commit(sha)
+            except PyGIT.GitErrorSha:
+                raise NoSuchChangeset(sha)
+            self._changes = None
+        else:  # `(msg, props, changes)` read by `Storage.iter_commits()`
+            msg, props, self._changes = commit
 
         self.props = props
 
@@ -910,7 +929,9 @@ class GitChangeset(Changeset):
         parent = self.props.get('parent')
         parent = parent[0] if parent else None
 
-        changes = self.repos.git.get_changes(parent, self.rev)
+        changes = self._changes
+        if changes is None:
+            changes = self.repos.git.get_changes(parent, self.rev)
         for mode1, mode2, obj1, obj2, action, path1, path2 in changes:
             path = path2 or path1
             p_path, p_rev = path1, parent
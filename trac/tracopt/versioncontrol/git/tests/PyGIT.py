@@ -21,7 +21,8 @@ from trac.test import EnvironmentStub, makeSuite, mkdtemp, rmtree
 from trac.util import create_file
 from trac.versioncontrol.api import Changeset, DbRepositoryProvider, \
                                     RepositoryManager
-from tracopt.versioncontrol.git.PyGIT import GitCore, GitError, Storage, \
+from tracopt.versioncontrol.git.PyGIT import GitCore, GitError, \
+                                             GitErrorSha, Storage, \
                                              SizedDict, StorageFactory, \
                                              parse_commit
 from tracopt.versioncontrol.git.tests.git_fs import GitCommandMixin
@@ -487,25 +488,31 @@ class StorageTestCase(unittest.TestCase, GitCommandMixin):
         if os.path.isdir(self.repos_path):
             rmtree(self.repos_path)
 
-    def _storage(self):
-        return Storage(self.repos_path, self.env.log, self.git_bin, 'utf-8')
+    def _storage(self, **kwargs):
+        return Storage(self.repos_path, self.env.log, self.git_bin, 'utf-8',
+                       **kwargs)
 
-    def _test_srev_dict(self, n_revs, type_):
+    def _create_commits(self, n_revs, branch=b'master', from_=None, ts=0):
         with self._spawn_git('fast-import', stdin=subprocess.PIPE) as proc:
             write = proc.stdin.write
             write(b'blob\n')
             write(b'mark :1\n')
             write(b'data 0\n')
             write(b'\n')
-            write(b'reset refs/heads/master\n')
+            if from_ is None:
+                write(b'reset refs/heads/%s\n' % branch)
             for i in range(n_revs):
-                ts = 1000000000 + i
-                write(b'commit refs/heads/master\n')
+                ts += 1
+                write(b'commit refs/heads/%s\n' % branch)
                 write(b'mark :2\n')
-                write(b'author Joe <joe@example.com> %d +0000\n' % ts)
-                write(b'committer Joe <joe@example.com> %d +0000\n' % ts)
+                write(b'author Joe <joe@example.com> %d +0000\n'
+                      % (1000000000 + ts))
+                write(b'committer Joe <joe@example.com> %d +0000\n'
+                      % (1000000000 + ts))
                 write(b'data 2\n')
                 write(b'.\n')
+                if i == 0 and from_ is not None:
+                    write(b'from %s\n' % from_)
                 write(b'M 100644 :1 .gitignore\n')
                 write(b'\n')
             stdout, stderr = proc.communicate()
@@ -513,8 +520,32 @@ class StorageTestCase(unittest.TestCase, GitCommandMixin):
                          'git exits with %r, stdout %r, stderr %r' %
                          (proc.returncode, stdout, stderr))
 
+    def _assert_same_rev_cache(self, expected, storage):
+        self.assertEqual(sorted(expected.all_revs()),
+                         sorted(storage.all_revs()))
+        self.assertEqual(expected.get_branches(), storage.get_branches())
+        for rev in expected.all_revs():
+            self.assertEqual(expected.parents(rev), storage.parents(rev))
+            self.assertEqual(expected.children(rev), storage.children(rev))
+            self.assertEqual(expected.get_branch_contains(rev, True),
+                             storage.get_branch_contains(rev, True))
+            self.assertEqual(rev, storage.fullrev(storage.shortrev(rev)
+                                                  .encode('ascii')).decode())
+
+    def _assert_topological_order(self, storage):
+        rev = storage.youngest_rev()
+        seen = set()
+        while rev:
+            seen.add(rev)
+            for parent in storage.parents(rev):
+                self.assertNotIn(parent, seen)
+            rev = storage.hist_prev_revision(rev)
+        self.assertEqual(len(list(storage.all_revs())), len(seen))
+
+    def _test_shortrev_and_fullrev(self, n_revs):
+        self._create_commits(n_revs)
         storage = self._storage()
-        self.assertIsInstance(storage.rev_cache.srev_dict, type_)
+        self.assertEqual(n_revs, len(storage.rev_cache))
         for i in range(0x10000):
             srev_b = b'%04x' % i
             frev_b = storage.fullrev(srev_b)
@@ -526,11 +557,195 @@ class StorageTestCase(unittest.TestCase, GitCommandMixin):
             self.assertTrue(frev_u.startswith(srev_u),
                             'frev_u %(frev_u)r, srev_u %(srev_u)r' % locals())
 
-    def test_srev_dict_a_dict(self):
-        self._test_srev_dict(4500, dict)
+    def test_shortrev_and_fullrev(self):
+        self._test_shortrev_and_fullrev(5500)
 
-    def test_srev_dict_a_list(self):
-        self._test_srev_dict(5500, list)
+    def test_rev_cache_updated_incrementally(self):
+        self._create_commits(20)
+        storage = self._storage()
+        master = storage.youngest_rev()
+        self.assertEqual(20, len(storage.rev_cache))
+        self._create_commits(5, from_=b'refs/heads/master^0', ts=100)
+        self._create_commits(5, branch=b'topic', from_=master.encode(),
+                             ts=200)
+        storage._build_rev_cache = None  # must not be called
+        self.assertTrue(storage.sync())
+        self.assertEqual(30, len(storage.rev_cache))
+        self.assertEqual(10, storage.rev_cache.num_new)
+        del storage._build_rev_cache
+
+        self._assert_same_rev_cache(self._storage(), storage)
+        self._assert_topological_order(storage)
+        self.assertEqual([('master', storage.rev_cache.sha(24).decode()),
+                          ('topic', storage.rev_cache.sha(29).decode())],
+                         storage.get_branch_contains(master, True))
+
+        rev_cache = storage.rev_cache
+        compacted = rev_cache.compact()
+        self.assertEqual(0, compacted.num_new)
+        for id_ in range(len(rev_cache)):
+            rev = rev_cache.sha(id_)
+            self.assertEqual(id_, compacted.index(rev))
+            self.assertEqual(rev_cache.parents(id_), compacted.parents(id_))
+            self.assertEqual(sorted(rev_cache.children(id_)),
+                             sorted(compacted.children(id_)))
+            self.assertEqual(rev_cache.unique_prefix_len(rev),
+                             compacted.unique_prefix_len(rev))
+
+    def _create_graph(self):
+        """Create commits on several branches, with merges."""
+        commands = ['blob', 'mark :1', 'data 0', '']
+        def commit(branch, mark, *parents):
+            commands.extend([
+                'commit refs/heads/%s' % branch,
+                'mark :%d' % mark,
+                'author Joe <joe@example.com> %d +0000' % (1000000000 + mark),
+                'committer Joe <joe@example.com> %d +0000'
+                % (1000000000 + mark),
+                'data 2', '.'])
+            for idx, parent in enumerate(parents):
+                commands.append('%s :%d' % ('merge' if idx else 'from',
+                                            parent))
+            commands.extend(['M 100644 :1 file%d' % mark, ''])
+        for mark in range(10, 20):
+            commit('master', mark, *((mark - 1,) if mark > 10 else ()))
+        commit('topic', 20, 13)
+        commit('topic', 21, 20)
+        commit('topic', 22, 21, 16)
+        commit('topic', 23, 22)
+        commit('fix', 30, 16)
+        commit('fix', 31, 30)
+        commit('master', 40, 19, 31)
+        commit('master', 41, 40)
+        commit('orphan', 50)
+        commit('orphan', 51, 50)
+        commands.append('reset refs/heads/merged')
+        commands.append('from :30')
+        self._git_fast_import('\n'.join(commands) + '\n')
+
+    def test_iter_commits(self):
+        self._create_graph()
+        storage = self._storage()
+        revs = list(storage.all_revs())
+        revs.reverse()
+        commits = list(storage.iter_commits(revs))
+        self.assertEqual(revs, [commit[0] for commit in commits])
+        for rev, msg, props, changes in commits:
+            parents = storage.parents(rev)
+            self.assertEqual(storage.read_commit(rev), (msg, props))
+            self.assertEqual(list(storage.get_changes(
+                                parents[0] if parents else None, rev)),
+                             changes)
+
+        for commit in storage.iter_commits(revs):
+            break  # stop reading in the middle
+        self.assertRaises(GitErrorSha, list,
+                          storage.iter_commits(['0' * 40]))
+
+    def _assert_reachability(self, storage):
+        revs = list(storage.all_revs())
+        ancestors = {}
+        for rev in revs:
+            with self._spawn_git('rev-list', rev + '^@') as proc:
+                stdout, stderr = proc.communicate()
+            ancestors[rev] = set(stdout.decode().split())
+        for rev1 in revs:
+            for rev2 in revs:
+                self.assertEqual(rev1 in ancestors[rev2],
+                                 storage.rev_is_anchestor_of(rev1, rev2),
+                                 '%s %s' % (rev1, rev2))
+
+    def test_reachability_index(self):
+        self._create_graph()
+        storage = self._storage()
+        self._assert_reachability(storage)
+        master = storage.verifyrev('master')
+        self.assertEqual(['fix', 'master', 'merged'],
+                         [name for name, rev in
+                          storage.get_branch_contains(
+                              storage.verifyrev('merged'), True)])
+        self.assertEqual([('master', master)],
+                         storage.get_branch_contains(master, True))
+        self.assertEqual(['master'],
+                         [name for name, rev in
+                          storage.get_branch_contains(
+                              storage.verifyrev('master~2'), True)])
+        self.assertEqual(['fix', 'master', 'merged', 'topic'],
+                         [name for name, rev in
+                          storage.get_branch_contains(
+                              storage.verifyrev('master~8'), True)])
+        self.assertEqual(['orphan'],
+                         [name for name, rev in
+                          storage.get_branch_contains(
+                              storage.verifyrev('orphan~1'), True)])
+
+    def test_reachability_index_updated_incrementally(self):
+        self._create_graph()
+        storage = self._storage()
+        storage.sync()
+        # rewind, delete and create branches, keeping all the commits
+        self._git('tag', 'v1', 'master')
+        self._git('update-ref', 'refs/heads/master', 'master~1')
+        self._git('update-ref', '-d', 'refs/heads/merged')
+        self._git('update-ref', 'refs/heads/new', 'topic~2')
+        self._create_commits(3, branch=b'fix', from_=b'refs/heads/fix^0',
+                             ts=100)
+        storage._build_rev_cache = None  # must not be called
+        self.assertTrue(storage.sync())
+        del storage._build_rev_cache
+
+        expected = self._storage()
+        self._assert_same_rev_cache(expected, storage)
+        self._assert_reachability(storage)
+
+    def test_reachability_index_snapshot(self):
+        rev_cache_dir = os.path.join(self.repos_path, 'revcache')
+        self._create_graph()
+        expected = self._storage(rev_cache_dir=rev_cache_dir)
+        expected.sync()
+        storage = self._storage(rev_cache_dir=rev_cache_dir)
+        storage._build_rev_cache = None  # must not be called
+        self._assert_same_rev_cache(expected, storage)
+        self._assert_reachability(storage)
+
+    def test_rev_cache_rebuilt_after_rewind(self):
+        self._create_commits(10)
+        storage = self._storage()
+        rev = storage.youngest_rev()
+        self._git('update-ref', 'refs/heads/master', rev + '~3')
+        self.assertTrue(storage.sync())
+        self.assertEqual(7, len(storage.rev_cache))
+        self.assertNotIn(rev, list(storage.all_revs()))
+        self.assertIsNone(storage.fullrev(rev.encode('ascii')))
+
+    def test_rev_cache_snapshot(self):
+        rev_cache_dir = os.path.join(self.repos_path, 'revcache')
+        self._create_commits(20)
+        storage = self._storage(rev_cache_dir=rev_cache_dir)
+        storage.sync()
+        self.assertEqual(1, len(os.listdir(rev_cache_dir)))
+        self._create_commits(5, from_=b'refs/heads/master^0', ts=100)
+
+        storage = self._storage(rev_cache_dir=rev_cache_dir)
+        storage._build_rev_cache = None  # must not be called
+        self.assertEqual(25, len(storage.rev_cache))
+        del storage._build_rev_cache
+        self._assert_same_rev_cache(self._storage(), storage)
+
+    def test_rev_cache_invalid_snapshot(self):
+        rev_cache_dir = os.path.join(self.repos_path, 'revcache')
+        self._create_commits(20)
+        self._storage(rev_cache_dir=rev_cache_dir).sync()
+        path = os.path.join(rev_cache_dir, os.listdir(rev_cache_dir)[0])
+        with open(path, 'r+b') as f:
+            f.truncate(100)
+        storage = self._storage(rev_cache_dir=rev_cache_dir)
+        self.assertEqual(20, len(storage.rev_cache))
+        # the snapshot has been saved again
+        self.assertGreater(os.path.getsize(path), 100)
+        storage = self._storage(rev_cache_dir=rev_cache_dir)
+        storage._build_rev_cache = None  # must not be called
+        self.assertEqual(20, len(storage.rev_cache))
 
 
 class SizedDictTestCase(unittest.TestCase):
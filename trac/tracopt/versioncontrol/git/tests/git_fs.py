@@ -18,7 +18,10 @@ import unittest
 from datetime import datetime, timedelta
 from subprocess import DEVNULL, PIPE, Popen
 
+from trac.admin.console import TracAdmin
+from trac.admin.test import execute_cmd
 from trac.core import TracError
+from trac.env import Environment
 from trac.test import EnvironmentStub, MockRequest, locate, makeSuite, \
                       mkdtemp, rmtree
 from trac.util import create_file
@@ -994,6 +997,7 @@ class GitCachedRepositoryTestCase(GitRepositoryTestCase):
                 raise StopSync
         def feedback_2(rev):
             revs2.append(rev)
+        repos.sync_batch_size = 1
         try:
             repos.sync(feedback=feedback_1, clean=True)
         except StopSync:
@@ -1001,6 +1005,34 @@ class GitCachedRepositoryTestCase(GitRepositoryTestCase):
             repos.sync(feedback=feedback_2)  # restart sync
         self.assertEqual(revs, revs2)
 
+    def test_sync_in_batches(self):
+        self._git_init()
+        self._create_merge_commit()
+        self._add_repository('gitrepos')
+        repos = self._repomgr.get_repository('gitrepos')
+        repos.sync_batch_size = 4
+
+        revs = []
+        repos.sync(feedback=revs.append)
+        self.assertEqual(6, len(revs))
+        self.assertEqual(sorted(revs), [rev for rev, in self.env.db_query(
+                                "SELECT rev FROM revision WHERE repos=%s "
+                                "ORDER BY rev", (repos.id,))])
+        for idx, rev in enumerate(revs):
+            for parent in repos.parent_revs(rev):
+                self.assertIn(parent, revs[:idx])
+            cset = repos.get_changeset(rev)
+            expected = repos.repos.get_changeset(rev)
+            self.assertEqual((expected.author, expected.date,
+                              expected.message),
+                             (cset.author, cset.date, cset.message))
+            self.assertEqual(sorted(expected.get_changes()),
+                             sorted(cset.get_changes()))
+
+        revs[:] = ()
+        repos.sync(feedback=revs.append)
+        self.assertEqual([], revs)
+
     def test_sync_file_with_invalid_byte_sequence(self):
         self._git_init(data=False)
         self._git_fast_import(b"""\
@@ -1057,6 +1089,7 @@ from :2
                 raise StopSync
         def feedback_2(rev):
             revs2.append(rev)
+        repos.sync_batch_size = 1
         try:
             repos.sync(feedback=feedback_1, clean=True)
         except StopSync:
@@ -1246,6 +1279,69 @@ class GitwebProjectsRepositoryProviderTestCase(unittest.TestCase):
 
 
 
+class GitAdminTestCase(unittest.TestCase, GitCommandMixin):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.env = Environment(os.path.join(self.tmpdir, 'env'), create=True,
+                               options=[
+            ('components', 'tracopt.versioncontrol.git.*', 'enabled'),
+            ('git', 'cached_repository', 'enabled'),
+            ('git', 'git_bin', self.git_bin),
+        ])
+        self.admin = TracAdmin()
+        self.admin.env_set(self.env.path, self.env)
+        for idx in range(3):
+            self.repos_path = os.path.join(self.tmpdir, 'repos%d.git' % idx)
+            os.mkdir(self.repos_path)
+            self._git('init', '--bare')
+            commands = ['blob', 'mark :1', 'data 0', '']
+            for mark in range(2, idx + 4):
+                commands.extend([
+                    'commit refs/heads/master', 'mark :%d' % mark,
+                    'author Joe <joe@example.com> %d +0000' % mark,
+                    'committer Joe <joe@example.com> %d +0000' % mark,
+                    'data 2', '.'])
+                if mark > 2:
+                    commands.append('from :%d' % (mark - 1))
+                commands.extend(['M 100644 :1 file%d' % mark, ''])
+            self._git_fast_import('\n'.join(commands) + '\n')
+            DbRepositoryProvider(self.env).add_repository(
+                'repos%d' % idx, self.repos_path, 'git')
+
+    def tearDown(self):
+        RepositoryManager(self.env).reload_repositories()
+        StorageFactory._clean()
+        self.env.shutdown()
+        rmtree(self.tmpdir)
+
+    def _count_revisions(self):
+        return dict(self.env.db_query("""
+            SELECT r.value, COUNT(*) FROM revision AS c
+            INNER JOIN repository AS r ON r.id=c.repos AND r.name='name'
+            GROUP BY r.value"""))
+
+    def test_resync_jobs(self):
+        rv, output = execute_cmd(self.admin, 'repository resync * --jobs=2')
+        self.assertEqual(0, rv, output)
+        self.assertIn('repos0: 2 revisions cached.\n', output)
+        self.assertIn('repos1: 3 revisions cached.\n', output)
+        self.assertIn('repos2: 4 revisions cached.\n', output)
+        self.assertTrue(output.endswith('Done.\n'), output)
+        self.assertEqual({'repos0': 2, 'repos1': 3, 'repos2': 4},
+                         self._count_revisions())
+
+        rv, output = execute_cmd(self.admin, 'repository sync * --jobs=3')
+        self.assertEqual(0, rv, output)
+        self.assertIn('repos2: 4 revisions cached.\n', output)
+
+    def test_sync_invalid_jobs(self):
+        rv, output = execute_cmd(self.admin, 'repository sync * --jobs=0')
+        self.assertEqual(2, rv, output)
+        self.assertIn('Invalid number of jobs: 0', output)
+        self.assertEqual({}, self._count_revisions())
+
+
 class StopSync(Exception):
     pass
 
@@ -1273,6 +1369,7 @@ def test_suite():
         suite.addTest(makeSuite(GitRepositoryTestCase))
         suite.addTest(makeSuite(GitCachedRepositoryTestCase))
         suite.addTest(makeSuite(GitConnectorTestCase))
+        suite.addTest(makeSuite(GitAdminTestCase))
         suite.addTest(makeSuite(GitwebProjectsRepositoryProviderTestCase))
     else:
         print("SKIP: tracopt/versioncontrol/git/tests/git_fs.py (git cli "